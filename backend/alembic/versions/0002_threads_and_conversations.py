@@ -0,0 +1,240 @@
+"""threads and conversations
+
+Thread summary columns on messages and the conversations inbox for direct
+messages, with both backfilled from existing rows.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 01:20:11.495489
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+# Lets batch mode (SQLite) address the unnamed foreign keys created by 0001
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+messages = sa.table(
+    'messages',
+    sa.column('id', sa.Integer),
+    sa.column('parent_message_id', sa.Integer),
+    sa.column('reply_count', sa.Integer),
+    sa.column('last_reply_at', sa.DateTime),
+    sa.column('created_at', sa.DateTime),
+)
+direct_messages = sa.table(
+    'direct_messages',
+    sa.column('id', sa.Integer),
+    sa.column('sender_id', sa.Integer),
+    sa.column('receiver_id', sa.Integer),
+    sa.column('is_read', sa.Boolean),
+    sa.column('created_at', sa.DateTime),
+    sa.column('conversation_id', sa.Integer),
+)
+conversations = sa.table(
+    'conversations',
+    sa.column('id', sa.Integer),
+    sa.column('user_low_id', sa.Integer),
+    sa.column('user_high_id', sa.Integer),
+    sa.column('last_message_id', sa.Integer),
+    sa.column('last_message_at', sa.DateTime),
+)
+conversation_participants = sa.table(
+    'conversation_participants',
+    sa.column('conversation_id', sa.Integer),
+    sa.column('user_id', sa.Integer),
+    sa.column('last_message_id', sa.Integer),
+    sa.column('last_read_message_id', sa.Integer),
+    sa.column('unread_count', sa.Integer),
+)
+
+
+def parent_message_fk_name() -> str:
+    """Name of the messages.parent_message_id foreign key as created by 0001"""
+    for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys('messages'):
+        if foreign_key['constrained_columns'] == ['parent_message_id'] and foreign_key['name']:
+            return foreign_key['name']
+    return NAMING_CONVENTION['fk'] % {
+        'table_name': 'messages', 'column_0_name': 'parent_message_id', 'referred_table_name': 'messages'
+    }
+
+
+def execute_in_batches(statement, rows: list):
+    bind = op.get_bind()
+    for start in range(0, len(rows), BATCH_SIZE):
+        bind.execute(statement, rows[start:start + BATCH_SIZE])
+
+
+def backfill_reply_counts():
+    rows = op.get_bind().execute(
+        sa.select(
+            messages.c.parent_message_id,
+            sa.func.count(messages.c.id),
+            sa.func.max(messages.c.created_at),
+        ).where(messages.c.parent_message_id.isnot(None)).group_by(messages.c.parent_message_id)
+    ).all()
+    execute_in_batches(
+        messages.update().where(messages.c.id == sa.bindparam('b_id')).values(
+            reply_count=sa.bindparam('b_reply_count'), last_reply_at=sa.bindparam('b_last_reply_at')
+        ),
+        [{'b_id': parent_id, 'b_reply_count': count, 'b_last_reply_at': last_reply_at}
+         for parent_id, count, last_reply_at in rows]
+    )
+
+
+def backfill_conversations():
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(
+            direct_messages.c.sender_id,
+            direct_messages.c.receiver_id,
+            direct_messages.c.is_read,
+            sa.func.count(direct_messages.c.id),
+            sa.func.max(direct_messages.c.id),
+        ).where(
+            direct_messages.c.sender_id.isnot(None),
+            direct_messages.c.receiver_id.isnot(None)
+        ).group_by(direct_messages.c.sender_id, direct_messages.c.receiver_id, direct_messages.c.is_read)
+    ).all()
+
+    # (low, high) -> last message id; (low, high, user) -> [last read id, unread count]
+    last_message = {}
+    participants = {}
+    for sender_id, receiver_id, is_read, count, max_id in rows:
+        pair = (min(sender_id, receiver_id), max(sender_id, receiver_id))
+        last_message[pair] = max(last_message.get(pair, 0), max_id)
+        for user_id in pair:
+            participants.setdefault(pair + (user_id,), [None, 0])
+        sender = participants[pair + (sender_id,)]
+        sender[0] = max(sender[0] or 0, max_id)
+        receiver = participants[pair + (receiver_id,)]
+        if is_read:
+            receiver[0] = max(receiver[0] or 0, max_id)
+        else:
+            receiver[1] += count
+    if not last_message:
+        return
+
+    created_at = dict(bind.execute(
+        sa.select(direct_messages.c.id, direct_messages.c.created_at)
+        .where(direct_messages.c.id.in_(sa.bindparam('ids', expanding=True))),
+        {'ids': list(last_message.values())}
+    ).all())
+    execute_in_batches(conversations.insert(), [
+        {'user_low_id': low, 'user_high_id': high, 'last_message_id': message_id,
+         'last_message_at': created_at.get(message_id)}
+        for (low, high), message_id in last_message.items()
+    ])
+    conversation_ids = {
+        (low, high): conversation_id
+        for conversation_id, low, high in bind.execute(
+            sa.select(conversations.c.id, conversations.c.user_low_id, conversations.c.user_high_id)
+        )
+    }
+
+    execute_in_batches(conversation_participants.insert(), [
+        {'conversation_id': conversation_ids[(low, high)], 'user_id': user_id,
+         'last_message_id': last_message[(low, high)], 'last_read_message_id': last_read_id,
+         'unread_count': unread_count}
+        for (low, high, user_id), (last_read_id, unread_count) in participants.items()
+    ])
+    execute_in_batches(
+        direct_messages.update().where(
+            sa.or_(
+                sa.and_(direct_messages.c.sender_id == sa.bindparam('b_low'),
+                        direct_messages.c.receiver_id == sa.bindparam('b_high')),
+                sa.and_(direct_messages.c.sender_id == sa.bindparam('b_high'),
+                        direct_messages.c.receiver_id == sa.bindparam('b_low')),
+            )
+        ).values(conversation_id=sa.bindparam('b_conversation_id')),
+        [{'b_low': low, 'b_high': high, 'b_conversation_id': conversation_id}
+         for (low, high), conversation_id in conversation_ids.items()]
+    )
+
+
+def upgrade() -> None:
+    op.create_table('conversations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_low_id', sa.Integer(), nullable=False),
+    sa.Column('user_high_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_message_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_high_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_low_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversations_user_pair')
+    )
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_conversations_id'), ['id'], unique=False)
+
+    op.create_table('conversation_participants',
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_read_message_id', sa.Integer(), nullable=True),
+    sa.Column('unread_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('conversation_id', 'user_id')
+    )
+    with op.batch_alter_table('conversation_participants', schema=None) as batch_op:
+        batch_op.create_index('ix_conversation_participants_user_id_last_message_id', ['user_id', 'last_message_id'], unique=False)
+
+    with op.batch_alter_table('direct_messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('conversation_id', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_direct_messages_conversation_id_id', ['conversation_id', 'id'], unique=False)
+        batch_op.create_foreign_key('fk_direct_messages_conversation_id', 'conversations', ['conversation_id'], ['id'])
+
+    # conversations <-> direct_messages is a cycle; this side is added once both tables exist
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.create_foreign_key('fk_conversations_last_message_id', 'direct_messages', ['last_message_id'], ['id'])
+
+    fk_name = parent_message_fk_name()
+    with op.batch_alter_table('messages', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.add_column(sa.Column('reply_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('last_reply_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_messages_parent_message_id_id', ['parent_message_id', 'id'], unique=False)
+        batch_op.drop_constraint(fk_name, type_='foreignkey')
+        batch_op.create_foreign_key(fk_name, 'messages', ['parent_message_id'], ['id'], ondelete='CASCADE')
+
+    backfill_reply_counts()
+    backfill_conversations()
+
+
+def downgrade() -> None:
+    fk_name = parent_message_fk_name()
+    with op.batch_alter_table('messages', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(fk_name, type_='foreignkey')
+        batch_op.create_foreign_key(fk_name, 'messages', ['parent_message_id'], ['id'])
+        batch_op.drop_index('ix_messages_parent_message_id_id')
+        batch_op.drop_column('last_reply_at')
+        batch_op.drop_column('reply_count')
+
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_conversations_last_message_id', type_='foreignkey')
+
+    with op.batch_alter_table('direct_messages', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_direct_messages_conversation_id', type_='foreignkey')
+        batch_op.drop_index('ix_direct_messages_conversation_id_id')
+        batch_op.drop_column('conversation_id')
+
+    with op.batch_alter_table('conversation_participants', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversation_participants_user_id_last_message_id')
+
+    op.drop_table('conversation_participants')
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_conversations_id'))
+
+    op.drop_table('conversations')
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+import threading
+from app.config import settings
+from app.models import User
+from app.auth import get_current_superuser
+from app.loop_monitor import loop_monitor, sample_stacks
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/loop")
+async def get_loop_stats(current_user: User = Depends(get_current_superuser)):
+    """Event loop lag and recent stalls of the worker serving the request (see app.loop_monitor)"""
+    return loop_monitor.snapshot()
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: int = Query(5, ge=1, le=1000),
+    all_threads: bool = False,
+    current_user: User = Depends(get_current_superuser)
+):
+    """Sample the serving worker's event loop thread (or every thread) and return collapsed stacks.
+
+    Feed the output to flamegraph.pl or open it in speedscope for a flamegraph.
+    """
+    if seconds > settings.profiler_max_seconds:
+        raise HTTPException(status_code=422, detail=f"seconds must be at most {settings.profiler_max_seconds}")
+
+    # This handler runs on the loop thread; the sampler runs beside it
+    thread_id = None if all_threads else threading.get_ident()
+    stacks = await run_in_threadpool(sample_stacks, thread_id, seconds, interval_ms / 1000)
+    if stacks is None:
+        raise HTTPException(status_code=409, detail="A profile is already running on this worker")
+    return PlainTextResponse(stacks)
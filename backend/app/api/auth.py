@@ -12,6 +12,7 @@ from app.auth import (
     get_current_active_user
 )
 from app.config import settings
+from app.redis_client import directory_manager
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -43,6 +44,9 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     db.commit()
     db.refresh(db_user)
     
+    # Record directory terms; team indexes pick the user up as they join teams
+    await directory_manager.index_user(db_user.id, db_user.username, db_user.full_name, team_ids=[])
+    
     return db_user
 
 
@@ -0,0 +1,172 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, func, or_
+from typing import Dict, List
+import json
+import logging
+from app.config import settings
+from app.database import get_db
+from app.models import (
+    Team, Channel, Message, User, ConversationParticipant, channel_members, team_members
+)
+from app.schemas import Bootstrap, BootstrapChannel, BootstrapTeam, User as UserSchema
+from app.auth import get_current_active_user
+from app.redis_client import cache_manager, presence_manager
+from app.sharding import CHANNEL, shard_router
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["bootstrap"])
+
+
+def _load_memberships(db: Session, user: User) -> dict:
+    """Teams, visible channels and the first page of team members (the cached part)"""
+    teams = [
+        BootstrapTeam.model_validate({
+            "id": team.id,
+            "name": team.name,
+            "description": team.description,
+            "is_public": team.is_public,
+            "avatar_url": team.avatar_url,
+            "created_by": team.created_by,
+            "created_at": team.created_at,
+            "role": role or "member"
+        })
+        for team, role in db.query(Team, team_members.c.role).join(
+            team_members, team_members.c.team_id == Team.id
+        ).filter(team_members.c.user_id == user.id).order_by(Team.id)
+    ]
+    team_ids = [team.id for team in teams]
+    if not team_ids:
+        return {"teams": [], "channels": [], "members": [], "next_member_cursor": None}
+    
+    # Public channels of the user's teams plus the private ones they belong to
+    channels = [
+        BootstrapChannel(
+            id=channel.id,
+            team_id=channel.team_id,
+            name=channel.name,
+            description=channel.description,
+            is_private=channel.is_private,
+            is_member=member_id is not None
+        )
+        for channel, member_id in db.query(Channel, channel_members.c.user_id).outerjoin(
+            channel_members,
+            and_(channel_members.c.channel_id == Channel.id, channel_members.c.user_id == user.id)
+        ).filter(
+            Channel.team_id.in_(team_ids),
+            or_(Channel.is_private == False, channel_members.c.user_id.isnot(None))
+        ).order_by(Channel.team_id, Channel.name)
+    ]
+    
+    # Same order and cursor as the plain listing of GET /users/
+    limit = settings.bootstrap_member_limit
+    members = db.query(User).filter(
+        User.is_active == True,
+        User.id.in_(db.query(team_members.c.user_id).filter(team_members.c.team_id.in_(team_ids)))
+    ).order_by(User.username).limit(limit + 1).all()
+    next_member_cursor = members[limit - 1].username if len(members) > limit else None
+    
+    return {
+        "teams": teams,
+        "channels": channels,
+        "members": [UserSchema.model_validate(member) for member in members[:limit]],
+        "next_member_cursor": next_member_cursor
+    }
+
+
+def _load_channel_state(db: Session, user_id: int, channel_ids: List[int]) -> Dict[int, dict]:
+    """Version, read marker and unread count of each channel (never cached)"""
+    if not channel_ids:
+        return {}
+    
+    state = {}
+    read_up_to = {}
+    for row in db.query(
+        Channel.id, Channel.version, channel_members.c.user_id, channel_members.c.last_read_message_id
+    ).outerjoin(
+        channel_members,
+        and_(channel_members.c.channel_id == Channel.id, channel_members.c.user_id == user_id)
+    ).filter(Channel.id.in_(channel_ids)):
+        state[row.id] = {"version": row.version, "last_read_message_id": row.last_read_message_id, "unread_count": 0}
+        if row.user_id is not None:
+            read_up_to[row.id] = row.last_read_message_id or 0
+    
+    # Top-level messages past the member's read marker, one query per message shard
+    for shard_db, shard_channel_ids in shard_router.sessions(db, CHANNEL, list(read_up_to)):
+        unread = shard_db.query(Message.channel_id, func.count(Message.id)).filter(
+            Message.channel_id.in_(shard_channel_ids),
+            Message.parent_message_id.is_(None),
+            Message.id > case(
+                {channel_id: read_up_to[channel_id] for channel_id in shard_channel_ids},
+                value=Message.channel_id
+            )
+        ).group_by(Message.channel_id)
+        for channel_id, count in unread:
+            state[channel_id]["unread_count"] = count
+    return state
+
+
+@router.get("/bootstrap", response_model=Bootstrap)
+async def bootstrap(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """User, teams, channels with unread state, and members with presence in one call.
+    
+    Replaces the chain of /auth/me, /teams/, /channels/team/{id} per team,
+    /users/ and per-user presence calls made on page load. Teams, channels
+    and members are cached per user for BOOTSTRAP_CACHE_TTL_SECONDS and
+    dropped when the user's own memberships or profile change; changes made
+    by others (a new public channel, a new team-mate) show up when the
+    entry expires. Channel versions, unread counts and presence are read on
+    every call.
+    """
+    memberships = None
+    try:
+        cached = await cache_manager.get_cached_bootstrap(current_user.id)
+        if cached is not None:
+            memberships = json.loads(cached)
+    except Exception as e:
+        logger.error(f"Error reading cached bootstrap for user {current_user.id}: {e}")
+    
+    if memberships is None:
+        memberships = _load_memberships(db, current_user)
+        if settings.bootstrap_cache_ttl_seconds > 0:
+            try:
+                payload = json.dumps({
+                    "teams": [team.model_dump(mode="json") for team in memberships["teams"]],
+                    "channels": [channel.model_dump(mode="json") for channel in memberships["channels"]],
+                    "members": [member.model_dump(mode="json") for member in memberships["members"]],
+                    "next_member_cursor": memberships["next_member_cursor"]
+                })
+                await cache_manager.cache_bootstrap(current_user.id, payload, settings.bootstrap_cache_ttl_seconds)
+            except Exception as e:
+                logger.error(f"Error caching bootstrap for user {current_user.id}: {e}")
+    
+    channels = [BootstrapChannel.model_validate(channel) for channel in memberships["channels"]]
+    state = _load_channel_state(db, current_user.id, [channel.id for channel in channels])
+    for channel in channels:
+        for key, value in state.get(channel.id, {}).items():
+            setattr(channel, key, value)
+    
+    direct_unread_count = db.query(func.coalesce(func.sum(ConversationParticipant.unread_count), 0)).filter(
+        ConversationParticipant.user_id == current_user.id
+    ).scalar()
+    
+    members = [UserSchema.model_validate(member) for member in memberships["members"]]
+    try:
+        presence = await presence_manager.get_statuses([member.id for member in members])
+    except Exception as e:
+        logger.error(f"Error reading presence for bootstrap of user {current_user.id}: {e}")
+        presence = {}
+    
+    return Bootstrap(
+        user=current_user,
+        teams=memberships["teams"],
+        channels=channels,
+        members=members,
+        next_member_cursor=memberships["next_member_cursor"],
+        presence=presence,
+        direct_unread_count=direct_unread_count
+    )
@@ -1,14 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
+from sqlalchemy import desc, or_
 from typing import List, Optional
-from app.database import get_db
-from app.models import Channel, User, Team, channel_members, team_members
-from app.schemas import ChannelCreate, ChannelUpdate, Channel as ChannelSchema, User as UserSchema
+from app.config import settings
+from app.database import get_db, insert_ignore
+from app.models import Channel, Message, User, Team, channel_members, team_members
+from app.schemas import (
+    ChannelCreate, ChannelMembersAdd, ChannelUpdate, MembersAdded, Channel as ChannelSchema, User as UserSchema
+)
 from app.auth import get_current_active_user
+from app.serializers import USER_COLUMNS, user_rows
+from app.sharding import CHANNEL, shard_router
+from app.websocket.connection_manager import manager
 
 router = APIRouter(prefix="/channels", tags=["channels"])
 
 
+def _latest_message_id(db: Session, channel_id: int) -> Optional[int]:
+    """Newest top-level message of a channel; members joining start with it read"""
+    return shard_router.channel_session(db, channel_id).query(Message.id).filter(
+        Message.channel_id == channel_id,
+        Message.parent_message_id.is_(None)
+    ).order_by(desc(Message.created_at), desc(Message.id)).limit(1).scalar()
+
+
 @router.post("/", response_model=ChannelSchema)
 async def create_channel(
     channel: ChannelCreate,
@@ -43,6 +59,9 @@ async def create_channel(
     )
     
     db.add(db_channel)
+    db.flush()
+    # Pick the message shard of the new channel
+    shard_router.place(db, CHANNEL, db_channel.id)
     db.commit()
     db.refresh(db_channel)
     
@@ -55,6 +74,8 @@ async def create_channel(
     )
     db.commit()
     
+    await manager.add_channel_membership(current_user.id, db_channel.id)
+    
     return db_channel
 
 
@@ -192,11 +213,14 @@ async def join_channel(
     db.execute(
         channel_members.insert().values(
             user_id=current_user.id,
-            channel_id=channel_id
+            channel_id=channel_id,
+            last_read_message_id=_latest_message_id(db, channel_id)
         )
     )
     db.commit()
     
+    await manager.add_channel_membership(current_user.id, channel_id)
+    
     return {"message": "Joined channel successfully"}
 
 
@@ -219,9 +243,55 @@ async def leave_channel(
     
     db.commit()
     
+    await manager.remove_channel_membership(current_user.id, [channel_id])
+    
     return {"message": "Left channel successfully"}
 
 
+@router.post("/{channel_id}/read")
+async def mark_channel_read(
+    channel_id: int,
+    message_id: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Move the read marker forward to a message (the newest one by default)"""
+    is_member = db.query(channel_members).filter(
+        channel_members.c.user_id == current_user.id,
+        channel_members.c.channel_id == channel_id
+    ).first()
+    
+    if not is_member:
+        raise HTTPException(status_code=404, detail="Not a member of this channel")
+    
+    if message_id is None:
+        message_id = _latest_message_id(db, channel_id)
+    else:
+        # An id from another channel could put the marker past this channel's newest message
+        in_channel = shard_router.channel_session(db, channel_id).query(Message.id).filter(
+            Message.id == message_id,
+            Message.channel_id == channel_id
+        ).first()
+        if not in_channel:
+            raise HTTPException(status_code=404, detail="Message not found in this channel")
+    
+    # Never move the marker backwards (an older tab reporting late)
+    if message_id is not None:
+        db.execute(
+            channel_members.update().where(
+                channel_members.c.user_id == current_user.id,
+                channel_members.c.channel_id == channel_id,
+                or_(
+                    channel_members.c.last_read_message_id.is_(None),
+                    channel_members.c.last_read_message_id < message_id
+                )
+            ).values(last_read_message_id=message_id)
+        )
+        db.commit()
+    
+    return {"message": "Channel marked as read"}
+
+
 @router.post("/{channel_id}/members/{user_id}")
 async def add_channel_member(
     channel_id: int,
@@ -267,14 +337,79 @@ async def add_channel_member(
     db.execute(
         channel_members.insert().values(
             user_id=user_id,
-            channel_id=channel_id
+            channel_id=channel_id,
+            last_read_message_id=_latest_message_id(db, channel_id)
         )
     )
     db.commit()
     
+    await manager.add_channel_membership(user_id, channel_id)
+    
     return {"message": "Member added successfully"}
 
 
+@router.post("/{channel_id}/members", response_model=MembersAdded)
+async def add_channel_members(
+    channel_id: int,
+    members: ChannelMembersAdd,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Add many users to a channel in one request (users outside the team come back as rejected)"""
+    user_ids = list(dict.fromkeys(members.user_ids))
+    if len(user_ids) > settings.bulk_membership_max_users:
+        raise HTTPException(
+            status_code=400, detail=f"At most {settings.bulk_membership_max_users} users per request"
+        )
+    
+    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    # Check if current user can add members
+    is_creator = channel.created_by == current_user.id
+    is_admin = db.query(team_members).filter(
+        team_members.c.user_id == current_user.id,
+        team_members.c.team_id == channel.team_id,
+        team_members.c.role == "admin"
+    ).first()
+    
+    if not (is_creator or is_admin):
+        raise HTTPException(status_code=403, detail="Permission denied")
+    
+    # One query for which users are in the team, one for which are already members
+    team_user_ids = {
+        row.user_id for row in db.query(team_members.c.user_id).filter(
+            team_members.c.team_id == channel.team_id,
+            team_members.c.user_id.in_(user_ids)
+        )
+    }
+    existing = {
+        row.user_id for row in db.query(channel_members.c.user_id).filter(
+            channel_members.c.channel_id == channel_id,
+            channel_members.c.user_id.in_(user_ids)
+        )
+    }
+    new_user_ids = [user_id for user_id in user_ids if user_id in team_user_ids and user_id not in existing]
+    
+    # Ignores rows a concurrent request inserted since the check above
+    if new_user_ids:
+        last_read_message_id = _latest_message_id(db, channel_id)
+        insert_ignore(db, channel_members, [
+            {"user_id": user_id, "channel_id": channel_id, "last_read_message_id": last_read_message_id}
+            for user_id in new_user_ids
+        ])
+        db.commit()
+        
+        await manager.add_channel_memberships(new_user_ids, channel_id)
+    
+    return {
+        "added": new_user_ids,
+        "already_members": [user_id for user_id in user_ids if user_id in team_user_ids and user_id in existing],
+        "rejected": [user_id for user_id in user_ids if user_id not in team_user_ids],
+    }
+
+
 @router.get("/{channel_id}/members", response_model=List[UserSchema])
 async def get_channel_members(
     channel_id: int,
@@ -296,8 +431,8 @@ async def get_channel_members(
         if not is_member:
             raise HTTPException(status_code=403, detail="Access denied")
     
-    members = db.query(User).join(channel_members).filter(
+    rows = db.query(*USER_COLUMNS).join(channel_members).filter(
         channel_members.c.channel_id == channel_id
     ).all()
     
-    return members
+    return ORJSONResponse(user_rows(rows))
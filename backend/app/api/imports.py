@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from typing import BinaryIO
+import gzip
+import logging
+import tempfile
+import orjson
+from app.auth import get_current_superuser
+from app.database import SessionLocal
+from app.importer import WorkspaceImporter
+from app.models import User
+from app.sharding import close_shard_sessions
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/import", tags=["import"])
+
+
+async def _import_progress(upload: BinaryIO, lines: BinaryIO, owner_id: int):
+    """Progress lines while the import runs in a worker thread, then its report"""
+    db = SessionLocal()
+    try:
+        importer = WorkspaceImporter(db, owner_id)
+        async for progress in iterate_in_threadpool(importer.run(lines)):
+            yield orjson.dumps(progress) + b"\n"
+        await importer.refresh_caches()
+        yield orjson.dumps(importer.report()) + b"\n"
+    finally:
+        close_shard_sessions(db)
+        db.close()
+        upload.close()
+
+
+@router.post("/")
+async def import_workspace(
+    request: Request,
+    current_user: User = Depends(get_current_superuser)
+):
+    """Import users, teams, channels, memberships and messages from an NDJSON body (see app.importer).
+
+    Send the body gzip-compressed with Content-Encoding: gzip for large
+    workspaces. It is spooled to a temporary file, then the response streams
+    NDJSON progress after every commit and a final report ("done", counts
+    and the first skipped records with their line numbers).
+    """
+    upload = tempfile.TemporaryFile()
+    async for chunk in request.stream():
+        upload.write(chunk)
+    upload.seek(0)
+
+    lines = gzip.GzipFile(fileobj=upload) if request.headers.get("content-encoding") == "gzip" else upload
+    logger.info(f"User {current_user.id} started a workspace import")
+    return StreamingResponse(
+        _import_progress(upload, lines, current_user.id), media_type="application/x-ndjson"
+    )
@@ -1,19 +1,140 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, or_, and_
-from typing import List, Optional
+from sqlalchemy import desc, func, or_
+from sqlalchemy.exc import IntegrityError
+from typing import Callable, List, Optional, Tuple
+from datetime import datetime
+import logging
+from app import archive
+from app.config import settings
 from app.database import get_db
-from app.models import Message, DirectMessage, User, Channel, channel_members, team_members
+from app.export import export_lines
+from app.models import (
+    Message, DirectMessage, User, Channel, Conversation, ConversationParticipant,
+    MessageReaction, MessageReactionCount, channel_members, team_members
+)
+from app.notifications import mention_job, parse_mentions
+from app.reactions import reaction_aggregator
 from app.schemas import (
     MessageCreate, MessageUpdate, Message as MessageSchema,
     DirectMessageCreate, DirectMessage as DirectMessageSchema,
-    SearchQuery, SearchResult
+    ConversationSummary, ConversationPage,
+    SearchQuery, SearchResult, ThreadPage, ReactionUpdate
 )
 from app.auth import get_current_active_user
+from app.redis_client import cache_manager, notification_queue, reaction_store
+from app.serializers import DIRECT_MESSAGE_COLUMNS, MESSAGE_COLUMNS, direct_message_rows, message_rows
+from app.sharding import CHANNEL, CONVERSATION, close_shard_sessions, shard_router
+from app.websocket.connection_manager import manager
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
 
+def _check_channel_access(db: Session, channel: Channel, user: User):
+    """Raise 403 unless the user may read and post in the channel"""
+    if channel.is_private:
+        is_member = db.query(channel_members).filter(
+            channel_members.c.user_id == user.id,
+            channel_members.c.channel_id == channel.id
+        ).first()
+
+        if not is_member:
+            raise HTTPException(status_code=403, detail="Not a channel member")
+    else:
+        # Check if user is team member for public channels
+        is_team_member = db.query(team_members).filter(
+            team_members.c.user_id == user.id,
+            team_members.c.team_id == channel.team_id
+        ).first()
+
+        if not is_team_member:
+            raise HTTPException(status_code=403, detail="Not a team member")
+
+
+def _channel_member_ids(db: Session, channel_id: int) -> List[int]:
+    """Users whose event logs receive a channel's message events"""
+    return [
+        row.user_id
+        for row in db.query(channel_members.c.user_id).filter(channel_members.c.channel_id == channel_id)
+    ]
+
+
+def _bump_channel_version(db: Session, channel_id: int) -> int:
+    """Advance the channel's history version inside the current transaction and return it"""
+    db.query(Channel).filter(Channel.id == channel_id).update(
+        # updated_at tracks channel settings, not traffic
+        {Channel.version: Channel.version + 1, Channel.updated_at: Channel.updated_at},
+        synchronize_session=False
+    )
+    return db.query(Channel.version).filter(Channel.id == channel_id).scalar()
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison against an If-None-Match header"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _archive_window(
+    offset: int, per_page: int, hot_rows: int, hot_count: Callable[[], int]
+) -> Optional[Tuple[int, int]]:
+    """Offset and limit into the archive for a page that runs past the hot rows, or None"""
+    if hot_rows == per_page or not archive.archive_enabled():
+        return None
+    # A short page ends the hot rows, so their count is known without asking
+    total = offset + hot_rows if hot_rows else hot_count()
+    return max(0, offset - total), per_page - hot_rows
+
+
+def _message_out(db: Session, shard_db: Session, message_id: int) -> MessageSchema:
+    """A channel message with its sender, read back from its shard"""
+    rows = shard_db.query(*MESSAGE_COLUMNS).filter(Message.id == message_id).all()
+    return MessageSchema.model_validate(message_rows(db, rows)[0])
+
+
+def _direct_message_out(db: Session, shard_db: Session, message_id: int) -> DirectMessageSchema:
+    """A direct message with its sender and receiver, read back from its shard"""
+    rows = shard_db.query(*DIRECT_MESSAGE_COLUMNS).filter(DirectMessage.id == message_id).all()
+    return DirectMessageSchema.model_validate(direct_message_rows(db, rows)[0])
+
+
+def _get_conversation_id(db: Session, user_id: int, other_user_id: int) -> Optional[int]:
+    """Look up the 1:1 conversation between two users by its canonical pair"""
+    user_low_id, user_high_id = sorted((user_id, other_user_id))
+    return db.query(Conversation.id).filter(
+        Conversation.user_low_id == user_low_id,
+        Conversation.user_high_id == user_high_id
+    ).scalar()
+
+
+def _get_or_create_conversation(db: Session, user_id: int, other_user_id: int) -> int:
+    """Return the 1:1 conversation id for two users, creating it with its participants"""
+    conversation_id = _get_conversation_id(db, user_id, other_user_id)
+    if conversation_id:
+        return conversation_id
+    
+    user_low_id, user_high_id = sorted((user_id, other_user_id))
+    conversation = Conversation(user_low_id=user_low_id, user_high_id=user_high_id)
+    db.add(conversation)
+    try:
+        db.flush()
+    except IntegrityError:
+        # The other participant created it concurrently
+        db.rollback()
+        return _get_conversation_id(db, user_id, other_user_id)
+    
+    shard_router.place(db, CONVERSATION, conversation.id)
+    for participant_id in {user_low_id, user_high_id}:
+        db.add(ConversationParticipant(conversation_id=conversation.id, user_id=participant_id))
+    db.flush()
+    return conversation.id
+
+
 @router.post("/channel", response_model=MessageSchema)
 async def send_channel_message(
     message: MessageCreate,
@@ -30,25 +151,20 @@ async def send_channel_message(
         raise HTTPException(status_code=404, detail="Channel not found")
     
     # Check permissions
-    if channel.is_private:
-        is_member = db.query(channel_members).filter(
-            channel_members.c.user_id == current_user.id,
-            channel_members.c.channel_id == message.channel_id
-        ).first()
-        
-        if not is_member:
-            raise HTTPException(status_code=403, detail="Not a channel member")
-    else:
-        # Check if user is team member for public channels
-        is_team_member = db.query(team_members).filter(
-            team_members.c.user_id == current_user.id,
-            team_members.c.team_id == channel.team_id
-        ).first()
-        
-        if not is_team_member:
-            raise HTTPException(status_code=403, detail="Not a team member")
+    _check_channel_access(db, channel, current_user)
+    
+    shard_db = shard_router.channel_session(db, channel.id, write=True)
+    
+    # Replies attach to a top-level message in the same channel
+    if message.parent_message_id:
+        parent = shard_db.query(Message).filter(Message.id == message.parent_message_id).first()
+        if not parent or parent.channel_id != channel.id:
+            raise HTTPException(status_code=404, detail="Parent message not found")
+        if parent.parent_message_id:
+            raise HTTPException(status_code=400, detail="Cannot reply to a reply")
     
     db_message = Message(
+        id=shard_router.allocate_message_id(db, channel.id),
         content=message.content,
         message_type=message.message_type,
         file_url=message.file_url,
@@ -57,11 +173,50 @@ async def send_channel_message(
         parent_message_id=message.parent_message_id
     )
     
-    db.add(db_message)
+    shard_db.add(db_message)
+    shard_db.flush()
+    message_id = db_message.id
+    if message.parent_message_id:
+        # Single UPDATE so concurrent replies cannot lose increments
+        shard_db.query(Message).filter(Message.id == message.parent_message_id).update(
+            {
+                Message.reply_count: Message.reply_count + 1,
+                Message.last_reply_at: func.now()
+            },
+            synchronize_session=False
+        )
+    else:
+        # Senders have read their own messages
+        db.execute(
+            channel_members.update().where(
+                channel_members.c.user_id == current_user.id,
+                channel_members.c.channel_id == channel.id,
+                or_(
+                    channel_members.c.last_read_message_id.is_(None),
+                    channel_members.c.last_read_message_id < message_id
+                )
+            ).values(last_read_message_id=message_id)
+        )
+    version = _bump_channel_version(db, channel.id)
     db.commit()
-    db.refresh(db_message)
-    
-    return db_message
+    message_out = _message_out(db, shard_db, message_id)
+    
+    message_data = message_out.model_dump(mode="json")
+    await manager.publish_to_channel(channel.id, _channel_member_ids(db, channel.id), {
+        "type": "new_message",
+        "data": message_data,
+        "version": version
+    })
+    
+    # Notifications are fanned out by app.notifications, off the request path
+    mentions = parse_mentions(message.content)
+    if mentions:
+        try:
+            await notification_queue.enqueue(mention_job(message_data, mentions))
+        except Exception as e:
+            logger.error(f"Error queueing mention notifications for message {message_id}: {e}")
+    
+    return message_out
 
 
 @router.post("/direct", response_model=DirectMessageSchema)
@@ -76,59 +231,201 @@ async def send_direct_message(
     if not receiver:
         raise HTTPException(status_code=404, detail="Receiver not found")
     
+    conversation_id = _get_or_create_conversation(db, current_user.id, receiver.id)
+    shard_db = shard_router.conversation_session(db, conversation_id, write=True)
+    
     db_message = DirectMessage(
+        id=shard_router.allocate_direct_message_id(db, conversation_id),
         content=message.content,
         message_type=message.message_type,
         file_url=message.file_url,
+        conversation_id=conversation_id,
         sender_id=current_user.id,
         receiver_id=message.receiver_id
     )
     
-    db.add(db_message)
+    shard_db.add(db_message)
+    shard_db.flush()
+    message_id = db_message.id
+    
+    # Move the conversation to the top of both inboxes
+    db.query(Conversation).filter(Conversation.id == conversation_id).update(
+        {Conversation.last_message_id: message_id, Conversation.last_message_at: func.now()},
+        synchronize_session=False
+    )
+    db.query(ConversationParticipant).filter(
+        ConversationParticipant.conversation_id == conversation_id
+    ).update(
+        {ConversationParticipant.last_message_id: message_id},
+        synchronize_session=False
+    )
+    # Senders have read their own messages
+    db.query(ConversationParticipant).filter(
+        ConversationParticipant.conversation_id == conversation_id,
+        ConversationParticipant.user_id == current_user.id
+    ).update(
+        {ConversationParticipant.last_read_message_id: message_id},
+        synchronize_session=False
+    )
+    if receiver.id != current_user.id:
+        db.query(ConversationParticipant).filter(
+            ConversationParticipant.conversation_id == conversation_id,
+            ConversationParticipant.user_id == receiver.id
+        ).update(
+            {ConversationParticipant.unread_count: ConversationParticipant.unread_count + 1},
+            synchronize_session=False
+        )
     db.commit()
-    db.refresh(db_message)
+    message_out = _direct_message_out(db, shard_db, message_id)
+    
+    await manager.publish({current_user.id, receiver.id}, {
+        "type": "new_direct_message",
+        "data": message_out.model_dump(mode="json")
+    })
     
-    return db_message
+    return message_out
 
 
 @router.get("/channel/{channel_id}", response_model=List[MessageSchema])
 async def get_channel_messages(
     channel_id: int,
+    request: Request,
     page: int = Query(1, ge=1),
     per_page: int = Query(50, ge=1, le=100),
+    include_replies: bool = Query(False),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get messages from a channel with pagination"""
+    """Get top-level messages from a channel with pagination.
+
+    A page only changes when the channel's version does, so the version is
+    the ETag (a matching If-None-Match gets 304) and the Redis cache key.
+    Sender profiles embedded in a page may lag behind profile edits until
+    the channel changes or the cached page expires.
+    """
     channel = db.query(Channel).filter(Channel.id == channel_id).first()
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     
     # Check permissions
-    if channel.is_private:
-        is_member = db.query(channel_members).filter(
-            channel_members.c.user_id == current_user.id,
-            channel_members.c.channel_id == channel_id
-        ).first()
-        
-        if not is_member:
-            raise HTTPException(status_code=403, detail="Not a channel member")
-    else:
-        # Check if user is team member for public channels
-        is_team_member = db.query(team_members).filter(
-            team_members.c.user_id == current_user.id,
-            team_members.c.team_id == channel.team_id
-        ).first()
-        
-        if not is_team_member:
-            raise HTTPException(status_code=403, detail="Not a team member")
+    _check_channel_access(db, channel, current_user)
+    
+    headers = {"ETag": f'"{channel.id}.{channel.version}"', "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    
+    page_key = f"{int(include_replies)}:{page}:{per_page}"
+    if settings.history_cache_ttl_seconds > 0:
+        try:
+            body = await cache_manager.get_cached_channel_page(channel.id, channel.version, page_key)
+            if body is not None:
+                return Response(content=body, media_type="application/json", headers=headers)
+        except Exception as e:
+            logger.error(f"Error reading cached page of channel {channel.id}: {e}")
+    
+    shard_db = shard_router.channel_session(db, channel.id)
+    query = shard_db.query(*MESSAGE_COLUMNS).filter(Message.channel_id == channel_id)
+    if not include_replies:
+        # Replies are fetched per thread and summarised by reply_count
+        query = query.filter(Message.parent_message_id.is_(None))
     
     offset = (page - 1) * per_page
-    messages = db.query(Message).filter(
-        Message.channel_id == channel_id
-    ).order_by(desc(Message.created_at)).offset(offset).limit(per_page).all()
+    rows = query.order_by(desc(Message.created_at)).offset(offset).limit(per_page).all()
+    messages = message_rows(db, rows)
+    
+    if archive.archive_enabled():
+        messages = archive.channel_history(db, query, channel_id, include_replies, offset, per_page, messages)
+    
+    response = ORJSONResponse(messages, headers=headers)
+    if settings.history_cache_ttl_seconds > 0:
+        try:
+            await cache_manager.cache_channel_page(
+                channel.id, channel.version, page_key, response.body.decode(), settings.history_cache_ttl_seconds
+            )
+        except Exception as e:
+            logger.error(f"Error caching page of channel {channel.id}: {e}")
+    return response
+
+
+@router.get("/channel/{channel_id}/export")
+async def export_channel_messages(
+    channel_id: int,
+    after_id: int = Query(0, ge=0),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    include_replies: bool = Query(True),
+    thread_id: Optional[int] = Query(None),
+    gzip: bool = Query(False),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Stream a channel's history as NDJSON, oldest first.
     
-    return messages
+    One message per line, optionally only those created in [since, until),
+    top-level only, or one thread (root and replies). An interrupted export
+    resumes with after_id set to the id of the last line received. With
+    gzip=true the body is gzip-compressed (Content-Encoding: gzip).
+    """
+    channel = db.query(Channel).filter(Channel.id == channel_id).first()
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    # Check permissions
+    _check_channel_access(db, channel, current_user)
+    
+    headers = {"Content-Disposition": f'attachment; filename="channel-{channel.id}.ndjson"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    lines = export_lines(
+        channel.id, compress=gzip, after_id=after_id, since=since, until=until,
+        include_replies=include_replies, thread_id=thread_id
+    )
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+
+
+@router.get("/{message_id}/thread", response_model=ThreadPage)
+async def get_thread(
+    message_id: int,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get a thread's parent message and a page of its replies, oldest first"""
+    shard_db = shard_router.message_session(db, message_id)
+    parents = message_rows(db, shard_db.query(*MESSAGE_COLUMNS).filter(Message.id == message_id))
+    if parents:
+        parent = MessageSchema.model_validate(parents[0])
+        channel = db.query(Channel).filter(Channel.id == parent.channel_id).first()
+        # Check permissions
+        _check_channel_access(db, channel, current_user)
+        
+        # Keyset page over the (parent_message_id, id) index
+        rows = shard_db.query(*MESSAGE_COLUMNS).filter(
+            Message.parent_message_id == message_id,
+            Message.id > after_id
+        ).order_by(Message.id).limit(limit + 1)
+        replies = [MessageSchema.model_validate(reply) for reply in message_rows(db, rows)]
+    else:
+        # Threads are archived whole, root and replies together
+        archived = archive.get_message(db, message_id) if archive.archive_enabled() else None
+        if not archived:
+            raise HTTPException(status_code=404, detail="Message not found")
+        
+        parent = MessageSchema.model_validate(archived)
+        channel = db.query(Channel).filter(Channel.id == parent.channel_id).first()
+        _check_channel_access(db, channel, current_user)
+        replies = [
+            MessageSchema.model_validate(reply)
+            for reply in archive.thread_replies(db, message_id, after_id, limit + 1)
+        ]
+    
+    next_after_id = None
+    if len(replies) > limit:
+        replies = replies[:limit]
+        next_after_id = replies[-1].id
+    
+    return ThreadPage(parent=parent, replies=replies, next_after_id=next_after_id)
 
 
 @router.get("/direct/{user_id}", response_model=List[DirectMessageSchema])
@@ -140,18 +437,115 @@ async def get_direct_messages(
     current_user: User = Depends(get_current_active_user)
 ):
     """Get direct messages between current user and another user"""
+    conversation_id = _get_conversation_id(db, current_user.id, user_id)
+    if not conversation_id:
+        return []
+    
     offset = (page - 1) * per_page
+    shard_db = shard_router.conversation_session(db, conversation_id)
+    query = shard_db.query(*DIRECT_MESSAGE_COLUMNS).filter(DirectMessage.conversation_id == conversation_id)
+    rows = query.order_by(desc(DirectMessage.id)).offset(offset).limit(per_page).all()
+    messages = direct_message_rows(db, rows)
     
-    messages = db.query(DirectMessage).filter(
-        or_(
-            and_(DirectMessage.sender_id == current_user.id, DirectMessage.receiver_id == user_id),
-            and_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == current_user.id)
-        )
-    ).order_by(desc(DirectMessage.created_at)).offset(offset).limit(per_page).all()
+    # Older history continues in the archive
+    window = _archive_window(offset, per_page, len(rows), query.count)
+    if window:
+        messages.extend(archive.direct_messages(db, conversation_id, *window))
     
     return messages
 
 
+@router.get("/conversations", response_model=ConversationPage)
+async def get_conversations(
+    before_id: Optional[int] = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """List the current user's DM conversations, most recently active first"""
+    query = db.query(ConversationParticipant).filter(
+        ConversationParticipant.user_id == current_user.id,
+        ConversationParticipant.last_message_id.isnot(None)
+    )
+    if before_id:
+        query = query.filter(ConversationParticipant.last_message_id < before_id)
+    participants = query.order_by(desc(ConversationParticipant.last_message_id)).limit(limit + 1).all()
+    
+    next_before_id = None
+    if len(participants) > limit:
+        participants = participants[:limit]
+        next_before_id = participants[-1].last_message_id
+    if not participants:
+        return ConversationPage(conversations=[])
+    
+    conversations = {
+        conversation.id: conversation
+        for conversation in db.query(Conversation).filter(
+            Conversation.id.in_([participant.conversation_id for participant in participants])
+        )
+    }
+    other_user_ids = {}
+    for conversation in conversations.values():
+        other_user_ids[conversation.id] = (
+            conversation.user_high_id if conversation.user_low_id == current_user.id else conversation.user_low_id
+        )
+    users = {user.id: user for user in db.query(User).filter(User.id.in_(set(other_user_ids.values())))}
+    users[current_user.id] = current_user
+    # Each from its conversation's shard
+    last_message_ids = {participant.conversation_id: participant.last_message_id for participant in participants}
+    last_messages = {}
+    for shard_db, conversation_ids in shard_router.sessions(db, CONVERSATION, list(last_message_ids)):
+        rows = shard_db.query(*DIRECT_MESSAGE_COLUMNS).filter(
+            DirectMessage.id.in_([last_message_ids[conversation_id] for conversation_id in conversation_ids])
+        )
+        last_messages.update((message["id"], message) for message in direct_message_rows(db, rows))
+    
+    return ConversationPage(
+        conversations=[
+            ConversationSummary(
+                id=participant.conversation_id,
+                other_user=users[other_user_ids[participant.conversation_id]],
+                last_message=last_messages.get(participant.last_message_id),
+                last_read_message_id=participant.last_read_message_id,
+                unread_count=participant.unread_count
+            )
+            for participant in participants
+        ],
+        next_before_id=next_before_id
+    )
+
+
+@router.post("/conversations/{conversation_id}/read")
+async def mark_conversation_read(
+    conversation_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Mark every message in a conversation as read by the current user"""
+    participant = db.query(ConversationParticipant).filter(
+        ConversationParticipant.conversation_id == conversation_id,
+        ConversationParticipant.user_id == current_user.id
+    ).first()
+    if not participant:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    participant.last_read_message_id = participant.last_message_id
+    participant.unread_count = 0
+    shard_db = shard_router.conversation_session(db, conversation_id, write=True)
+    shard_db.query(DirectMessage).filter(
+        DirectMessage.conversation_id == conversation_id,
+        DirectMessage.receiver_id == current_user.id,
+        DirectMessage.is_read == False
+    ).update(
+        {DirectMessage.is_read: True, DirectMessage.read_at: func.now()},
+        synchronize_session=False
+    )
+    
+    db.commit()
+    
+    return {"message": "Conversation marked as read"}
+
+
 @router.put("/{message_id}", response_model=MessageSchema)
 async def update_message(
     message_id: int,
@@ -160,7 +554,8 @@ async def update_message(
     current_user: User = Depends(get_current_active_user)
 ):
     """Update a message (edit)"""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    shard_db = shard_router.message_session(db, message_id, write=True)
+    message = shard_db.query(Message).filter(Message.id == message_id).first()
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
@@ -171,11 +566,19 @@ async def update_message(
     message.content = message_update.content
     message.is_edited = True
     message.edited_at = func.now()
+    channel_id = message.channel_id
+    version = _bump_channel_version(db, channel_id)
     
     db.commit()
-    db.refresh(message)
+    message_out = _message_out(db, shard_db, message_id)
+    
+    await manager.publish_to_channel(channel_id, _channel_member_ids(db, channel_id), {
+        "type": "message_updated",
+        "data": message_out.model_dump(mode="json"),
+        "version": version
+    })
     
-    return message
+    return message_out
 
 
 @router.delete("/{message_id}")
@@ -185,7 +588,8 @@ async def delete_message(
     current_user: User = Depends(get_current_active_user)
 ):
     """Delete a message"""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    shard_db = shard_router.message_session(db, message_id, write=True)
+    message = shard_db.query(Message).filter(Message.id == message_id).first()
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
@@ -202,12 +606,141 @@ async def delete_message(
         if not is_admin:
             raise HTTPException(status_code=403, detail="Permission denied")
     
-    db.delete(message)
+    deleted_ids = [message.id]
+    if message.parent_message_id:
+        # Keep the parent's thread summary in step (MySQL cannot read the
+        # table being updated in a subquery, so the latest reply is looked up first)
+        last_reply_at = shard_db.query(func.max(Message.created_at)).filter(
+            Message.parent_message_id == message.parent_message_id,
+            Message.id != message.id
+        ).scalar()
+        shard_db.query(Message).filter(Message.id == message.parent_message_id).update(
+            {
+                Message.reply_count: Message.reply_count - 1,
+                Message.last_reply_at: last_reply_at
+            },
+            synchronize_session=False
+        )
+    elif message.reply_count:
+        # Deleting a thread root removes its replies too
+        deleted_ids += [
+            row.id for row in shard_db.query(Message.id).filter(Message.parent_message_id == message.id)
+        ]
+        shard_db.query(Message).filter(Message.parent_message_id == message.id).delete(
+            synchronize_session=False
+        )
+    
+    # Reactions live in the main database, keyed by message id
+    for model in (MessageReaction, MessageReactionCount):
+        db.query(model).filter(model.message_id.in_(deleted_ids)).delete(synchronize_session=False)
+    
+    deleted = {
+        "id": message.id,
+        "channel_id": message.channel_id,
+        "parent_message_id": message.parent_message_id
+    }
+    shard_db.delete(message)
+    version = _bump_channel_version(db, deleted["channel_id"])
     db.commit()
     
+    await manager.publish_to_channel(deleted["channel_id"], _channel_member_ids(db, deleted["channel_id"]), {
+        "type": "message_deleted",
+        "data": deleted,
+        "version": version
+    })
+    
+    try:
+        await reaction_store.forget(deleted_ids)
+    except Exception as e:
+        logger.error(f"Error dropping reactions of message {message_id}: {e}")
+    
     return {"message": "Message deleted successfully"}
 
 
+def _release_connections(db: Session):
+    """Hand the request's database connections back before waiting on Redis; the session stays usable.
+
+    During a burst of reactions every request would otherwise hold a pooled
+    connection for its whole duration and new ones would wait for it.
+    """
+    close_shard_sessions(db)
+    db.close()
+
+
+async def _load_reactions(db: Session, message_id: int) -> int:
+    """Load a channel message's persisted reactions into Redis; returns its channel id"""
+    shard_db = shard_router.message_session(db, message_id)
+    channel_id = shard_db.query(Message.channel_id).filter(Message.id == message_id).scalar()
+    if channel_id is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    reactions = db.query(MessageReaction.user_id, MessageReaction.emoji).filter(
+        MessageReaction.message_id == message_id
+    ).all()
+    _release_connections(db)
+    await reaction_store.load(message_id, channel_id, reactions)
+    return channel_id
+
+
+async def _check_reaction_access(db: Session, user: User, channel_id: int):
+    """Raise 403 unless the user can read the channel; members are found in their cached channel list"""
+    if channel_id not in await manager.get_user_channel_ids(user.id):
+        channel = db.query(Channel).filter(Channel.id == channel_id).first()
+        _check_channel_access(db, channel, user)
+        _release_connections(db)
+
+
+async def _react(db: Session, user: User, message_id: int, emoji: str, add: bool) -> ReactionUpdate:
+    """Add or remove a reaction in Redis; app.reactions broadcasts and persists it"""
+    if not emoji.strip():
+        raise HTTPException(status_code=422, detail="Emoji must not be blank")
+    _release_connections(db)
+    try:
+        channel_id = await reaction_store.channel_of(message_id)
+        if channel_id is None:
+            channel_id = await _load_reactions(db, message_id)
+        await _check_reaction_access(db, user, channel_id)
+        result = await reaction_store.react(channel_id, message_id, user.id, emoji, add)
+        if result is None:
+            # Expired from Redis (or the message was deleted) since it was looked up
+            channel_id = await _load_reactions(db, message_id)
+            await _check_reaction_access(db, user, channel_id)
+            result = await reaction_store.react(channel_id, message_id, user.id, emoji, add)
+        if result is None:
+            raise HTTPException(status_code=409, detail="Message changed, try again")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error updating reactions of message {message_id}: {e}")
+        raise HTTPException(status_code=503, detail="Reactions are unavailable")
+    
+    changed, count = result
+    if changed:
+        reaction_aggregator.record(channel_id, message_id, emoji)
+    return ReactionUpdate(message_id=message_id, emoji=emoji, count=count, changed=changed)
+
+
+@router.put("/{message_id}/reactions/{emoji}", response_model=ReactionUpdate)
+async def add_reaction(
+    message_id: int,
+    emoji: str = Path(..., max_length=64),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """React to a channel message; reacting again with the same emoji changes nothing"""
+    return await _react(db, current_user, message_id, emoji, add=True)
+
+
+@router.delete("/{message_id}/reactions/{emoji}", response_model=ReactionUpdate)
+async def remove_reaction(
+    message_id: int,
+    emoji: str = Path(..., max_length=64),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Take back the current user's reaction"""
+    return await _react(db, current_user, message_id, emoji, add=False)
+
+
 @router.post("/search", response_model=SearchResult)
 async def search_messages(
     search_query: SearchQuery,
@@ -216,40 +749,63 @@ async def search_messages(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Search messages with filters"""
-    query = db.query(Message).join(Channel).join(team_members).filter(
-        team_members.c.user_id == current_user.id
-    )
-    
-    # Apply search filters
-    if search_query.query:
-        query = query.filter(Message.content.contains(search_query.query))
-    
+    """Search messages with filters, on every shard that holds one of the user's channels"""
+    channel_ids = [
+        row.id for row in db.query(Channel.id).join(
+            team_members, team_members.c.team_id == Channel.team_id
+        ).filter(team_members.c.user_id == current_user.id)
+    ]
     if search_query.channel_id:
-        query = query.filter(Message.channel_id == search_query.channel_id)
-    
-    if search_query.user_id:
-        query = query.filter(Message.sender_id == search_query.user_id)
-    
-    if search_query.start_date:
-        query = query.filter(Message.created_at >= search_query.start_date)
+        channel_ids = [channel_id for channel_id in channel_ids if channel_id == search_query.channel_id]
     
-    if search_query.end_date:
-        query = query.filter(Message.created_at <= search_query.end_date)
+    queries = []
+    for shard_db, shard_channel_ids in shard_router.sessions(db, CHANNEL, channel_ids):
+        query = shard_db.query(*MESSAGE_COLUMNS).filter(Message.channel_id.in_(shard_channel_ids))
+        
+        # Apply search filters
+        if search_query.query:
+            query = query.filter(Message.content.contains(search_query.query))
+        
+        if search_query.user_id:
+            query = query.filter(Message.sender_id == search_query.user_id)
+        
+        if search_query.start_date:
+            query = query.filter(Message.created_at >= search_query.start_date)
+        
+        if search_query.end_date:
+            query = query.filter(Message.created_at <= search_query.end_date)
+        
+        queries.append(query)
     
     # Get total count
-    total_count = query.count()
+    total_count = sum(query.count() for query in queries)
     
     # Apply pagination
     offset = (page - 1) * per_page
-    messages = query.order_by(desc(Message.created_at)).offset(offset).limit(per_page).all()
-    
-    return SearchResult(
-        messages=messages,
-        total_count=total_count,
-        page=page,
-        per_page=per_page
-    )
+    if len(queries) == 1:
+        rows = queries[0].order_by(desc(Message.created_at)).offset(offset).limit(per_page).all()
+    else:
+        # The first offset + per_page of each shard, merged newest first
+        rows = sorted(
+            (row for query in queries for row in query.order_by(desc(Message.created_at)).limit(offset + per_page)),
+            key=lambda row: (row.created_at, row.id),
+            reverse=True
+        )[offset:offset + per_page]
+    messages = message_rows(db, rows)
+    
+    if archive.archive_enabled():
+        archived_count, messages = archive.search_messages(
+            db, queries, channel_ids, search_query, offset, per_page, messages
+        )
+        total_count += archived_count
+    
+    # Same body as SearchResult, built from row tuples
+    return ORJSONResponse({
+        "messages": messages,
+        "total_count": total_count,
+        "page": page,
+        "per_page": per_page
+    })
 
 
 @router.post("/direct/{message_id}/mark-read")
@@ -259,7 +815,8 @@ async def mark_direct_message_read(
     current_user: User = Depends(get_current_active_user)
 ):
     """Mark a direct message as read"""
-    message = db.query(DirectMessage).filter(DirectMessage.id == message_id).first()
+    shard_db = shard_router.direct_message_session(db, message_id, write=True)
+    message = shard_db.query(DirectMessage).filter(DirectMessage.id == message_id).first()
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
@@ -267,11 +824,19 @@ async def mark_direct_message_read(
     if message.receiver_id != current_user.id:
         raise HTTPException(status_code=403, detail="Can only mark own messages as read")
     
+    if not message.is_read and message.conversation_id:
+        db.query(ConversationParticipant).filter(
+            ConversationParticipant.conversation_id == message.conversation_id,
+            ConversationParticipant.user_id == current_user.id,
+            ConversationParticipant.unread_count > 0
+        ).update(
+            {ConversationParticipant.unread_count: ConversationParticipant.unread_count - 1},
+            synchronize_session=False
+        )
+    
     message.is_read = True
     message.read_at = func.now()
     
     db.commit()
     
     return {"message": "Message marked as read"}
-
-from sqlalchemy.sql import func
@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import desc, func
+from typing import Optional
+from app.database import get_db
+from app.models import Notification, User
+from app.schemas import NotificationPage
+from app.auth import get_current_active_user
+
+router = APIRouter(prefix="/notifications", tags=["notifications"])
+
+
+@router.get("/", response_model=NotificationPage)
+async def get_notifications(
+    before_id: Optional[int] = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=100),
+    unread_only: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """List the @mentions that reached the current user while offline, newest first"""
+    query = db.query(Notification).filter(Notification.user_id == current_user.id)
+    if unread_only:
+        query = query.filter(Notification.read_at.is_(None))
+    if before_id:
+        query = query.filter(Notification.id < before_id)
+    notifications = query.order_by(desc(Notification.id)).limit(limit + 1).all()
+    
+    next_before_id = None
+    if len(notifications) > limit:
+        notifications = notifications[:limit]
+        next_before_id = notifications[-1].id
+    
+    unread_count = db.query(func.count(Notification.id)).filter(
+        Notification.user_id == current_user.id,
+        Notification.read_at.is_(None)
+    ).scalar()
+    
+    return NotificationPage(notifications=notifications, unread_count=unread_count, next_before_id=next_before_id)
+
+
+@router.post("/read")
+async def mark_notifications_read(
+    up_to_id: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Mark the current user's notifications read, up to an id (all of them by default)"""
+    query = db.query(Notification).filter(
+        Notification.user_id == current_user.id,
+        Notification.read_at.is_(None)
+    )
+    if up_to_id:
+        query = query.filter(Notification.id <= up_to_id)
+    updated = query.update({Notification.read_at: func.now()}, synchronize_session=False)
+    db.commit()
+    
+    return {"message": "Notifications marked as read", "updated": updated}
@@ -1,10 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from app.database import get_db
-from app.models import Team, User, team_members
-from app.schemas import TeamCreate, TeamUpdate, Team as TeamSchema, User as UserSchema
+from app.config import settings
+from app.database import get_db, insert_ignore
+from app.models import Team, User, Channel, team_members
+from app.schemas import MembersAdded, TeamCreate, TeamMembersAdd, TeamUpdate, Team as TeamSchema, User as UserSchema
 from app.auth import get_current_active_user
+from app.redis_client import cache_manager, directory_manager
+from app.serializers import USER_COLUMNS, user_rows
+from app.websocket.connection_manager import manager
 
 router = APIRouter(prefix="/teams", tags=["teams"])
 
@@ -37,6 +42,12 @@ async def create_team(
     )
     db.commit()
     
+    # The creator is the only member, so the new team's index is complete
+    await directory_manager.build_team_index(
+        db_team.id, [(current_user.id, current_user.username, current_user.full_name)]
+    )
+    await cache_manager.invalidate_bootstrap(current_user.id)
+    
     return db_team
 
 
@@ -151,9 +162,64 @@ async def add_team_member(
     )
     db.commit()
     
+    await directory_manager.add_team_member(team_id, user.id, user.username, user.full_name)
+    await cache_manager.invalidate_bootstrap(user.id)
+    
     return {"message": "Member added successfully"}
 
 
+@router.post("/{team_id}/members", response_model=MembersAdded)
+async def add_team_members(
+    team_id: int,
+    members: TeamMembersAdd,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Add many users to a team in one request (users that do not exist come back as rejected)"""
+    user_ids = list(dict.fromkeys(members.user_ids))
+    if len(user_ids) > settings.bulk_membership_max_users:
+        raise HTTPException(
+            status_code=400, detail=f"At most {settings.bulk_membership_max_users} users per request"
+        )
+    
+    # Check if user is admin
+    is_admin = db.query(team_members).filter(
+        team_members.c.user_id == current_user.id,
+        team_members.c.team_id == team_id,
+        team_members.c.role == "admin"
+    ).first()
+    
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    # One query for which users exist, one for which are already members
+    users = db.query(User.id, User.username, User.full_name).filter(User.id.in_(user_ids)).all()
+    existing = {
+        row.user_id for row in db.query(team_members.c.user_id).filter(
+            team_members.c.team_id == team_id,
+            team_members.c.user_id.in_(user_ids)
+        )
+    }
+    new_users = [user for user in users if user.id not in existing]
+    
+    # Ignores rows a concurrent request inserted since the check above
+    insert_ignore(db, team_members, [
+        {"user_id": user.id, "team_id": team_id, "role": members.role} for user in new_users
+    ])
+    db.commit()
+    
+    if new_users:
+        await directory_manager.add_team_members(team_id, new_users)
+        await cache_manager.invalidate_bootstrap(*[user.id for user in new_users])
+    
+    found = {user.id for user in users}
+    return {
+        "added": [user.id for user in new_users],
+        "already_members": [user_id for user_id in user_ids if user_id in existing],
+        "rejected": [user_id for user_id in user_ids if user_id not in found],
+    }
+
+
 @router.delete("/{team_id}/members/{user_id}")
 async def remove_team_member(
     team_id: int,
@@ -185,6 +251,12 @@ async def remove_team_member(
     
     db.commit()
     
+    await directory_manager.remove_team_member(team_id, user_id)
+    
+    # Losing the team revokes access to all of its channels
+    team_channel_ids = [row.id for row in db.query(Channel.id).filter(Channel.team_id == team_id)]
+    await manager.remove_channel_membership(user_id, team_channel_ids)
+    
     return {"message": "Member removed successfully"}
 
 
@@ -204,8 +276,8 @@ async def get_team_members(
     if not is_member:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    members = db.query(User).join(team_members).filter(
+    rows = db.query(*USER_COLUMNS).join(team_members).filter(
         team_members.c.team_id == team_id
     ).all()
     
-    return members
+    return ORJSONResponse(user_rows(rows))
@@ -1,11 +1,11 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.database import get_db
-from app.models import User
-from app.schemas import User as UserSchema, UserPresence
+from app.models import User, team_members
+from app.schemas import User as UserSchema, UserPresence, UserUpdate, UserDirectoryPage
 from app.auth import get_current_active_user
-from app.redis_client import presence_manager
+from app.redis_client import cache_manager, presence_manager, directory_manager
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -18,14 +18,85 @@ async def get_current_user_profile(
     return current_user
 
 
-@router.get("/", response_model=List[UserSchema])
+@router.put("/me", response_model=UserSchema)
+async def update_current_user_profile(
+    user_update: UserUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Update current user profile"""
+    for field, value in user_update.dict(exclude_unset=True).items():
+        setattr(current_user, field, value)
+    
+    db.commit()
+    db.refresh(current_user)
+    
+    # Keep the mention directory in sync with the new name
+    team_ids = [
+        row.team_id for row in
+        db.query(team_members.c.team_id).filter(team_members.c.user_id == current_user.id)
+    ]
+    await directory_manager.index_user(current_user.id, current_user.username, current_user.full_name, team_ids)
+    await cache_manager.invalidate_bootstrap(current_user.id)
+    
+    return current_user
+
+
+@router.get("/", response_model=UserDirectoryPage)
 async def get_users(
+    q: Optional[str] = Query(None, max_length=100, description="Username or name prefix"),
+    team_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get all users (for mentions, etc.)"""
-    users = db.query(User).filter(User.is_active == True).all()
-    return users
+    """Page through users in the caller's teams, optionally by prefix (for mentions, etc.)"""
+    team_ids = [
+        row.team_id for row in
+        db.query(team_members.c.team_id).filter(team_members.c.user_id == current_user.id)
+    ]
+    if team_id is not None:
+        if team_id not in team_ids:
+            raise HTTPException(status_code=403, detail="Not a team member")
+        team_ids = [team_id]
+    
+    if not team_ids:
+        return UserDirectoryPage(users=[])
+    
+    if q and q.strip():
+        # Rebuild any team index Redis no longer has before searching
+        for missing_team_id in await directory_manager.missing_team_indexes(team_ids):
+            members = db.query(User.id, User.username, User.full_name).join(team_members).filter(
+                team_members.c.team_id == missing_team_id
+            ).all()
+            await directory_manager.build_team_index(missing_team_id, members)
+        
+        try:
+            user_ids, next_cursor = await directory_manager.search(team_ids, q.strip(), limit, cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        
+        users_by_id = {
+            user.id: user for user in
+            db.query(User).filter(User.id.in_(user_ids), User.is_active == True)
+        } if user_ids else {}
+        users = [users_by_id[user_id] for user_id in user_ids if user_id in users_by_id]
+        return UserDirectoryPage(users=users, next_cursor=next_cursor)
+    
+    # Plain listing: keyset pagination on username
+    query = db.query(User).filter(
+        User.is_active == True,
+        User.id.in_(
+            db.query(team_members.c.user_id).filter(team_members.c.team_id.in_(team_ids))
+        )
+    )
+    if cursor:
+        query = query.filter(User.username > cursor)
+    users = query.order_by(User.username).limit(limit + 1).all()
+    
+    next_cursor = users[limit - 1].username if len(users) > limit else None
+    return UserDirectoryPage(users=users[:limit], next_cursor=next_cursor)
 
 
 @router.get("/{user_id}", response_model=UserSchema)
@@ -0,0 +1,313 @@
+"""Cold storage for old channel and direct messages.
+
+`python -m app.archive` moves messages older than ARCHIVE_AFTER_DAYS out of
+the hot `messages` and `direct_messages` tables (of every message shard, see
+app.sharding) into the archive database (ARCHIVE_DATABASE_URL), in batches. A thread moves as a whole once both its
+root and its latest reply are past the cutoff, and a conversation's latest
+message stays hot. Archived rows keep their ids and are read-only.
+
+Channel history and search merge archived messages into their pages;
+thread and direct message reads fall through to the archive past the hot
+rows.
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import argparse
+import logging
+
+from sqlalchemy import Column, DateTime, Index, MetaData, Table, create_engine, delete, desc, func, insert, or_, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Query, Session
+
+from app.config import settings
+from app.models import Channel, Conversation, DirectMessage, Message
+from app.schemas import SearchQuery
+from app.serializers import DIRECT_MESSAGE_FIELDS, MESSAGE_COLUMNS, MESSAGE_FIELDS, direct_message_rows, message_rows
+from app.sharding import close_shard_sessions, shard_router
+
+logger = logging.getLogger(__name__)
+
+archive_metadata = MetaData()
+
+
+def _archive_table(name: str, source: Table, *indexes: Index) -> Table:
+    """Same columns as the hot table (ids kept), plus when each row was archived"""
+    columns = [
+        Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable, autoincrement=False)
+        for column in source.columns
+    ]
+    # Compressed InnoDB pages on MySQL; other backends ignore the option
+    return Table(
+        name, archive_metadata, *columns, Column("archived_at", DateTime, default=func.now()), *indexes,
+        mysql_row_format="COMPRESSED"
+    )
+
+
+archived_messages = _archive_table(
+    "archived_messages", Message.__table__,
+    Index(
+        "ix_archived_messages_channel_id_parent_message_id_created_at",
+        "channel_id", "parent_message_id", "created_at"
+    ),
+    Index("ix_archived_messages_parent_message_id_id", "parent_message_id", "id"),
+    Index("ix_archived_messages_channel_id_id", "channel_id", "id"),
+)
+archived_direct_messages = _archive_table(
+    "archived_direct_messages", DirectMessage.__table__,
+    Index("ix_archived_direct_messages_conversation_id_id", "conversation_id", "id"),
+)
+
+ARCHIVED_MESSAGE_COLUMNS = tuple(archived_messages.c[field] for field in MESSAGE_FIELDS)
+ARCHIVED_DIRECT_MESSAGE_COLUMNS = tuple(archived_direct_messages.c[field] for field in DIRECT_MESSAGE_FIELDS)
+
+
+@lru_cache
+def get_archive_engine() -> Optional[Engine]:
+    """Engine of the archive database, or None when archiving is not configured.
+
+    The archive is not under Alembic: its tables mirror the hot ones and are
+    created here, on first use, if missing, as are indexes added since.
+    """
+    if not settings.archive_database_url:
+        return None
+    connect_args = {"check_same_thread": False} if settings.archive_database_url.startswith("sqlite") else {}
+    engine = create_engine(settings.archive_database_url, echo=settings.sql_echo, connect_args=connect_args)
+    archive_metadata.create_all(engine)
+    for table in archive_metadata.tables.values():
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    return engine
+
+
+def archive_enabled() -> bool:
+    return get_archive_engine() is not None
+
+
+# Reads
+
+def _merged_page(
+    db: Session, hot_queries: List[Query], conditions: list, offset: int, limit: int, hot_page: List[dict]
+) -> List[dict]:
+    """One page, newest first, over hot and archived messages together.
+
+    A thread stays hot while it has recent replies, so the two sets overlap
+    in time and a page cannot simply continue from one into the other. When
+    nothing archived sorts above the end of the hot page that page is
+    returned as is; otherwise the page is picked from the (created_at, id)
+    keys of both sides (the hot side may span several shards, one query
+    each) and then loaded.
+    """
+    keys = select(archived_messages.c.created_at, archived_messages.c.id).where(*conditions).order_by(
+        desc(archived_messages.c.created_at), desc(archived_messages.c.id)
+    )
+    with get_archive_engine().connect() as conn:
+        newest = conn.execute(keys.limit(1)).first()
+        if newest is None or (
+            len(hot_page) == limit and (hot_page[-1]["created_at"], hot_page[-1]["id"]) > tuple(newest)
+        ):
+            return hot_page
+        archived_keys = conn.execute(keys.limit(offset + limit)).all()
+
+    hot_keys = [
+        key for hot_query in hot_queries for key in hot_query.with_entities(Message.created_at, Message.id).order_by(
+            desc(Message.created_at), desc(Message.id)
+        ).limit(offset + limit)
+    ]
+    page = sorted(
+        [(created_at, message_id, False) for created_at, message_id in hot_keys]
+        + [(created_at, message_id, True) for created_at, message_id in archived_keys],
+        reverse=True
+    )[offset:offset + limit]
+
+    messages = {message["id"]: message for message in hot_page}
+    hot_ids = [message_id for _, message_id, archived in page if not archived and message_id not in messages]
+    if hot_ids:
+        rows = [
+            row for hot_query in hot_queries
+            for row in hot_query.with_entities(*MESSAGE_COLUMNS).filter(Message.id.in_(hot_ids))
+        ]
+        messages.update((message["id"], message) for message in message_rows(db, rows))
+    archived_ids = [message_id for _, message_id, archived in page if archived]
+    if archived_ids:
+        with get_archive_engine().connect() as conn:
+            rows = conn.execute(
+                select(*ARCHIVED_MESSAGE_COLUMNS).where(archived_messages.c.id.in_(archived_ids))
+            ).all()
+        messages.update((message["id"], message) for message in message_rows(db, rows))
+    return [messages[message_id] for _, message_id, _ in page if message_id in messages]
+
+
+def channel_history(
+    db: Session, hot_query: Query, channel_id: int, include_replies: bool, offset: int, limit: int,
+    hot_page: List[dict]
+) -> List[dict]:
+    """A channel history page (newest first) with the archived messages merged in"""
+    conditions = [archived_messages.c.channel_id == channel_id]
+    if not include_replies:
+        conditions.append(archived_messages.c.parent_message_id.is_(None))
+    return _merged_page(db, [hot_query], conditions, offset, limit, hot_page)
+
+
+def get_message(db: Session, message_id: int) -> Optional[dict]:
+    with get_archive_engine().connect() as conn:
+        rows = conn.execute(select(*ARCHIVED_MESSAGE_COLUMNS).where(archived_messages.c.id == message_id)).all()
+    messages = message_rows(db, rows)
+    return messages[0] if messages else None
+
+
+def thread_replies(db: Session, message_id: int, after_id: int, limit: int) -> List[dict]:
+    """Archived replies of a thread in id order (a thread is archived whole)"""
+    with get_archive_engine().connect() as conn:
+        rows = conn.execute(
+            select(*ARCHIVED_MESSAGE_COLUMNS).where(
+                archived_messages.c.parent_message_id == message_id,
+                archived_messages.c.id > after_id
+            ).order_by(archived_messages.c.id).limit(limit)
+        ).all()
+    return message_rows(db, rows)
+
+
+def search_messages(
+    db: Session, hot_queries: List[Query], channel_ids: List[int], search_query: SearchQuery, offset: int, limit: int,
+    hot_page: List[dict]
+) -> Tuple[int, List[dict]]:
+    """Archived match count, and the search page with archived matches merged in"""
+    table = archived_messages
+    conditions = [table.c.channel_id.in_(channel_ids)]
+    if search_query.query:
+        conditions.append(table.c.content.contains(search_query.query))
+    if search_query.channel_id:
+        conditions.append(table.c.channel_id == search_query.channel_id)
+    if search_query.user_id:
+        conditions.append(table.c.sender_id == search_query.user_id)
+    if search_query.start_date:
+        conditions.append(table.c.created_at >= search_query.start_date)
+    if search_query.end_date:
+        conditions.append(table.c.created_at <= search_query.end_date)
+
+    with get_archive_engine().connect() as conn:
+        archived_count = conn.execute(select(func.count()).select_from(table).where(*conditions)).scalar()
+    if not archived_count:
+        return 0, hot_page
+    return archived_count, _merged_page(db, hot_queries, conditions, offset, limit, hot_page)
+
+
+def direct_messages(db: Session, conversation_id: int, offset: int, limit: int) -> List[dict]:
+    """Archived messages of a conversation, newest first, in the shape of app.schemas.DirectMessage"""
+    with get_archive_engine().connect() as conn:
+        rows = conn.execute(
+            select(*ARCHIVED_DIRECT_MESSAGE_COLUMNS)
+            .where(archived_direct_messages.c.conversation_id == conversation_id)
+            .order_by(desc(archived_direct_messages.c.id)).offset(offset).limit(limit)
+        ).all()
+    return direct_message_rows(db, rows)
+
+
+# Archival job
+
+def _copy_rows(archive: Engine, table: Table, rows: List[dict]):
+    """Write rows to the archive, replacing copies left by an interrupted run"""
+    with archive.begin() as conn:
+        conn.execute(delete(table).where(table.c.id.in_([row["id"] for row in rows])))
+        conn.execute(insert(table), rows)
+
+
+def archive_channel_messages(db: Session, shard_db: Session, archive: Engine, cutoff: datetime, batch_size: int) -> int:
+    """Move threads of one shard that went quiet before `cutoff`; returns the number of messages moved"""
+    moved = 0
+    while True:
+        # Locked so a reply cannot land on a root while it is being moved
+        root_ids = [row.id for row in shard_db.query(Message.id).filter(
+            Message.parent_message_id.is_(None),
+            Message.created_at < cutoff,
+            or_(Message.last_reply_at.is_(None), Message.last_reply_at < cutoff)
+        ).order_by(Message.id).limit(batch_size).with_for_update()]
+        if not root_ids:
+            return moved
+
+        rows = [
+            dict(row._mapping) for row in shard_db.execute(
+                select(Message.__table__).where(
+                    or_(Message.id.in_(root_ids), Message.parent_message_id.in_(root_ids))
+                )
+            )
+        ]
+        _copy_rows(archive, archived_messages, rows)
+
+        # Replies first: they reference their root
+        shard_db.execute(delete(Message.__table__).where(Message.parent_message_id.in_(root_ids)))
+        shard_db.execute(delete(Message.__table__).where(Message.id.in_(root_ids)))
+        # History pages of these channels now continue into the archive; cached copies are stale
+        db.query(Channel).filter(Channel.id.in_({row["channel_id"] for row in rows})).update(
+            {Channel.version: Channel.version + 1, Channel.updated_at: Channel.updated_at},
+            synchronize_session=False
+        )
+        # Commits the shard first (app.sharding)
+        db.commit()
+        moved += len(rows)
+        logger.info(f"Archived {len(rows)} channel messages ({len(root_ids)} threads)")
+
+
+def archive_direct_messages(db: Session, shard_db: Session, archive: Engine, cutoff: datetime, batch_size: int) -> int:
+    """Move direct messages of one shard sent before `cutoff`, except each conversation's latest"""
+    moved = 0
+    last_id = 0
+    while True:
+        rows = [
+            dict(row._mapping) for row in shard_db.execute(
+                select(DirectMessage.__table__).where(
+                    DirectMessage.created_at < cutoff,
+                    DirectMessage.id > last_id
+                ).order_by(DirectMessage.id).limit(batch_size)
+            )
+        ]
+        if not rows:
+            return moved
+        last_id = rows[-1]["id"]
+
+        # Conversations live in the main database, their messages possibly on a shard
+        latest_ids = set(db.execute(
+            select(Conversation.last_message_id).where(Conversation.last_message_id.in_([row["id"] for row in rows]))
+        ).scalars())
+        rows = [row for row in rows if row["id"] not in latest_ids]
+        if not rows:
+            continue
+
+        _copy_rows(archive, archived_direct_messages, rows)
+        shard_db.execute(delete(DirectMessage.__table__).where(DirectMessage.id.in_([row["id"] for row in rows])))
+        db.commit()
+        moved += len(rows)
+        logger.info(f"Archived {len(rows)} direct messages")
+
+
+def run_archival(older_than_days: int, batch_size: int) -> Dict[str, int]:
+    """Archive everything older than `older_than_days`, shard by shard"""
+    from app.database import SessionLocal
+
+    archive = get_archive_engine()
+    if archive is None:
+        raise RuntimeError("ARCHIVE_DATABASE_URL is not set")
+
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = {"messages": 0, "direct_messages": 0}
+    db = SessionLocal()
+    try:
+        for shard in shard_router.shard_names():
+            shard_db = shard_router.session(db, shard)
+            moved["messages"] += archive_channel_messages(db, shard_db, archive, cutoff, batch_size)
+            moved["direct_messages"] += archive_direct_messages(db, shard_db, archive, cutoff, batch_size)
+        return moved
+    finally:
+        close_shard_sessions(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m app.archive", description="Move old messages to the archive")
+    parser.add_argument("--older-than-days", type=int, default=settings.archive_after_days)
+    parser.add_argument("--batch-size", type=int, default=settings.archive_batch_size)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(run_archival(args.older_than_days, args.batch_size))
@@ -1,5 +1,7 @@
+from functools import lru_cache
+import threading
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Any, Callable, Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -11,9 +13,128 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int = 30
     cors_origins: List[str] = ["http://localhost:3000"]
     environment: str = "development"
+    sql_echo: bool = True
+    # Connect to MySQL and Redis during startup rather than on the first request
+    startup_warm_up: bool = False
+    typing_flush_interval_ms: int = 500
+    typing_ttl_seconds: float = 6.0
+    ws_inbound_rate: float = 10.0
+    ws_inbound_burst: int = 30
+    ws_user_inbound_rate: float = 20.0
+    ws_user_inbound_burst: int = 60
+    ws_shared_inbound_rate: float = 0.0  # per user across workers (Redis); 0 disables
+    ws_shared_inbound_burst: int = 100
+    ws_shared_lease_size: int = 10
+    ws_max_message_bytes: int = 16384
+    ws_max_violations: int = 50
+    # permessage-deflate, applied when serving with app.websocket.protocol
+    ws_deflate_enabled: bool = True
+    ws_deflate_level: int = 6
+    ws_deflate_mem_level: int = 5
+    ws_deflate_window_bits: int = 12
+    ws_deflate_no_context_takeover: bool = False
+    # Graceful drain on shutdown: clients are told to reconnect spread over the window
+    # The three together must fit in the stop grace period (stop_grace_period in docker-compose.yml)
+    ws_drain_window_seconds: float = 30.0
+    ws_drain_close_grace_seconds: float = 5.0
+    presence_handoff_seconds: float = 15.0
+    event_log_max_len: int = 1000
+    event_log_ttl_seconds: int = 172800
+    event_replay_max: int = 500
+    # Channel history pages cached in Redis per channel version; 0 disables
+    history_cache_ttl_seconds: int = 300
+    # /api/bootstrap: cached teams/channels/members per user, and how many members it lists
+    bootstrap_cache_ttl_seconds: int = 60
+    bootstrap_member_limit: int = 200
+    # Cold message storage (python -m app.archive); unset keeps everything in the main database
+    archive_database_url: Optional[str] = None
+    archive_after_days: int = 90
+    archive_batch_size: int = 1000
+    # Message shards by name (JSON: {"s1": url, ...}); new channels and conversations are placed
+    # across them by hash (app.sharding). Empty keeps every message in the main database
+    message_shard_urls: Dict[str, str] = {}
+    message_shard_move_batch_size: int = 1000
+    # Rows per keyset batch of a channel export (GET /api/messages/channel/{id}/export)
+    export_batch_size: int = 1000
+    # Workspace imports (app.importer): rows per multi-row INSERT and per transaction
+    import_batch_size: int = 5000
+    import_transaction_rows: int = 100000
+    # Most user ids one bulk membership request (POST .../members) may add
+    bulk_membership_max_users: int = 5000
+    # @mention notifications (app.notifications): jobs wait in a Redis Stream read by a worker task
+    # in each app process; @channel/@here in one channel within the debounce window are merged
+    notification_worker_enabled: bool = True
+    notification_stream_max_len: int = 100000
+    notification_read_count: int = 100
+    notification_block_ms: int = 1000
+    notification_claim_idle_ms: int = 60000
+    notification_debounce_ms: int = 2000
+    notification_batch_size: int = 1000
+    # Message reactions (app.reactions): counted in Redis, broadcast as one event per message per
+    # interval and written to the database in batches
+    reaction_broadcast_interval_ms: int = 250
+    reaction_persist_interval_ms: int = 1000
+    reaction_cache_ttl_seconds: int = 86400
+    # Event loop monitoring (app.loop_monitor): lag sampled every interval; a watchdog thread
+    # attributes stalls of at least the threshold to a route or WebSocket message type
+    loop_monitor_enabled: bool = True
+    loop_monitor_interval_ms: int = 100
+    loop_stall_threshold_ms: int = 200
+    loop_stall_history: int = 50
+    # Longest capture of GET /api/admin/profile
+    profiler_max_seconds: float = 60.0
+    rate_limit_enabled: bool = True
+    rate_limit_sync_interval_ms: int = 500
+    rate_limit_default: Optional[str] = "600/minute"
+    # Proxies in front of the app that append to X-Forwarded-For (the shipped nginx.conf is one);
+    # anonymous clients are limited by the address the outermost of them saw. 0 when serving directly
+    rate_limit_trusted_proxy_hops: int = 1
+    rate_limits: Dict[str, str] = {
+        "POST /api/auth/login": "10/minute",
+        "POST /api/auth/token": "10/minute",
+        "POST /api/auth/register": "5/minute",
+        "POST /api/messages/search": "30/minute",
+        "GET /api/messages/channel/{channel_id}/export": "10/minute",
+        "GET /api/users/": "60/minute",
+    }
 
     class Config:
         env_file = ".env"
 
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    """Settings read from the environment on first use"""
+    return Settings()
+
+
+class LazySettings:
+    """Module-level `settings` that defers reading the environment until an attribute is used"""
+
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
+
+
+settings = LazySettings()
+
+
+class LazyInstance:
+    """Module-level instance built by `factory` on first attribute use, so importing its module reads no settings"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    object.__setattr__(self, "_instance", self._factory())
+        return self._instance
+
+    def __getattr__(self, name: str):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._get(), name, value)
@@ -1,15 +1,31 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from functools import lru_cache
+from typing import List, Optional
+from sqlalchemy import Table, create_engine, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 from app.config import settings
 
-# Create database engine
-engine = create_engine(settings.database_url, echo=True)
+
+@lru_cache
+def get_engine() -> Engine:
+    """Create the database engine on first use (importing opens nothing)"""
+    connect_args = {"check_same_thread": False} if settings.database_url.startswith("sqlite") else {}
+    return create_engine(settings.database_url, echo=settings.sql_echo, connect_args=connect_args)
+
+
+class LazySessionmaker(sessionmaker):
+    """Session factory that binds to the engine the first time a session is made"""
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
 
 # Create session maker
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
 
-# Create base class for models
+# Declarative base shared by every model (app.models)
 Base = declarative_base()
 
 
@@ -19,4 +35,43 @@ def get_db():
     try:
         yield db
     finally:
+        from app.sharding import close_shard_sessions
+        close_shard_sessions(db)
         db.close()
+
+
+def insert_ignore_statement(dialect: str, table: Table, no_op_column: Optional[str] = None):
+    """INSERT that skips rows conflicting with a primary key or unique constraint, for `dialect`
+
+    MySQL has no DO NOTHING: a conflicting row assigns `no_op_column` its own
+    value, so pass a column the rows supply and the conflicting key covers
+    (the primary key by default, which suits tables keyed on their columns
+    rather than an autoincrement id).
+    """
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        # ON DUPLICATE KEY with a no-op update; INSERT IGNORE would also swallow foreign key errors
+        statement = mysql_insert(table)
+        key = no_op_column or table.primary_key.columns.values()[0].name
+        return statement.on_duplicate_key_update({key: statement.inserted[key]})
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+        return postgresql_insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+
+def insert_ignore(db: Session, table: Table, rows: List[dict], no_op_column: Optional[str] = None):
+    """Multi-row INSERT that skips rows conflicting with an existing one (see `insert_ignore_statement`)"""
+    if not rows:
+        return
+    db.execute(insert_ignore_statement(db.get_bind().dialect.name, table, no_op_column), rows)
+
+
+def __getattr__(name: str):
+    # `from app.database import engine` still works; the engine is created at that point
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
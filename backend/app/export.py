@@ -0,0 +1,105 @@
+"""Streaming export of a channel's history as NDJSON.
+
+One message per line, in the JSON shape of app.schemas.Message, oldest first
+(id order). Rows are read in keyset batches over (channel_id, id) from the
+channel's shard and, when archiving is on, from the archive, merged by id.
+Nothing beyond one batch is held, so memory stays flat whatever the size of
+the channel, and each batch is its own short transaction rather than one
+snapshot held open for the whole export.
+
+Every line carries its message's id: an export that stops part way resumes
+from `after_id` set to the last id received.
+"""
+from datetime import datetime
+from typing import Iterator, List, Optional
+import zlib
+
+import orjson
+from sqlalchemy import Table, or_, select
+from sqlalchemy.orm import Session
+
+from app import archive
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Message
+from app.serializers import MESSAGE_COLUMNS, message_rows
+from app.sharding import close_shard_sessions, shard_router
+
+
+def _conditions(
+    table: Table, channel_id: int, after_id: int, since: Optional[datetime], until: Optional[datetime],
+    include_replies: bool, thread_id: Optional[int]
+) -> list:
+    """Filters of an export on the hot or archived messages table"""
+    conditions = [table.c.channel_id == channel_id, table.c.id > after_id]
+    if since:
+        conditions.append(table.c.created_at >= since)
+    if until:
+        conditions.append(table.c.created_at < until)
+    if thread_id:
+        conditions.append(or_(table.c.id == thread_id, table.c.parent_message_id == thread_id))
+    elif not include_replies:
+        conditions.append(table.c.parent_message_id.is_(None))
+    return conditions
+
+
+def message_batches(
+    db: Session, channel_id: int, after_id: int = 0, since: Optional[datetime] = None,
+    until: Optional[datetime] = None, include_replies: bool = True, thread_id: Optional[int] = None,
+    batch_size: Optional[int] = None
+) -> Iterator[List[dict]]:
+    """A channel's messages in id order, a batch at a time"""
+    batch_size = batch_size or settings.export_batch_size
+    while True:
+        # Looked up per batch, so an export keeps up with the channel moving shards
+        shard_db = shard_router.channel_session(db, channel_id)
+        filters = (channel_id, after_id, since, until, include_replies, thread_id)
+        hot = shard_db.execute(
+            select(*MESSAGE_COLUMNS).where(*_conditions(Message.__table__, *filters))
+            .order_by(Message.id).limit(batch_size)
+        ).all()
+        archived = []
+        if archive.archive_enabled():
+            with archive.get_archive_engine().connect() as conn:
+                archived = conn.execute(
+                    select(*archive.ARCHIVED_MESSAGE_COLUMNS)
+                    .where(*_conditions(archive.archived_messages, *filters))
+                    .order_by(archive.archived_messages.c.id).limit(batch_size)
+                ).all()
+
+        # Both sides are in id order: a full side may have more rows past its last id, so the
+        # batch stops there; when neither is full this is the last batch
+        bound = min((rows[-1].id for rows in (hot, archived) if len(rows) == batch_size), default=None)
+        rows = sorted(
+            (row for row in hot + archived if bound is None or row.id <= bound), key=lambda row: row.id
+        )
+        messages = message_rows(db, rows)
+        # Ends this batch's transactions, main and shard
+        db.rollback()
+        if messages:
+            yield messages
+        if bound is None:
+            return
+        after_id = bound
+
+
+def export_lines(channel_id: int, compress: bool = False, **filters) -> Iterator[bytes]:
+    """NDJSON body of a channel export, optionally gzip-compressed, on a session of its own.
+
+    The session is opened here rather than taken from the request because
+    the body is produced after the route has returned.
+    """
+    db = SessionLocal()
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    try:
+        for messages in message_batches(db, channel_id, **filters):
+            chunk = b"".join(orjson.dumps(message) + b"\n" for message in messages)
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if compressor:
+            yield compressor.flush()
+    finally:
+        close_shard_sessions(db)
+        db.close()
@@ -0,0 +1,733 @@
+"""Bulk import of a workspace migrated from another chat tool.
+
+The input is NDJSON, one record per line with a "type" (the Import*
+schemas in app.schemas):
+
+    {"type": "user", "id": "U1", "username": "ada", "email": "ada@example.com", "full_name": "Ada L"}
+    {"type": "team", "id": "T1", "name": "Engineering", "created_by": "U1"}
+    {"type": "channel", "id": "C1", "team": "T1", "name": "general"}
+    {"type": "team_member", "team": "T1", "user": "U1", "role": "admin"}
+    {"type": "channel_member", "channel": "C1", "user": "U1"}
+    {"type": "message", "id": "M1", "channel": "C1", "sender": "U1", "content": "hi", "created_at": "..."}
+    {"type": "message", "id": "M2", "channel": "C1", "sender": "U2", "content": "hey", "parent": "M1", ...}
+    {"type": "direct_message", "sender": "U1", "receiver": "U2", "content": "psst", "created_at": "..."}
+
+Ids are the source tool's and only need to be unique per type. A record
+refers to others by those ids, and only to ones on earlier lines; messages
+are expected in the order they were sent.
+
+Records are buffered and written IMPORT_BATCH_SIZE rows at a time as
+multi-row INSERTs, committing every IMPORT_TRANSACTION_ROWS rows. Ids are
+reserved up front rather than read back, which locks the end of each
+table's id range until commit: the app's own inserts into those tables
+wait for the import's current transaction.
+
+A user whose email already has an account is mapped onto it. New users get
+a password nobody knows and cannot log in until one is set. Records that
+fail validation or refer to something unknown are skipped and reported;
+the import carries on.
+
+Importing the same workspace again (the same file, a later export, or the
+rest of one that failed) only adds what is new. Teams and channels are
+found by their source ids, recorded in imported_records; memberships that
+exist are left alone; and a message is taken as already imported when its
+channel or conversation existed before this import and has a message from
+the same sender, sent the same second, with the same content.
+
+Once everything is in, derived state is rebuilt: thread reply counts, read
+markers (imported history counts as read), summaries of new conversations,
+channel versions and, in Redis, the mention directory of imported teams
+and the cached memberships of users who joined something.
+
+    python -m app.importer import workspace.ndjson.gz --owner admin
+    python -m app.importer superuser admin
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import gzip
+import logging
+import secrets
+import sys
+import time
+
+import orjson
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import Table, bindparam, case, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from app import archive
+from app.config import settings
+from app.database import insert_ignore
+from app.models import (
+    Channel, Conversation, ConversationParticipant, DirectMessage, ImportedRecord, Message, Team, User,
+    channel_members, team_members
+)
+from app.redis_client import cache_manager, directory_manager
+from app.schemas import (
+    ImportChannel, ImportChannelMember, ImportDirectMessage, ImportMessage, ImportTeam, ImportTeamMember, ImportUser
+)
+from app.sharding import CHANNEL, CONVERSATION, close_shard_sessions, shard_router
+
+logger = logging.getLogger(__name__)
+
+# In the order pending records are written, so references resolve
+RECORD_TYPES = {
+    "user": ImportUser,
+    "team": ImportTeam,
+    "channel": ImportChannel,
+    "team_member": ImportTeamMember,
+    "channel_member": ImportChannelMember,
+    "message": ImportMessage,
+    "direct_message": ImportDirectMessage,
+}
+
+MAX_REPORTED_ERRORS = 100
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC, as the app stores timestamps"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _message_key(scope_id: int, sender_id: int, record) -> tuple:
+    """What identifies a message already imported; to the second, as MySQL DATETIME keeps no more"""
+    return scope_id, sender_id, _utc(record.created_at).replace(microsecond=0), record.content
+
+
+def _validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+
+class WorkspaceImporter:
+    """One import: the source to new id maps, counts, and the derived state to rebuild at the end"""
+
+    def __init__(
+        self, db: Session, owner_id: int, batch_size: Optional[int] = None, transaction_rows: Optional[int] = None
+    ):
+        self.db = db
+        # Creator of teams and channels whose own creator is not in the import
+        self.owner_id = owner_id
+        self.batch_size = batch_size or settings.import_batch_size
+        self.transaction_rows = transaction_rows or settings.import_transaction_rows
+
+        self.users: Dict[str, int] = {}
+        self.teams: Dict[str, int] = {}
+        self.channels: Dict[str, int] = {}
+        # Created by this import, so nothing of theirs can be in the database already
+        self.new_teams: Set[int] = set()
+        self.new_channels: Set[int] = set()
+        # Top-level messages only, as replies cannot be replied to: source id -> (id, channel id)
+        self.roots: Dict[str, Tuple[int, int]] = {}
+        self.conversations: Dict[Tuple[int, int], int] = {}
+        self.team_memberships: Set[Tuple[int, int]] = set()
+        self.channel_memberships: Set[Tuple[int, int]] = set()
+
+        self.pending: Dict[str, List[Tuple[int, BaseModel]]] = {record_type: [] for record_type in RECORD_TYPES}
+        self.pending_rows = 0
+        self.uncommitted_rows = 0
+        self.counts = dict.fromkeys(RECORD_TYPES, 0)
+        self.committed = dict(self.counts)
+        self.line = 0
+        self.committed_line = 0
+        self.skipped = 0
+        self.errors: List[dict] = []
+        self.error: Optional[str] = None
+        self.started = time.perf_counter()
+
+        # Rebuilt once everything is in
+        self.threads: Dict[int, list] = {}  # root id -> [channel id, replies, last reply at]
+        self.channel_latest: Dict[int, int] = {}  # channel id -> newest top-level message id
+        self.new_conversations: Dict[int, Optional[Tuple[int, datetime]]] = {}  # id -> latest (id, created_at)
+        self.member_user_ids: Set[int] = set()
+        self._password_hash: Optional[str] = None
+
+    def run(self, lines: Iterable[bytes]) -> Iterator[dict]:
+        """Import NDJSON lines, yielding progress after every commit; see report() for the outcome"""
+        try:
+            for line in lines:
+                self.line += 1
+                if line.strip():
+                    self._add(line)
+                if self.pending_rows >= self.batch_size:
+                    self._flush()
+                if self.uncommitted_rows >= self.transaction_rows:
+                    self._commit()
+                    yield self.progress()
+            self._flush()
+            self._rebuild()
+            self._commit()
+        except Exception as e:
+            logger.error(f"Error importing at line {self.line}: {e}")
+            self.db.rollback()
+            self.error = str(e)
+
+    def progress(self) -> dict:
+        """Committed so far"""
+        elapsed = time.perf_counter() - self.started
+        messages = self.committed["message"] + self.committed["direct_message"]
+        return {
+            "line": self.committed_line,
+            "imported": {f"{record_type}s": count for record_type, count in self.committed.items()},
+            "skipped": self.skipped,
+            "elapsed_seconds": round(elapsed, 1),
+            "messages_per_second": round(messages / elapsed) if elapsed else None,
+        }
+
+    def report(self) -> dict:
+        return {**self.progress(), "done": self.error is None, "error": self.error, "errors": self.errors}
+
+    async def refresh_caches(self):
+        """Mention directory of the imported teams; cached memberships of users who joined something"""
+        try:
+            for team_id in self.teams.values():
+                members = self.db.query(User.id, User.username, User.full_name).join(team_members).filter(
+                    team_members.c.team_id == team_id
+                ).all()
+                await directory_manager.build_team_index(team_id, members)
+            user_ids = list(self.member_user_ids)
+            for start in range(0, len(user_ids), 1000):
+                await cache_manager.invalidate_bootstrap(*user_ids[start:start + 1000])
+                await cache_manager.invalidate_user_channels(*user_ids[start:start + 1000])
+        except Exception as e:
+            logger.error(f"Error refreshing caches after import: {e}")
+
+    # Reading
+
+    def _add(self, line: bytes):
+        try:
+            data = orjson.loads(line)
+            record_type = data.pop("type", None) if isinstance(data, dict) else None
+            if record_type not in RECORD_TYPES:
+                raise ValueError(f"unknown record type {record_type!r}")
+            record = RECORD_TYPES[record_type].model_validate(data)
+        except ValidationError as e:
+            self._skip(self.line, _validation_error(e))
+            return
+        except ValueError as e:
+            self._skip(self.line, str(e))
+            return
+        self.pending[record_type].append((self.line, record))
+        self.pending_rows += 1
+
+    def _skip(self, line: int, reason: str):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": reason})
+
+    def _flush(self):
+        for record_type, pending in self.pending.items():
+            if pending:
+                self.pending[record_type] = []
+                written = getattr(self, f"_write_{record_type}s")(pending)
+                self.counts[record_type] += written
+                self.uncommitted_rows += written
+        self.pending_rows = 0
+
+    def _commit(self):
+        self._flush()
+        self.db.commit()
+        self.committed = dict(self.counts)
+        self.committed_line = self.line
+        self.uncommitted_rows = 0
+        logger.info(f"Import committed through line {self.line}: {self.committed}")
+
+    # Writing
+
+    def _reserve(self, table: Table, archived: Optional[Table] = None) -> int:
+        """First id of a run of new rows; the end of the table's id range stays locked until commit"""
+        latest = self.db.execute(select(func.max(table.c.id)).with_for_update()).scalar() or 0
+        if archived is not None and archive.archive_enabled():
+            # The newest rows may have been archived, and ids are never reused
+            with archive.get_archive_engine().connect() as conn:
+                latest = max(latest, conn.execute(select(func.max(archived.c.id))).scalar() or 0)
+        return latest + 1
+
+    def _unusable_password(self) -> str:
+        # A random secret nobody knows, hashed once rather than per user (bcrypt is slow by design)
+        if self._password_hash is None:
+            from app.auth import get_password_hash
+            self._password_hash = get_password_hash(secrets.token_urlsafe(32))
+        return self._password_hash
+
+    def _write_users(self, pending: List[Tuple[int, ImportUser]]) -> int:
+        emails = {record.email for _, record in pending}
+        usernames = {record.username for _, record in pending}
+        existing = dict(self.db.execute(select(User.email, User.id).where(User.email.in_(emails))).all())
+        taken = set(self.db.execute(select(User.username).where(User.username.in_(usernames))).scalars())
+
+        rows = []
+        next_id = self._reserve(User.__table__)
+        for line, record in pending:
+            if record.email in existing:
+                # Already has an account (or appeared earlier in the import): records attach to it
+                self.users[record.id] = existing[record.email]
+                continue
+            if record.username in taken:
+                self._skip(line, f"username {record.username!r} is taken")
+                continue
+            created_at = _utc(record.created_at) or datetime.utcnow()
+            rows.append({
+                "id": next_id,
+                "username": record.username,
+                "email": record.email,
+                "hashed_password": self._unusable_password(),
+                "full_name": record.full_name,
+                "avatar_url": record.avatar_url,
+                "is_active": record.is_active,
+                "is_online": False,
+                "is_superuser": False,
+                "last_seen": created_at,
+                "created_at": created_at,
+                "updated_at": created_at,
+            })
+            self.users[record.id] = existing[record.email] = next_id
+            taken.add(record.username)
+            next_id += 1
+        if rows:
+            self.db.execute(insert(User.__table__), rows)
+        return len(rows)
+
+    def _creator(self, source_id: Optional[str]) -> int:
+        return self.users.get(source_id, self.owner_id) if source_id is not None else self.owner_id
+
+    def _imported(self, record_type: str, source_ids: List[str]) -> Dict[str, int]:
+        """Rows an earlier import created for these source ids"""
+        return dict(self.db.execute(
+            select(ImportedRecord.source_id, ImportedRecord.local_id).where(
+                ImportedRecord.record_type == record_type, ImportedRecord.source_id.in_(source_ids)
+            )
+        ).all())
+
+    def _record_imported(self, record_type: str, created: Dict[str, int]):
+        insert_ignore(self.db, ImportedRecord.__table__, [
+            {"record_type": record_type, "source_id": source_id, "local_id": local_id}
+            for source_id, local_id in created.items()
+        ])
+
+    def _write_teams(self, pending: List[Tuple[int, ImportTeam]]) -> int:
+        self.teams.update(self._imported("team", [record.id for _, record in pending]))
+        rows, created = [], {}
+        next_id = self._reserve(Team.__table__)
+        for _, record in pending:
+            if record.id in self.teams:
+                continue
+            created_at = _utc(record.created_at) or datetime.utcnow()
+            rows.append({
+                "id": next_id,
+                "name": record.name,
+                "description": record.description,
+                "is_public": record.is_public,
+                "created_by": self._creator(record.created_by),
+                "created_at": created_at,
+                "updated_at": created_at,
+            })
+            self.teams[record.id] = created[record.id] = next_id
+            self.new_teams.add(next_id)
+            next_id += 1
+        if rows:
+            self.db.execute(insert(Team.__table__), rows)
+            self._record_imported("team", created)
+        return len(rows)
+
+    def _write_channels(self, pending: List[Tuple[int, ImportChannel]]) -> int:
+        self.channels.update(self._imported("channel", [record.id for _, record in pending]))
+        rows, created = [], {}
+        next_id = self._reserve(Channel.__table__)
+        for line, record in pending:
+            if record.id in self.channels:
+                continue
+            team_id = self.teams.get(record.team)
+            if team_id is None:
+                self._skip(line, f"unknown team {record.team!r}")
+                continue
+            created_at = _utc(record.created_at) or datetime.utcnow()
+            rows.append({
+                "id": next_id,
+                "name": record.name,
+                "description": record.description,
+                "is_private": record.is_private,
+                "team_id": team_id,
+                "created_by": self._creator(record.created_by),
+                "version": 0,
+                "created_at": created_at,
+                "updated_at": created_at,
+            })
+            self.channels[record.id] = created[record.id] = next_id
+            self.new_channels.add(next_id)
+            next_id += 1
+        if rows:
+            self.db.execute(insert(Channel.__table__), rows)
+            self._record_imported("channel", created)
+            shard_router.place_many(self.db, CHANNEL, [row["id"] for row in rows])
+        return len(rows)
+
+    def _existing_members(self, table: Table, key: str, new: Set[int], pairs: List[Tuple[int, int]]) -> Set[tuple]:
+        """The (team or channel, user) pairs that are members already; none of those created by this import"""
+        pairs = [pair for pair in pairs if pair[0] not in new]
+        if not pairs:
+            return set()
+        return set(self.db.execute(
+            select(table.c[key], table.c.user_id).where(tuple_(table.c[key], table.c.user_id).in_(pairs))
+        ).all())
+
+    def _write_team_members(self, pending: List[Tuple[int, ImportTeamMember]]) -> int:
+        roles = {}
+        for line, record in pending:
+            team_id, user_id = self.teams.get(record.team), self.users.get(record.user)
+            if team_id is None or user_id is None:
+                self._skip(line, f"unknown team {record.team!r} or user {record.user!r}")
+            elif (team_id, user_id) not in self.team_memberships:
+                self.team_memberships.add((team_id, user_id))
+                roles[(team_id, user_id)] = record.role
+        existing = self._existing_members(team_members, "team_id", self.new_teams, list(roles))
+        now = datetime.utcnow()
+        rows = [
+            {"user_id": user_id, "team_id": team_id, "role": role, "joined_at": now}
+            for (team_id, user_id), role in roles.items() if (team_id, user_id) not in existing
+        ]
+        # Ignores memberships the app added since the check above
+        insert_ignore(self.db, team_members, rows)
+        self.member_user_ids.update(row["user_id"] for row in rows)
+        return len(rows)
+
+    def _write_channel_members(self, pending: List[Tuple[int, ImportChannelMember]]) -> int:
+        pairs = []
+        for line, record in pending:
+            channel_id, user_id = self.channels.get(record.channel), self.users.get(record.user)
+            if channel_id is None or user_id is None:
+                self._skip(line, f"unknown channel {record.channel!r} or user {record.user!r}")
+            elif (channel_id, user_id) not in self.channel_memberships:
+                self.channel_memberships.add((channel_id, user_id))
+                pairs.append((channel_id, user_id))
+        existing = self._existing_members(channel_members, "channel_id", self.new_channels, pairs)
+        now = datetime.utcnow()
+        rows = [
+            {"user_id": user_id, "channel_id": channel_id, "joined_at": now}
+            for channel_id, user_id in pairs if (channel_id, user_id) not in existing
+        ]
+        insert_ignore(self.db, channel_members, rows)
+        self.member_user_ids.update(row["user_id"] for row in rows)
+        return len(rows)
+
+    def _write_messages(self, pending: List[Tuple[int, ImportMessage]]) -> int:
+        valid = []
+        for line, record in pending:
+            channel_id, sender_id = self.channels.get(record.channel), self.users.get(record.sender)
+            if channel_id is None or sender_id is None:
+                self._skip(line, f"unknown channel {record.channel!r} or sender {record.sender!r}")
+            else:
+                valid.append((line, record, channel_id, sender_id))
+
+        existing = self._existing_messages(CHANNEL, Message.__table__, "channel_id", [
+            _message_key(channel_id, sender_id, record)
+            for _, record, channel_id, sender_id in valid if channel_id not in self.new_channels
+        ])
+        if existing:
+            fresh = []
+            for line, record, channel_id, sender_id in valid:
+                matches = existing.get(_message_key(channel_id, sender_id, record))
+                if not matches:
+                    fresh.append((line, record, channel_id, sender_id))
+                elif record.parent is None:
+                    # Replies later in the file still find their thread
+                    self.roots[record.id] = (matches.pop(0), channel_id)
+                else:
+                    matches.pop(0)
+            valid = fresh
+        if not valid:
+            return 0
+
+        ids = shard_router.reserve_ids(self.db, CHANNEL, [channel_id for _, _, channel_id, _ in valid])
+        if ids is None:
+            first = self._reserve(Message.__table__, archive.archived_messages)
+            ids = range(first, first + len(valid))
+        rows = []
+        for message_id, (line, record, channel_id, sender_id) in zip(ids, valid):
+            created_at = _utc(record.created_at)
+            parent_id = None
+            if record.parent is not None:
+                parent = self.roots.get(record.parent)
+                if parent is None or parent[1] != channel_id:
+                    self._skip(line, f"unknown parent {record.parent!r}: not an earlier top-level message here")
+                    continue
+                parent_id = parent[0]
+                thread = self.threads.setdefault(parent_id, [channel_id, 0, created_at])
+                thread[1] += 1
+                thread[2] = max(thread[2], created_at)
+            else:
+                self.roots[record.id] = (message_id, channel_id)
+                self.channel_latest[channel_id] = message_id
+            edited_at = _utc(record.edited_at)
+            rows.append({
+                "id": message_id,
+                "content": record.content,
+                "message_type": record.message_type,
+                "file_url": record.file_url,
+                "channel_id": channel_id,
+                "sender_id": sender_id,
+                "parent_message_id": parent_id,
+                "reply_count": 0,
+                "last_reply_at": None,
+                "is_edited": edited_at is not None,
+                "edited_at": edited_at,
+                "created_at": created_at,
+                "updated_at": edited_at or created_at,
+            })
+
+        self._insert_by_shard(CHANNEL, Message.__table__, "channel_id", rows)
+        return len(rows)
+
+    def _write_direct_messages(self, pending: List[Tuple[int, ImportDirectMessage]]) -> int:
+        valid = []
+        for line, record in pending:
+            sender_id, receiver_id = self.users.get(record.sender), self.users.get(record.receiver)
+            if sender_id is None or receiver_id is None:
+                self._skip(line, f"unknown sender {record.sender!r} or receiver {record.receiver!r}")
+            else:
+                valid.append((record, sender_id, receiver_id, tuple(sorted((sender_id, receiver_id)))))
+        if not valid:
+            return 0
+
+        missing = {}
+        for record, _, _, pair in valid:
+            if pair not in self.conversations:
+                missing.setdefault(pair, _utc(record.created_at))
+        if missing:
+            self._open_conversations(missing)
+
+        existing = self._existing_messages(CONVERSATION, DirectMessage.__table__, "conversation_id", [
+            _message_key(self.conversations[pair], sender_id, record)
+            for record, sender_id, _, pair in valid if self.conversations[pair] not in self.new_conversations
+        ])
+        if existing:
+            fresh = []
+            for record, sender_id, receiver_id, pair in valid:
+                matches = existing.get(_message_key(self.conversations[pair], sender_id, record))
+                if matches:
+                    matches.pop(0)
+                else:
+                    fresh.append((record, sender_id, receiver_id, pair))
+            valid = fresh
+            if not valid:
+                return 0
+
+        conversation_ids = [self.conversations[pair] for *_, pair in valid]
+        ids = shard_router.reserve_ids(self.db, CONVERSATION, conversation_ids)
+        if ids is None:
+            first = self._reserve(DirectMessage.__table__, archive.archived_direct_messages)
+            ids = range(first, first + len(valid))
+        rows = []
+        for message_id, conversation_id, (record, sender_id, receiver_id, _) in zip(ids, conversation_ids, valid):
+            created_at = _utc(record.created_at)
+            edited_at = _utc(record.edited_at)
+            rows.append({
+                "id": message_id,
+                "content": record.content,
+                "message_type": record.message_type,
+                "file_url": record.file_url,
+                "conversation_id": conversation_id,
+                "sender_id": sender_id,
+                "receiver_id": receiver_id,
+                # Imported history counts as read
+                "is_read": True,
+                "read_at": created_at,
+                "is_edited": edited_at is not None,
+                "edited_at": edited_at,
+                "created_at": created_at,
+                "updated_at": edited_at or created_at,
+            })
+            if conversation_id in self.new_conversations:
+                self.new_conversations[conversation_id] = (message_id, created_at)
+
+        self._insert_by_shard(CONVERSATION, DirectMessage.__table__, "conversation_id", rows)
+        return len(rows)
+
+    def _existing_messages(self, scope: str, table: Table, key: str, wanted: List[tuple]) -> Dict[tuple, List[int]]:
+        """Ids of the stored messages that match `_message_key`s, oldest first"""
+        if not wanted:
+            return {}
+        column = table.c[key]
+        since = min(created_at for _, _, created_at, _ in wanted)
+        until = max(created_at for _, _, created_at, _ in wanted) + timedelta(seconds=1)
+        found: Dict[tuple, List[int]] = {}
+        for shard_db, scope_ids in shard_router.sessions(self.db, scope, list({scope_id for scope_id, *_ in wanted})):
+            for row in shard_db.execute(
+                select(table.c.id, column, table.c.sender_id, table.c.created_at, table.c.content)
+                .where(column.in_(scope_ids), table.c.created_at >= since, table.c.created_at < until)
+                .order_by(table.c.id)
+            ):
+                key_values = (row[1], row.sender_id, row.created_at.replace(microsecond=0), row.content)
+                found.setdefault(key_values, []).append(row.id)
+        return found
+
+    def _insert_by_shard(self, scope: str, table: Table, key: str, rows: List[dict]):
+        """Insert message rows into the shards of their channels or conversations"""
+        groups = shard_router.sessions(self.db, scope, list({row[key] for row in rows}))
+        for shard_db, scope_ids in groups:
+            if len(groups) == 1:
+                shard_db.execute(insert(table), rows)
+            else:
+                scope_ids = set(scope_ids)
+                shard_db.execute(insert(table), [row for row in rows if row[key] in scope_ids])
+
+    def _open_conversations(self, pairs: Dict[Tuple[int, int], datetime]):
+        """Look up or create the conversations of user pairs (low, high), with their participants"""
+        self.conversations.update(
+            ((user_low_id, user_high_id), conversation_id)
+            for user_low_id, user_high_id, conversation_id in self.db.execute(
+                select(Conversation.user_low_id, Conversation.user_high_id, Conversation.id).where(
+                    tuple_(Conversation.user_low_id, Conversation.user_high_id).in_(list(pairs))
+                )
+            )
+        )
+        new = [pair for pair in pairs if pair not in self.conversations]
+        if not new:
+            return
+        rows, participants = [], []
+        for conversation_id, (user_low_id, user_high_id) in enumerate(new, start=self._reserve(Conversation.__table__)):
+            rows.append({
+                "id": conversation_id,
+                "user_low_id": user_low_id,
+                "user_high_id": user_high_id,
+                "created_at": pairs[(user_low_id, user_high_id)],
+            })
+            participants.extend(
+                {"conversation_id": conversation_id, "user_id": user_id, "unread_count": 0}
+                for user_id in {user_low_id, user_high_id}
+            )
+            self.conversations[(user_low_id, user_high_id)] = conversation_id
+            self.new_conversations[conversation_id] = None
+        self.db.execute(insert(Conversation.__table__), rows)
+        self.db.execute(insert(ConversationParticipant.__table__), participants)
+        shard_router.place_many(self.db, CONVERSATION, [row["id"] for row in rows])
+
+    def _rebuild(self):
+        """Reply counts, read markers, channel versions and new conversations' summaries"""
+        self._flush()
+        threads = self.threads
+        for shard_db, channel_ids in shard_router.sessions(
+            self.db, CHANNEL, list({channel_id for channel_id, _, _ in threads.values()})
+        ):
+            channel_ids = set(channel_ids)
+            self._execute_batches(
+                shard_db,
+                # The root may be from an earlier import, with replies of its own
+                update(Message.__table__).where(Message.id == bindparam("row_id")).values(
+                    reply_count=Message.reply_count + bindparam("replies"),
+                    last_reply_at=case(
+                        (Message.last_reply_at > bindparam("replied_at"), Message.last_reply_at),
+                        else_=bindparam("replied_at")
+                    )
+                ),
+                [
+                    {"row_id": root_id, "replies": replies, "replied_at": replied_at}
+                    for root_id, (channel_id, replies, replied_at) in threads.items() if channel_id in channel_ids
+                ]
+            )
+
+        # Members of imported channels start with the imported history read
+        self._execute_batches(
+            self.db,
+            update(channel_members).where(channel_members.c.channel_id == bindparam("row_channel_id"))
+            .values(last_read_message_id=bindparam("latest_id")),
+            [
+                {"row_channel_id": channel_id, "latest_id": latest_id}
+                for channel_id, latest_id in self.channel_latest.items()
+            ]
+        )
+        # Drops any history page cached while the import was running
+        channel_ids = list(self.channels.values())
+        for start in range(0, len(channel_ids), self.batch_size):
+            self.db.execute(
+                update(Channel.__table__).where(Channel.id.in_(channel_ids[start:start + self.batch_size]))
+                .values(version=Channel.version + 1)
+            )
+
+        latest = [
+            {"row_id": conversation_id, "latest_id": message[0], "latest_at": message[1]}
+            for conversation_id, message in self.new_conversations.items() if message is not None
+        ]
+        self._execute_batches(
+            self.db,
+            update(Conversation.__table__).where(Conversation.id == bindparam("row_id"))
+            .values(last_message_id=bindparam("latest_id"), last_message_at=bindparam("latest_at")),
+            latest
+        )
+        self._execute_batches(
+            self.db,
+            update(ConversationParticipant.__table__)
+            .where(ConversationParticipant.conversation_id == bindparam("row_id"))
+            .values(last_message_id=bindparam("latest_id"), last_read_message_id=bindparam("latest_id")),
+            latest
+        )
+
+    def _execute_batches(self, session: Session, statement, rows: List[dict]):
+        for start in range(0, len(rows), self.batch_size):
+            session.execute(statement, rows[start:start + self.batch_size])
+
+
+def _open(path: str):
+    if path == "-":
+        return sys.stdin.buffer
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def import_file(
+    path: str, owner: str, batch_size: Optional[int] = None, transaction_rows: Optional[int] = None
+) -> dict:
+    """Import an NDJSON file (gzip if it ends in .gz, stdin for "-"), printing progress; returns the report"""
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        owner_id = db.query(User.id).filter(User.username == owner).scalar()
+        if owner_id is None:
+            raise ValueError(f"Unknown user {owner!r}")
+        importer = WorkspaceImporter(db, owner_id, batch_size, transaction_rows)
+        with _open(path) as lines:
+            for progress in importer.run(lines):
+                print(orjson.dumps(progress).decode(), flush=True)
+        asyncio.run(importer.refresh_caches())
+        return importer.report()
+    finally:
+        close_shard_sessions(db)
+        db.close()
+
+
+def set_superuser(username: str, is_superuser: bool = True):
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        updated = db.query(User).filter(User.username == username).update({User.is_superuser: is_superuser})
+        if not updated:
+            raise ValueError(f"Unknown user {username!r}")
+        db.commit()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m app.importer", description="Import a workspace from NDJSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="import an NDJSON file (.gz for gzip, - for stdin)")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--owner", required=True, help="username that creates teams and channels by default")
+    import_parser.add_argument("--batch-size", type=int, default=settings.import_batch_size)
+    import_parser.add_argument("--transaction-rows", type=int, default=settings.import_transaction_rows)
+    superuser_parser = commands.add_parser("superuser", help="allow a user to import through the API")
+    superuser_parser.add_argument("username")
+    superuser_parser.add_argument("--revoke", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "superuser":
+        set_superuser(args.username, not args.revoke)
+    else:
+        report = import_file(args.path, args.owner, args.batch_size, args.transaction_rows)
+        print(orjson.dumps(report).decode())
+        sys.exit(0 if report["done"] else 1)
@@ -0,0 +1,240 @@
+"""Event loop lag, stall attribution and an on-demand sampling profiler.
+
+Handlers are `async def` but some of them still call blocking code (the
+database, bcrypt) on the event loop thread; while one runs, every other
+request and WebSocket on the worker waits. `LoopMonitor` (`loop_monitor`),
+started with the app, makes that visible:
+
+- a task wakes up every LOOP_MONITOR_INTERVAL_MS and records how late it
+  woke up (the loop lag)
+- a watchdog thread checks that those wake-ups keep coming; once the loop
+  has been stuck for LOOP_STALL_THRESHOLD_MS it takes the loop thread's
+  stack and attributes the stall to the request route ("POST
+  /api/auth/login") or WebSocket message type ("WEBSOCKET /ws
+  join_channel") found on it, else to the innermost app function
+
+Both only wake a few times per interval and look at stacks only when the
+loop is stuck, so they stay on. GET /api/admin/loop reports the lag
+percentiles and recent stalls of the worker that serves it.
+
+`sample_stacks` backs GET /api/admin/profile: it samples the loop thread's
+stack from another thread for a few seconds and returns collapsed stacks
+("frame;frame;frame count" lines), the input of flamegraph.pl, speedscope
+and most flamegraph viewers.
+"""
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+
+from app.config import LazyInstance, settings
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Frames kept per recorded stall, innermost last
+STALL_STACK_DEPTH = 20
+# One profile at a time per worker
+_profile_lock = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _frames(thread_id: int) -> List:
+    """Frames of a thread's current stack, outermost first"""
+    frame = sys._current_frames().get(thread_id)
+    stack = []
+    while frame is not None:
+        stack.append(frame)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _route_path(scope: dict) -> str:
+    """Route template of a routed request (so ids do not split the counts), else its path"""
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is not None and app is not None:
+        for route in getattr(app, "routes", []):
+            if getattr(route, "endpoint", None) is endpoint:
+                return route.path
+    return scope.get("path", "")
+
+
+def attribute(stack: List) -> str:
+    """What a stack (outermost first) was doing: route, WebSocket message type or app function"""
+    from app.websocket.connection_manager import ConnectionManager
+
+    label = None
+    for frame in stack:
+        code = frame.f_code
+        if code is ConnectionManager.handle_message.__code__:
+            data = frame.f_locals.get("data")
+            if label and isinstance(data, dict):
+                return f"{label} {data.get('type')}"
+        elif "scope" in code.co_varnames:
+            scope = frame.f_locals.get("scope")
+            if isinstance(scope, dict) and scope.get("type") in ("http", "websocket"):
+                method = scope.get("method", "WEBSOCKET")
+                label = f"{method} {_route_path(scope)}"
+    if label:
+        return label
+    for frame in reversed(stack):
+        if frame.f_code.co_filename.startswith(APP_DIR):
+            return _frame_name(frame)
+    return "unknown"
+
+
+class LoopMonitor:
+    """Loop lag and stalls of one worker's event loop (see the module docstring)"""
+
+    def __init__(self, interval: float = 0.1, stall_threshold: float = 0.2, history: int = 50):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        # Lag of the recent wake-ups, in seconds (about a minute of them)
+        self.lags: Deque[float] = deque(maxlen=max(1, int(60 / interval)))
+        self.max_lag = 0.0
+        self.stalls: Deque[dict] = deque(maxlen=history)
+        # label -> [count, total seconds, max seconds]
+        self.by_label: Dict[str, list] = {}
+        self.heartbeat = time.monotonic()
+        # Stack taken by the watchdog for the stall in progress
+        self._pending: Optional[dict] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._loop_thread_id = threading.get_ident()
+            self.heartbeat = time.monotonic()
+            self._task = asyncio.get_running_loop().create_task(self._beat())
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+        return self._task
+
+    async def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+            self._thread = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = self.heartbeat = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.stall_threshold:
+                self._record_stall(lag)
+            else:
+                self._pending = None
+
+    def _watch(self):
+        """Watchdog thread: take the loop thread's stack once per stall"""
+        check = min(self.interval, self.stall_threshold) / 2
+        while not self._stopping.wait(check):
+            stuck_for = time.monotonic() - self.heartbeat - self.interval
+            if stuck_for < self.stall_threshold or self._pending is not None:
+                continue
+            try:
+                stack = _frames(self._loop_thread_id)
+                self._pending = {
+                    "label": attribute(stack),
+                    "stack": [_frame_name(frame) for frame in stack[-STALL_STACK_DEPTH:]],
+                }
+            except Exception as e:
+                logger.error(f"Error inspecting the stalled event loop: {e}")
+                self._pending = {"label": "unknown", "stack": []}
+
+    def _record_stall(self, lag: float):
+        # Stalls that ended before the watchdog looked keep no stack
+        pending, self._pending = self._pending, None
+        pending = pending or {"label": "unknown", "stack": []}
+        stats = self.by_label.setdefault(pending["label"], [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += lag
+        stats[2] = max(stats[2], lag)
+        self.stalls.append({"at": time.time(), "duration_ms": round(lag * 1000, 1), **pending})
+        logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms in {pending['label']}")
+
+    def snapshot(self) -> dict:
+        """Lag percentiles over the recent wake-ups, stall counts per label and the latest stalls"""
+        lags = sorted(self.lags)
+
+        def percentile(pct: float) -> float:
+            if not lags:
+                return 0.0
+            return round(lags[min(len(lags) - 1, int(len(lags) * pct / 100))] * 1000, 2)
+
+        return {
+            "pid": os.getpid(),
+            "running": self._task is not None and not self._task.done(),
+            "interval_ms": self.interval * 1000,
+            "stall_threshold_ms": self.stall_threshold * 1000,
+            "lag_ms": {"p50": percentile(50), "p99": percentile(99), "max": percentile(100)},
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "stalls": sum(stats[0] for stats in self.by_label.values()),
+            "stalls_by_label": {
+                label: {"count": count, "total_ms": round(total * 1000, 1), "max_ms": round(worst * 1000, 1)}
+                for label, (count, total, worst) in sorted(
+                    self.by_label.items(), key=lambda item: item[1][1], reverse=True
+                )
+            },
+            "recent_stalls": list(reversed(self.stalls)),
+        }
+
+
+def sample_stacks(thread_id: Optional[int], seconds: float, interval: float) -> Optional[str]:
+    """Collapsed stacks of a thread (every thread with None) sampled for `seconds`; None while a profile runs"""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        samples: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            thread_ids = [thread_id] if thread_id is not None else list(sys._current_frames())
+            for ident in thread_ids:
+                if ident == me:
+                    continue
+                stack = _frames(ident)
+                if not stack:
+                    continue
+                frames = [_frame_name(frame) for frame in stack]
+                if thread_id is None:
+                    frames.insert(0, names.get(ident, str(ident)))
+                samples[";".join(frames)] += 1
+            time.sleep(interval)
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+    finally:
+        _profile_lock.release()
+
+
+# Global instance, started by the app's lifespan when LOOP_MONITOR_ENABLED is set
+loop_monitor = LazyInstance(lambda: LoopMonitor(
+    interval=settings.loop_monitor_interval_ms / 1000,
+    stall_threshold=settings.loop_stall_threshold_ms / 1000,
+    history=settings.loop_stall_history,
+))
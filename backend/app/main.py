@@ -1,43 +1,115 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+import logging
 from app.config import settings
-from app.database import engine, Base
-from app.api import auth, teams, channels, messages, users
+from app.database import get_engine
+from app.loop_monitor import loop_monitor
+from app.notifications import notification_worker
+from app.reactions import reaction_aggregator
+from app.rate_limit import RateLimitMiddleware, SlidingWindowLimiter
+from app.redis_client import redis_client
+from app.api import admin, auth, teams, channels, messages, users, bootstrap, imports, notifications
+from app.websocket.connection_manager import manager
 from app.websocket.endpoints import websocket_endpoint
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-# Create FastAPI app
-app = FastAPI(
-    title="SyncSpace API",
-    description="Real-Time Chat Application for Team Collaboration",
-    version="1.0.0"
-)
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.cors_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def check_database():
+    with get_engine().connect() as connection:
+        connection.execute(text("SELECT 1"))
+
 
-# Add trusted host middleware for production
-if settings.environment == "production":
+async def warm_up():
+    """Open the database pool and Redis connection before the first request needs them"""
+    try:
+        await run_in_threadpool(check_database)
+        await redis_client.ping()
+    except Exception as e:
+        logger.error(f"Startup warm-up failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Started first, so a slow warm-up shows up as a stall
+    if settings.loop_monitor_enabled:
+        loop_monitor.start()
+    # The schema is managed out-of-band (`alembic upgrade head`), never at startup
+    if settings.startup_warm_up:
+        await warm_up()
+    if settings.notification_worker_enabled:
+        notification_worker.start()
+    yield
+    await notification_worker.stop()
+    # Write reactions still waiting in Redis
+    await reaction_aggregator.stop()
+    # Normally already started by the WebSocket protocol on SIGTERM; waits for it to finish
+    await manager.drain()
+    await loop_monitor.stop()
+
+
+def add_middleware(app: FastAPI):
+    # Add rate limiting (inside CORS so 429 responses still carry CORS headers)
+    if settings.rate_limit_enabled:
+        app.add_middleware(
+            RateLimitMiddleware,
+            limiter=SlidingWindowLimiter(redis_client, settings.rate_limit_sync_interval_ms / 1000),
+            rules=settings.rate_limits,
+            secret_key=settings.secret_key,
+            algorithm=settings.algorithm,
+            default_rate=settings.rate_limit_default,
+            trusted_proxy_hops=settings.rate_limit_trusted_proxy_hops
+        )
+
+    # Add CORS middleware
     app.add_middleware(
-        TrustedHostMiddleware,
-        allowed_hosts=["syncspace.com", "*.syncspace.com"]
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
     )
 
+    # Add trusted host middleware for production
+    if settings.environment == "production":
+        app.add_middleware(
+            TrustedHostMiddleware,
+            allowed_hosts=["syncspace.com", "*.syncspace.com"]
+        )
+
+
+class SyncSpaceAPI(FastAPI):
+    """FastAPI app whose settings-dependent middleware is added when the server first calls it, not on import"""
+
+    def build_middleware_stack(self):
+        add_middleware(self)
+        return super().build_middleware_stack()
+
+
+# Create FastAPI app
+app = SyncSpaceAPI(
+    title="SyncSpace API",
+    description="Real-Time Chat Application for Team Collaboration",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
 # Include API routers
 app.include_router(auth.router, prefix="/api")
 app.include_router(users.router, prefix="/api")
 app.include_router(teams.router, prefix="/api")
 app.include_router(channels.router, prefix="/api")
 app.include_router(messages.router, prefix="/api")
+app.include_router(bootstrap.router, prefix="/api")
+app.include_router(imports.router, prefix="/api")
+app.include_router(notifications.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
 
 # WebSocket endpoint
 app.websocket("/ws")(websocket_endpoint)
@@ -56,10 +128,29 @@ async def health_check():
 
 
 if __name__ == "__main__":
+    # The server entrypoint (Dockerfile, benchmarks): `uvicorn app.main:app` cannot load
+    # the app's WebSocket protocol, as its --ws option only takes uvicorn's built-in ones
+    import argparse
     import uvicorn
+    from app.websocket.protocol import SyncSpaceWebSocketProtocol
+
+    parser = argparse.ArgumentParser(prog="python -m app.main")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--reload", action=argparse.BooleanOptionalAction, default=settings.environment == "development"
+    )
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--access-log", action=argparse.BooleanOptionalAction, default=True)
+    args = parser.parse_args()
     uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True if settings.environment == "development" else False
+        # Reloading needs an import string; otherwise this module is not imported a second time
+        "app.main:app" if args.reload else app,
+        host=args.host,
+        port=args.port,
+        reload=args.reload,
+        log_level=args.log_level,
+        access_log=args.access_log,
+        # Tuned permessage-deflate and graceful drain on shutdown
+        ws=SyncSpaceWebSocketProtocol
     )
@@ -1,10 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Table
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Table, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
-
-Base = declarative_base()
+from app.database import Base
 
 # Association table for team members
 team_members = Table(
@@ -13,7 +11,9 @@ team_members = Table(
     Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
     Column('team_id', Integer, ForeignKey('teams.id'), primary_key=True),
     Column('role', String(50), default='member'),  # admin, member
-    Column('joined_at', DateTime, default=func.now())
+    Column('joined_at', DateTime, default=func.now()),
+    # The primary key leads with user_id; member lists look up by team
+    Index('ix_team_members_team_id', 'team_id')
 )
 
 # Association table for channel members
@@ -22,7 +22,11 @@ channel_members = Table(
     Base.metadata,
     Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
     Column('channel_id', Integer, ForeignKey('channels.id'), primary_key=True),
-    Column('joined_at', DateTime, default=func.now())
+    Column('joined_at', DateTime, default=func.now()),
+    # Newest top-level message the member has seen; later ones count as unread
+    Column('last_read_message_id', Integer),
+    # Fan-out and member lists look up by channel
+    Index('ix_channel_members_channel_id', 'channel_id')
 )
 
 
@@ -37,6 +41,8 @@ class User(Base):
     avatar_url = Column(String(255))
     is_active = Column(Boolean, default=True)
     is_online = Column(Boolean, default=False)
+    # Instance administrators, e.g. for workspace imports; granted with `python -m app.importer superuser`
+    is_superuser = Column(Boolean, default=False, server_default="0", nullable=False)
     last_seen = Column(DateTime, default=func.now())
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -76,6 +82,8 @@ class Channel(Base):
     is_private = Column(Boolean, default=False)
     team_id = Column(Integer, ForeignKey("teams.id"))
     created_by = Column(Integer, ForeignKey("users.id"))
+    # Bumped on every message send, edit and delete; keys cached history pages
+    version = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -95,17 +103,28 @@ class Message(Base):
     file_url = Column(String(255))
     channel_id = Column(Integer, ForeignKey("channels.id"))
     sender_id = Column(Integer, ForeignKey("users.id"))
-    parent_message_id = Column(Integer, ForeignKey("messages.id"))  # For threaded messages
+    parent_message_id = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"))  # For threaded messages
+    reply_count = Column(Integer, default=0, server_default="0", nullable=False)  # Maintained on reply send/delete
+    last_reply_at = Column(DateTime)
     is_edited = Column(Boolean, default=False)
     edited_at = Column(DateTime)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        # Channel pages: top-level messages (parent_message_id IS NULL) newest first
+        Index("ix_messages_channel_id_parent_message_id_created_at", "channel_id", "parent_message_id", "created_at"),
+        # Thread pages: replies of one parent in id order
+        Index("ix_messages_parent_message_id_id", "parent_message_id", "id"),
+        # Exports: a channel's messages in id order
+        Index("ix_messages_channel_id_id", "channel_id", "id"),
+    )
+
     # Relationships
     channel = relationship("Channel", back_populates="messages")
     sender = relationship("User", back_populates="sent_messages")
-    parent_message = relationship("Message", remote_side=[id])
-    replies = relationship("Message", remote_side=[parent_message_id])
+    parent_message = relationship("Message", remote_side=[id], back_populates="replies")
+    replies = relationship("Message", back_populates="parent_message", passive_deletes=True)
 
 
 class DirectMessage(Base):
@@ -115,6 +134,7 @@ class DirectMessage(Base):
     content = Column(Text, nullable=False)
     message_type = Column(String(20), default="text")
     file_url = Column(String(255))
+    conversation_id = Column(Integer, ForeignKey("conversations.id"))
     sender_id = Column(Integer, ForeignKey("users.id"))
     receiver_id = Column(Integer, ForeignKey("users.id"))
     is_read = Column(Boolean, default=False)
@@ -124,9 +144,100 @@ class DirectMessage(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        # Conversation history: one range scan per conversation
+        Index("ix_direct_messages_conversation_id_id", "conversation_id", "id"),
+    )
+
     # Relationships
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_direct_messages")
     receiver = relationship("User", foreign_keys=[receiver_id], back_populates="received_direct_messages")
+    conversation = relationship("Conversation", foreign_keys=[conversation_id])
+
+
+class Conversation(Base):
+    __tablename__ = "conversations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Canonical pair for 1:1 conversations: user_low_id < user_high_id
+    user_low_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_high_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Not a foreign key: with message sharding the message lives in another database
+    last_message_id = Column(Integer)
+    last_message_at = Column(DateTime)
+    created_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_low_id", "user_high_id", name="uq_conversations_user_pair"),
+    )
+
+    # Relationships
+    participants = relationship("ConversationParticipant", back_populates="conversation")
+
+
+class ConversationParticipant(Base):
+    __tablename__ = "conversation_participants"
+
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    # Copied from the conversation so the inbox is a single-index scan per user
+    last_message_id = Column(Integer)
+    last_read_message_id = Column(Integer)
+    unread_count = Column(Integer, default=0, server_default="0", nullable=False)
+
+    __table_args__ = (
+        Index("ix_conversation_participants_user_id_last_message_id", "user_id", "last_message_id"),
+    )
+
+    # Relationships
+    conversation = relationship("Conversation", back_populates="participants")
+    user = relationship("User")
+
+
+class Notification(Base):
+    __tablename__ = "notifications"
+
+    # Inbox of @mentions that reached a user while they were offline (app.notifications)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String(20), nullable=False)  # mention, channel
+    channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
+    # Not a foreign key: with message sharding the message lives in another database
+    message_id = Column(Integer, nullable=False)
+    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Start of the message, so the inbox is listed without reading shards
+    excerpt = Column(String(200), nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    read_at = Column(DateTime)
+
+    __table_args__ = (
+        # A redelivered job or a user mentioned twice in one message adds nothing
+        UniqueConstraint("user_id", "message_id", name="uq_notifications_user_id_message_id"),
+        # Inbox pages: a user's notifications newest first
+        Index("ix_notifications_user_id_id", "user_id", "id"),
+    )
+
+
+class MessageReaction(Base):
+    __tablename__ = "message_reactions"
+
+    # Who reacted with what; written in batches from Redis (app.reactions)
+    # Not a foreign key: with message sharding the message lives in another database
+    message_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    emoji = Column(String(64), primary_key=True)
+    channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+
+class MessageReactionCount(Base):
+    __tablename__ = "message_reaction_counts"
+
+    # Totals of message_reactions, recounted for the messages of each batch, so history
+    # pages read one row per (message, emoji) instead of counting reactions
+    message_id = Column(Integer, primary_key=True)
+    emoji = Column(String(64), primary_key=True)
+    count = Column(Integer, nullable=False)
 
 
 class UserPresence(Base):
@@ -140,3 +251,43 @@ class UserPresence(Base):
 
     # Relationships
     user = relationship("User")
+
+
+class ShardPlacement(Base):
+    __tablename__ = "shard_placements"
+
+    # Which message shard (app.sharding) holds a channel's or a conversation's messages;
+    # those without a row are in the main database
+    scope = Column(String(20), primary_key=True)  # channel, conversation
+    scope_id = Column(Integer, primary_key=True)
+    shard = Column(String(50), nullable=False)
+    # Set while `python -m app.sharding move` copies the messages; writes are refused meanwhile
+    moving = Column(Boolean, default=False, server_default="0", nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class ImportedRecord(Base):
+    __tablename__ = "imported_records"
+
+    # Team or channel a workspace import (app.importer) created for a source id, so
+    # importing the same workspace again attaches to it instead of creating another
+    record_type = Column(String(20), primary_key=True)  # team, channel
+    source_id = Column(String(100), primary_key=True)
+    local_id = Column(Integer, nullable=False)
+
+
+# Ids of messages written while sharding is on, allocated here so they are
+# unique across shards, and the channel or conversation each belongs to
+message_locations = Table(
+    'message_locations',
+    Base.metadata,
+    Column('id', Integer, primary_key=True),
+    Column('channel_id', Integer, nullable=False)
+)
+
+direct_message_locations = Table(
+    'direct_message_locations',
+    Base.metadata,
+    Column('id', Integer, primary_key=True),
+    Column('conversation_id', Integer, nullable=False)
+)
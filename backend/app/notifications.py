@@ -0,0 +1,305 @@
+"""@mention notifications.
+
+Channel messages are scanned for mentions as they are sent (`parse_mentions`):
+@username, @channel (every member of the channel) and @here (the members who
+are online). A message with any of them queues one job on a Redis Stream
+(`notification_queue`); the send route does no extra queries.
+
+`NotificationWorker`, started with the app, reads the jobs. It resolves
+usernames to users who can read the channel, leaves out the sender and
+splits the recipients by presence:
+
+- online users get a `mention` event through ConnectionManager.publish, the
+  same path (and per-user event log) as message events
+- offline users get a row in the `notifications` inbox (GET /api/notifications),
+  except for @here, which is only meant for whoever is around
+
+Inbox rows are written with multi-row inserts of NOTIFICATION_BATCH_SIZE that
+skip existing (user, message) pairs, so a @channel in a 10k-member channel is
+a handful of statements and a redelivered job adds nothing. @channel and
+@here are held per channel for NOTIFICATION_DEBOUNCE_MS: a burst of them
+becomes one notification about the latest message (with `count`) instead
+of one per message for every member. Jobs are acknowledged once delivered;
+those of a process that died are claimed after NOTIFICATION_CLAIM_IDLE_MS.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+import asyncio
+import logging
+import os
+import re
+import socket
+import time
+
+from sqlalchemy import and_
+from starlette.concurrency import run_in_threadpool
+
+from app.config import LazyInstance, settings
+from app.database import SessionLocal, insert_ignore
+from app.models import Channel, Notification, User, channel_members, team_members
+from app.redis_client import NotificationQueue, notification_queue, presence_manager
+
+logger = logging.getLogger(__name__)
+
+# "@name", not part of an email address or another mention; trailing dots and dashes are punctuation
+MENTION_PATTERN = re.compile(r"(?<![\w@.])@(\w[\w.-]*)")
+MAX_MENTIONED_USERS = 50
+EXCERPT_LENGTH = 200
+
+
+@dataclass
+class Mentions:
+    usernames: Set[str] = field(default_factory=set)
+    channel: bool = False
+    here: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.usernames or self.channel or self.here)
+
+
+def parse_mentions(content: str) -> Mentions:
+    """Usernames and @channel / @here mentioned in a message"""
+    mentions = Mentions()
+    if "@" not in content:
+        return mentions
+    for match in MENTION_PATTERN.finditer(content):
+        name = match.group(1).rstrip(".-")
+        if name.lower() == "channel":
+            mentions.channel = True
+        elif name.lower() == "here":
+            mentions.here = True
+        elif name:
+            mentions.usernames.add(name)
+    return mentions
+
+
+def mention_job(message: dict, mentions: Mentions) -> dict:
+    """The queued job for a sent message (MessageSchema dumped with mode="json")"""
+    return {
+        "message_id": message["id"],
+        "channel_id": message["channel_id"],
+        "sender_id": message["sender_id"],
+        "parent_message_id": message["parent_message_id"],
+        "excerpt": message["content"][:EXCERPT_LENGTH],
+        "usernames": sorted(mentions.usernames)[:MAX_MENTIONED_USERS],
+        "channel": mentions.channel,
+        "here": mentions.here,
+    }
+
+
+def mentioned_readers(channel_id: int, usernames: List[str], sender_id: int) -> List[int]:
+    """Ids of the mentioned users who can read the channel, without the sender"""
+    if not usernames:
+        return []
+    db = SessionLocal()
+    try:
+        channel = db.query(Channel.team_id, Channel.is_private).filter(Channel.id == channel_id).first()
+        if not channel:
+            return []
+        query = db.query(User.id).filter(User.username.in_(usernames), User.id != sender_id)
+        # Same rule as the REST routes: team members see public channels, members see private ones
+        if channel.is_private:
+            query = query.join(channel_members, and_(
+                channel_members.c.user_id == User.id, channel_members.c.channel_id == channel_id
+            ))
+        else:
+            query = query.join(team_members, and_(
+                team_members.c.user_id == User.id, team_members.c.team_id == channel.team_id
+            ))
+        return [row.id for row in query]
+    finally:
+        db.close()
+
+
+def channel_recipients(channel_id: int, sender_id: int, skip_usernames: List[str]) -> List[int]:
+    """Members reached by @channel / @here, without the sender and users mentioned by name"""
+    db = SessionLocal()
+    try:
+        query = db.query(channel_members.c.user_id).filter(
+            channel_members.c.channel_id == channel_id,
+            channel_members.c.user_id != sender_id
+        )
+        if skip_usernames:
+            query = query.join(User, User.id == channel_members.c.user_id).filter(User.username.notin_(skip_usernames))
+        return [row.user_id for row in query]
+    finally:
+        db.close()
+
+
+def store_notifications(job: dict, kind: str, user_ids: List[int], batch_size: int):
+    """Add inbox rows for offline users, one multi-row insert per batch, in one transaction"""
+    rows = [
+        {
+            "user_id": user_id,
+            "kind": kind,
+            "channel_id": job["channel_id"],
+            "message_id": job["message_id"],
+            "sender_id": job["sender_id"],
+            "excerpt": job["excerpt"],
+        }
+        for user_id in user_ids
+    ]
+    db = SessionLocal()
+    try:
+        for start in range(0, len(rows), batch_size):
+            # Conflicts are on (user_id, message_id); the autoincrement id is not in the rows
+            insert_ignore(db, Notification.__table__, rows[start:start + batch_size], no_op_column="user_id")
+        db.commit()
+    finally:
+        db.close()
+
+
+@dataclass
+class PendingBroadcast:
+    """@channel / @here jobs of one channel held until `due`"""
+    due: float
+    entries: List[str] = field(default_factory=list)
+    jobs: List[dict] = field(default_factory=list)
+
+
+class NotificationWorker:
+    """Reads mention jobs from the stream and notifies users (see the module docstring)"""
+
+    def __init__(
+        self,
+        queue: NotificationQueue,
+        consumer: Optional[str] = None,
+        read_count: int = 100,
+        block_ms: int = 1000,
+        claim_idle_ms: int = 60000,
+        debounce: float = 2.0,
+        batch_size: int = 1000,
+    ):
+        self.queue = queue
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.read_count = read_count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.debounce = debounce
+        self.batch_size = batch_size
+        # channel_id -> held @channel / @here jobs
+        self.pending: Dict[int, PendingBroadcast] = {}
+        self.held: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        """Stop reading; held jobs stay unacknowledged and are claimed by another worker"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _wait_ms(self) -> int:
+        # Wake up for the first held broadcast that falls due; 0 would block forever
+        if not self.pending:
+            return self.block_ms
+        due = min(pending.due for pending in self.pending.values())
+        return max(1, min(self.block_ms, int((due - time.monotonic()) * 1000)))
+
+    async def _run(self):
+        last_claim = 0.0
+        while True:
+            try:
+                await self.queue.ensure_group()
+                while True:
+                    entries = []
+                    if time.monotonic() - last_claim >= self.claim_idle_ms / 1000:
+                        last_claim = time.monotonic()
+                        entries += await self.queue.claim_stale(self.consumer, self.claim_idle_ms, self.read_count)
+                    wait_ms, started = self._wait_ms(), time.monotonic()
+                    entries += await self.queue.read(self.consumer, self.read_count, wait_ms)
+                    if not entries:
+                        # Servers that do not block on reads (the memory:// stand-in) would make this spin
+                        await asyncio.sleep(max(0.0, wait_ms / 1000 - (time.monotonic() - started)))
+                    await self.handle(entries)
+                    await self.flush_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Unacknowledged jobs are read again once claimed
+                logger.error(f"Error processing mention notifications: {e}")
+                await asyncio.sleep(1)
+
+    async def handle(self, entries: List[tuple]):
+        """Deliver mentions by name now; hold @channel / @here for their channel's debounce window"""
+        done = []
+        for entry_id, job in entries:
+            if entry_id in self.held:
+                continue
+            await self.deliver_mentions(job)
+            if job["channel"] or job["here"]:
+                pending = self.pending.get(job["channel_id"])
+                if pending is None:
+                    pending = self.pending[job["channel_id"]] = PendingBroadcast(time.monotonic() + self.debounce)
+                pending.entries.append(entry_id)
+                pending.jobs.append(job)
+                self.held.add(entry_id)
+            else:
+                done.append(entry_id)
+        await self.queue.ack(done)
+
+    async def flush_due(self, force: bool = False):
+        """Deliver the held broadcasts whose window has passed (all of them with `force`)"""
+        now = time.monotonic()
+        for channel_id, pending in list(self.pending.items()):
+            if force or pending.due <= now:
+                await self.deliver_broadcast(pending.jobs)
+                await self.queue.ack(pending.entries)
+                del self.pending[channel_id]
+                self.held.difference_update(pending.entries)
+
+    async def deliver_mentions(self, job: dict):
+        user_ids = await run_in_threadpool(mentioned_readers, job["channel_id"], job["usernames"], job["sender_id"])
+        await self.notify(job, "mention", user_ids, inbox=True)
+
+    async def deliver_broadcast(self, jobs: List[dict]):
+        latest = max(jobs, key=lambda job: job["message_id"])
+        everyone = any(job["channel"] for job in jobs)
+        # Users named in any of the held messages got their own mention for it
+        mentioned = sorted({username for job in jobs for username in job["usernames"]})
+        user_ids = await run_in_threadpool(channel_recipients, latest["channel_id"], latest["sender_id"], mentioned)
+        await self.notify(latest, "channel" if everyone else "here", user_ids, inbox=everyone, count=len(jobs))
+
+    async def notify(self, job: dict, kind: str, user_ids: List[int], inbox: bool, count: int = 1):
+        """Publish to online users and, with `inbox`, store for offline ones"""
+        if not user_ids:
+            return
+        from app.websocket.connection_manager import manager
+
+        statuses = await presence_manager.get_statuses(user_ids)
+        online = [user_id for user_id in user_ids if statuses[user_id] != "offline"]
+        offline = [user_id for user_id in user_ids if statuses[user_id] == "offline"]
+        if online:
+            await manager.publish(online, {
+                "type": "mention",
+                "data": {
+                    "kind": kind,
+                    "channel_id": job["channel_id"],
+                    "message_id": job["message_id"],
+                    "parent_message_id": job["parent_message_id"],
+                    "sender_id": job["sender_id"],
+                    "excerpt": job["excerpt"],
+                    "count": count,
+                }
+            })
+        if inbox and offline:
+            await run_in_threadpool(store_notifications, job, kind, offline, self.batch_size)
+
+
+# Global instance, started by the app's lifespan when NOTIFICATION_WORKER_ENABLED is set
+notification_worker = LazyInstance(lambda: NotificationWorker(
+    notification_queue,
+    read_count=settings.notification_read_count,
+    block_ms=settings.notification_block_ms,
+    claim_idle_ms=settings.notification_claim_idle_ms,
+    debounce=settings.notification_debounce_ms / 1000,
+    batch_size=settings.notification_batch_size,
+))
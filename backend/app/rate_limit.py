@@ -0,0 +1,322 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import math
+import re
+import time
+from jose import JWTError, jwt
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """In-process token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self, cost: float = 1.0) -> bool:
+        """Take `cost` tokens if available; returns False when over the limit"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+# Refill and take up to ARGV[3] tokens atomically; time comes from the Redis
+# server so that workers with skewed clocks share one consistent bucket
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return granted
+"""
+
+
+class RedisTokenBucket:
+    """Token bucket shared by every worker through Redis.
+
+    Tokens are leased from Redis `lease_size` at a time and spent locally, so a
+    busy client costs one round-trip per lease rather than one per event. An
+    empty bucket is remembered locally until the next token is due. Redis errors
+    fail open: a limiter outage must not take the real-time path down with it.
+    """
+
+    def __init__(self, redis, key: str, rate: float, capacity: int, lease_size: int = 10):
+        self.redis = redis
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.lease_size = max(1, min(lease_size, capacity))
+        self.leased = 0
+        self.empty_until = 0.0
+        self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def consume(self, cost: int = 1) -> bool:
+        """Take `cost` tokens, leasing more from Redis when the local lease runs out"""
+        if self.leased >= cost:
+            self.leased -= cost
+            return True
+
+        now = time.monotonic()
+        if now < self.empty_until:
+            return False
+
+        try:
+            granted = int(await self._script(
+                keys=[self.key], args=[self.rate, self.capacity, max(cost, self.lease_size)]
+            ))
+        except Exception as e:
+            logger.error(f"Shared rate limit check failed for {self.key}: {e}")
+            return True
+
+        self.leased += granted
+        if self.leased >= cost:
+            self.leased -= cost
+            return True
+
+        self.empty_until = now + cost / self.rate
+        return False
+
+
+WINDOW_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """Parse a "10/minute" style limit into (limit, window_seconds)"""
+    count, _, unit = rate.partition("/")
+    unit = unit.strip().lower()
+    if unit.endswith("s"):
+        unit = unit[:-1]
+    return int(count), WINDOW_UNITS[unit]
+
+
+class _WindowCounter:
+    __slots__ = ("window", "window_index", "previous", "current", "unsynced")
+
+    def __init__(self, window: int, window_index: int):
+        self.window = window
+        self.window_index = window_index
+        self.previous = 0
+        self.current = 0
+        self.unsynced = 0
+
+
+class SlidingWindowLimiter:
+    """Sliding-window-counter limits decided in-process and reconciled through Redis.
+
+    Each key keeps the last known global counts for the current and previous
+    fixed window plus the hits this worker has not pushed yet, so `hit()` never
+    touches the network. A background task pushes unsynced hits with INCRBY and
+    reads back the global totals every `sync_interval` seconds in one pipeline.
+    Across N workers a key can overshoot its limit by at most the hits admitted
+    during one sync interval on each worker.
+    """
+
+    def __init__(self, redis, sync_interval: float = 0.5, key_prefix: str = "rate_limit"):
+        self.redis = redis
+        self.sync_interval = sync_interval
+        self.key_prefix = key_prefix
+        self.counters: Dict[str, _WindowCounter] = {}
+        # Unsynced hits left behind when a counter rolled into a new window
+        self.backlog: List[Tuple[str, int, int, int]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def hit(self, key: str, limit: int, window: int) -> float:
+        """Count one request; returns 0 when allowed, else seconds until a retry may succeed"""
+        now = time.time()
+        window_index = int(now // window)
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = _WindowCounter(window, window_index)
+            self._ensure_running()
+        elif counter.window_index != window_index:
+            if counter.unsynced:
+                self.backlog.append((key, counter.window_index, counter.unsynced, window))
+            if window_index == counter.window_index + 1:
+                counter.previous = counter.current + counter.unsynced
+            else:
+                counter.previous = 0
+            counter.window_index = window_index
+            counter.current = 0
+            counter.unsynced = 0
+
+        elapsed_fraction = (now % window) / window
+        estimated = counter.previous * (1 - elapsed_fraction) + counter.current + counter.unsynced
+        if estimated + 1 > limit:
+            return max(1.0, window * (1 - elapsed_fraction))
+
+        counter.unsynced += 1
+        return 0.0
+
+    def _redis_key(self, key: str, window_index: int) -> str:
+        return f"{self.key_prefix}:{key}:{window_index}"
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self.counters:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Error syncing rate limit counters: {e}")
+
+    async def sync(self):
+        """Push unsynced hits and pull global counts for every key used since the last sync"""
+        pushed = []
+        for key, counter in list(self.counters.items()):
+            if counter.unsynced:
+                pushed.append((key, counter, counter.window_index, counter.unsynced))
+                counter.unsynced = 0
+            elif counter.window_index < int(time.time() // counter.window) - 1:
+                # Idle for a full window: nothing left worth remembering
+                del self.counters[key]
+
+        backlog, self.backlog = self.backlog, []
+        if not pushed and not backlog:
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        for key, window_index, count, window in backlog:
+            pipe.incrby(self._redis_key(key, window_index), count)
+            pipe.expire(self._redis_key(key, window_index), window * 2)
+        for key, counter, window_index, count in pushed:
+            pipe.incrby(self._redis_key(key, window_index), count)
+            pipe.expire(self._redis_key(key, window_index), counter.window * 2)
+            pipe.get(self._redis_key(key, window_index - 1))
+        results = await pipe.execute()
+
+        results = results[len(backlog) * 2:]
+        for position, (key, counter, window_index, count) in enumerate(pushed):
+            total, _, previous = results[position * 3:position * 3 + 3]
+            # Hits admitted while the pipeline was in flight stay in `unsynced`
+            if counter.window_index == window_index:
+                counter.current = int(total)
+                counter.previous = max(counter.previous, int(previous or 0))
+
+
+@lru_cache(maxsize=8192)
+def _token_subject(token: str, secret_key: str, algorithm: str) -> Tuple[Optional[str], float]:
+    try:
+        payload = jwt.decode(token, secret_key, algorithms=[algorithm])
+    except JWTError:
+        return None, 0.0
+    return payload.get("sub"), float(payload.get("exp", 0))
+
+
+class _RouteRule:
+    __slots__ = ("name", "limit", "window")
+
+    def __init__(self, name: str, rate: str):
+        self.name = name
+        self.limit, self.window = parse_rate(rate)
+
+
+class RateLimitMiddleware:
+    """Per-route request limits keyed by authenticated user, or by client IP otherwise.
+
+    Rules map "METHOD /path" (with {param} placeholders) to a rate such as
+    "10/minute"; requests matching no rule fall back to `default_rate` when it
+    is set. Bearer tokens are verified (and cached) so a forged `sub` cannot
+    spend another user's budget. Over-limit requests get a 429 with Retry-After.
+    Behind `trusted_proxy_hops` proxies that append to X-Forwarded-For, the client
+    IP is the entry that many places from the right.
+    """
+
+    def __init__(
+        self,
+        app,
+        limiter: SlidingWindowLimiter,
+        rules: Dict[str, str],
+        secret_key: str,
+        algorithm: str,
+        default_rate: Optional[str] = None,
+        trusted_proxy_hops: int = 0,
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.trusted_proxy_hops = trusted_proxy_hops
+        self.exact_rules: Dict[Tuple[str, str], _RouteRule] = {}
+        self.pattern_rules: List[Tuple[str, re.Pattern, _RouteRule]] = []
+        for name, rate in rules.items():
+            method, _, path = name.partition(" ")
+            rule = _RouteRule(name, rate)
+            if "{" in path:
+                pattern = re.compile("^" + re.sub(r"\{[^/]+\}", "[^/]+", path) + "$")
+                self.pattern_rules.append((method.upper(), pattern, rule))
+            else:
+                self.exact_rules[(method.upper(), path)] = rule
+        self.default_rule = _RouteRule("default", default_rate) if default_rate else None
+
+    def _match(self, method: str, path: str) -> Optional[_RouteRule]:
+        rule = self.exact_rules.get((method, path))
+        if rule:
+            return rule
+        for rule_method, pattern, rule in self.pattern_rules:
+            if rule_method == method and pattern.match(path):
+                return rule
+        return self.default_rule
+
+    def _identity(self, scope) -> str:
+        headers = dict(scope["headers"])
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        if authorization[:7].lower() == "bearer ":
+            subject, expires_at = _token_subject(authorization[7:], self.secret_key, self.algorithm)
+            if subject and expires_at > time.time():
+                return f"user:{subject}"
+
+        # Each trusted proxy appends the address it saw; anything left of those came from the client
+        if self.trusted_proxy_hops and b"x-forwarded-for" in headers:
+            hops = headers[b"x-forwarded-for"].decode("latin-1").split(",")
+            if len(hops) >= self.trusted_proxy_hops:
+                return "ip:" + hops[-self.trusted_proxy_hops].strip()
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rule = self._match(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = self.limiter.hit(f"{rule.name}:{self._identity(scope)}", rule.limit, rule.window)
+        if retry_after:
+            response = JSONResponse(
+                {"detail": "Rate limit exceeded"},
+                status_code=429,
+                headers={"Retry-After": str(int(math.ceil(retry_after)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,202 @@
+"""Message reactions.
+
+Reacting (PUT / DELETE /api/messages/{id}/reactions/{emoji}) only touches
+Redis (`reaction_store`): one script call adds or removes the user's
+reaction, adjusts the emoji's total and notes the op for the database. The
+first reaction to a message that is not in Redis loads its persisted
+reactions. A hot message therefore costs no database writes per reaction.
+
+`ReactionAggregator` (`reaction_aggregator`), a background task in each app
+process while reactions come in:
+
+- broadcasts at most one `reactions` event per message per
+  REACTION_BROADCAST_INTERVAL_MS to the channel's sockets connected to this
+  process, with the current totals of the emojis that changed (0 when the
+  last one was removed), however many reactions arrived in between
+- every REACTION_PERSIST_INTERVAL_MS writes the pending ops of all processes
+  as one batch (`persist_reactions`): multi-row inserts and deletes of
+  message_reactions, a recount of message_reaction_counts for the messages
+  in the batch and one version bump of their channels, so cached history
+  pages and ETags pick up the new counts. One process writes at a time; a
+  batch that failed (or whose writer died) is written again first.
+
+History pages embed the persisted totals (app.serializers), at most one
+persist interval behind the live ones carried by the events.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+
+from sqlalchemy import func, select, tuple_
+from starlette.concurrency import run_in_threadpool
+
+from app.config import LazyInstance, settings
+from app.database import SessionLocal, insert_ignore
+from app.models import Channel, MessageReaction, MessageReactionCount
+from app.redis_client import ReactionStore, reaction_store
+
+logger = logging.getLogger(__name__)
+
+# Rows per multi-row INSERT / DELETE and messages per recount statement
+PERSIST_BATCH_SIZE = 1000
+# How long a writer may hold the batch before another process takes it over
+PERSIST_LOCK_MS = 30000
+
+
+def persist_reactions(batch: List[Tuple[str, int]]):
+    """Write a batch of ("channel_id:message_id:user_id:emoji", delta) ops in one transaction"""
+    added, removed = [], []
+    message_ids, channel_ids = set(), set()
+    for field, delta in batch:
+        channel_id, message_id, user_id, emoji = field.split(":", 3)
+        channel_id, message_id, user_id = int(channel_id), int(message_id), int(user_id)
+        if delta > 0:
+            added.append({"message_id": message_id, "user_id": user_id, "emoji": emoji, "channel_id": channel_id})
+        else:
+            removed.append((message_id, user_id, emoji))
+        message_ids.add(message_id)
+        channel_ids.add(channel_id)
+
+    db = SessionLocal()
+    try:
+        for start in range(0, len(added), PERSIST_BATCH_SIZE):
+            insert_ignore(db, MessageReaction.__table__, added[start:start + PERSIST_BATCH_SIZE])
+        key = tuple_(MessageReaction.message_id, MessageReaction.user_id, MessageReaction.emoji)
+        for start in range(0, len(removed), PERSIST_BATCH_SIZE):
+            db.query(MessageReaction).filter(key.in_(removed[start:start + PERSIST_BATCH_SIZE])).delete(
+                synchronize_session=False
+            )
+
+        message_ids = sorted(message_ids)
+        for start in range(0, len(message_ids), PERSIST_BATCH_SIZE):
+            chunk = message_ids[start:start + PERSIST_BATCH_SIZE]
+            db.query(MessageReactionCount).filter(MessageReactionCount.message_id.in_(chunk)).delete(
+                synchronize_session=False
+            )
+            db.execute(MessageReactionCount.__table__.insert().from_select(
+                ["message_id", "emoji", "count"],
+                select(MessageReaction.message_id, MessageReaction.emoji, func.count()).where(
+                    MessageReaction.message_id.in_(chunk)
+                ).group_by(MessageReaction.message_id, MessageReaction.emoji)
+            ))
+
+        db.query(Channel).filter(Channel.id.in_(channel_ids)).update(
+            # updated_at tracks channel settings, not traffic
+            {Channel.version: Channel.version + 1, Channel.updated_at: Channel.updated_at},
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+class ReactionAggregator:
+    """Coalesces reaction events and persists reactions in batches (see the module docstring)"""
+
+    def __init__(
+        self,
+        store: ReactionStore,
+        broadcast_interval: float = 0.25,
+        persist_interval: float = 1.0,
+        token: Optional[str] = None,
+    ):
+        self.store = store
+        self.broadcast_interval = broadcast_interval
+        self.persist_interval = persist_interval
+        self.token = token or f"{socket.gethostname()}-{os.getpid()}"
+        # (channel_id, message_id) -> emojis changed since the last broadcast
+        self.changed: Dict[Tuple[int, int], Set[str]] = {}
+        # Set while ops noted in Redis may still be waiting for a write
+        self.unsaved = False
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, channel_id: int, message_id: int, emoji: str):
+        """Note a changed reaction for the next event and write"""
+        self.changed.setdefault((channel_id, message_id), set()).add(emoji)
+        self.unsaved = True
+        self._ensure_running()
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        last_persist = time.monotonic()
+        while self.changed or self.unsaved:
+            await asyncio.sleep(self.broadcast_interval)
+            try:
+                await self.broadcast()
+            except Exception as e:
+                logger.error(f"Error broadcasting reactions: {e}")
+            if time.monotonic() - last_persist >= self.persist_interval:
+                last_persist = time.monotonic()
+                try:
+                    await self.persist()
+                except Exception as e:
+                    logger.error(f"Error persisting reactions: {e}")
+
+    async def stop(self):
+        """Stop the task and write what is pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            # A batch left over from a failed write goes first, then the latest ops
+            while await self.persist():
+                pass
+        except Exception as e:
+            logger.error(f"Error persisting reactions: {e}")
+
+    async def broadcast(self):
+        """One event per changed message with the current totals of its changed emojis"""
+        changed, self.changed = self.changed, {}
+        if not changed:
+            return
+        from app.websocket.connection_manager import manager
+
+        totals = await self.store.counts([message_id for _, message_id in changed])
+        for (channel_id, message_id), emojis in changed.items():
+            counts = totals.get(message_id, {})
+            await manager.broadcast_to_channel(json.dumps({
+                "type": "reactions",
+                "data": {
+                    "channel_id": channel_id,
+                    "message_id": message_id,
+                    "reactions": {emoji: counts.get(emoji, 0) for emoji in sorted(emojis)},
+                }
+            }), channel_id)
+
+    async def persist(self) -> int:
+        """Write one batch of pending ops; returns how many (0 when none, or another process is writing)"""
+        self.unsaved = False
+        batch = await self.store.take_pending(self.token, PERSIST_LOCK_MS)
+        if batch is None:
+            self.unsaved = True
+            return 0
+        if not batch:
+            return 0
+        # More ops may have arrived meanwhile; the loop stops after a take finds none
+        self.unsaved = True
+        written = False
+        try:
+            await run_in_threadpool(persist_reactions, batch)
+            written = True
+        finally:
+            await self.store.release_pending(self.token, written)
+        return len(batch)
+
+
+# Global instance; its task runs while reactions come in and is stopped by the app's lifespan
+reaction_aggregator = LazyInstance(lambda: ReactionAggregator(
+    reaction_store,
+    broadcast_interval=settings.reaction_broadcast_interval_ms / 1000,
+    persist_interval=settings.reaction_persist_interval_ms / 1000,
+))
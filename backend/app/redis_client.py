@@ -1,28 +1,108 @@
-import redis
-from app.config import settings
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+import base64
+import json
+import time
+import redis.asyncio as redis
+from app.config import LazyInstance, settings
+
+
+def create_redis_client(url: str):
+    """Create a Redis client (memory:// URLs use an in-process stand-in)"""
+    if url.startswith("memory://"):
+        from fakeredis import aioredis as fake_aioredis
+        return fake_aioredis.FakeRedis(decode_responses=True)
+    return redis.from_url(url, decode_responses=True)
+
+
+@lru_cache
+def get_redis_client():
+    """The shared Redis client, created on first use"""
+    return create_redis_client(settings.redis_url)
+
+
+class LazyRedis:
+    """Module-level `redis_client` that creates the real client on first attribute access"""
+
+    def __getattr__(self, name: str):
+        return getattr(get_redis_client(), name)
+
+
+class LazyScript:
+    """Lua script registered with the shared client on its first call"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self._script = None
+
+    def __call__(self, keys=None, args=None, client=None):
+        if self._script is None:
+            self._script = get_redis_client().register_script(self.source)
+        return self._script(keys=keys, args=args, client=client)
+
 
 # Redis connection
-redis_client = redis.from_url(settings.redis_url, decode_responses=True)
+redis_client = LazyRedis()
+
+
+# Mark offline the handed-off users whose marker no reconnect has consumed;
+# KEYS = online set, then (handoff marker, presence hash) per user in ARGV
+FINISH_HANDOFF_SCRIPT = """
+local offline = 0
+for i, user_id in ipairs(ARGV) do
+    if redis.call('DEL', KEYS[2 * i]) == 1 then
+        redis.call('HSET', KEYS[2 * i + 1], 'status', 'offline')
+        redis.call('SREM', KEYS[1], user_id)
+        offline = offline + 1
+    end
+end
+return offline
+"""
 
 
 class PresenceManager:
     def __init__(self):
         self.redis = redis_client
+        self._finish_hand_off = LazyScript(FINISH_HANDOFF_SCRIPT)
         
-    async def set_user_online(self, user_id: int, socket_id: str):
-        """Set user as online with socket ID"""
-        await self.redis.hset(f"user_presence:{user_id}", mapping={
+    async def set_user_online(self, user_id: int, socket_id: str) -> bool:
+        """Set user as online with socket ID; True when it picks up a handed-off session"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(f"user_presence:{user_id}", mapping={
             "status": "online",
             "socket_id": socket_id,
             "last_activity": str(int(time.time()))
         })
-        await self.redis.sadd("online_users", user_id)
+        pipe.sadd("online_users", user_id)
+        pipe.delete(f"presence_handoff:{user_id}")
+        results = await pipe.execute()
+        return bool(results[-1])
         
     async def set_user_offline(self, user_id: int):
         """Set user as offline"""
         await self.redis.hset(f"user_presence:{user_id}", "status", "offline")
         await self.redis.srem("online_users", user_id)
         
+    async def hand_off(self, user_ids: List[int], ttl: int, chunk_size: int = 1000):
+        """Keep draining users online until they reconnect elsewhere or the handoff finishes"""
+        for start in range(0, len(user_ids), chunk_size):
+            pipe = self.redis.pipeline(transaction=False)
+            for user_id in user_ids[start:start + chunk_size]:
+                pipe.set(f"presence_handoff:{user_id}", 1, ex=ttl)
+            await pipe.execute()
+        
+    async def finish_hand_off(self, user_ids: List[int], chunk_size: int = 500) -> int:
+        """Mark offline the handed-off users that did not reconnect; returns how many"""
+        offline = 0
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            keys = ["online_users"]
+            for user_id in chunk:
+                keys += [f"presence_handoff:{user_id}", f"user_presence:{user_id}"]
+            offline += await self._finish_hand_off(keys=keys, args=chunk)
+        return offline
+        
     async def get_user_presence(self, user_id: int):
         """Get user presence status"""
         presence = await self.redis.hgetall(f"user_presence:{user_id}")
@@ -32,6 +112,14 @@ class PresenceManager:
         """Get list of online users"""
         return await self.redis.smembers("online_users")
         
+    async def get_statuses(self, user_ids: List[int]) -> Dict[int, str]:
+        """Presence status of many users in one round trip"""
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hget(f"user_presence:{user_id}", "status")
+        statuses = await pipe.execute()
+        return {user_id: status or "offline" for user_id, status in zip(user_ids, statuses)}
+        
     async def update_user_activity(self, user_id: int):
         """Update user's last activity timestamp"""
         await self.redis.hset(f"user_presence:{user_id}", "last_activity", str(int(time.time())))
@@ -41,28 +129,511 @@ class CacheManager:
     def __init__(self):
         self.redis = redis_client
         
-    async def cache_message(self, channel_id: int, message_data: dict, ttl: int = 3600):
-        """Cache recent messages for a channel"""
-        await self.redis.lpush(f"channel_messages:{channel_id}", str(message_data))
-        await self.redis.expire(f"channel_messages:{channel_id}", ttl)
+    async def cache_channel_page(self, channel_id: int, version: int, page_key: str, body: str, ttl: int):
+        """Cache a serialized history page; keyed by channel version, so never invalidated"""
+        await self.redis.setex(f"channel_page:{channel_id}:{version}:{page_key}", ttl, body)
         
-    async def get_cached_messages(self, channel_id: int, limit: int = 50):
-        """Get cached messages for a channel"""
-        messages = await self.redis.lrange(f"channel_messages:{channel_id}", 0, limit - 1)
-        return [eval(msg) for msg in messages]  # In production, use proper JSON serialization
+    async def get_cached_channel_page(self, channel_id: int, version: int, page_key: str) -> Optional[str]:
+        """Get a cached history page for the channel's current version"""
+        return await self.redis.get(f"channel_page:{channel_id}:{version}:{page_key}")
         
     async def cache_user_channels(self, user_id: int, channels: list, ttl: int = 1800):
         """Cache user's channels"""
-        await self.redis.setex(f"user_channels:{user_id}", ttl, str(channels))
+        await self.redis.setex(f"user_channels:{user_id}", ttl, json.dumps(channels))
         
     async def get_cached_user_channels(self, user_id: int):
         """Get cached user channels"""
         channels = await self.redis.get(f"user_channels:{user_id}")
-        return eval(channels) if channels else None
+        return json.loads(channels) if channels else None
+        
+    async def invalidate_user_channels(self, *user_ids: int):
+        """Drop cached channel lists after membership changes"""
+        if user_ids:
+            await self.redis.delete(*[f"user_channels:{user_id}" for user_id in user_ids])
+        
+    async def cache_bootstrap(self, user_id: int, payload: str, ttl: int):
+        """Cache the membership part of a user's bootstrap payload"""
+        await self.redis.setex(f"bootstrap:{user_id}", ttl, payload)
+        
+    async def get_cached_bootstrap(self, user_id: int) -> Optional[str]:
+        """Get the cached membership part of a user's bootstrap payload"""
+        return await self.redis.get(f"bootstrap:{user_id}")
+        
+    async def invalidate_bootstrap(self, *user_ids: int):
+        """Drop cached bootstrap payloads after team, channel or profile changes"""
+        if user_ids:
+            await self.redis.delete(*[f"bootstrap:{user_id}" for user_id in user_ids])
+
+
+# ZADD ARGV (members, score 0) to KEYS[1] only if it exists: an index lost with Redis
+# must be rebuilt in full, not restarted with just the latest members
+ZADD_IF_EXISTS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV do
+    redis.call('ZADD', KEYS[1], 0, ARGV[i])
+end
+return #ARGV
+"""
+
+
+class DirectoryManager:
+    """Prefix index of team members for @mention autocomplete.
+
+    Each team has a sorted set of "<term>NUL<user_id>" members, all scored 0, so a
+    prefix lookup is a ZRANGEBYLEX range and results are already scoped to the
+    caller's teams. Terms are the lowercased username, full name and each word
+    of the full name; the terms last indexed for a user are kept so renames
+    can remove the old entries.
+
+    Only `build_team_index` creates a team's index. Later changes are applied to
+    it while it exists; once it is gone (never built, or lost with Redis) the
+    next search rebuilds it from the database.
+    """
+
+    def __init__(self):
+        self.redis = redis_client
+        self._zadd_if_exists = LazyScript(ZADD_IF_EXISTS_SCRIPT)
+
+    @staticmethod
+    def index_terms(username: str, full_name: Optional[str]) -> List[str]:
+        """Lowercased search terms for a user"""
+        terms = [username.lower()]
+        if full_name:
+            name = " ".join(full_name.lower().split())
+            terms.append(name)
+            terms.extend(name.split(" "))
+        return sorted(set(term for term in terms if term))
+
+    @staticmethod
+    def encode_cursor(member: str) -> str:
+        return base64.urlsafe_b64encode(member.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> str:
+        return base64.b64decode(cursor.encode(), altchars=b"-_", validate=True).decode()
+
+    async def index_user(self, user_id: int, username: str, full_name: Optional[str], team_ids: Iterable[int]):
+        """(Re)index a user's terms in every team they belong to"""
+        terms = self.index_terms(username, full_name)
+        previous = await self.redis.get(f"user_directory_terms:{user_id}")
+        old_terms = json.loads(previous) if previous else []
+
+        pipe = self.redis.pipeline(transaction=False)
+        for team_id in team_ids:
+            key = f"team_directory:{team_id}"
+            stale = [f"{term}\x00{user_id}" for term in old_terms if term not in terms]
+            if stale:
+                pipe.zrem(key, *stale)
+            await self._zadd_if_exists(keys=[key], args=[f"{term}\x00{user_id}" for term in terms], client=pipe)
+        pipe.set(f"user_directory_terms:{user_id}", json.dumps(terms))
+        await pipe.execute()
+
+    async def add_team_member(self, team_id: int, user_id: int, username: str, full_name: Optional[str]):
+        """Index a user in a team they just joined"""
+        terms = self.index_terms(username, full_name)
+        await self._zadd_if_exists(keys=[f"team_directory:{team_id}"], args=[f"{term}\x00{user_id}" for term in terms])
+
+    async def add_team_members(self, team_id: int, members: Iterable[Tuple[int, str, Optional[str]]]):
+        """Index users who just joined a team, from (user_id, username, full_name) rows, in one call"""
+        entries = [
+            f"{term}\x00{user_id}"
+            for user_id, username, full_name in members for term in self.index_terms(username, full_name)
+        ]
+        if entries:
+            await self._zadd_if_exists(keys=[f"team_directory:{team_id}"], args=entries)
+
+    async def remove_team_member(self, team_id: int, user_id: int):
+        """Drop a user from a team's index"""
+        terms = await self.redis.get(f"user_directory_terms:{user_id}")
+        if terms:
+            await self.redis.zrem(f"team_directory:{team_id}", *[f"{term}\x00{user_id}" for term in json.loads(terms)])
+
+    async def missing_team_indexes(self, team_ids: List[int]) -> List[int]:
+        """Teams whose index is absent (never built or lost with Redis)"""
+        pipe = self.redis.pipeline(transaction=False)
+        for team_id in team_ids:
+            pipe.exists(f"team_directory:{team_id}")
+        exists = await pipe.execute()
+        return [team_id for team_id, present in zip(team_ids, exists) if not present]
+
+    async def build_team_index(self, team_id: int, members: Iterable[Tuple[int, str, Optional[str]]]):
+        """Rebuild a team's index from (user_id, username, full_name) rows"""
+        entries = {}
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id, username, full_name in members:
+            terms = self.index_terms(username, full_name)
+            entries.update({f"{term}\x00{user_id}": 0 for term in terms})
+            pipe.set(f"user_directory_terms:{user_id}", json.dumps(terms))
+        if entries:
+            pipe.zadd(f"team_directory:{team_id}", entries)
+        await pipe.execute()
+
+    async def first_terms(self, user_ids: Iterable[int], prefix: str) -> Dict[int, str]:
+        """Smallest indexed term of each user that starts with `prefix` (users without stored terms are left out)"""
+        user_ids = list(user_ids)
+        stored = await self.redis.mget([f"user_directory_terms:{user_id}" for user_id in user_ids]) if user_ids else []
+        firsts = {}
+        for user_id, terms in zip(user_ids, stored):
+            matching = [term for term in json.loads(terms) if term.startswith(prefix)] if terms else []
+            if matching:
+                firsts[user_id] = min(matching)
+        return firsts
+
+    async def search(self, team_ids: List[int], prefix: str, limit: int, cursor: Optional[str] = None):
+        """Return (user_ids, next_cursor) for users in `team_ids` with a term starting with `prefix`
+
+        A user matching on several terms is returned once, at their smallest
+        matching term, so later pages do not repeat them. Each team is read
+        `limit * 2` members at a time; a round only goes as far as the
+        smallest last member of the teams that had more, as members past it
+        in those teams have not been read yet.
+        """
+        prefix = prefix.lower()
+        after = self.decode_cursor(cursor) if cursor else None
+        if after is not None and not after.startswith(prefix):
+            raise ValueError("Cursor does not belong to this search")
+        start = f"({after}" if after else f"[{prefix}"
+        end = f"[{prefix}\U0010ffff"
+        fetch = limit * 2
+
+        user_ids, seen, last_member = [], set(), None
+        while True:
+            pipe = self.redis.pipeline(transaction=False)
+            for team_id in team_ids:
+                pipe.zrangebylex(f"team_directory:{team_id}", start, end, start=0, num=fetch)
+            results = await pipe.execute()
+
+            truncated = [result[-1] for result in results if len(result) == fetch]
+            read_up_to = min(truncated) if truncated else None
+            members = sorted(set(
+                member for result in results for member in result if read_up_to is None or member <= read_up_to
+            ))
+            firsts = await self.first_terms({int(member.rsplit("\x00", 1)[1]) for member in members}, prefix)
+            for member in members:
+                if len(user_ids) == limit:
+                    return user_ids, self.encode_cursor(last_member)
+                last_member = member
+                term, user_id = member.rsplit("\x00", 1)
+                user_id = int(user_id)
+                if firsts.get(user_id, term) == term and user_id not in seen:
+                    seen.add(user_id)
+                    user_ids.append(user_id)
+
+            if read_up_to is None:
+                return user_ids, None
+            if len(user_ids) == limit:
+                return user_ids, self.encode_cursor(last_member)
+            start = f"({read_up_to}"
+
+
+# Assign the next sequence number and append in one step so a user's stream ids
+# are always 1-0, 2-0, 3-0... and a gap in them means events were trimmed
+APPEND_EVENT_SCRIPT = """
+local seq = redis.call('INCR', KEYS[2])
+redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], seq .. '-0', 'event', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return seq
+"""
+
+
+class EventLogManager:
+    """Bounded per-user log of real-time events, kept in a Redis Stream.
+
+    Every event delivered to a user gets the next number in that user's
+    sequence. A reconnecting client sends the last sequence it saw and the
+    missed events are read back from the stream; when they have been trimmed
+    (or there are too many) the caller tells the client to resync over REST.
+    """
+
+    def __init__(self, max_len: int = 1000, ttl: int = 172800):
+        self.redis = redis_client
+        self.max_len = max_len
+        self.ttl = ttl
+        self._append = LazyScript(APPEND_EVENT_SCRIPT)
+
+    @staticmethod
+    def _keys(user_id: int) -> List[str]:
+        # Shared hash tag keeps both keys in one cluster slot for the script
+        return [f"user_events:{{{user_id}}}", f"user_event_seq:{{{user_id}}}"]
+
+    @staticmethod
+    def frame(payload: str, seq: Optional[int]) -> str:
+        """Add `seq` to an already serialized {"type": ..., "data": ...} event"""
+        if seq is None:
+            return payload
+        return f'{payload[:-1]}, "seq": {seq}}}'
+
+    async def append(self, user_ids: Iterable[int], payload: str) -> Dict[int, int]:
+        """Append a serialized event to each user's log; returns user_id -> seq"""
+        user_ids = list(user_ids)
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            await self._append(keys=self._keys(user_id), args=[payload, self.max_len, self.ttl], client=pipe)
+        seqs = await pipe.execute()
+        return {user_id: int(seq) for user_id, seq in zip(user_ids, seqs)}
+
+    async def current_seq(self, user_id: int) -> int:
+        """Sequence number of the user's latest event (0 when the log is empty)"""
+        seq = await self.redis.get(self._keys(user_id)[1])
+        return int(seq) if seq else 0
+
+    async def replay(self, user_id: int, after_seq: int, limit: int) -> Optional[List[Tuple[int, str]]]:
+        """Events after `after_seq` as (seq, payload), or None when the gap cannot be replayed"""
+        stream_key, seq_key = self._keys(user_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.get(seq_key)
+        pipe.xrange(stream_key, min=f"{after_seq + 1}-0", max="+", count=limit + 1)
+        current, entries = await pipe.execute()
+
+        current = int(current) if current else 0
+        if after_seq > current:
+            # The log was reset (expired or Redis lost its data)
+            return None
+        if after_seq == current:
+            return []
+        if len(entries) > limit or not entries or int(entries[0][0].split("-")[0]) != after_seq + 1:
+            return None
+        return [(int(entry_id.split("-")[0]), fields["event"]) for entry_id, fields in entries]
+
+
+class NotificationQueue:
+    """Mention notification jobs in a Redis Stream, read by one consumer group.
+
+    Each app process runs a consumer (app.notifications). An entry stays pending
+    until its consumer acknowledges it, so jobs of a worker that died are
+    claimed by another once they have been idle long enough.
+    """
+
+    stream = "notification_jobs"
+    group = "notifiers"
+
+    def __init__(self, max_len: int = 100000):
+        self.redis = redis_client
+        self.max_len = max_len
+
+    async def enqueue(self, job: dict) -> str:
+        """Append a job; returns its entry id"""
+        return await self.redis.xadd(self.stream, {"job": json.dumps(job)}, maxlen=self.max_len, approximate=True)
+
+    async def ensure_group(self):
+        """Create the stream and consumer group unless they exist"""
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def read(self, consumer: str, count: int, block_ms: int) -> List[Tuple[str, dict]]:
+        """New jobs for this consumer as (entry_id, job), waiting up to `block_ms` for one"""
+        streams = await self.redis.xreadgroup(self.group, consumer, {self.stream: ">"}, count=count, block=block_ms)
+        return [(entry_id, json.loads(fields["job"])) for _, entries in streams or [] for entry_id, fields in entries]
+
+    async def claim_stale(self, consumer: str, min_idle_ms: int, count: int) -> List[Tuple[str, dict]]:
+        """Take over jobs another consumer read but did not acknowledge within `min_idle_ms`"""
+        _, entries, *_ = await self.redis.xautoclaim(
+            self.stream, self.group, consumer, min_idle_time=min_idle_ms, start_id="0-0", count=count
+        )
+        return [(entry_id, json.loads(fields["job"])) for entry_id, fields in entries if fields]
+
+    async def ack(self, entry_ids: List[str]):
+        """Acknowledge and drop handled jobs"""
+        if entry_ids:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.xack(self.stream, self.group, *entry_ids)
+            pipe.xdel(self.stream, *entry_ids)
+            await pipe.execute()
+
+
+# Add or remove one user's reaction and, when that changed anything, adjust the
+# total and note the latest op for the next database write. Returns false when the
+# message's reactions are not loaded (for that channel). KEYS = channel marker, totals
+# hash, reactors hash, pending ops hash; ARGV = emoji, reactor field, delta, op field,
+# ttl, channel id
+REACT_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[6] then
+    return false
+end
+local changed
+if ARGV[3] == '1' then
+    changed = redis.call('HSETNX', KEYS[3], ARGV[2], 1)
+else
+    changed = redis.call('HDEL', KEYS[3], ARGV[2])
+end
+local count
+if changed == 1 then
+    count = redis.call('HINCRBY', KEYS[2], ARGV[1], ARGV[3])
+    if count <= 0 then
+        redis.call('HDEL', KEYS[2], ARGV[1])
+        count = 0
+    end
+    redis.call('HSET', KEYS[4], ARGV[4], ARGV[3])
+else
+    count = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+end
+for i = 1, 3 do
+    redis.call('EXPIRE', KEYS[i], ARGV[5])
+end
+return {changed, count}
+"""
+
+# Take the pending ops as the batch to write, unless another process holds the lock;
+# a batch left by a writer that failed or died is taken again first.
+# KEYS = pending ops, batch, lock; ARGV = lock token, lock ttl in ms
+TAKE_REACTION_OPS_SCRIPT = """
+if not redis.call('SET', KEYS[3], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return false
+end
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        redis.call('DEL', KEYS[3])
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+# Release the lock and, once written, drop the batch; KEYS = batch, lock; ARGV = token, written
+RELEASE_REACTION_OPS_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+if ARGV[2] == '1' then
+    redis.call('DEL', KEYS[1])
+end
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+
+class ReactionStore:
+    """Live reaction state of recently used messages, loaded from the database on first use.
+
+    Per message: the channel it is in (doubling as the "loaded" marker), a hash
+    of emoji -> total and a hash of the (user, emoji) pairs that reacted. Each
+    change is also noted in one pending-ops hash, field
+    "channel_id:message_id:user_id:emoji" -> latest delta, which app.reactions
+    writes to the database in batches; a user toggling a reaction many times
+    between two writes leaves one op.
+
+    A message's channel never changes, so it is also remembered in-process
+    for the next reaction; the script still checks it against the marker.
+    """
+
+    pending_key = "reaction_ops"
+    batch_key = "reaction_ops:batch"
+    lock_key = "reaction_ops:lock"
+
+    def __init__(self, ttl: int = 86400, local_size: int = 10000):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.local_size = local_size
+        # message_id -> channel_id, oldest first
+        self.channels: "OrderedDict[int, int]" = OrderedDict()
+        self._react = LazyScript(REACT_SCRIPT)
+        self._take = LazyScript(TAKE_REACTION_OPS_SCRIPT)
+        self._release = LazyScript(RELEASE_REACTION_OPS_SCRIPT)
+
+    @staticmethod
+    def _keys(message_id: int) -> List[str]:
+        return [f"reaction_channel:{message_id}", f"reaction_counts:{message_id}", f"reaction_users:{message_id}"]
+
+    def _remember(self, message_id: int, channel_id: int):
+        self.channels[message_id] = channel_id
+        self.channels.move_to_end(message_id)
+        if len(self.channels) > self.local_size:
+            self.channels.popitem(last=False)
+
+    async def channel_of(self, message_id: int) -> Optional[int]:
+        """Channel of a message whose reactions are loaded, else None"""
+        if message_id in self.channels:
+            return self.channels[message_id]
+        channel_id = await self.redis.get(self._keys(message_id)[0])
+        if not channel_id:
+            return None
+        self._remember(message_id, int(channel_id))
+        return int(channel_id)
+
+    async def load(self, message_id: int, channel_id: int, reactions: Iterable[Tuple[int, str]]):
+        """Load a message's persisted (user_id, emoji) reactions unless another request already did"""
+        self._remember(message_id, channel_id)
+        marker, counts_key, users_key = self._keys(message_id)
+        users, counts = {}, {}
+        for user_id, emoji in reactions:
+            users[f"{user_id}:{emoji}"] = 1
+            counts[emoji] = counts.get(emoji, 0) + 1
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(marker)
+                if await pipe.exists(marker):
+                    return
+                pipe.multi()
+                pipe.delete(counts_key, users_key)
+                if users:
+                    pipe.hset(users_key, mapping=users)
+                    pipe.hset(counts_key, mapping=counts)
+                    pipe.expire(users_key, self.ttl)
+                    pipe.expire(counts_key, self.ttl)
+                pipe.set(marker, channel_id, ex=self.ttl)
+                await pipe.execute()
+            except redis.WatchError:
+                # Loaded by a concurrent request
+                pass
+
+    async def react(self, channel_id: int, message_id: int, user_id: int, emoji: str, add: bool):
+        """Add or remove a reaction; returns (changed, emoji total), or None when the message is not loaded"""
+        delta = 1 if add else -1
+        result = await self._react(
+            keys=self._keys(message_id) + [self.pending_key],
+            args=[
+                emoji, f"{user_id}:{emoji}", delta, f"{channel_id}:{message_id}:{user_id}:{emoji}", self.ttl, channel_id
+            ]
+        )
+        if result is None:
+            # Expired, or deleted (and the id reused) since it was remembered
+            self.channels.pop(message_id, None)
+            return None
+        changed, count = result
+        return bool(changed), int(count)
+
+    async def counts(self, message_ids: List[int]) -> Dict[int, Dict[str, int]]:
+        """Live emoji totals of loaded messages"""
+        pipe = self.redis.pipeline(transaction=False)
+        for message_id in message_ids:
+            pipe.hgetall(self._keys(message_id)[1])
+        results = await pipe.execute()
+        return {
+            message_id: {emoji: int(count) for emoji, count in counts.items()}
+            for message_id, counts in zip(message_ids, results)
+        }
+
+    async def forget(self, message_ids: List[int]):
+        """Drop deleted messages; reacting to them then finds no message"""
+        for message_id in message_ids:
+            self.channels.pop(message_id, None)
+        if message_ids:
+            await self.redis.delete(*[key for message_id in message_ids for key in self._keys(message_id)])
+
+    async def take_pending(self, token: str, lock_ms: int) -> Optional[List[Tuple[str, int]]]:
+        """The batch of (op field, delta) to write, or None while another process writes one"""
+        flat = await self._take(keys=[self.pending_key, self.batch_key, self.lock_key], args=[token, lock_ms])
+        if flat is None:
+            return None
+        return [(flat[i], int(flat[i + 1])) for i in range(0, len(flat), 2)]
+
+    async def release_pending(self, token: str, written: bool):
+        """Give up the lock, dropping the batch once it is written"""
+        await self._release(keys=[self.batch_key, self.lock_key], args=[token, int(written)])
 
 
 # Global instances
 presence_manager = PresenceManager()
 cache_manager = CacheManager()
-
-import time
+directory_manager = DirectoryManager()
+# Sized from settings, so built on first use
+event_log = LazyInstance(lambda: EventLogManager(settings.event_log_max_len, settings.event_log_ttl_seconds))
+notification_queue = LazyInstance(lambda: NotificationQueue(settings.notification_stream_max_len))
+reaction_store = LazyInstance(lambda: ReactionStore(settings.reaction_cache_ttl_seconds))
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, BeforeValidator, EmailStr
+from typing import Annotated, Dict, Optional, List
 from datetime import datetime
 
 
@@ -31,6 +31,11 @@ class User(UserBase):
         from_attributes = True
 
 
+class UserDirectoryPage(BaseModel):
+    users: List[User]
+    next_cursor: Optional[str] = None
+
+
 class UserPresence(BaseModel):
     user_id: int
     status: str
@@ -59,6 +64,11 @@ class TeamUpdate(BaseModel):
     avatar_url: Optional[str] = None
 
 
+class TeamMembersAdd(BaseModel):
+    user_ids: List[int]
+    role: str = "member"
+
+
 class Team(TeamBase):
     id: int
     avatar_url: Optional[str] = None
@@ -98,6 +108,16 @@ class Channel(ChannelBase):
         from_attributes = True
 
 
+class ChannelMembersAdd(BaseModel):
+    user_ids: List[int]
+
+
+class MembersAdded(BaseModel):
+    added: List[int]
+    already_members: List[int]
+    rejected: List[int]
+
+
 # Message schemas
 class MessageBase(BaseModel):
     content: str
@@ -119,15 +139,34 @@ class Message(MessageBase):
     channel_id: Optional[int]
     sender_id: int
     parent_message_id: Optional[int] = None
+    reply_count: int = 0
+    last_reply_at: Optional[datetime] = None
     is_edited: bool = False
     edited_at: Optional[datetime] = None
     created_at: datetime
     sender: User
+    # emoji -> number of users who reacted with it
+    reactions: Dict[str, int] = {}
 
     class Config:
         from_attributes = True
 
 
+class ReactionUpdate(BaseModel):
+    message_id: int
+    emoji: str
+    # Users now reacting with the emoji
+    count: int
+    # False when the user had already added (or not added) the reaction
+    changed: bool
+
+
+class ThreadPage(BaseModel):
+    parent: Message
+    replies: List[Message]
+    next_after_id: Optional[int] = None
+
+
 # Direct Message schemas
 class DirectMessageCreate(MessageBase):
     receiver_id: int
@@ -135,6 +174,7 @@ class DirectMessageCreate(MessageBase):
 
 class DirectMessage(MessageBase):
     id: int
+    conversation_id: Optional[int] = None
     sender_id: int
     receiver_id: int
     is_read: bool = False
@@ -149,6 +189,40 @@ class DirectMessage(MessageBase):
         from_attributes = True
 
 
+class ConversationSummary(BaseModel):
+    id: int
+    other_user: User
+    last_message: Optional[DirectMessage] = None
+    last_read_message_id: Optional[int] = None
+    unread_count: int = 0
+
+
+class ConversationPage(BaseModel):
+    conversations: List[ConversationSummary]
+    next_before_id: Optional[int] = None
+
+
+# Notification schemas
+class Notification(BaseModel):
+    id: int
+    kind: str
+    channel_id: int
+    message_id: int
+    sender_id: int
+    excerpt: str
+    created_at: datetime
+    read_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class NotificationPage(BaseModel):
+    notifications: List[Notification]
+    unread_count: int
+    next_before_id: Optional[int] = None
+
+
 # Authentication schemas
 class Token(BaseModel):
     access_token: str
@@ -194,3 +268,92 @@ class SearchResult(BaseModel):
     total_count: int
     page: int
     per_page: int
+
+
+# Bootstrap schemas
+class BootstrapTeam(TeamBase):
+    id: int
+    avatar_url: Optional[str] = None
+    created_by: int
+    created_at: datetime
+    role: str
+
+
+class BootstrapChannel(ChannelBase):
+    id: int
+    team_id: int
+    is_member: bool
+    version: int = 0
+    last_read_message_id: Optional[int] = None
+    unread_count: int = 0
+
+
+class Bootstrap(BaseModel):
+    user: User
+    teams: List[BootstrapTeam]
+    channels: List[BootstrapChannel]
+    members: List[User]
+    next_member_cursor: Optional[str] = None
+    presence: Dict[int, str]
+    direct_unread_count: int = 0
+
+
+# Workspace import records (app.importer), one per NDJSON line with a "type";
+# ids are the source tool's, as strings or numbers, and references use them
+ExternalId = Annotated[str, BeforeValidator(str)]
+
+
+class ImportUser(BaseModel):
+    id: ExternalId
+    username: str
+    email: EmailStr
+    full_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+    is_active: bool = True
+    created_at: Optional[datetime] = None
+
+
+class ImportTeam(BaseModel):
+    id: ExternalId
+    name: str
+    description: Optional[str] = None
+    is_public: bool = True
+    created_by: Optional[ExternalId] = None
+    created_at: Optional[datetime] = None
+
+
+class ImportChannel(BaseModel):
+    id: ExternalId
+    team: ExternalId
+    name: str
+    description: Optional[str] = None
+    is_private: bool = False
+    created_by: Optional[ExternalId] = None
+    created_at: Optional[datetime] = None
+
+
+class ImportTeamMember(BaseModel):
+    team: ExternalId
+    user: ExternalId
+    role: str = "member"
+
+
+class ImportChannelMember(BaseModel):
+    channel: ExternalId
+    user: ExternalId
+
+
+class ImportMessage(MessageBase):
+    id: ExternalId
+    channel: ExternalId
+    sender: ExternalId
+    parent: Optional[ExternalId] = None
+    created_at: datetime
+    edited_at: Optional[datetime] = None
+
+
+class ImportDirectMessage(MessageBase):
+    sender: ExternalId
+    receiver: ExternalId
+    created_at: datetime
+    edited_at: Optional[datetime] = None
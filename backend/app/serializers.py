@@ -0,0 +1,92 @@
+"""Row-tuple serializers for the high-volume list endpoints.
+
+The routes select only the columns a response schema exposes and build its
+JSON shape straight from the row tuples, skipping ORM instances and Pydantic
+validation. Keys and values match `app.schemas.User`, `app.schemas.Message`
+and `app.schemas.DirectMessage` dumped with mode="json", so the responses are
+unchanged.
+
+Messages may live on a message shard (app.sharding) while users are always
+in the main database, so senders are looked up there by id rather than
+joined. Reaction totals come from the main database the same way, one query
+per call.
+"""
+from typing import Dict, Iterable, List
+
+from sqlalchemy.orm import Session
+
+from app.models import DirectMessage, Message, MessageReactionCount, User
+
+USER_FIELDS = (
+    "username", "email", "full_name", "id", "avatar_url", "is_active", "is_online", "last_seen", "created_at"
+)
+USER_COLUMNS = tuple(getattr(User, field) for field in USER_FIELDS)
+
+MESSAGE_FIELDS = (
+    "content", "message_type", "file_url", "id", "channel_id", "sender_id", "parent_message_id",
+    "reply_count", "last_reply_at", "is_edited", "edited_at", "created_at"
+)
+MESSAGE_COLUMNS = tuple(getattr(Message, field) for field in MESSAGE_FIELDS)
+
+DIRECT_MESSAGE_FIELDS = (
+    "content", "message_type", "file_url", "id", "conversation_id", "sender_id", "receiver_id",
+    "is_read", "read_at", "is_edited", "edited_at", "created_at"
+)
+DIRECT_MESSAGE_COLUMNS = tuple(getattr(DirectMessage, field) for field in DIRECT_MESSAGE_FIELDS)
+
+
+def users_by_id(db: Session, user_ids: Iterable[int]) -> Dict[int, tuple]:
+    """USER_COLUMNS tuples of users from the main database, by id"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    return {row.id: tuple(row) for row in db.query(*USER_COLUMNS).filter(User.id.in_(user_ids))}
+
+
+def user_rows(rows: Iterable) -> List[dict]:
+    """Users selected with USER_COLUMNS"""
+    return [dict(zip(USER_FIELDS, row)) for row in rows]
+
+
+def reaction_counts(db: Session, message_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+    """message_id -> {emoji: count} from the persisted totals (app.reactions)"""
+    message_ids = set(message_ids)
+    if not message_ids:
+        return {}
+    counts: Dict[int, Dict[str, int]] = {}
+    query = db.query(MessageReactionCount.message_id, MessageReactionCount.emoji, MessageReactionCount.count).filter(
+        MessageReactionCount.message_id.in_(message_ids)
+    )
+    for message_id, emoji, count in query:
+        counts.setdefault(message_id, {})[emoji] = count
+    return counts
+
+
+def message_rows(db: Session, rows: Iterable) -> List[dict]:
+    """Messages selected with MESSAGE_COLUMNS, each with its sender (from `db`) and reaction counts embedded"""
+    rows = list(rows)
+    senders = users_by_id(db, [row.sender_id for row in rows])
+    reactions = reaction_counts(db, [row.id for row in rows])
+    messages = []
+    for row in rows:
+        # Skipped like an inner join would
+        if row.sender_id in senders:
+            message = dict(zip(MESSAGE_FIELDS, row))
+            message["sender"] = dict(zip(USER_FIELDS, senders[row.sender_id]))
+            message["reactions"] = reactions.get(row.id, {})
+            messages.append(message)
+    return messages
+
+
+def direct_message_rows(db: Session, rows: Iterable) -> List[dict]:
+    """Direct messages selected with DIRECT_MESSAGE_COLUMNS, with sender and receiver embedded"""
+    rows = list(rows)
+    users = users_by_id(db, [user_id for row in rows for user_id in (row.sender_id, row.receiver_id)])
+    messages = []
+    for row in rows:
+        if row.sender_id in users and row.receiver_id in users:
+            message = dict(zip(DIRECT_MESSAGE_FIELDS, row))
+            message["sender"] = dict(zip(USER_FIELDS, users[row.sender_id]))
+            message["receiver"] = dict(zip(USER_FIELDS, users[row.receiver_id]))
+            messages.append(message)
+    return messages
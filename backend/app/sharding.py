@@ -0,0 +1,443 @@
+"""Channel-based sharding of message storage.
+
+With MESSAGE_SHARD_URLS set, the `messages` and `direct_messages` tables are
+spread over several databases (shards): a channel's messages live on its
+channel's shard and a direct message on its conversation's. Users, teams,
+channels, conversations and read state stay in the main database, which is
+itself the shard named "main".
+
+Placement is a directory in the main database (`shard_placements`). A
+channel or conversation created while sharding is on gets a row naming a
+shard picked by rendezvous hashing over the configured names; anything
+without a row, such as everything stored before sharding was turned on, is
+on "main". Adding a shard only affects placements made from then on;
+existing channels and conversations are moved with
+`python -m app.sharding move`.
+
+Message ids are allocated in the main database (`message_locations`,
+`direct_message_locations`), so they stay unique and ordered across shards
+and a message can be found by id alone.
+
+`shard_router` gives out the session of the shard that holds a channel's,
+a conversation's or a message's rows. Shard sessions hang off the request's
+main session: they commit just before it and roll back with it, so routes
+commit and roll back as before. With MESSAGE_SHARD_URLS empty, every lookup
+returns the main session itself and nothing here runs a query.
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import hashlib
+import logging
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import Column, Index, MetaData, Table, create_engine, delete, desc, event, func, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import get_engine
+from app.models import DirectMessage, Message, ShardPlacement, direct_message_locations, message_locations
+
+logger = logging.getLogger(__name__)
+
+MAIN_SHARD = "main"
+CHANNEL = "channel"
+CONVERSATION = "conversation"
+
+shard_metadata = MetaData()
+
+
+def _shard_table(source: Table) -> Table:
+    """Same name, columns and indexes as the main table, without foreign keys to tables a shard lacks"""
+    columns = [
+        Column(
+            column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+            server_default=column.server_default.arg if column.server_default is not None else None
+        )
+        for column in source.columns
+    ]
+    indexes = [Index(index.name, *[column.name for column in index.columns]) for index in source.indexes]
+    return Table(source.name, shard_metadata, *columns, *indexes)
+
+
+shard_messages = _shard_table(Message.__table__)
+shard_direct_messages = _shard_table(DirectMessage.__table__)
+
+# scope -> (message table, id allocation table, key column)
+_SCOPES = {
+    CHANNEL: (Message.__table__, message_locations, "channel_id"),
+    CONVERSATION: (DirectMessage.__table__, direct_message_locations, "conversation_id"),
+}
+
+_SESSIONS_KEY = "shard_sessions"
+
+
+@lru_cache(maxsize=None)
+def get_shard_engine(name: str) -> Engine:
+    """Engine of a message shard.
+
+    Shards other than the main database are not under Alembic: their tables
+    mirror the main ones and are created here, on first use, if missing, as
+    are indexes added since.
+    """
+    if name == MAIN_SHARD:
+        return get_engine()
+    url = settings.message_shard_urls.get(name)
+    if url is None:
+        raise ValueError(f"Unknown message shard {name!r}")
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    engine = create_engine(url, echo=settings.sql_echo, connect_args=connect_args)
+    shard_metadata.create_all(engine)
+    for table in shard_metadata.tables.values():
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    return engine
+
+
+def _commit_shards(db: Session):
+    for shard_db in db.info.get(_SESSIONS_KEY, {}).values():
+        shard_db.commit()
+
+
+def _rollback_shards(db: Session):
+    for shard_db in db.info.get(_SESSIONS_KEY, {}).values():
+        shard_db.rollback()
+
+
+def close_shard_sessions(db: Session):
+    """Close the shard sessions opened for a main session"""
+    for shard_db in db.info.pop(_SESSIONS_KEY, {}).values():
+        shard_db.close()
+
+
+class ShardRouter:
+    """Finds the session that holds a channel's, a conversation's or a message's rows"""
+
+    def __init__(self):
+        # Allocation tables already moved past the ids used before sharding, in this process
+        self._seeded: Set[str] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.message_shard_urls)
+
+    def shard_names(self) -> List[str]:
+        return [MAIN_SHARD] + [name for name in settings.message_shard_urls if name != MAIN_SHARD]
+
+    def pick_shard(self, scope: str, scope_id: int) -> str:
+        """Rendezvous hash over the configured shards: a new shard only takes the keys it now wins"""
+        return max(
+            settings.message_shard_urls,
+            key=lambda name: hashlib.sha1(f"{name}:{scope}:{scope_id}".encode()).digest()
+        )
+
+    def place(self, db: Session, scope: str, scope_id: int) -> str:
+        """Record the shard of a new channel or conversation, in the caller's transaction"""
+        if not self.enabled:
+            return MAIN_SHARD
+        shard = self.pick_shard(scope, scope_id)
+        db.add(ShardPlacement(scope=scope, scope_id=scope_id, shard=shard))
+        # Visible to lookups later in the same transaction (sessions do not autoflush)
+        db.flush()
+        return shard
+
+    def place_many(self, db: Session, scope: str, scope_ids: List[int]):
+        """Record the shards of many new channels or conversations in one statement, in the caller's transaction"""
+        if self.enabled and scope_ids:
+            db.execute(insert(ShardPlacement.__table__), [
+                {"scope": scope, "scope_id": scope_id, "shard": self.pick_shard(scope, scope_id)}
+                for scope_id in scope_ids
+            ])
+
+    def _shard_of(self, db: Session, scope: str, scope_id: int, write: bool) -> str:
+        query = db.query(ShardPlacement.shard, ShardPlacement.moving).filter(
+            ShardPlacement.scope == scope,
+            ShardPlacement.scope_id == scope_id
+        )
+        if write:
+            # Held until commit, so a move cannot start under a write in flight
+            query = query.with_for_update(read=True)
+        placement = query.first()
+        if placement is None:
+            return MAIN_SHARD
+        if write and placement.moving:
+            raise HTTPException(
+                status_code=503,
+                detail=f"This {scope}'s messages are moving to another shard, retry shortly",
+                headers={"Retry-After": "1"}
+            )
+        return placement.shard
+
+    def session(self, db: Session, shard: str) -> Session:
+        """Session of a shard, tied to the transaction of the main session `db`"""
+        if shard == MAIN_SHARD:
+            return db
+        sessions = db.info.setdefault(_SESSIONS_KEY, {})
+        if shard not in sessions:
+            if not sessions:
+                event.listen(db, "before_commit", _commit_shards)
+                event.listen(db, "after_rollback", _rollback_shards)
+            sessions[shard] = Session(bind=get_shard_engine(shard), autoflush=False)
+        return sessions[shard]
+
+    def channel_session(self, db: Session, channel_id: int, write: bool = False) -> Session:
+        """Session holding a channel's messages; writing to a channel being moved is a 503"""
+        if not self.enabled:
+            return db
+        return self.session(db, self._shard_of(db, CHANNEL, channel_id, write))
+
+    def conversation_session(self, db: Session, conversation_id: int, write: bool = False) -> Session:
+        """Session holding a conversation's direct messages"""
+        if not self.enabled:
+            return db
+        return self.session(db, self._shard_of(db, CONVERSATION, conversation_id, write))
+
+    def sessions(self, db: Session, scope: str, scope_ids: List[int]) -> List[Tuple[Session, List[int]]]:
+        """Channel or conversation ids grouped by the session of their shard"""
+        if not scope_ids:
+            return []
+        if not self.enabled:
+            return [(db, list(scope_ids))]
+        placed = dict(db.query(ShardPlacement.scope_id, ShardPlacement.shard).filter(
+            ShardPlacement.scope == scope,
+            ShardPlacement.scope_id.in_(scope_ids)
+        ).all())
+        groups: Dict[str, List[int]] = {}
+        for scope_id in scope_ids:
+            groups.setdefault(placed.get(scope_id, MAIN_SHARD), []).append(scope_id)
+        return [(self.session(db, shard), ids) for shard, ids in groups.items()]
+
+    def _located(self, db: Session, scope: str, message_id: int) -> Optional[int]:
+        """Channel or conversation of a message, by id"""
+        table, locations, key = _SCOPES[scope]
+        scope_id = db.query(locations.c[key]).filter(locations.c.id == message_id).scalar()
+        if scope_id is None:
+            # Stored before sharding was turned on and never moved
+            scope_id = db.query(table.c[key]).filter(table.c.id == message_id).scalar()
+        return scope_id
+
+    def message_session(self, db: Session, message_id: int, write: bool = False) -> Session:
+        """Session holding a channel message"""
+        if not self.enabled:
+            return db
+        channel_id = self._located(db, CHANNEL, message_id)
+        return db if channel_id is None else self.channel_session(db, channel_id, write)
+
+    def direct_message_session(self, db: Session, message_id: int, write: bool = False) -> Session:
+        """Session holding a direct message"""
+        if not self.enabled:
+            return db
+        conversation_id = self._located(db, CONVERSATION, message_id)
+        return db if conversation_id is None else self.conversation_session(db, conversation_id, write)
+
+    def allocate_message_id(self, db: Session, channel_id: int) -> Optional[int]:
+        """Id for a new channel message, or None for the database to assign when sharding is off"""
+        return self._allocate(db, CHANNEL, channel_id)
+
+    def allocate_direct_message_id(self, db: Session, conversation_id: int) -> Optional[int]:
+        """Id for a new direct message, or None when sharding is off"""
+        return self._allocate(db, CONVERSATION, conversation_id)
+
+    def reserve_ids(self, db: Session, scope: str, scope_ids: List[int]) -> Optional[List[int]]:
+        """Ids for a batch of new messages, one per channel or conversation id given, or None when sharding is off.
+
+        The ids are consecutive and the end of the range stays locked until
+        commit, so allocations in other transactions wait and continue above.
+        """
+        if not self.enabled:
+            return None
+        _, locations, key = _SCOPES[scope]
+        if locations.name not in self._seeded:
+            self._seed(db, scope)
+        start = (db.execute(select(func.max(locations.c.id)).with_for_update()).scalar() or 0) + 1
+        ids = list(range(start, start + len(scope_ids)))
+        db.execute(
+            insert(locations), [{"id": message_id, key: scope_id} for message_id, scope_id in zip(ids, scope_ids)]
+        )
+        return ids
+
+    def _allocate(self, db: Session, scope: str, scope_id: int) -> Optional[int]:
+        if not self.enabled:
+            return None
+        _, locations, key = _SCOPES[scope]
+        if locations.name not in self._seeded:
+            self._seed(db, scope)
+        return db.execute(insert(locations).values({key: scope_id})).inserted_primary_key[0]
+
+    def _seed(self, db: Session, scope: str):
+        """Start allocating above every id used before sharding, in the main database or the archive"""
+        from app import archive
+
+        table, locations, key = _SCOPES[scope]
+        archived = archive.archived_messages if scope == CHANNEL else archive.archived_direct_messages
+        allocated = db.execute(select(func.max(locations.c.id))).scalar() or 0
+        latest = [db.execute(select(table.c.id, table.c[key]).order_by(desc(table.c.id)).limit(1)).first()]
+        if archive.archive_enabled():
+            with archive.get_archive_engine().connect() as conn:
+                latest.append(conn.execute(
+                    select(archived.c.id, archived.c[key]).order_by(desc(archived.c.id)).limit(1)
+                ).first())
+        latest = max((row for row in latest if row is not None), default=None)
+        if latest is not None and latest[0] > allocated:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(locations).values({"id": latest[0], key: latest[1]}))
+            except IntegrityError:
+                # Another worker seeded it first
+                pass
+        self._seeded.add(locations.name)
+
+
+shard_router = ShardRouter()
+
+
+# Rebalancing
+
+def _copy_rows(
+    source: Engine, target: Engine, scope: str, scope_id: int, batch_size: int, skip: Set[int]
+) -> Set[int]:
+    """Copy a channel's or conversation's rows in id order, replacing partial copies; returns the ids copied"""
+    table, locations, key = _SCOPES[scope]
+    copied = set()
+    last_id = 0
+    while True:
+        with source.connect() as conn:
+            rows = [
+                dict(row._mapping) for row in conn.execute(
+                    select(table).where(table.c[key] == scope_id, table.c.id > last_id)
+                    .order_by(table.c.id).limit(batch_size)
+                )
+            ]
+        if not rows:
+            return copied
+        last_id = rows[-1]["id"]
+        rows = [row for row in rows if row["id"] not in skip]
+        if not rows:
+            continue
+
+        ids = [row["id"] for row in rows]
+        with target.begin() as conn:
+            conn.execute(delete(table).where(table.c.id.in_(ids)))
+            conn.execute(insert(table), rows)
+        # Rows from before sharding have no location yet, and are found by id through it from now on
+        with get_engine().begin() as conn:
+            located = set(conn.execute(select(locations.c.id).where(locations.c.id.in_(ids))).scalars())
+            missing = [{"id": row_id, key: scope_id} for row_id in ids if row_id not in located]
+            if missing:
+                conn.execute(insert(locations), missing)
+        copied.update(ids)
+
+
+def _delete_rows(engine: Engine, scope: str, scope_id: int, batch_size: int):
+    """Remove a channel's or conversation's rows from a shard, newest first so replies go before their root"""
+    table, _, key = _SCOPES[scope]
+    with engine.connect() as conn:
+        ids = conn.execute(
+            select(table.c.id).where(table.c[key] == scope_id).order_by(desc(table.c.id))
+        ).scalars().all()
+    for start in range(0, len(ids), batch_size):
+        with engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.id.in_(ids[start:start + batch_size])))
+
+
+def move(scope: str, scope_id: int, target: str, batch_size: int, settle_seconds: float = 1.0) -> int:
+    """Move a channel's or conversation's messages to another shard; returns the number of rows moved.
+
+    Reads carry on from the old shard until the switch. Writes are refused
+    (503 with Retry-After) from when the placement is flagged until it
+    points at the new shard; the flag waits for writes holding the
+    placement (MySQL) and `settle_seconds` lets the rest finish. Rows that
+    still reach the old shard during the copy are picked up after the
+    switch, then the old copies are deleted.
+    """
+    from app.database import SessionLocal
+
+    target_engine = get_shard_engine(target)
+    db = SessionLocal()
+    try:
+        placement = db.query(ShardPlacement).filter(
+            ShardPlacement.scope == scope,
+            ShardPlacement.scope_id == scope_id
+        ).with_for_update().first()
+        if placement is None:
+            placement = ShardPlacement(scope=scope, scope_id=scope_id, shard=MAIN_SHARD)
+            db.add(placement)
+        source = placement.shard
+        if source == target:
+            db.rollback()
+            return 0
+        source_engine = get_shard_engine(source)
+        placement.moving = True
+        db.commit()
+
+        switched = False
+        try:
+            time.sleep(settle_seconds)
+            copied = _copy_rows(source_engine, target_engine, scope, scope_id, batch_size, set())
+            placement.shard = target
+            switched = True
+        except Exception:
+            # Leave nothing half-copied behind on the shard that is not taking over
+            _delete_rows(target_engine, scope, scope_id, batch_size)
+            raise
+        finally:
+            placement.moving = False
+            db.commit()
+
+        if switched:
+            copied |= _copy_rows(source_engine, target_engine, scope, scope_id, batch_size, copied)
+            _delete_rows(source_engine, scope, scope_id, batch_size)
+        logger.info(f"Moved {len(copied)} messages of {scope} {scope_id} from {source} to {target}")
+        return len(copied)
+    finally:
+        db.close()
+
+
+def status() -> Dict[str, Dict[str, int]]:
+    """Placements and stored rows per shard"""
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        placed = db.query(ShardPlacement.shard, ShardPlacement.scope, func.count()).group_by(
+            ShardPlacement.shard, ShardPlacement.scope
+        ).all()
+    finally:
+        db.close()
+
+    shards = {}
+    for name in shard_router.shard_names():
+        with get_shard_engine(name).connect() as conn:
+            shards[name] = {
+                table.name: conn.execute(select(func.count()).select_from(table)).scalar()
+                for table in (Message.__table__, DirectMessage.__table__)
+            }
+        for shard, scope, count in placed:
+            if shard == name:
+                shards[name][f"{scope}s_placed"] = count
+    return shards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m app.sharding", description="Inspect and rebalance message shards")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="placements and rows per shard")
+    move_parser = commands.add_parser("move", help="move channels' or conversations' messages to another shard")
+    move_parser.add_argument("--channel", type=int, action="append", default=[], help="repeatable")
+    move_parser.add_argument("--conversation", type=int, action="append", default=[], help="repeatable")
+    move_parser.add_argument("--to", required=True, help="shard name, or main")
+    move_parser.add_argument("--batch-size", type=int, default=settings.message_shard_move_batch_size)
+    move_parser.add_argument("--settle-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "status":
+        print(status())
+    else:
+        moves = [(CHANNEL, channel_id) for channel_id in args.channel]
+        moves += [(CONVERSATION, conversation_id) for conversation_id in args.conversation]
+        for scope, scope_id in moves:
+            print(scope, scope_id, move(scope, scope_id, args.to, args.batch_size, args.settle_seconds))
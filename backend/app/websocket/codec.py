@@ -0,0 +1,173 @@
+from datetime import datetime, timezone
+from typing import Any, Dict
+import json
+
+
+# Verbose key -> compact key; keys not listed pass through unchanged
+KEYS = {
+    "type": "t",
+    "data": "d",
+    "seq": "q",
+    "id": "i",
+    "channel_id": "c",
+    "conversation_id": "v",
+    "sender_id": "s",
+    "receiver_id": "r",
+    "user_id": "u",
+    "user_ids": "us",
+    "parent_message_id": "p",
+    "reply_count": "n",
+    "content": "x",
+    "message_type": "mt",
+    "file_url": "f",
+    "is_edited": "e",
+    "is_read": "rd",
+    "status": "st",
+    "detail": "dt",
+    "sender": "S",
+    "receiver": "R",
+    "username": "un",
+    "email": "em",
+    "full_name": "fn",
+    "avatar_url": "av",
+    "is_active": "ac",
+    "is_online": "on",
+    "created_at": "ca",
+    "edited_at": "ea",
+    "read_at": "ra",
+    "last_reply_at": "la",
+    "last_seen": "ls",
+    "after_ms": "am",
+    "version": "vn",
+}
+
+# Event type -> compact type; unknown types pass through unchanged
+TYPES = {
+    "new_message": "m",
+    "new_direct_message": "dm",
+    "message_updated": "mu",
+    "message_deleted": "md",
+    "user_status": "us",
+    "typing": "ty",
+    "resync": "rs",
+    "resumed": "rm",
+    "error": "er",
+    "pong": "po",
+    "reconnect": "rc",
+}
+
+# ISO timestamps sent as integer epoch milliseconds (UTC)
+TIME_KEYS = {"created_at", "edited_at", "read_at", "last_reply_at", "last_seen"}
+
+# Integer id lists sent as first value then successive differences
+DELTA_LIST_KEYS = {"user_ids"}
+
+# Nested user objects whose id repeats a sibling field and is dropped
+NESTED_ID_KEYS = {"sender": "sender_id", "receiver": "receiver_id"}
+
+_KEYS_REVERSED = {compact: verbose for verbose, compact in KEYS.items()}
+_TYPES_REVERSED = {compact: verbose for verbose, compact in TYPES.items()}
+
+
+def _to_epoch_ms(value: str) -> Any:
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _from_epoch_ms(value: Any) -> Any:
+    if not isinstance(value, int):
+        return value
+    moment = datetime.fromtimestamp(value / 1000, tz=timezone.utc).replace(tzinfo=None)
+    return moment.isoformat(timespec="milliseconds")
+
+
+def _delta_encode(values: list) -> list:
+    if not all(isinstance(value, int) for value in values):
+        return values
+    return values[:1] + [current - previous for previous, current in zip(values, values[1:])]
+
+
+def _delta_decode(values: list) -> list:
+    decoded = []
+    total = 0
+    for index, value in enumerate(values):
+        total = value if index == 0 else total + value
+        decoded.append(total)
+    return decoded
+
+
+class CompactCodec:
+    """Short-key encoding of server events for bandwidth-bound clients.
+
+    Opted into per socket with `/ws?format=compact`. On top of the key and
+    type tables above: null fields are omitted, timestamps become epoch
+    milliseconds, id lists are delta encoded, nested sender/receiver objects
+    drop the id already given by `sender_id`/`receiver_id`, and a reply's
+    `parent_message_id` is sent as its distance back from `id`. Frames are
+    written without whitespace. `decode` restores the verbose shape
+    (timestamps at millisecond precision).
+    """
+
+    def encode(self, event: Dict[str, Any]) -> str:
+        return json.dumps(self._encode_object(event), separators=(",", ":"))
+
+    def transcode(self, message: str) -> str:
+        """Re-encode an already serialized verbose frame"""
+        return self.encode(json.loads(message))
+
+    def decode(self, message: str) -> Dict[str, Any]:
+        return self._decode_object(json.loads(message))
+
+    def _encode_object(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        encoded = {}
+        for key, value in values.items():
+            if value is None:
+                continue
+            if key == "type" and isinstance(value, str):
+                value = TYPES.get(value, value)
+            elif key in TIME_KEYS and isinstance(value, str):
+                value = _to_epoch_ms(value)
+            elif key in DELTA_LIST_KEYS and isinstance(value, list):
+                value = _delta_encode(value)
+            elif key == "parent_message_id" and isinstance(values.get("id"), int):
+                value = values["id"] - value
+            elif isinstance(value, dict):
+                value = self._encode_object(value)
+                sibling = NESTED_ID_KEYS.get(key)
+                if sibling and value.get("i") == values.get(sibling):
+                    del value["i"]
+            encoded[KEYS.get(key, key)] = value
+        return encoded
+
+    def _decode_object(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        decoded = {}
+        for compact_key, value in values.items():
+            key = _KEYS_REVERSED.get(compact_key, compact_key)
+            if key == "type" and isinstance(value, str):
+                value = _TYPES_REVERSED.get(value, value)
+            elif key in TIME_KEYS:
+                value = _from_epoch_ms(value)
+            elif key in DELTA_LIST_KEYS and isinstance(value, list):
+                value = _delta_decode(value)
+            elif isinstance(value, dict):
+                value = self._decode_object(value)
+            decoded[key] = value
+
+        if isinstance(decoded.get("parent_message_id"), int) and isinstance(decoded.get("id"), int):
+            decoded["parent_message_id"] = decoded["id"] - decoded["parent_message_id"]
+        for key, sibling in NESTED_ID_KEYS.items():
+            nested = decoded.get(key)
+            if isinstance(nested, dict) and "id" not in nested and sibling in decoded:
+                nested["id"] = decoded[sibling]
+        return decoded
+
+
+compact_codec = CompactCodec()
+
+# `?format=` values accepted on /ws; anything else gets verbose JSON
+CODECS = {"compact": compact_codec}
@@ -1,92 +1,219 @@
 from fastapi import WebSocket, WebSocketDisconnect, Depends
-from typing import Dict, List, Set
+from typing import Iterable, List, Optional
 import json
 import asyncio
+import random
+import time
 from app.auth import get_current_user
+from app.config import LazyInstance, settings
 from app.models import User
-from app.redis_client import presence_manager
+from app.rate_limit import TokenBucket, RedisTokenBucket
+from app.redis_client import presence_manager, cache_manager, event_log, redis_client
+from app.websocket.codec import CODECS
+from app.websocket.limits import InboundLimiter, ACCEPT
+from app.websocket.registry import Connection, ConnectionRegistry
+from app.websocket.typing import TypingAggregator
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def _is_channel_id(value) -> bool:
+    """Whether a client-sent channel_id is an integer id (the registry bisects on ints; bool is not an id)"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
 class ConnectionManager:
     def __init__(self):
-        # Store active connections: user_id -> set of websockets
-        self.active_connections: Dict[int, Set[WebSocket]] = {}
-        # Store channel subscriptions: channel_id -> set of user_ids
-        self.channel_subscriptions: Dict[int, Set[int]] = {}
-        # Store direct message subscriptions: user_id -> set of user_ids
-        self.dm_subscriptions: Dict[int, Set[int]] = {}
-        # Store websocket to user mapping
-        self.websocket_users: Dict[WebSocket, int] = {}
-    
-    async def connect(self, websocket: WebSocket, user_id: int):
+        # Sockets, per-user state and channel subscriptions (user_id <-> channel_id)
+        self.registry = ConnectionRegistry()
+        # Coalesced "users typing" frames per channel
+        self.typing = LazyInstance(lambda: TypingAggregator(
+            self.broadcast_to_channel,
+            flush_interval=settings.typing_flush_interval_ms / 1000,
+            ttl=settings.typing_ttl_seconds
+        ))
+        # Set once shutdown starts; new sockets are refused from then on
+        self.draining = False
+        self._drain_task: Optional[asyncio.Task] = None
+    
+    async def connect(self, websocket: WebSocket, user_id: int, frame_format: Optional[str] = None):
         """Accept websocket connection and add to active connections"""
         await websocket.accept()
         
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = set()
+        connection, first = self.registry.add(websocket, user_id)
+        connection.limiter = self._create_inbound_limiter(user_id)
+        connection.codec = CODECS.get(frame_format)
         
-        self.active_connections[user_id].add(websocket)
-        self.websocket_users[websocket] = user_id
+        # Subscribe to every channel the user belongs to (once per user, not per socket)
+        if first:
+            await self.subscribe_user_channels(user_id)
         
         # Set user as online in Redis
-        await presence_manager.set_user_online(user_id, str(id(websocket)))
+        handed_off = await presence_manager.set_user_online(user_id, str(id(websocket)))
         
         logger.info(f"User {user_id} connected via WebSocket")
         
-        # Notify about user coming online
-        await self.broadcast_user_status(user_id, "online")
+        # Notify about user coming online (not when moving here from a draining worker)
+        if not handed_off:
+            await self.broadcast_user_status(user_id, "online")
     
     async def disconnect(self, websocket: WebSocket):
         """Remove websocket connection and clean up"""
-        user_id = self.websocket_users.get(websocket)
+        # Dropping the user's last socket also drops their subscriptions
+        connection, last = self.registry.remove(websocket)
+        if connection is None:
+            return
         
-        if user_id:
-            if user_id in self.active_connections:
-                self.active_connections[user_id].discard(websocket)
-                
-                # If no more connections for this user, set as offline
-                if not self.active_connections[user_id]:
-                    del self.active_connections[user_id]
-                    await presence_manager.set_user_offline(user_id)
-                    
-                    # Notify about user going offline
-                    await self.broadcast_user_status(user_id, "offline")
+        user_id = connection.user_id
+        if last:
+            self.typing.remove_user(user_id)
             
-            # Clean up subscriptions
-            for channel_id in list(self.channel_subscriptions.keys()):
-                if user_id in self.channel_subscriptions[channel_id]:
-                    self.channel_subscriptions[channel_id].discard(user_id)
-                    if not self.channel_subscriptions[channel_id]:
-                        del self.channel_subscriptions[channel_id]
-            
-            if websocket in self.websocket_users:
-                del self.websocket_users[websocket]
-            
-            logger.info(f"User {user_id} disconnected from WebSocket")
+            # While draining, presence was handed off in bulk and is settled by the drain
+            if not self.draining:
+                await presence_manager.set_user_offline(user_id)
+                
+                # Notify about user going offline
+                await self.broadcast_user_status(user_id, "offline")
+        
+        logger.info(f"User {user_id} disconnected from WebSocket")
+    
+    def is_connected(self, user_id: int) -> bool:
+        """Whether the user has an open socket on this worker"""
+        return user_id in self.registry.users
+    
+    def get_limiter(self, websocket: WebSocket) -> Optional[InboundLimiter]:
+        connection = self.registry.get(websocket)
+        return connection.limiter if connection else None
+    
+    def _create_inbound_limiter(self, user_id: int) -> InboundLimiter:
+        user = self.registry.users[user_id]
+        if user.bucket is None:
+            user.bucket = TokenBucket(settings.ws_user_inbound_rate, settings.ws_user_inbound_burst)
+        if settings.ws_shared_inbound_rate > 0 and user.shared_bucket is None:
+            user.shared_bucket = RedisTokenBucket(
+                redis_client,
+                f"ws_inbound_bucket:{user_id}",
+                settings.ws_shared_inbound_rate,
+                settings.ws_shared_inbound_burst,
+                settings.ws_shared_lease_size
+            )
+        
+        return InboundLimiter(
+            connection_bucket=TokenBucket(settings.ws_inbound_rate, settings.ws_inbound_burst),
+            user_bucket=user.bucket,
+            violation_bucket=TokenBucket(1.0, settings.ws_max_violations),
+            max_message_bytes=settings.ws_max_message_bytes,
+            shared_bucket=user.shared_bucket
+        )
+    
+    async def admit(self, websocket: WebSocket, size: int) -> str:
+        """Apply inbound size and rate limits to a received frame"""
+        limiter = self.get_limiter(websocket)
+        if limiter is None:
+            return ACCEPT
+        return await limiter.admit(size)
+    
+    async def _send_to_connections(self, message: str, connections: List[Connection]):
+        # Each codec re-encodes the verbose frame once per call, not once per socket
+        encoded = {}
+        disconnected_websockets = []
+        for connection in connections:
+            frame = message
+            if connection.codec is not None:
+                frame = encoded.get(connection.codec)
+                if frame is None:
+                    frame = encoded[connection.codec] = connection.codec.transcode(message)
+            try:
+                await connection.websocket.send_text(frame)
+            except Exception as e:
+                logger.error(f"Error sending WebSocket message: {e}")
+                disconnected_websockets.append(connection.websocket)
+        
+        # Clean up disconnected websockets
+        for websocket in disconnected_websockets:
+            await self.disconnect(websocket)
+    
+    @staticmethod
+    def _frame_for(connection: Optional[Connection], message: str) -> str:
+        if connection is not None and connection.codec is not None:
+            return connection.codec.transcode(message)
+        return message
+    
+    async def send_frame(self, websocket: WebSocket, message: str):
+        """Send a verbose JSON frame to one socket in the format it negotiated"""
+        await websocket.send_text(self._frame_for(self.registry.get(websocket), message))
     
     async def send_personal_message(self, message: str, user_id: int):
         """Send message to specific user"""
-        if user_id in self.active_connections:
-            disconnected_websockets = []
-            for websocket in self.active_connections[user_id]:
-                try:
-                    await websocket.send_text(message)
-                except Exception as e:
-                    logger.error(f"Error sending message to user {user_id}: {e}")
-                    disconnected_websockets.append(websocket)
-            
-            # Clean up disconnected websockets
-            for websocket in disconnected_websockets:
-                await self.disconnect(websocket)
+        await self._send_to_connections(message, self.registry.user_connections(user_id))
     
     async def broadcast_to_channel(self, message: str, channel_id: int):
         """Broadcast message to all users in a channel"""
-        if channel_id in self.channel_subscriptions:
-            for user_id in self.channel_subscriptions[channel_id]:
-                await self.send_personal_message(message, user_id)
+        await self._send_to_connections(message, self.registry.channel_connections(channel_id))
+    
+    async def publish(self, user_ids: Iterable[int], event: dict):
+        """Append an event to each user's log and deliver it to the ones connected here"""
+        user_ids = list(user_ids)
+        payload = json.dumps(event)
+        try:
+            seqs = await event_log.append(user_ids, payload)
+        except Exception as e:
+            # Live delivery still works; clients will resync on their next reconnect
+            logger.error(f"Error appending to event log: {e}")
+            seqs = {}
+        
+        for user_id in user_ids:
+            if self.is_connected(user_id):
+                await self.send_personal_message(event_log.frame(payload, seqs.get(user_id)), user_id)
+    
+    async def publish_to_channel(self, channel_id: int, member_ids: Iterable[int], event: dict):
+        """Append a channel event to the members' logs and deliver it to the channel's subscribed sockets.
+        
+        Live delivery follows subscriptions, like typing and reactions: team members who
+        joined a public channel over the socket get it too (without a seq, as it is not
+        in their log), and members who left it over the socket do not.
+        """
+        member_ids = list(member_ids)
+        payload = json.dumps(event)
+        try:
+            seqs = await event_log.append(member_ids, payload)
+        except Exception as e:
+            # Live delivery still works; clients will resync on their next reconnect
+            logger.error(f"Error appending to event log: {e}")
+            seqs = {}
+        
+        # One frame per user, as the seq differs between users
+        by_user = {}
+        for connection in self.registry.channel_connections(channel_id):
+            by_user.setdefault(connection.user_id, []).append(connection)
+        for user_id, connections in by_user.items():
+            await self._send_to_connections(event_log.frame(payload, seqs.get(user_id)), connections)
+    
+    async def resume(self, websocket: WebSocket, user_id: int, last_seq: Optional[int]):
+        """Replay the events a reconnecting client missed, or tell it to resync"""
+        events = None
+        if isinstance(last_seq, int) and last_seq >= 0:
+            try:
+                events = await event_log.replay(user_id, last_seq, settings.event_replay_max)
+            except Exception as e:
+                logger.error(f"Error replaying events for user {user_id}: {e}")
+        
+        if events is None:
+            try:
+                current_seq = await event_log.current_seq(user_id)
+            except Exception as e:
+                logger.error(f"Error reading event sequence for user {user_id}: {e}")
+                current_seq = None
+            await self.send_frame(websocket, json.dumps({"type": "resync", "data": {"seq": current_seq}}))
+            return
+        
+        for seq, payload in events:
+            await self.send_frame(websocket, event_log.frame(payload, seq))
+        await self.send_frame(websocket, json.dumps({
+            "type": "resumed",
+            "data": {"seq": events[-1][0] if events else last_seq}
+        }))
     
     async def broadcast_user_status(self, user_id: int, status: str):
         """Broadcast user status change to all connected users"""
@@ -98,62 +225,195 @@ class ConnectionManager:
             }
         })
         
-        for connected_user_id in self.active_connections.keys():
+        for connected_user_id in list(self.registry.users):
             if connected_user_id != user_id:
                 await self.send_personal_message(message, connected_user_id)
     
+    def start_drain(self) -> asyncio.Task:
+        """Start draining this worker (idempotent; callable from sync shutdown hooks)"""
+        if self._drain_task is None:
+            self.draining = True
+            self._drain_task = asyncio.get_running_loop().create_task(self._drain())
+        return self._drain_task
+    
+    async def drain(self):
+        """Drain this worker and wait until every socket is gone and presence is settled"""
+        await self.start_drain()
+    
+    async def _drain(self):
+        window = settings.ws_drain_window_seconds
+        close_grace = settings.ws_drain_close_grace_seconds
+        handoff = settings.presence_handoff_seconds
+        connections = [connection for connection in self.registry.connections if connection is not None]
+        user_ids = list(self.registry.users)
+        if not connections:
+            return
+        logger.info(f"Draining {len(connections)} WebSocket connections over {window}s")
+        
+        # Keep everyone online while they move; a reconnect elsewhere consumes the marker
+        try:
+            await presence_manager.hand_off(user_ids, int(2 * (window + close_grace + handoff)) + 1)
+        except Exception as e:
+            logger.error(f"Error handing off presence: {e}")
+        
+        # Spread reconnects evenly over the window, with jitter inside each slot
+        random.shuffle(connections)
+        slot = window / len(connections) if connections else 0
+        started = time.monotonic()
+        deadlines = []
+        for index, connection in enumerate(connections):
+            after = slot * index + random.uniform(0, slot)
+            deadlines.append((after, connection))
+            message = json.dumps({"type": "reconnect", "data": {"after_ms": int(after * 1000)}})
+            try:
+                await connection.websocket.send_text(self._frame_for(connection, message))
+            except Exception as e:
+                logger.error(f"Error sending reconnect frame: {e}")
+            # Let the loop breathe (and early deadlines fire) while thousands of frames go out
+            if index % 100 == 99:
+                await asyncio.sleep(0)
+        
+        # Close whatever is still open once its deadline plus grace has passed
+        for after, connection in deadlines:
+            delay = started + after + close_grace - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.registry.get(connection.websocket) is not connection:
+                continue
+            try:
+                await connection.websocket.close(code=1012)
+            except Exception as e:
+                logger.error(f"Error closing WebSocket while draining: {e}")
+            await self.disconnect(connection.websocket)
+        
+        # Sockets that completed their handshake as the drain started; uvicorn waits for them too
+        for connection in [connection for connection in self.registry.connections if connection is not None]:
+            try:
+                await connection.websocket.close(code=1012)
+            except Exception as e:
+                logger.error(f"Error closing WebSocket while draining: {e}")
+            await self.disconnect(connection.websocket)
+        
+        # Whoever has not reconnected anywhere by now really is offline
+        await asyncio.sleep(handoff)
+        try:
+            offline = await presence_manager.finish_hand_off(user_ids)
+            logger.info(f"Drain finished; {offline} of {len(user_ids)} users did not reconnect")
+        except Exception as e:
+            logger.error(f"Error finishing presence handoff: {e}")
+    
+    async def get_user_channel_ids(self, user_id: int) -> List[int]:
+        """Channels the user is a member of, from cache or one database query"""
+        try:
+            channel_ids = await cache_manager.get_cached_user_channels(user_id)
+            if channel_ids is not None:
+                return channel_ids
+        except Exception as e:
+            logger.error(f"Error reading cached channels for user {user_id}: {e}")
+        
+        channel_ids = load_user_channel_ids(user_id)
+        try:
+            await cache_manager.cache_user_channels(user_id, channel_ids)
+        except Exception as e:
+            logger.error(f"Error caching channels for user {user_id}: {e}")
+        return channel_ids
+    
+    async def subscribe_user_channels(self, user_id: int):
+        """Subscribe a newly connected user to all of their channels in bulk"""
+        channel_ids = await self.get_user_channel_ids(user_id)
+        added = self.registry.subscribe_many(user_id, channel_ids)
+        logger.info(f"User {user_id} subscribed to {added} channels")
+    
     async def subscribe_to_channel(self, user_id: int, channel_id: int):
         """Subscribe user to channel updates"""
-        if channel_id not in self.channel_subscriptions:
-            self.channel_subscriptions[channel_id] = set()
-        
-        self.channel_subscriptions[channel_id].add(user_id)
-        logger.info(f"User {user_id} subscribed to channel {channel_id}")
+        if self.registry.subscribe(user_id, channel_id):
+            logger.info(f"User {user_id} subscribed to channel {channel_id}")
     
     async def unsubscribe_from_channel(self, user_id: int, channel_id: int):
         """Unsubscribe user from channel updates"""
-        if channel_id in self.channel_subscriptions:
-            self.channel_subscriptions[channel_id].discard(user_id)
-            if not self.channel_subscriptions[channel_id]:
-                del self.channel_subscriptions[channel_id]
+        if self.registry.unsubscribe(user_id, channel_id):
+            # A typing indicator left behind would keep being shown until it expires
+            self.typing.discard(channel_id, user_id)
+            logger.info(f"User {user_id} unsubscribed from channel {channel_id}")
+    
+    async def add_channel_membership(self, user_id: int, channel_id: int):
+        """Follow a membership added over REST: refresh the cache and subscribe open sockets"""
+        try:
+            await cache_manager.invalidate_user_channels(user_id)
+            await cache_manager.invalidate_bootstrap(user_id)
+        except Exception as e:
+            logger.error(f"Error invalidating cached channels for user {user_id}: {e}")
+        
+        if self.is_connected(user_id):
+            await self.subscribe_to_channel(user_id, channel_id)
+    
+    async def add_channel_memberships(self, user_ids: List[int], channel_id: int):
+        """Follow a batch of memberships added over REST: one cache round trip, then subscribe open sockets"""
+        try:
+            await cache_manager.invalidate_user_channels(*user_ids)
+            await cache_manager.invalidate_bootstrap(*user_ids)
+        except Exception as e:
+            logger.error(f"Error invalidating cached channels for {len(user_ids)} users: {e}")
         
-        logger.info(f"User {user_id} unsubscribed from channel {channel_id}")
+        subscribed = sum(1 for user_id in user_ids if self.registry.subscribe(user_id, channel_id))
+        if subscribed:
+            logger.info(f"{subscribed} connected users subscribed to channel {channel_id}")
+    
+    async def remove_channel_membership(self, user_id: int, channel_ids: Iterable[int]):
+        """Follow memberships removed over REST: refresh the cache and unsubscribe open sockets"""
+        try:
+            await cache_manager.invalidate_user_channels(user_id)
+            await cache_manager.invalidate_bootstrap(user_id)
+        except Exception as e:
+            logger.error(f"Error invalidating cached channels for user {user_id}: {e}")
+        
+        for channel_id in channel_ids:
+            await self.unsubscribe_from_channel(user_id, channel_id)
     
     async def handle_message(self, websocket: WebSocket, data: dict):
         """Handle incoming WebSocket messages"""
-        user_id = self.websocket_users.get(websocket)
-        if not user_id:
+        connection = self.registry.get(websocket)
+        if not connection:
             return
+        user_id = connection.user_id
         
         message_type = data.get("type")
         
         if message_type == "join_channel":
             channel_id = data.get("channel_id")
             if channel_id:
-                await self.subscribe_to_channel(user_id, channel_id)
+                valid = _is_channel_id(channel_id)
+                # Member channels are already subscribed; anything else is checked first
+                if valid and self.registry.is_subscribed(user_id, channel_id):
+                    return
+                if valid and user_can_read_channel(user_id, channel_id):
+                    await self.subscribe_to_channel(user_id, channel_id)
+                else:
+                    await self.send_frame(websocket, json.dumps({
+                        "type": "error",
+                        "data": {"detail": "Cannot join channel", "channel_id": channel_id}
+                    }))
         
         elif message_type == "leave_channel":
             channel_id = data.get("channel_id")
-            if channel_id:
+            if _is_channel_id(channel_id):
                 await self.unsubscribe_from_channel(user_id, channel_id)
         
         elif message_type == "typing":
             channel_id = data.get("channel_id")
-            if channel_id:
-                typing_message = json.dumps({
-                    "type": "typing",
-                    "data": {
-                        "user_id": user_id,
-                        "channel_id": channel_id,
-                        "typing": data.get("typing", False)
-                    }
-                })
-                await self.broadcast_to_channel(typing_message, channel_id)
+            # Only into channels the user is subscribed to (member channels, or joined after the read check)
+            if _is_channel_id(channel_id) and self.registry.is_subscribed(user_id, channel_id):
+                # Aggregated and flushed at most every typing_flush_interval_ms
+                self.typing.update(channel_id, user_id, bool(data.get("typing", False)))
+        
+        elif message_type == "resume":
+            # Sent after reconnecting with the last event seq the client saw
+            await self.resume(websocket, user_id, data.get("last_seq"))
         
         elif message_type == "ping":
             # Update user activity
             await presence_manager.update_user_activity(user_id)
-            await websocket.send_text(json.dumps({"type": "pong"}))
+            await self.send_frame(websocket, json.dumps({"type": "pong"}))
 
 
 # Global connection manager instance
@@ -186,3 +446,51 @@ async def get_websocket_user(websocket: WebSocket, token: str):
         logger.error(f"WebSocket authentication error: {e}")
         await websocket.close(code=4001)
         return None
+
+
+def load_user_channel_ids(user_id: int) -> List[int]:
+    """Channels the user is a member of, limited to teams they still belong to"""
+    from app.database import SessionLocal
+    from app.models import Channel, channel_members, team_members
+    from sqlalchemy import and_
+    
+    db = SessionLocal()
+    try:
+        rows = db.query(channel_members.c.channel_id).join(
+            Channel, Channel.id == channel_members.c.channel_id
+        ).join(
+            team_members,
+            and_(team_members.c.team_id == Channel.team_id, team_members.c.user_id == channel_members.c.user_id)
+        ).filter(channel_members.c.user_id == user_id).all()
+        return [row.channel_id for row in rows]
+    finally:
+        db.close()
+
+
+def user_can_read_channel(user_id: int, channel_id: int) -> bool:
+    """Same rule as the REST routes: team members see public channels, members see private ones"""
+    from app.database import SessionLocal
+    from app.models import Channel, channel_members, team_members
+    
+    db = SessionLocal()
+    try:
+        channel = db.query(Channel.team_id, Channel.is_private).filter(Channel.id == channel_id).first()
+        if not channel:
+            return False
+        
+        is_team_member = db.query(team_members).filter(
+            team_members.c.user_id == user_id,
+            team_members.c.team_id == channel.team_id
+        ).first()
+        if not is_team_member:
+            return False
+        
+        if channel.is_private:
+            is_member = db.query(channel_members).filter(
+                channel_members.c.user_id == user_id,
+                channel_members.c.channel_id == channel_id
+            ).first()
+            return bool(is_member)
+        return True
+    finally:
+        db.close()
@@ -1,27 +1,50 @@
 from fastapi import WebSocket, WebSocketDisconnect, Query
+from typing import Optional
 import json
 import logging
 from app.websocket.connection_manager import manager, get_websocket_user
+from app.websocket.limits import DROP, CLOSE
 
 logger = logging.getLogger(__name__)
 
 
-async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
+async def websocket_endpoint(websocket: WebSocket, token: str = Query(...), format: Optional[str] = Query(None)):
     """Main WebSocket endpoint for real-time messaging"""
     
+    # A draining worker takes no new sockets; the client retries on another one
+    if manager.draining:
+        await websocket.close(code=1013)
+        return
+    
     # Authenticate user
     user = await get_websocket_user(websocket, token)
     if not user:
         return
+    # Shutdown may have started while authenticating
+    if manager.draining:
+        await websocket.close(code=1013)
+        return
     
     # Connect user
-    await manager.connect(websocket, user.id)
+    # `format=compact` opts into short-key frames (see app.websocket.codec)
+    await manager.connect(websocket, user.id, format)
     
     try:
         while True:
             # Receive message from client
             data = await websocket.receive_text()
             
+            # Enforce size and rate limits before any parsing (the cap is in UTF-8 bytes, not characters)
+            verdict = await manager.admit(websocket, len(data.encode()))
+            if verdict == DROP:
+                continue
+            if verdict == CLOSE:
+                limiter = manager.get_limiter(websocket)
+                logger.warning(f"Closing WebSocket for user {user.id}: {limiter.close_reason}")
+                await websocket.close(code=limiter.close_code, reason=limiter.close_reason)
+                await manager.disconnect(websocket)
+                return
+            
             try:
                 message_data = json.loads(data)
                 await manager.handle_message(websocket, message_data)
@@ -0,0 +1,65 @@
+from typing import Optional
+from app.rate_limit import TokenBucket, RedisTokenBucket
+
+# Verdicts for an inbound frame
+ACCEPT = "accept"
+DROP = "drop"
+CLOSE = "close"
+
+# Close codes sent to clients that break the inbound limits
+WS_CLOSE_MESSAGE_TOO_BIG = 1009
+WS_CLOSE_RATE_LIMITED = 4029
+
+
+class InboundLimiter:
+    """Admission control for frames received on one WebSocket connection.
+
+    A frame must fit under the size cap and get a token from the connection's
+    bucket, the user's bucket (shared by all of the user's sockets on this
+    worker) and, when configured, the user's Redis bucket (shared across
+    workers). Rejected frames are dropped; every drop also spends a token from a
+    slowly refilling violation budget, and a client that exhausts it is closed.
+    """
+
+    __slots__ = (
+        "connection_bucket", "user_bucket", "violation_bucket", "max_message_bytes",
+        "shared_bucket", "close_code", "close_reason", "dropped"
+    )
+
+    def __init__(
+        self,
+        connection_bucket: TokenBucket,
+        user_bucket: TokenBucket,
+        violation_bucket: TokenBucket,
+        max_message_bytes: int,
+        shared_bucket: Optional[RedisTokenBucket] = None,
+    ):
+        self.connection_bucket = connection_bucket
+        self.user_bucket = user_bucket
+        self.violation_bucket = violation_bucket
+        self.max_message_bytes = max_message_bytes
+        self.shared_bucket = shared_bucket
+        self.close_code: Optional[int] = None
+        self.close_reason = ""
+        self.dropped = 0
+
+    async def admit(self, size: int) -> str:
+        """Decide whether a frame of `size` bytes is handled, dropped or ends the connection"""
+        if size > self.max_message_bytes:
+            self.close_code = WS_CLOSE_MESSAGE_TOO_BIG
+            self.close_reason = f"Message exceeds {self.max_message_bytes} bytes"
+            return CLOSE
+
+        if (
+            self.connection_bucket.consume()
+            and self.user_bucket.consume()
+            and (self.shared_bucket is None or await self.shared_bucket.consume())
+        ):
+            return ACCEPT
+
+        self.dropped += 1
+        if not self.violation_bucket.consume():
+            self.close_code = WS_CLOSE_RATE_LIMITED
+            self.close_reason = "Rate limit exceeded, reconnect later"
+            return CLOSE
+        return DROP
@@ -0,0 +1,52 @@
+from typing import List
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets.extensions.base import ServerExtensionFactory
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from app.config import settings
+from app.websocket.connection_manager import manager
+
+
+def deflate_extensions() -> List[ServerExtensionFactory]:
+    """permessage-deflate offer built from settings; empty when disabled.
+
+    Each compressing connection holds roughly
+    `2 ** (window_bits + 2) + 2 ** (mem_level + 9)` bytes of zlib state while
+    context takeover is on (about 32 KiB at the defaults, against 256 KiB for
+    zlib's own defaults), so window and memory level are kept small.
+    """
+    if not settings.ws_deflate_enabled:
+        return []
+    return [
+        ServerPerMessageDeflateFactory(
+            server_no_context_takeover=settings.ws_deflate_no_context_takeover,
+            server_max_window_bits=settings.ws_deflate_window_bits,
+            client_max_window_bits=settings.ws_deflate_window_bits,
+            compress_settings={
+                "level": settings.ws_deflate_level,
+                "memLevel": settings.ws_deflate_mem_level
+            }
+        )
+    ]
+
+
+class SyncSpaceWebSocketProtocol(WebSocketProtocol):
+    """uvicorn's websockets protocol with tuned permessage-deflate and graceful drain.
+
+    uvicorn only exposes deflate as on/off and, on shutdown, closes every
+    socket at once with 1012 before the app's lifespan shutdown runs. Passed
+    as `ws=` to `uvicorn.run` (see app.main), this class negotiates the
+    configured deflate settings and turns shutdown into a staggered drain by
+    the ConnectionManager; uvicorn waits for the drained sockets to close.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.available_extensions = deflate_extensions()
+
+    def shutdown(self):
+        if not self.handshake_completed_event.is_set() or settings.ws_drain_window_seconds <= 0:
+            super().shutdown()
+            return
+        # The drain closes this socket on its own deadline
+        self.ws_server.closing = True
+        manager.start_drain()
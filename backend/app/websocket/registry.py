@@ -0,0 +1,192 @@
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi import WebSocket
+
+
+def _insert_sorted(values: array, value: int) -> bool:
+    position = bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        return False
+    values.insert(position, value)
+    return True
+
+
+def _remove_sorted(values: array, value: int) -> bool:
+    position = bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        del values[position]
+        return True
+    return False
+
+
+class Connection:
+    """One open socket, addressed by a small integer handle"""
+
+    __slots__ = ("handle", "websocket", "user_id", "limiter", "codec")
+
+    def __init__(self, handle: int, websocket: WebSocket, user_id: int):
+        self.handle = handle
+        self.websocket = websocket
+        self.user_id = user_id
+        self.limiter = None
+        # None sends verbose JSON
+        self.codec = None
+
+
+class ConnectedUser:
+    """Per-user state shared by all of a user's sockets on this worker"""
+
+    __slots__ = ("handles", "channels", "bucket", "shared_bucket")
+
+    def __init__(self):
+        self.handles = array("i")
+        # Sorted channel ids the user is subscribed to
+        self.channels = array("i")
+        self.bucket = None
+        self.shared_bucket = None
+
+
+class ConnectionRegistry:
+    """Compact bookkeeping of sockets, users and channel subscriptions.
+
+    Sockets live in a flat list indexed by integer handle (freed handles are
+    reused). Channels hold sorted `array("i")` of the handles subscribed to
+    them, and users a sorted array of their channel ids, instead of Python
+    sets: 4 bytes per membership rather than a hash table slot plus a boxed
+    int, and a broadcast is one pass over a contiguous block of handles.
+    Inserts and removals shift the array, which stays cheap even for channels
+    with hundreds of thousands of subscribers.
+    """
+
+    def __init__(self):
+        self.connections: List[Optional[Connection]] = []
+        self._free_handles = array("i")
+        self._handles: Dict[WebSocket, int] = {}
+        self.users: Dict[int, ConnectedUser] = {}
+        # channel_id -> sorted handles of subscribed sockets
+        self.channels: Dict[int, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    def add(self, websocket: WebSocket, user_id: int) -> Tuple[Connection, bool]:
+        """Register a socket; returns its record and whether it is the user's first"""
+        if self._free_handles:
+            handle = self._free_handles.pop()
+        else:
+            handle = len(self.connections)
+            self.connections.append(None)
+
+        connection = Connection(handle, websocket, user_id)
+        self.connections[handle] = connection
+        self._handles[websocket] = handle
+
+        user = self.users.get(user_id)
+        first = user is None
+        if first:
+            user = self.users[user_id] = ConnectedUser()
+        user.handles.append(handle)
+        # Another tab of a connected user joins their existing subscriptions
+        for channel_id in user.channels:
+            _insert_sorted(self.channels[channel_id], handle)
+        return connection, first
+
+    def remove(self, websocket: WebSocket) -> Tuple[Optional[Connection], bool]:
+        """Unregister a socket; returns its record and whether it was the user's last.
+
+        When it was the last one the user's subscriptions are dropped as well.
+        """
+        handle = self._handles.pop(websocket, None)
+        if handle is None:
+            return None, False
+
+        connection = self.connections[handle]
+        self.connections[handle] = None
+        self._free_handles.append(handle)
+
+        user = self.users[connection.user_id]
+        # A handful of handles per user: a linear remove is fine
+        user.handles.remove(handle)
+        for channel_id in user.channels:
+            self._discard_handle(channel_id, handle)
+        if user.handles:
+            return connection, False
+
+        del self.users[connection.user_id]
+        return connection, True
+
+    def get(self, websocket: WebSocket) -> Optional[Connection]:
+        handle = self._handles.get(websocket)
+        return None if handle is None else self.connections[handle]
+
+    def user_connections(self, user_id: int) -> List[Connection]:
+        """Open sockets of a user (a snapshot, safe to await while iterating)"""
+        user = self.users.get(user_id)
+        if user is None:
+            return []
+        connections = self.connections
+        return [connections[handle] for handle in user.handles]
+
+    def user_channel_ids(self, user_id: int) -> array:
+        user = self.users.get(user_id)
+        return user.channels if user is not None else array("i")
+
+    def is_subscribed(self, user_id: int, channel_id: int) -> bool:
+        user = self.users.get(user_id)
+        if user is None:
+            return False
+        position = bisect_left(user.channels, channel_id)
+        return position < len(user.channels) and user.channels[position] == channel_id
+
+    def channel_connections(self, channel_id: int) -> List[Connection]:
+        """Every open socket subscribed to a channel (a snapshot, safe to await while iterating)"""
+        handles = self.channels.get(channel_id)
+        if not handles:
+            return []
+        connections = self.connections
+        return [connections[handle] for handle in handles]
+
+    def subscribe(self, user_id: int, channel_id: int) -> bool:
+        """Subscribe a connected user to a channel; False if not connected or already subscribed"""
+        user = self.users.get(user_id)
+        if user is None or not _insert_sorted(user.channels, channel_id):
+            return False
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = array("i")
+        for handle in user.handles:
+            _insert_sorted(channel, handle)
+        return True
+
+    def subscribe_many(self, user_id: int, channel_ids: Iterable[int]) -> int:
+        """Bulk subscribe on connect; returns how many subscriptions were added"""
+        user = self.users.get(user_id)
+        if user is None:
+            return 0
+        new_ids = set(channel_ids).difference(user.channels)
+        if not new_ids:
+            return 0
+        user.channels = array("i", sorted(new_ids.union(user.channels)))
+        for channel_id in new_ids:
+            channel = self.channels.get(channel_id)
+            if channel is None:
+                channel = self.channels[channel_id] = array("i")
+            for handle in user.handles:
+                _insert_sorted(channel, handle)
+        return len(new_ids)
+
+    def unsubscribe(self, user_id: int, channel_id: int) -> bool:
+        user = self.users.get(user_id)
+        if user is None or not _remove_sorted(user.channels, channel_id):
+            return False
+        for handle in user.handles:
+            self._discard_handle(channel_id, handle)
+        return True
+
+    def _discard_handle(self, channel_id: int, handle: int):
+        channel = self.channels.get(channel_id)
+        if channel is not None:
+            _remove_sorted(channel, handle)
+            if not channel:
+                del self.channels[channel_id]
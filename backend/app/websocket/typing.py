@@ -0,0 +1,98 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TypingAggregator:
+    """Coalesces typing events into one "users typing" frame per channel.
+
+    Each channel keeps a small `user_id -> expires_at` map. Keystroke events only
+    refresh that map; a background flusher emits the channel's current typer set
+    at most once per `flush_interval` and only when the set actually changed, so
+    the frame rate no longer scales with keystrokes. Typers that stop sending
+    events drop out on their own once `ttl` passes.
+    """
+
+    def __init__(
+        self,
+        broadcast: Callable[[str, int], Awaitable[None]],
+        flush_interval: float = 0.5,
+        ttl: float = 6.0,
+    ):
+        self.broadcast = broadcast
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        # channel_id -> {user_id: expires_at}
+        self.typing: Dict[int, Dict[int, float]] = {}
+        # channel_id -> typer list in the last emitted frame
+        self.last_sent: Dict[int, List[int]] = {}
+        self.dirty: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, channel_id: int, user_id: int, typing: bool):
+        """Record a typing start/refresh or stop event"""
+        channel_typing = self.typing.setdefault(channel_id, {})
+        if typing:
+            channel_typing[user_id] = time.monotonic() + self.ttl
+        else:
+            channel_typing.pop(user_id, None)
+        self.dirty.add(channel_id)
+        self._ensure_running()
+
+    def discard(self, channel_id: int, user_id: int):
+        """Drop a user from one channel's typers (e.g. when they stop following it)"""
+        if self.typing.get(channel_id, {}).pop(user_id, None) is not None:
+            self.dirty.add(channel_id)
+
+    def remove_user(self, user_id: int):
+        """Drop a user from every channel (e.g. when their last socket closes)"""
+        for channel_id, channel_typing in self.typing.items():
+            if channel_typing.pop(user_id, None) is not None:
+                self.dirty.add(channel_id)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self.typing:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing typing indicators: {e}")
+
+    async def flush(self):
+        """Expire stale typers and emit one frame per channel whose typer set changed"""
+        now = time.monotonic()
+        for channel_id, channel_typing in list(self.typing.items()):
+            expired = [user_id for user_id, expires_at in channel_typing.items() if expires_at <= now]
+            for user_id in expired:
+                del channel_typing[user_id]
+            if expired:
+                self.dirty.add(channel_id)
+
+        dirty, self.dirty = self.dirty, set()
+        for channel_id in dirty:
+            user_ids = sorted(self.typing.get(channel_id, ()))
+            if not user_ids:
+                self.typing.pop(channel_id, None)
+            if user_ids == self.last_sent.get(channel_id, []):
+                continue
+
+            if user_ids:
+                self.last_sent[channel_id] = user_ids
+            else:
+                self.last_sent.pop(channel_id, None)
+
+            await self.broadcast(json.dumps({
+                "type": "typing",
+                "data": {
+                    "channel_id": channel_id,
+                    "user_ids": user_ids
+                }
+            }), channel_id)
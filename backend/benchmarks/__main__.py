@@ -0,0 +1,117 @@
+"""Seed a workspace, start the API and drive a mixed REST + WebSocket load against it.
+
+Usage (from backend/):
+
+    python -m benchmarks --users 500 --messages 50000 --ws-clients 2000 --output bench.json
+
+Results are written as JSON so runs on different commits can be diffed.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--redis-url", default="memory://", help="redis://... or memory:// for the in-process stand-in")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--teams", type=int, default=4)
+    parser.add_argument("--channels-per-team", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of steady-state load")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent REST clients")
+    parser.add_argument("--ws-clients", type=int, default=1000)
+    parser.add_argument("--ws-connect-concurrency", type=int, default=200)
+    parser.add_argument("--typing-interval", type=float, default=2.0)
+    parser.add_argument("--rate-limit", action="store_true", help="keep the API rate limits enabled")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+async def drive(base_url, workspace, tokens, config, recorder):
+    from benchmarks.workloads import run_rest_workload, run_ws_workload
+
+    start_event = asyncio.Event()
+    ws_task = None
+    ramp_seconds = 0.0
+    if config.ws_clients:
+        ramp_start = time.perf_counter()
+        ws_task = asyncio.create_task(
+            run_ws_workload(base_url, workspace, tokens, config, recorder, start_event)
+        )
+        while len(recorder.samples["ws_join_channels"]) + recorder.errors["ws_connect"] < config.ws_clients:
+            await asyncio.sleep(0.05)
+        ramp_seconds = time.perf_counter() - ramp_start
+
+    start_event.set()
+    started = time.perf_counter()
+    await run_rest_workload(base_url, workspace, tokens, config, recorder)
+    if ws_task:
+        await ws_task
+    return ramp_seconds, time.perf_counter() - started
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(args.database_url, args.redis_url, rate_limit_enabled=args.rate_limit)
+    database_url = env["DATABASE_URL"]
+
+    # Imported after the environment is set: app settings are read at import time
+    from benchmarks.seed import SeedScale, seed
+    from benchmarks.server import running_server
+    from benchmarks.stats import LatencyRecorder
+    from benchmarks.workloads import WorkloadConfig
+    from app.auth import create_access_token
+
+    scale = SeedScale(
+        users=args.users,
+        teams=args.teams,
+        channels_per_team=args.channels_per_team,
+        messages=args.messages,
+    )
+    config = WorkloadConfig(
+        duration=args.duration,
+        concurrency=args.concurrency,
+        ws_clients=args.ws_clients,
+        ws_connect_concurrency=args.ws_connect_concurrency,
+        typing_interval=args.typing_interval,
+    )
+
+    seed_start = time.perf_counter()
+    workspace = seed(database_url, scale, args.seed)
+    seed_seconds = time.perf_counter() - seed_start
+    tokens = {
+        user_id: create_access_token({"sub": username})
+        for user_id, username in workspace.usernames.items()
+    }
+
+    recorder = LatencyRecorder()
+    with running_server(env) as base_url:
+        ramp_seconds, elapsed = asyncio.run(drive(base_url, workspace, tokens, config, recorder))
+
+    report = {
+        "meta": {
+            **run_metadata(),
+            "database": database_url.split(":", 1)[0],
+            "redis": args.redis_url.split(":", 1)[0],
+        },
+        "scale": vars(scale),
+        "workload": {key: value for key, value in vars(config).items()},
+        "timings": {
+            "seed_seconds": round(seed_seconds, 3),
+            "ws_ramp_seconds": round(ramp_seconds, 3),
+            "steady_state_seconds": round(elapsed, 3),
+        },
+        "results": recorder.summary(elapsed),
+        "counters": dict(recorder.counters),
+    }
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Archival of cold history: what moves, what reads cost, and that nothing is lost.
+
+    python -m benchmarks.archive --messages 50000 --days 365 --older-than-days 30
+
+Seeds a workspace whose messages are spread evenly over the last `--days`
+days (with a few old threads that got a reply today, which must stay hot)
+and whose direct messages are as old. It then pages through the busy
+channel's full history, runs a search and reads a thread, runs
+`python -m app.archive`'s job with a separate SQLite archive database, and
+repeats the reads.
+
+Reports rows moved and job time, hot and archive table sizes, latency of the
+first (hot) and last (archived) history pages before and after, and whether
+the history, the search and the thread read back unchanged.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.archive")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=365, help="age of the oldest message")
+    parser.add_argument("--older-than-days", type=int, default=30)
+    parser.add_argument("--live-threads", type=int, default=20, help="old threads replied to today")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+def age_workspace(database_url: str, args, channel_id: int) -> int:
+    """Spread messages over `--days` and reply today to a few old threads; returns an old, quiet thread's root"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import bindparam, create_engine, desc, func, insert, select, update
+    from app.models import Conversation, DirectMessage, Message
+    from benchmarks.explain_queries import seed_threads_and_conversations
+
+    engine = create_engine(database_url)
+    seed_threads_and_conversations(engine, args.users, threads=200)
+    now = datetime.utcnow()
+    oldest = now - timedelta(days=args.days)
+    aged = update(Message.__table__).where(Message.id == bindparam("row_id")).values(created_at=bindparam("aged_at"))
+    with engine.begin() as conn:
+        # Top-level messages and direct messages evenly in id order
+        roots = conn.execute(
+            select(Message.id).where(Message.parent_message_id.is_(None)).order_by(Message.id)
+        ).scalars().all()
+        step = timedelta(days=args.days) / max(len(roots), 1)
+        created = {root_id: oldest + step * index for index, root_id in enumerate(roots)}
+        conn.execute(aged, [{"row_id": root_id, "aged_at": created_at} for root_id, created_at in created.items()])
+
+        direct_ids = conn.execute(select(DirectMessage.id).order_by(DirectMessage.id)).scalars().all()
+        direct_step = timedelta(days=args.days) / max(len(direct_ids), 1)
+        conn.execute(
+            update(DirectMessage.__table__).where(DirectMessage.id == bindparam("row_id"))
+            .values(created_at=bindparam("aged_at")),
+            [{"row_id": row_id, "aged_at": oldest + direct_step * index} for index, row_id in enumerate(direct_ids)]
+        )
+
+        # Seeded replies a minute apart after their root, with the thread summary to match
+        replies = conn.execute(
+            select(Message.id, Message.parent_message_id)
+            .where(Message.parent_message_id.isnot(None)).order_by(Message.id)
+        ).all()
+        threads = {}
+        for reply_id, parent_id in replies:
+            threads.setdefault(parent_id, []).append(reply_id)
+        conn.execute(aged, [
+            {"row_id": reply_id, "aged_at": created[parent_id] + timedelta(minutes=index + 1)}
+            for parent_id, reply_ids in threads.items()
+            for index, reply_id in enumerate(reply_ids)
+        ])
+        conn.execute(
+            update(Message.__table__).where(Message.id == bindparam("row_id"))
+            .values(reply_count=bindparam("replies"), last_reply_at=bindparam("replied_at")),
+            [
+                {
+                    "row_id": parent_id,
+                    "replies": len(reply_ids),
+                    "replied_at": created[parent_id] + timedelta(minutes=len(reply_ids)),
+                }
+                for parent_id, reply_ids in threads.items()
+            ]
+        )
+
+        # A few old threads are still active and must stay hot
+        for parent_id in list(threads)[:args.live_threads]:
+            conn.execute(insert(Message.__table__).values(
+                channel_id=conn.execute(select(Message.channel_id).where(Message.id == parent_id)).scalar(),
+                sender_id=1, parent_message_id=parent_id, content="still going", created_at=now
+            ))
+            conn.execute(
+                update(Message.__table__).where(Message.id == parent_id)
+                .values(reply_count=Message.reply_count + 1, last_reply_at=now)
+            )
+
+        # Each conversation's newest message, which the job must leave in place
+        latest = conn.execute(
+            select(DirectMessage.conversation_id, func.max(DirectMessage.id)).group_by(DirectMessage.conversation_id)
+        ).all()
+        conn.execute(
+            update(Conversation.__table__).where(Conversation.id == bindparam("row_id"))
+            .values(last_message_id=bindparam("latest_id")),
+            [{"row_id": conversation_id, "latest_id": message_id} for conversation_id, message_id in latest]
+        )
+
+        quiet_root = conn.execute(
+            select(Message.id).where(
+                Message.channel_id == channel_id,
+                Message.reply_count > 0,
+                Message.last_reply_at < oldest + timedelta(days=30)
+            ).order_by(desc(Message.id)).limit(1)
+        ).scalar()
+    engine.dispose()
+    return quiet_root
+
+
+def table_counts(database_url: str, tables: list) -> dict:
+    from sqlalchemy import create_engine, func, select
+
+    engine = create_engine(database_url)
+    with engine.connect() as conn:
+        counts = {table.name: conn.execute(select(func.count()).select_from(table)).scalar() for table in tables}
+    engine.dispose()
+    return counts
+
+
+def file_size(database_url: str) -> int:
+    path = database_url.replace("sqlite:///", "", 1)
+    return os.path.getsize(path) if database_url.startswith("sqlite") and os.path.exists(path) else None
+
+
+async def read_everything(client, headers: dict, channel_id: int, thread_id: int, per_page: int) -> dict:
+    """Full history of a channel page by page, a search and a thread"""
+    history = []
+    page_ms = []
+    page = 1
+    while True:
+        started = time.perf_counter()
+        response = await client.get(
+            f"/api/messages/channel/{channel_id}", params={"page": page, "per_page": per_page}, headers=headers
+        )
+        page_ms.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        messages = response.json()
+        if not messages:
+            break
+        history.extend(message["id"] for message in messages)
+        page += 1
+
+    started = time.perf_counter()
+    search = (await client.post(
+        "/api/messages/search", params={"per_page": per_page}, json={"query": "deploy"}, headers=headers
+    )).json()
+    search_ms = (time.perf_counter() - started) * 1000
+    thread = (await client.get(f"/api/messages/{thread_id}/thread", headers=headers)).json()
+    return {
+        "history": history,
+        "first_page_ms": round(page_ms[0], 2),
+        "last_page_ms": round(page_ms[-2] if len(page_ms) > 1 else page_ms[0], 2),
+        "search_total": search["total_count"],
+        "search_page": [message["id"] for message in search["messages"]],
+        "search_ms": round(search_ms, 2),
+        "thread": [reply["id"] for reply in thread.get("replies", [])],
+    }
+
+
+async def read_phase(args, workspace, thread_id: int) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.main import app
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': workspace.usernames[1]})}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        return await read_everything(client, headers, workspace.busy_channel_id, thread_id, args.per_page)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    archive_url = f"sqlite:///{tempfile.mkdtemp(prefix='syncspace-archive-')}/archive.db"
+    env = configure_environment(args.database_url, archive_database_url=archive_url, history_cache_ttl_seconds=0)
+
+    from app.archive import archived_direct_messages, archived_messages, run_archival
+    from app.models import DirectMessage, Message
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(env["DATABASE_URL"], SeedScale(users=args.users, messages=args.messages), args.seed)
+    thread_id = age_workspace(env["DATABASE_URL"], args, workspace.busy_channel_id)
+    hot_tables = [Message.__table__, DirectMessage.__table__]
+
+    before = asyncio.run(read_phase(args, workspace, thread_id))
+    hot_before = table_counts(env["DATABASE_URL"], hot_tables)
+
+    started = time.perf_counter()
+    moved = run_archival(args.older_than_days, args.batch_size)
+    job_seconds = time.perf_counter() - started
+
+    after = asyncio.run(read_phase(args, workspace, thread_id))
+    results = {
+        "moved": moved,
+        "job_seconds": round(job_seconds, 2),
+        "rows_per_second": round(sum(moved.values()) / job_seconds) if job_seconds else None,
+        "hot_rows_before": hot_before,
+        "hot_rows_after": table_counts(env["DATABASE_URL"], hot_tables),
+        "archive_rows": table_counts(archive_url, [archived_messages, archived_direct_messages]),
+        "archive_file_bytes": file_size(archive_url),
+        "reads": {
+            phase: {key: value for key, value in reads.items() if key not in ("history", "search_page", "thread")}
+            for phase, reads in (("before", before), ("after", after))
+        },
+        "history_messages": len(after["history"]),
+        "history_unchanged": before["history"] == after["history"],
+        "history_same_ids": sorted(before["history"]) == sorted(after["history"]),
+        "search_unchanged": (
+            before["search_total"] == after["search_total"] and before["search_page"] == after["search_page"]
+        ),
+        "thread_unchanged": bool(before["thread"]) and before["thread"] == after["thread"],
+    }
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Time-to-interactive of a scripted client: legacy request chain vs /api/bootstrap.
+
+    python -m benchmarks.bootstrap --clients 50 --rtt-ms 40
+
+Seeds a workspace, marks a share of its users online, then loads the app
+shell for `--clients` users in three ways:
+
+- legacy: the calls a client made before /api/bootstrap, awaited in order as
+  a page does: /auth/me, /teams/, /channels/team/{id} per team, /users/
+  pages up to BOOTSTRAP_MEMBER_LIMIT members, /users/online/list and
+  /users/{id}/presence per member
+- bootstrap_cold: one GET /api/bootstrap with the per-user cache empty
+- bootstrap_warm: the same call again with the cache filled
+
+Time-to-interactive is the wall time until the client has everything it
+needs. `--rtt-ms` adds a simulated network round trip to every request, as
+requests here run in-process. Reports TTI, requests and SQL statements per
+client.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bootstrap")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--teams", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--online-share", type=float, default=0.3)
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="simulated round trip added to each request")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+class ScriptedClient:
+    """An authenticated client that counts its requests and pays a round trip on each"""
+
+    def __init__(self, client, token: str, rtt: float):
+        self.client = client
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.rtt = rtt
+        self.requests = 0
+        self.errors = 0
+
+    async def get(self, url: str, required: bool = True, **params):
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        self.requests += 1
+        response = await self.client.get(url, params=params, headers=self.headers)
+        if not required and response.is_error:
+            self.errors += 1
+            return None
+        response.raise_for_status()
+        return response.json()
+
+
+async def load_legacy(session: ScriptedClient, member_limit: int) -> int:
+    """The pre-bootstrap chain; returns the number of members with presence loaded"""
+    await session.get("/api/auth/me")
+    teams = await session.get("/api/teams/")
+    for team in teams:
+        await session.get(f"/api/channels/team/{team['id']}")
+
+    members = []
+    cursor = None
+    while len(members) < member_limit:
+        params = {"limit": min(100, member_limit - len(members))}
+        if cursor:
+            params["cursor"] = cursor
+        page = await session.get("/api/users/", **params)
+        members.extend(page["users"])
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+
+    await session.get("/api/users/online/list")
+    for member in members:
+        # Answers 500 for users never seen online; the old client carried on without them
+        await session.get(f"/api/users/{member['id']}/presence", required=False)
+    return len(members)
+
+
+async def load_bootstrap(session: ScriptedClient) -> int:
+    payload = await session.get("/api/bootstrap")
+    return len(payload["members"])
+
+
+async def run_mode(client, args, tokens, user_ids, mode: str, counter) -> dict:
+    from app.config import get_settings
+    from app.redis_client import cache_manager
+    from benchmarks.stats import LatencyRecorder
+
+    if mode == "bootstrap_cold":
+        await cache_manager.invalidate_bootstrap(*user_ids)
+    recorder = LatencyRecorder()
+    started = time.perf_counter()
+    for user_id in user_ids:
+        session = ScriptedClient(client, tokens[user_id], args.rtt_ms / 1000)
+        statements_before = counter.count
+        load_started = time.perf_counter()
+        if mode == "legacy":
+            members = await load_legacy(session, get_settings().bootstrap_member_limit)
+        else:
+            members = await load_bootstrap(session)
+        recorder.record("tti", time.perf_counter() - load_started)
+        recorder.count("requests", session.requests)
+        recorder.count("sql_statements", counter.count - statements_before)
+        recorder.count("members", members)
+        recorder.count("failed_requests", session.errors)
+
+    summary = recorder.summary(time.perf_counter() - started)
+    clients = len(user_ids)
+    summary["requests_per_client"] = round(recorder.counters["requests"] / clients, 1)
+    summary["sql_per_client"] = round(recorder.counters["sql_statements"] / clients, 1)
+    summary["members_per_client"] = round(recorder.counters["members"] / clients, 1)
+    summary["failed_requests"] = recorder.counters["failed_requests"]
+    return summary
+
+
+async def run(args, workspace) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.database import engine
+    from app.main import app
+    from app.redis_client import presence_manager
+    from benchmarks.reconnect_storm import StatementCounter
+
+    rng = random.Random(args.seed)
+    user_ids = sorted(workspace.usernames)
+    for user_id in rng.sample(user_ids, int(len(user_ids) * args.online_share)):
+        await presence_manager.set_user_online(user_id, f"bench-{user_id}")
+
+    clients = rng.sample(user_ids, min(args.clients, len(user_ids)))
+    tokens = {user_id: create_access_token({"sub": workspace.usernames[user_id]}) for user_id in clients}
+    counter = StatementCounter(engine)
+    # Failed presence lookups come back as 500s rather than raising
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        return {
+            mode: await run_mode(client, args, tokens, clients, mode, counter)
+            for mode in ("legacy", "bootstrap_cold", "bootstrap_warm")
+        }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(args.database_url)
+
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(
+        env["DATABASE_URL"], SeedScale(users=args.users, teams=args.teams, messages=args.messages), args.seed
+    )
+    results = asyncio.run(run(args, workspace))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
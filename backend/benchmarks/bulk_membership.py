@@ -0,0 +1,160 @@
+"""Provisioning an org: one request per member vs the bulk membership endpoints.
+
+    python -m benchmarks.bulk_membership --users 3000
+
+Seeds `--users` users, has user 1 create two empty teams, each with a private
+channel, and connects `--connected-share` of the users with in-process
+sockets whose bootstrap payloads are cached. Every user is then added to the
+first team and its channel one request at a time (POST
+/api/teams/{id}/members/{user_id}, POST /api/channels/{id}/members/{user_id})
+and to the second pair with POST /api/teams/{id}/members and POST
+/api/channels/{id}/members, `--chunk` user ids per request. Reports wall
+time, requests and SQL statements of both.
+
+Checks that both ways end with the same members, that connected users are
+subscribed to the new channel and their bootstrap caches were dropped, that
+added users are found by the mention directory, that unknown ids come back
+rejected and that repeating a bulk request adds nothing.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+UNKNOWN_USER_ID = 10 ** 9
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bulk_membership")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--chunk", type=int, default=5000, help="user ids per bulk request")
+    parser.add_argument("--connected-share", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+async def create_team_with_channel(client, headers: dict, name: str) -> tuple:
+    team = (await client.post("/api/teams/", json={"name": name}, headers=headers)).json()
+    channel = (await client.post(
+        "/api/channels/", json={"name": f"{name}-private", "is_private": True, "team_id": team["id"]}, headers=headers
+    )).json()
+    return team["id"], channel["id"]
+
+
+async def timed(counter, phase):
+    statements_before = counter.count
+    started = time.perf_counter()
+    requests = await phase()
+    seconds = time.perf_counter() - started
+    return {
+        "seconds": round(seconds, 2),
+        "requests": requests,
+        "sql_statements": counter.count - statements_before,
+    }
+
+
+async def run(args, workspace) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.database import engine
+    from app.main import app
+    from app.redis_client import cache_manager
+    from app.websocket.connection_manager import manager
+    from benchmarks.fakes import FakeWebSocket
+    from benchmarks.reconnect_storm import StatementCounter
+
+    rng = random.Random(args.seed)
+    user_ids = sorted(workspace.usernames)
+    # User 1 creates the teams and is already a member of both
+    targets = user_ids[1:]
+    connected = rng.sample(targets, int(len(targets) * args.connected_share))
+    for user_id in connected:
+        manager.registry.add(FakeWebSocket(), user_id)
+        await cache_manager.cache_bootstrap(user_id, "{}", 3600)
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': workspace.usernames[1]})}"}
+    counter = StatementCounter(engine)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        single_team, single_channel = await create_team_with_channel(client, headers, "one-by-one")
+        bulk_team, bulk_channel = await create_team_with_channel(client, headers, "bulk")
+
+        async def one_by_one():
+            for user_id in targets:
+                (await client.post(f"/api/teams/{single_team}/members/{user_id}", headers=headers)).raise_for_status()
+                (await client.post(
+                    f"/api/channels/{single_channel}/members/{user_id}", headers=headers
+                )).raise_for_status()
+            return 2 * len(targets)
+
+        reports = {"team": [], "channel": []}
+
+        async def bulk():
+            chunks = [targets[start:start + args.chunk] for start in range(0, len(targets), args.chunk)]
+            for chunk in chunks:
+                response = await client.post(
+                    f"/api/teams/{bulk_team}/members", json={"user_ids": chunk + [UNKNOWN_USER_ID]}, headers=headers
+                )
+                response.raise_for_status()
+                reports["team"].append(response.json())
+                response = await client.post(
+                    f"/api/channels/{bulk_channel}/members", json={"user_ids": chunk}, headers=headers
+                )
+                response.raise_for_status()
+                reports["channel"].append(response.json())
+            return 2 * len(chunks)
+
+        results = {"one_by_one": await timed(counter, one_by_one)}
+        # The single-user routes already dropped these; refill them for the bulk path to clear
+        for user_id in connected:
+            await cache_manager.cache_bootstrap(user_id, "{}", 3600)
+        results["bulk"] = await timed(counter, bulk)
+
+        repeat = (await client.post(
+            f"/api/channels/{bulk_channel}/members", json={"user_ids": targets[:100]}, headers=headers
+        )).json()
+        members = {}
+        for channel_id in (single_channel, bulk_channel):
+            response = await client.get(f"/api/channels/{channel_id}/members", headers=headers)
+            members[channel_id] = sorted(user["id"] for user in response.json())
+        directory = (await client.get(
+            "/api/users/", params={"q": workspace.usernames[targets[-1]]}, headers=headers
+        )).json()
+        bootstraps_left = [user_id for user_id in connected if await cache_manager.get_cached_bootstrap(user_id)]
+
+    for key in ("seconds", "requests", "sql_statements"):
+        if results["bulk"][key]:
+            results[f"{key}_ratio"] = round(results["one_by_one"][key] / results["bulk"][key], 1)
+    results["checks"] = {
+        "same_members": members[single_channel] == members[bulk_channel] == user_ids,
+        "team_added": sum(len(report["added"]) for report in reports["team"]) == len(targets),
+        "channel_added": sum(len(report["added"]) for report in reports["channel"]) == len(targets),
+        "unknown_rejected": all(report["rejected"] == [UNKNOWN_USER_ID] for report in reports["team"]),
+        "subscribed": all(manager.registry.is_subscribed(user_id, bulk_channel) for user_id in connected),
+        "bootstrap_invalidated": not bootstraps_left,
+        "directory_search": any(user["id"] == targets[-1] for user in directory["users"]),
+        "repeat_adds_nothing": repeat["added"] == [] and len(repeat["already_members"]) == len(targets[:100]),
+    }
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(args.database_url)
+
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(
+        env["DATABASE_URL"], SeedScale(users=args.users, teams=1, channels_per_team=1, messages=0), args.seed
+    )
+    results = asyncio.run(run(args, workspace))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
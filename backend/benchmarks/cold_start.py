@@ -0,0 +1,152 @@
+"""Cold-start time budget: import, first ready, first request, first WebSocket.
+
+    python -m benchmarks.cold_start --runs 5 --budget-ready-ms 3000
+
+Applies the migrations to a fresh database with `alembic upgrade head` (the
+app no longer creates tables itself), then measures over `--runs` fresh
+processes:
+
+- import: `import app.main` in a new interpreter, and that interpreter's
+  total wall time
+- ready: `python -m app.main` (uvicorn) launched until /health answers
+- first_request: an authenticated GET /api/users/me on the fresh server
+- first_ws: WebSocket handshake on the fresh server until the first pong
+
+Each server phase runs with STARTUP_WARM_UP off and on. Medians and maxima
+are reported; the process exits non-zero when a median of the default
+(warm-up off) mode is over its `--budget-*` limit.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+from benchmarks.server import BACKEND_DIR, running_server
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app.main; "
+    "print((time.perf_counter() - started) * 1000)"
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.cold_start")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-import-ms", type=float, default=2000.0)
+    parser.add_argument("--budget-ready-ms", type=float, default=3000.0)
+    parser.add_argument("--budget-first-request-ms", type=float, default=250.0)
+    parser.add_argument("--budget-first-ws-ms", type=float, default=250.0)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+def summarize(samples: list) -> dict:
+    return {"median_ms": round(statistics.median(samples), 1), "max_ms": round(max(samples), 1)}
+
+
+def prepare_database(env: dict) -> str:
+    """Migrate the database and add the user the requests run as; returns its token"""
+    from sqlalchemy import create_engine, insert
+    from app.auth import create_access_token
+    from app.models import User
+
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True
+    )
+    engine = create_engine(env["DATABASE_URL"])
+    with engine.begin() as conn:
+        conn.execute(insert(User).values(
+            username="coldstart", email="coldstart@example.com", hashed_password="", is_active=True
+        ))
+    engine.dispose()
+    return create_access_token({"sub": "coldstart"})
+
+
+def measure_import(env: dict) -> tuple:
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1]), (time.perf_counter() - started) * 1000
+
+
+async def first_contact(base_url: str, token: str) -> tuple:
+    import httpx
+    import websockets
+
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        started = time.perf_counter()
+        response = await client.get("/api/users/me", headers={"Authorization": f"Bearer {token}"})
+        response.raise_for_status()
+        first_request = (time.perf_counter() - started) * 1000
+
+    ws_url = base_url.replace("http://", "ws://") + f"/ws?token={token}"
+    started = time.perf_counter()
+    async with websockets.connect(ws_url) as websocket:
+        await websocket.send(json.dumps({"type": "ping"}))
+        while json.loads(await websocket.recv()).get("type") != "pong":
+            pass
+        first_ws = (time.perf_counter() - started) * 1000
+    return first_request, first_ws
+
+
+def measure_server(env: dict, token: str, runs: int) -> dict:
+    samples = {"ready": [], "first_request": [], "first_ws": []}
+    for _ in range(runs):
+        started = time.perf_counter()
+        with running_server(env, poll_interval=0.005) as base_url:
+            samples["ready"].append((time.perf_counter() - started) * 1000)
+            first_request, first_ws = asyncio.run(first_contact(base_url, token))
+            samples["first_request"].append(first_request)
+            samples["first_ws"].append(first_ws)
+    return {phase: summarize(values) for phase, values in samples.items()}
+
+
+def check_budgets(results: dict, args) -> list:
+    budgets = {
+        ("import", "import_ms"): args.budget_import_ms,
+        ("lazy", "ready"): args.budget_ready_ms,
+        ("lazy", "first_request"): args.budget_first_request_ms,
+        ("lazy", "first_ws"): args.budget_first_ws_ms,
+    }
+    failures = []
+    for (section, phase), budget in budgets.items():
+        median = results[section][phase]["median_ms"]
+        if median > budget:
+            failures.append(f"{phase}: median {median} ms over the {budget} ms budget")
+    return failures
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(args.database_url)
+    token = prepare_database(env)
+
+    import_samples = [measure_import(env) for _ in range(args.runs)]
+    results = {
+        "import": {
+            "import_ms": summarize([in_process for in_process, _ in import_samples]),
+            "process_ms": summarize([process for _, process in import_samples]),
+        },
+        "lazy": measure_server({**env, "STARTUP_WARM_UP": "false"}, token, args.runs),
+        "warm_up": measure_server({**env, "STARTUP_WARM_UP": "true"}, token, args.runs),
+    }
+    failures = check_budgets(results, args)
+    write_report(
+        {"meta": run_metadata(), "params": vars(args), "results": results, "over_budget": failures},
+        args.output
+    )
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
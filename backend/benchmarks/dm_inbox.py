@@ -0,0 +1,236 @@
+"""Inbox and DM history latency for a user with many direct message partners.
+
+    python -m benchmarks.dm_inbox --partners 2000 --messages-per-partner 5
+
+Seeds one user who has a conversation with every partner, then compares the
+queries a client needed before the conversations table (an OR over
+sender/receiver grouped by partner) with the conversation-keyed queries, and
+times the inbox and history endpoints in-process through the ASGI app.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.dm_inbox")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--partners", type=int, default=2000)
+    parser.add_argument("--messages-per-partner", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+def seed_inbox(database_url: str, partners: int, messages_per_partner: int, seed_value: int) -> int:
+    """Create the schema and give user 1 a conversation with every partner; returns the message count"""
+    from sqlalchemy import create_engine, insert
+    from app.auth import get_password_hash
+    from app.models import Base, User, DirectMessage, Conversation, ConversationParticipant
+    from benchmarks.seed import BENCH_PASSWORD, random_sentence
+
+    rng = random.Random(seed_value)
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+
+    users = [
+        {
+            "id": user_id,
+            "username": f"bench_user_{user_id}",
+            "email": f"bench_user_{user_id}@example.com",
+            "hashed_password": hashed_password,
+            "full_name": f"Bench User {user_id}",
+            "is_active": True,
+        }
+        for user_id in range(1, partners + 2)
+    ]
+
+    # Interleave partners so every conversation's messages are spread over the table
+    messages = []
+    last_message = {}
+    for _ in range(messages_per_partner):
+        for partner_id in rng.sample(range(2, partners + 2), partners):
+            message_id = len(messages) + 1
+            sender_id, receiver_id = (1, partner_id) if rng.random() < 0.5 else (partner_id, 1)
+            messages.append({
+                "id": message_id,
+                "content": random_sentence(rng),
+                "conversation_id": partner_id - 1,
+                "sender_id": sender_id,
+                "receiver_id": receiver_id,
+                "is_read": True,
+            })
+            last_message[partner_id] = message_id
+
+    conversations = [
+        {"id": partner_id - 1, "user_low_id": 1, "user_high_id": partner_id, "last_message_id": last_message[partner_id]}
+        for partner_id in range(2, partners + 2)
+    ]
+    participants = [
+        {
+            "conversation_id": partner_id - 1,
+            "user_id": user_id,
+            "last_message_id": last_message[partner_id],
+            "last_read_message_id": last_message[partner_id],
+            "unread_count": 0,
+        }
+        for partner_id in range(2, partners + 2)
+        for user_id in (1, partner_id)
+    ]
+
+    with engine.begin() as conn:
+        for table, rows in (
+            (User.__table__, users),
+            (Conversation.__table__, conversations),
+            (DirectMessage.__table__, messages),
+            (ConversationParticipant.__table__, participants),
+        ):
+            for start in range(0, len(rows), 5000):
+                conn.execute(insert(table), rows[start:start + 5000])
+    engine.dispose()
+    return len(messages)
+
+
+def legacy_inbox(db, user_id: int, limit: int):
+    """Partner list as it had to be derived before conversations existed"""
+    from sqlalchemy import case, desc, func, or_
+    from app.models import DirectMessage
+
+    partner = case(
+        (DirectMessage.sender_id == user_id, DirectMessage.receiver_id),
+        else_=DirectMessage.sender_id
+    ).label("partner_id")
+    return db.query(partner, func.max(DirectMessage.id).label("last_message_id")).filter(
+        or_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == user_id)
+    ).group_by(partner).order_by(desc("last_message_id")).limit(limit).all()
+
+
+def legacy_history(db, user_id: int, other_user_id: int, limit: int):
+    """DM history with the OR of two sender/receiver pairs"""
+    from sqlalchemy import and_, desc, or_
+    from app.models import DirectMessage
+
+    return db.query(DirectMessage).filter(
+        or_(
+            and_(DirectMessage.sender_id == user_id, DirectMessage.receiver_id == other_user_id),
+            and_(DirectMessage.sender_id == other_user_id, DirectMessage.receiver_id == user_id)
+        )
+    ).order_by(desc(DirectMessage.created_at)).limit(limit).all()
+
+
+def conversation_inbox(db, user_id: int, limit: int):
+    """The participant-index scan behind the inbox endpoint"""
+    from sqlalchemy import desc
+    from app.models import ConversationParticipant
+
+    return db.query(ConversationParticipant).filter(
+        ConversationParticipant.user_id == user_id,
+        ConversationParticipant.last_message_id.isnot(None)
+    ).order_by(desc(ConversationParticipant.last_message_id)).limit(limit).all()
+
+
+def conversation_history(db, user_id: int, other_user_id: int, limit: int):
+    """The conversation range scan behind the history endpoint"""
+    from sqlalchemy import desc
+    from app.api.messages import _get_conversation_id
+    from app.models import DirectMessage
+
+    conversation_id = _get_conversation_id(db, user_id, other_user_id)
+    return db.query(DirectMessage).filter(
+        DirectMessage.conversation_id == conversation_id
+    ).order_by(desc(DirectMessage.id)).limit(limit).all()
+
+
+def time_call(recorder, operation: str, repeat: int, func):
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        recorder.record(operation, time.perf_counter() - start)
+
+
+async def time_request(recorder, operation: str, repeat: int, client, url: str, headers: dict):
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        if response.status_code == 200:
+            recorder.record(operation, time.perf_counter() - start)
+        else:
+            recorder.error(operation)
+
+
+async def run(args) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.database import SessionLocal
+    from app.main import app
+    from benchmarks.stats import LatencyRecorder
+
+    recorder = LatencyRecorder()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench_user_1'})}"}
+    partner_id = args.partners + 1
+
+    db = SessionLocal()
+    try:
+        time_call(recorder, "legacy_inbox_query", args.repeat, lambda: legacy_inbox(db, 1, args.page_size))
+        time_call(recorder, "legacy_history_query", args.repeat, lambda: legacy_history(db, 1, partner_id, args.page_size))
+        time_call(recorder, "inbox_query", args.repeat, lambda: conversation_inbox(db, 1, args.page_size))
+        time_call(recorder, "history_query", args.repeat, lambda: conversation_history(db, 1, partner_id, args.page_size))
+    finally:
+        db.close()
+
+    started = time.perf_counter()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await time_request(
+            recorder, "inbox_first_page", args.repeat, client,
+            f"/api/messages/conversations?limit={args.page_size}", headers
+        )
+        await time_request(
+            recorder, "history_page", args.repeat, client,
+            f"/api/messages/direct/{partner_id}?per_page={args.page_size}", headers
+        )
+
+        # Walk the whole inbox once
+        conversations = 0
+        before_id = None
+        walk_start = time.perf_counter()
+        while True:
+            params = {"limit": 100}
+            if before_id:
+                params["before_id"] = before_id
+            page = (await client.get("/api/messages/conversations", params=params, headers=headers)).json()
+            conversations += len(page["conversations"])
+            before_id = page["next_before_id"]
+            if not before_id:
+                break
+        recorder.record("inbox_full_walk", time.perf_counter() - walk_start)
+
+    return {
+        "conversations_listed": conversations,
+        "latency": recorder.summary(time.perf_counter() - started),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(args.database_url)
+    seed_start = time.perf_counter()
+    messages = seed_inbox(env["DATABASE_URL"], args.partners, args.messages_per_partner, args.seed)
+    seed_seconds = time.perf_counter() - seed_start
+
+    results = asyncio.run(run(args))
+    results["messages"] = messages
+    results["seed_seconds"] = round(seed_seconds, 3)
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Environment for benchmark runs; must be applied before any `app` module is imported"""
+from typing import Dict, Optional
+import os
+import secrets
+import tempfile
+
+
+def configure_environment(database_url: Optional[str] = None, redis_url: str = "memory://", **overrides) -> Dict[str, str]:
+    """Point the app settings at benchmark-local backing services and return the variables set"""
+    if database_url is None:
+        database_url = f"sqlite:///{tempfile.mkdtemp(prefix='syncspace-bench-')}/bench.db"
+    env = {
+        "DATABASE_URL": database_url,
+        "TEST_DATABASE_URL": database_url,
+        "REDIS_URL": redis_url,
+        "SECRET_KEY": secrets.token_hex(32),
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "600",
+        "SQL_ECHO": "false",
+        # Load comes from one IP and a handful of users; opt back in per run
+        "RATE_LIMIT_ENABLED": "false",
+    }
+    env.update({key.upper(): str(value) for key, value in overrides.items()})
+    os.environ.update(env)
+    return env
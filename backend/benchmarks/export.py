@@ -0,0 +1,224 @@
+"""Streaming channel export: throughput and server memory at any channel size.
+
+    python -m benchmarks.export --messages 10000000
+
+Fills one channel with `--messages` messages spread over `--days` days (every
+`--thread-every`th one a reply), starts the app under uvicorn and streams
+GET /api/messages/channel/{id}/export over HTTP, plain and gzip. Reports
+seconds, messages and bytes per second, and the server's resident memory
+(Linux /proc; VmRSS sampled while streaming and the VmHWM peak) against its
+baseline after a warm-up request.
+
+Also checks that every export is in strictly increasing id order with the
+expected number of lines: the full history, one cut off part way and
+resumed with after_id, a date window, top-level only and a single thread.
+"""
+from datetime import datetime, timedelta
+import argparse
+import math
+import random
+import time
+import zlib
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+from benchmarks.server import running_server_process
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.export")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=1000000, help="messages in the exported channel")
+    parser.add_argument("--days", type=int, default=365, help="age of the oldest message")
+    parser.add_argument("--thread-every", type=int, default=20, help="every Nth message is a reply")
+    parser.add_argument("--batch-size", type=int, default=1000, help="EXPORT_BATCH_SIZE")
+    parser.add_argument("--insert-batch", type=int, default=10000)
+    parser.add_argument("--interrupt-at", type=float, default=0.4, help="fraction read before disconnecting")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+def fill_channel(database_url: str, channel_id: int, args) -> dict:
+    """Bulk insert the channel's history with explicit ids; returns what the checks expect"""
+    from sqlalchemy import bindparam, create_engine, func, insert, select, update
+    from app.models import Message
+    from benchmarks.seed import random_sentence
+
+    rng = random.Random(args.seed)
+    sentences = [random_sentence(rng, rng.randint(4, 20)) for _ in range(1000)]
+    engine = create_engine(database_url)
+    oldest = datetime.utcnow() - timedelta(days=args.days)
+    step = timedelta(days=args.days) / max(args.messages, 1)
+    reply_counts = {}
+    roots = 0
+    with engine.begin() as conn:
+        next_id = (conn.execute(select(func.max(Message.id))).scalar() or 0) + 1
+        root_id = None
+        rows = []
+        for index in range(args.messages):
+            message_id = next_id + index
+            is_reply = root_id is not None and index % args.thread_every == 0
+            rows.append({
+                "id": message_id,
+                "content": sentences[index % len(sentences)],
+                "message_type": "text",
+                "channel_id": channel_id,
+                "sender_id": rng.randint(1, args.users),
+                "parent_message_id": root_id if is_reply else None,
+                "created_at": oldest + step * index,
+            })
+            if is_reply:
+                reply_counts[root_id] = reply_counts.get(root_id, 0) + 1
+            else:
+                roots += 1
+                # Replies go to a root a few hundred messages back, so threads interleave
+                if root_id is None or rng.random() < 0.01:
+                    root_id = message_id
+            if len(rows) >= args.insert_batch:
+                conn.execute(insert(Message.__table__), rows)
+                rows = []
+        if rows:
+            conn.execute(insert(Message.__table__), rows)
+        if reply_counts:
+            conn.execute(
+                update(Message.__table__).where(Message.id == bindparam("row_id"))
+                .values(reply_count=bindparam("replies")),
+                [{"row_id": row_id, "replies": replies} for row_id, replies in reply_counts.items()]
+            )
+    engine.dispose()
+
+    thread_id, thread_replies = max(reply_counts.items(), key=lambda item: item[1], default=(None, 0))
+    window = (oldest + timedelta(days=args.days / 3), oldest + timedelta(days=2 * args.days / 3))
+    in_window = sum(1 for index in range(args.messages) if window[0] <= oldest + step * index < window[1])
+    return {
+        "total": args.messages,
+        "roots": roots,
+        "thread_id": thread_id,
+        "thread_messages": thread_replies + 1,
+        "window": window,
+        "window_messages": in_window,
+    }
+
+
+def memory_kb(pid: int) -> dict:
+    """VmRSS and VmHWM of a process in kB, from /proc (empty elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            fields = dict(line.split(":", 1) for line in status if ":" in line)
+    except OSError:
+        return {}
+    return {key: int(fields[key].split()[0]) for key in ("VmRSS", "VmHWM") if key in fields}
+
+
+def stream_export(client, channel_id: int, params: dict, pid: int, stop_after: int = 0) -> dict:
+    """Read one export, checking id order; disconnects after `stop_after` lines when set"""
+    import orjson
+
+    gzip = params.get("gzip", False)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzip else None
+    rss_peak_kb = 0
+    lines = 0
+    wire_bytes = 0
+    first_id = last_id = None
+    in_order = True
+    pending = b""
+    started = time.perf_counter()
+    with client.stream("GET", f"/api/messages/channel/{channel_id}/export", params=params) as response:
+        response.raise_for_status()
+        for chunk in response.iter_raw():
+            wire_bytes += len(chunk)
+            if decompressor:
+                chunk = decompressor.decompress(chunk)
+            pending += chunk
+            *complete, pending = pending.split(b"\n")
+            for line in complete:
+                message_id = orjson.loads(line)["id"]
+                in_order = in_order and (last_id is None or message_id > last_id)
+                first_id = message_id if first_id is None else first_id
+                last_id = message_id
+                lines += 1
+                if lines % 20000 == 0:
+                    rss_peak_kb = max(rss_peak_kb, memory_kb(pid).get("VmRSS", 0))
+            if stop_after and lines >= stop_after:
+                break
+    seconds = time.perf_counter() - started
+    rss_peak_kb = max(rss_peak_kb, memory_kb(pid).get("VmRSS", 0))
+    return {
+        "lines": lines,
+        "first_id": first_id,
+        "last_id": last_id,
+        "in_order": in_order and not pending,
+        "seconds": round(seconds, 2),
+        "messages_per_second": round(lines / seconds) if seconds else None,
+        "wire_mb": round(wire_bytes / 1e6, 1),
+        "wire_mb_per_second": round(wire_bytes / 1e6 / seconds, 1) if seconds else None,
+        "server_rss_mb_while_streaming": round(rss_peak_kb / 1024, 1) if rss_peak_kb else None,
+    }
+
+
+def run_exports(base_url: str, pid: int, token: str, channel_id: int, expected: dict, args) -> dict:
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    with httpx.Client(base_url=base_url, headers=headers, timeout=None) as client:
+        # Warm-up: imports, pools and the first batch are not what is measured
+        stream_export(client, channel_id, {"thread_id": expected["thread_id"]}, pid)
+        baseline = memory_kb(pid)
+
+        plain = stream_export(client, channel_id, {}, pid)
+        gzipped = stream_export(client, channel_id, {"gzip": True}, pid)
+
+        cut_after = max(1, int(expected["total"] * args.interrupt_at))
+        cut = stream_export(client, channel_id, {}, pid, stop_after=cut_after)
+        resumed = stream_export(client, channel_id, {"after_id": cut["last_id"]}, pid)
+
+        since, until = expected["window"]
+        window = stream_export(client, channel_id, {"since": since.isoformat(), "until": until.isoformat()}, pid)
+        top_level = stream_export(client, channel_id, {"include_replies": False}, pid)
+        thread = stream_export(client, channel_id, {"thread_id": expected["thread_id"]}, pid)
+        peak = memory_kb(pid)
+
+    return {
+        "exports": {"plain": plain, "gzip": gzipped},
+        "gzip_ratio": round(plain["wire_mb"] / gzipped["wire_mb"], 1) if gzipped["wire_mb"] else None,
+        "server_rss_baseline_mb": round(baseline["VmRSS"] / 1024, 1) if baseline else None,
+        "server_rss_peak_mb": round(peak["VmHWM"] / 1024, 1) if peak else None,
+        "server_rss_growth_mb": round((peak["VmHWM"] - baseline["VmRSS"]) / 1024, 1) if peak else None,
+        "paged_requests_replaced": math.ceil(expected["roots"] / 100),
+        "checks": {
+            "full": plain["in_order"] and plain["lines"] == expected["total"],
+            "gzip": gzipped["in_order"] and gzipped["lines"] == expected["total"],
+            "resumed": (
+                cut["in_order"] and resumed["in_order"] and resumed["first_id"] > cut["last_id"]
+                and cut["lines"] + resumed["lines"] == expected["total"]
+            ),
+            "date_window": window["in_order"] and window["lines"] == expected["window_messages"],
+            "top_level": top_level["in_order"] and top_level["lines"] == expected["roots"],
+            "thread": thread["in_order"] and thread["lines"] == expected["thread_messages"],
+        },
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(args.database_url, export_batch_size=args.batch_size)
+
+    from app.auth import create_access_token
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(env["DATABASE_URL"], SeedScale(users=args.users, messages=0), args.seed)
+    started = time.perf_counter()
+    expected = fill_channel(env["DATABASE_URL"], workspace.busy_channel_id, args)
+    fill_seconds = time.perf_counter() - started
+
+    token = create_access_token({"sub": workspace.usernames[1]})
+    with running_server_process(env) as (base_url, process):
+        results = run_exports(base_url, process.pid, token, workspace.busy_channel_id, expected, args)
+    results["fill_seconds"] = round(fill_seconds, 1)
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""In-process stand-ins for sockets, for benchmarks that drive ConnectionManager directly"""
+import itertools
+
+_ids = itertools.count(1)
+
+
+class FakeWebSocket:
+    """Counts frames and bytes instead of writing to a network socket"""
+
+    def __init__(self):
+        self.id = next(_ids)
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        self.frames_sent += 1
+        self.bytes_sent += len(data)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.closed_with = code
+
+    def __hash__(self):
+        return self.id
+
+    def __eq__(self, other):
+        return self is other
+
+
+class RecordingWebSocket(FakeWebSocket):
+    """Keeps every frame sent, for benchmarks that replay captured traffic"""
+
+    def __init__(self):
+        super().__init__()
+        self.frames = []
+
+    async def send_text(self, data: str):
+        await super().send_text(data)
+        self.frames.append(data)
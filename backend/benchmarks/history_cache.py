@@ -0,0 +1,131 @@
+"""Channel history reads with and without the versioned cache.
+
+    python -m benchmarks.history_cache --readers 200 --reads 20 --write-every 500
+
+Seeds a workspace, then has `--readers` members of the busy channel read its
+first page `--reads` times each while a message is posted every
+`--write-every` reads, in three modes:
+
+- uncached: history cache off, no validators (every read queries the database)
+- redis: pages served from the Redis cache keyed by channel version
+- etag: as redis, with clients revalidating through If-None-Match
+
+Reports latency, SQL statements per read, 304s and bytes sent. It also counts
+stale reads: a read after a post that does not contain the posted message.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.history_cache")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--readers", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=20, help="reads per reader")
+    parser.add_argument("--write-every", type=int, default=500, help="post one message every N reads")
+    parser.add_argument("--per-page", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+async def run_mode(client, args, workspace, tokens, mode: str, counter) -> dict:
+    from app.config import get_settings
+    from benchmarks.stats import LatencyRecorder
+
+    get_settings().history_cache_ttl_seconds = 0 if mode == "uncached" else 300
+    rng = random.Random(args.seed)
+    channel_id = workspace.busy_channel_id
+    url = f"/api/messages/channel/{channel_id}?per_page={args.per_page}"
+    readers = rng.sample(sorted(workspace.usernames), min(args.readers, len(workspace.usernames)))
+    etags = {}
+    latest_posted = None
+    recorder = LatencyRecorder()
+    counter.count = 0
+    started = time.perf_counter()
+
+    for index in range(args.readers * args.reads):
+        if index % args.write_every == 0:
+            response = await client.post("/api/messages/channel", json={
+                "content": "fresh", "channel_id": channel_id
+            }, headers={"Authorization": f"Bearer {tokens[readers[0]]}"})
+            latest_posted = response.json()["id"]
+            recorder.count("writes")
+
+        user_id = readers[index % len(readers)]
+        headers = {"Authorization": f"Bearer {tokens[user_id]}"}
+        if mode == "etag" and user_id in etags:
+            headers["If-None-Match"] = etags[user_id]
+        statements_before_read = counter.count
+        read_started = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        recorder.record("read", time.perf_counter() - read_started)
+        recorder.count("read_sql_statements", counter.count - statements_before_read)
+        recorder.count(f"status_{response.status_code}")
+        recorder.count("bytes", len(response.content))
+
+        if response.status_code == 200:
+            etags[user_id] = response.headers.get("etag")
+            if latest_posted not in {message["id"] for message in response.json()}:
+                recorder.count("stale_reads")
+        elif etags.get(user_id) != response.headers.get("etag"):
+            recorder.count("stale_reads")
+
+    elapsed = time.perf_counter() - started
+    summary = recorder.summary(elapsed)
+    reads = summary["read"]["count"]
+    summary["sql_per_read"] = round(recorder.counters["read_sql_statements"] / reads, 2)
+    summary["bytes_per_read"] = round(recorder.counters["bytes"] / reads)
+    summary["not_modified"] = recorder.counters["status_304"]
+    summary["stale_reads"] = recorder.counters["stale_reads"]
+    summary["writes"] = recorder.counters["writes"]
+    return summary
+
+
+async def run(args, workspace) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.database import engine
+    from app.main import app
+    from app.websocket.connection_manager import manager
+    from benchmarks.reconnect_storm import StatementCounter
+
+    async def skip_publish(channel_id, member_ids, event):
+        pass
+
+    # Fan-out to sockets is not what is measured here
+    manager.publish_to_channel = skip_publish
+
+    tokens = {
+        user_id: create_access_token({"sub": username})
+        for user_id, username in workspace.usernames.items()
+    }
+    counter = StatementCounter(engine)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        return {
+            mode: await run_mode(client, args, workspace, tokens, mode, counter)
+            for mode in ("uncached", "redis", "etag")
+        }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(args.database_url)
+
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(env["DATABASE_URL"], SeedScale(users=args.users, messages=args.messages), args.seed)
+    results = asyncio.run(run(args, workspace))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Event loop monitor: its overhead, stall attribution and the sampling profiler.
+
+    python -m benchmarks.loop_monitor --requests 5000
+
+Sends `--requests` GET /health through the app in-process, `--rounds` times
+with the monitor stopped and as many with it running (alternating), and
+reports the best time per request of each.
+
+Then blocks the loop on purpose: `--logins` concurrent POST /api/auth/login
+(bcrypt runs on the loop thread) and, over /ws driven through the app's ASGI
+interface, `join_channel` for a channel the user is not in, whose membership
+check is slowed by `--slow-query-ms` to stand in for a slow database. A
+stall is measured from the monitor's next missed wake-up, so it can read up
+to one `--interval-ms` short of the block. Checks that GET
+/api/admin/loop lists both stalls under their route and message type, that
+GET /api/admin/profile taken during logins has the login route and
+verify_password in its collapsed stacks, that a second profile at the same
+time is refused and that both endpoints are for superusers only.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+LOGIN_ROUTE = "POST /api/auth/login"
+JOIN_LABEL = "WEBSOCKET /ws join_channel"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loop_monitor")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--logins", type=int, default=8)
+    parser.add_argument("--slow-query-ms", type=int, default=300)
+    parser.add_argument("--interval-ms", type=int, default=100, help="LOOP_MONITOR_INTERVAL_MS")
+    parser.add_argument("--stall-threshold-ms", type=int, default=100, help="LOOP_STALL_THRESHOLD_MS")
+    parser.add_argument("--profile-seconds", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+async def time_requests(client, requests: int) -> float:
+    """Microseconds per GET /health"""
+    started = time.perf_counter()
+    for _ in range(requests):
+        (await client.get("/health")).raise_for_status()
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def websocket_session(app, token: str, messages: list, settle: float):
+    """Connect to /ws through the app's ASGI interface, send `messages`, wait `settle` seconds and disconnect"""
+    incoming = asyncio.Queue()
+    incoming.put_nowait({"type": "websocket.connect"})
+    for message in messages:
+        incoming.put_nowait({"type": "websocket.receive", "text": json.dumps(message)})
+    scope = {
+        "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": "/ws", "raw_path": b"/ws",
+        "root_path": "", "query_string": f"token={token}".encode(), "headers": [], "subprotocols": [],
+        "server": ("bench", 80), "client": ("127.0.0.1", 50000),
+    }
+
+    async def send(message):
+        pass
+
+    session = asyncio.get_running_loop().create_task(app(scope, incoming.get, send))
+    await asyncio.sleep(settle)
+    incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+    await session
+
+
+async def run(args, workspace) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.importer import set_superuser
+    from app.loop_monitor import loop_monitor
+    from app.main import app
+    from app.websocket import connection_manager
+    from benchmarks.seed import BENCH_PASSWORD
+
+    admin_id, user_id = sorted(workspace.usernames)[:2]
+    set_superuser(workspace.usernames[admin_id])
+    as_admin = {"Authorization": f"Bearer {create_access_token({'sub': workspace.usernames[admin_id]})}"}
+    as_user = {"Authorization": f"Bearer {create_access_token({'sub': workspace.usernames[user_id]})}"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await time_requests(client, 100)
+        overhead = {"stopped": [], "running": []}
+        for _ in range(args.rounds):
+            overhead["stopped"].append(await time_requests(client, args.requests))
+            loop_monitor.start()
+            overhead["running"].append(await time_requests(client, args.requests))
+            await loop_monitor.stop()
+
+        loop_monitor.start()
+        await asyncio.sleep(1)
+        idle = (await client.get("/api/admin/loop", headers=as_admin)).json()
+
+        async def login():
+            response = await client.post("/api/auth/login", json={
+                "username": workspace.usernames[user_id], "password": BENCH_PASSWORD
+            })
+            response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*[login() for _ in range(args.logins)])
+        logins_seconds = time.perf_counter() - started
+
+        # A membership check that takes --slow-query-ms, run on the loop by the message handler
+        user_can_read_channel = connection_manager.user_can_read_channel
+
+        def slow_user_can_read_channel(*arguments):
+            time.sleep(args.slow_query_ms / 1000)
+            return user_can_read_channel(*arguments)
+
+        connection_manager.user_can_read_channel = slow_user_can_read_channel
+        other_channel = next(
+            channel_id for channel_id in workspace.channel_ids if channel_id not in workspace.user_channels[user_id]
+        )
+        await websocket_session(app, create_access_token({"sub": workspace.usernames[user_id]}), [
+            {"type": "join_channel", "channel_id": other_channel}
+        ], settle=args.slow_query_ms / 1000 + args.interval_ms / 1000 * 2)
+        connection_manager.user_can_read_channel = user_can_read_channel
+        stats = (await client.get("/api/admin/loop", headers=as_admin)).json()
+
+        async def profile():
+            return await client.get(
+                "/api/admin/profile", params={"seconds": args.profile_seconds}, headers=as_admin
+            )
+
+        async def logins_during_profile():
+            await asyncio.sleep(0.2)
+            await asyncio.gather(*[login() for _ in range(args.logins)])
+
+        profiled, second, _ = await asyncio.gather(profile(), profile(), logins_during_profile())
+        if profiled.status_code != 200:
+            profiled, second = second, profiled
+        stacks = profiled.text
+        forbidden = [
+            (await client.get("/api/admin/loop", headers=as_user)).status_code,
+            (await client.get("/api/admin/profile", params={"seconds": 0.1}, headers=as_user)).status_code,
+        ]
+        await loop_monitor.stop()
+
+    folded = [line.rsplit(" ", 1) for line in stacks.splitlines()]
+    login_samples = sum(int(count) for stack, count in folded if "verify_password" in stack and "login" in stack)
+    by_label = stats["stalls_by_label"]
+    join_stall_ms = by_label.get(JOIN_LABEL, {}).get("max_ms", 0)
+    return {
+        "health_us_per_request": {state: round(min(samples), 1) for state, samples in overhead.items()},
+        "overhead_pct": round((min(overhead["running"]) / min(overhead["stopped"]) - 1) * 100, 1),
+        "idle_lag_ms": idle["lag_ms"],
+        "logins_seconds": round(logins_seconds, 2),
+        "lag_ms": stats["lag_ms"],
+        "stalls_by_label": by_label,
+        "profile": {
+            "samples": sum(int(count) for _, count in folded),
+            "stacks": len(folded),
+            "login_samples": login_samples,
+        },
+        "checks": {
+            "idle_no_stalls": idle["stalls"] == 0,
+            "login_attributed": by_label.get(LOGIN_ROUTE, {}).get("count", 0) >= 1,
+            "websocket_attributed": join_stall_ms >= args.slow_query_ms - args.interval_ms,
+            "stall_stack_recorded": any(
+                "verify_password" in " ".join(stall["stack"]) for stall in stats["recent_stalls"]
+                if stall["label"] == LOGIN_ROUTE
+            ),
+            "profile_has_logins": login_samples > 0,
+            "one_profile_at_a_time": second.status_code == 409,
+            "superuser_only": forbidden == [403, 403],
+        },
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(
+        args.database_url, loop_monitor_interval_ms=args.interval_ms, loop_stall_threshold_ms=args.stall_threshold_ms
+    )
+
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(env["DATABASE_URL"], SeedScale(users=20, teams=3, channels_per_team=2, messages=0), args.seed)
+    results = asyncio.run(run(args, workspace))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""@channel in a large channel: send latency, fan-out time and inbox writes.
+
+    python -m benchmarks.mentions --members 10000
+
+Seeds one channel with `--members` members, marks `--online-share` of them
+online with in-process sockets and runs the notification worker in-process.
+Sends `--sends` plain messages and as many @channel messages (spaced out by
+more than the debounce window) and reports the send route's latency for
+both, then how long each @channel takes to reach every online socket and
+every offline inbox, and the SQL statements it costs.
+
+Checks that every online member got one `mention` event and every offline
+member one inbox row per @channel, that `--burst` concurrent @channel
+messages are merged into fewer notifications (their `count`s add up to the
+burst), that @here skips the inbox, that mentions by name reach online and
+offline users, that the inbox lists and clears over the API, and that a job
+abandoned by a dead consumer is claimed and delivered once.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+from benchmarks.stats import percentile
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.mentions")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--online-share", type=float, default=0.3)
+    parser.add_argument("--sends", type=int, default=5)
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--debounce-ms", type=int, default=500, help="NOTIFICATION_DEBOUNCE_MS")
+    parser.add_argument("--batch-size", type=int, default=1000, help="NOTIFICATION_BATCH_SIZE")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+def inbox_counts() -> dict:
+    """user_id -> inbox rows"""
+    from sqlalchemy import func
+    from app.database import SessionLocal
+    from app.models import Notification
+
+    db = SessionLocal()
+    try:
+        return dict(db.query(Notification.user_id, func.count(Notification.id)).group_by(Notification.user_id).all())
+    finally:
+        db.close()
+
+
+def mention_frames(websocket) -> list:
+    import orjson
+
+    return [frame for frame in map(orjson.loads, websocket.frames) if frame["type"] == "mention"]
+
+
+def milliseconds(samples: list) -> dict:
+    samples = sorted(samples)
+    return {"p50": round(percentile(samples, 50), 1), "max": round(samples[-1], 1)}
+
+
+async def wait_for(condition, timeout: float = 300.0) -> float:
+    """Seconds until `condition()` holds, polling"""
+    started = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError("notifications were not delivered in time")
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+async def run(args, workspace) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.database import engine
+    from app.main import app
+    from app.notifications import notification_worker
+    from app.redis_client import notification_queue, presence_manager
+    from app.websocket.connection_manager import manager
+    from benchmarks.fakes import RecordingWebSocket
+    from benchmarks.reconnect_storm import StatementCounter
+
+    rng = random.Random(args.seed)
+    channel_id = workspace.busy_channel_id
+    members = sorted(workspace.usernames)
+    sender_id = members[0]
+    online = set(rng.sample(members[1:], int((len(members) - 1) * args.online_share)))
+    offline = [user_id for user_id in members[1:] if user_id not in online]
+    sockets = {}
+    for user_id in online:
+        await presence_manager.set_user_online(user_id, f"bench-{user_id}")
+        sockets[user_id] = RecordingWebSocket()
+        manager.registry.add(sockets[user_id], user_id)
+
+    def delivered(rounds: int):
+        """Every online member has `rounds` mention events and every offline one `rounds` inbox rows"""
+        def condition():
+            counts = inbox_counts()
+            return (
+                all(len(mention_frames(sockets[user_id])) >= rounds for user_id in online)
+                and all(counts.get(user_id, 0) >= rounds for user_id in offline)
+            )
+        return condition
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': workspace.usernames[sender_id]})}"}
+    counter = StatementCounter(engine)
+    worker = notification_worker.start()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def send(content: str) -> float:
+            started = time.perf_counter()
+            response = await client.post(
+                "/api/messages/channel", json={"channel_id": channel_id, "content": content}, headers=headers
+            )
+            response.raise_for_status()
+            return (time.perf_counter() - started) * 1000
+
+        await send("warm-up")
+        plain_ms = [await send(f"plain message {index}") for index in range(args.sends)]
+        channel_ms, fanout_seconds, fanout_statements = [], [], []
+        for index in range(args.sends):
+            statements_before = counter.count
+            channel_ms.append(await send(f"@channel release {index} is out"))
+            # Includes the debounce window, which is reported separately
+            fanout_seconds.append(await wait_for(delivered(index + 1)))
+            fanout_statements.append(counter.count - statements_before)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[send(f"@channel burst {index}") for index in range(args.burst)])
+        burst_send_seconds = time.perf_counter() - started
+        await wait_for(lambda: all(
+            sum(frame["data"]["count"] for frame in mention_frames(sockets[user_id])[args.sends:]) == args.burst
+            for user_id in online
+        ))
+        burst_notifications = len(mention_frames(sockets[min(online)])[args.sends:])
+        rounds = args.sends + burst_notifications
+        await wait_for(delivered(rounds))
+
+        frames_before = {user_id: len(mention_frames(sockets[user_id])) for user_id in online}
+        inbox_before = inbox_counts()
+        await send("@here standup in 5")
+        await wait_for(lambda: all(
+            len(mention_frames(sockets[user_id])) > frames_before[user_id] for user_id in online
+        ))
+        await asyncio.sleep(args.debounce_ms / 1000 * 2)
+        here_skipped_inbox = inbox_counts() == inbox_before
+
+        offline_user, online_user = offline[0], min(online)
+        await send(f"@{workspace.usernames[offline_user]} @{workspace.usernames[online_user]} can you review?")
+        await wait_for(lambda: inbox_counts().get(offline_user) == rounds + 1)
+        await wait_for(lambda: len(mention_frames(sockets[online_user])) == rounds + 2)
+        by_name = mention_frames(sockets[online_user])[-1]["data"]["kind"] == "mention"
+
+        # A consumer that read a job and died without acknowledging it
+        claimed_user = offline[1]
+        job = {
+            "message_id": 10 ** 9, "channel_id": channel_id, "sender_id": sender_id, "parent_message_id": None,
+            "excerpt": "abandoned", "usernames": [workspace.usernames[claimed_user]], "channel": False, "here": False,
+        }
+        await notification_worker.stop()
+        await notification_queue.enqueue(job)
+        await notification_queue.enqueue(job)
+        await notification_queue.read("dead-consumer", 10, 1)
+        worker = notification_worker.start()
+        claim_seconds = await wait_for(lambda: inbox_counts().get(claimed_user) == rounds + 1)
+
+        as_offline = {"Authorization": f"Bearer {create_access_token({'sub': workspace.usernames[offline_user]})}"}
+        page = (await client.get("/api/notifications/", headers=as_offline)).json()
+        await client.post("/api/notifications/read", headers=as_offline)
+        after_read = (await client.get("/api/notifications/", params={"unread_only": True}, headers=as_offline)).json()
+
+    worker_running = not worker.done()
+    await notification_worker.stop()
+    counts = inbox_counts()
+    return {
+        "online": len(online),
+        "offline": len(offline),
+        "send_ms": {"plain": milliseconds(plain_ms), "at_channel": milliseconds(channel_ms)},
+        "fanout_ms": milliseconds([seconds * 1000 for seconds in fanout_seconds]),
+        "debounce_ms": args.debounce_ms,
+        "fanout_sql_statements": max(fanout_statements),
+        "inbox_rows_per_at_channel": len(offline),
+        "burst_send_seconds": round(burst_send_seconds, 2),
+        "burst_notifications": burst_notifications,
+        "claim_seconds": round(claim_seconds, 2),
+        "checks": {
+            "every_member_once": all(counts[user_id] == rounds + (user_id in (offline_user, claimed_user))
+                                     for user_id in offline),
+            "burst_merged": burst_notifications < args.burst,
+            "here_skips_inbox": here_skipped_inbox,
+            "by_name": by_name,
+            "inbox_api": page["unread_count"] == rounds + 1 and page["notifications"][0]["kind"] == "mention",
+            "mark_read": after_read["unread_count"] == 0 and not after_read["notifications"],
+            "claimed_once": counts[claimed_user] == rounds + 1,
+            "worker_running": worker_running,
+        },
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(
+        args.database_url, history_cache_ttl_seconds=0, notification_debounce_ms=args.debounce_ms,
+        notification_batch_size=args.batch_size, notification_block_ms=20, notification_claim_idle_ms=1000
+    )
+
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(
+        env["DATABASE_URL"], SeedScale(users=args.members, teams=1, channels_per_team=1, messages=0), args.seed
+    )
+    results = asyncio.run(run(args, workspace))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Per-request overhead of RateLimitMiddleware, measured with raw ASGI calls.
+
+    python -m benchmarks.rate_limit_overhead --requests 50000
+
+Compares an empty ASGI app with the same app behind the middleware for
+anonymous, authenticated and templated-route requests, and times one Redis
+sync of the local counters (the only network work, once per sync interval).
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.rate_limit_overhead")
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--identities", type=int, default=1000, help="distinct users/IPs in the sync test")
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+async def empty_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def http_scope(method: str, path: str, token: str = None, client: str = "10.0.0.1"):
+    headers = [(b"host", b"bench")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return {"type": "http", "method": method, "path": path, "headers": headers, "client": (client, 5000)}
+
+
+async def time_requests(app, scope, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(scope, receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def run(args) -> dict:
+    from app.auth import create_access_token
+    from app.config import settings
+    from app.rate_limit import RateLimitMiddleware, SlidingWindowLimiter
+    from app.redis_client import redis_client
+
+    limiter = SlidingWindowLimiter(redis_client, sync_interval=3600)
+    high = f"{args.requests * 10}/minute"
+    middleware = RateLimitMiddleware(
+        empty_app,
+        limiter=limiter,
+        rules={"POST /api/messages/search": high, "GET /api/messages/channel/{channel_id}": high},
+        secret_key=settings.secret_key,
+        algorithm=settings.algorithm,
+        default_rate=high,
+    )
+    token = create_access_token({"sub": "bench_user_1"})
+
+    scenarios = {
+        "no_middleware": (empty_app, http_scope("GET", "/health")),
+        "anonymous_default_rule": (middleware, http_scope("GET", "/health")),
+        "authenticated_exact_rule": (middleware, http_scope("POST", "/api/messages/search", token)),
+        "authenticated_templated_rule": (middleware, http_scope("GET", "/api/messages/channel/42", token)),
+    }
+    results = {}
+    for name, (app, scope) in scenarios.items():
+        await time_requests(app, scope, min(1000, args.requests))  # warm caches
+        results[f"{name}_us_per_request"] = round(await time_requests(app, scope, args.requests), 3)
+    baseline = results["no_middleware_us_per_request"]
+    for name in list(results):
+        if name != "no_middleware_us_per_request":
+            results[name.replace("_us_per_request", "_overhead_us")] = round(results[name] - baseline, 3)
+
+    for index in range(args.identities):
+        await middleware(http_scope("GET", "/health", client=f"10.1.{index // 256}.{index % 256}"), receive, send)
+    start = time.perf_counter()
+    await limiter.sync()
+    results["sync_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    results["sync_keys"] = args.identities
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment()
+    results = asyncio.run(run(args))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
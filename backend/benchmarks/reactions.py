@@ -0,0 +1,273 @@
+"""Reactions on one hot message: request latency, coalesced events and database writes.
+
+    python -m benchmarks.reactions --rate 1000 --seconds 10
+
+Seeds one channel with `--users` members and `--messages` messages, connects
+`--listeners` of the members with in-process sockets and has random members
+toggle one of `--emojis` emojis on the newest message at `--rate` requests
+per second (PUT or DELETE /api/messages/{id}/reactions/{emoji}) for
+`--seconds`. Reports the achieved rate, request latency, `reactions` events
+per listener, SQL statements per reaction and the batches written. Client
+and app share one event loop, and the memory:// stand-in runs every Redis
+command (and script) in Python, so point `--redis-url` at a real Redis to
+measure the app rather than the stand-in.
+
+Checks that the totals in Redis, the persisted rows and totals, the last
+event a listener got and the history page all match what the responses
+said, that reacting twice changes nothing, that the channel's ETag moved on
+once the batch was written, and that a history page of messages that all
+have reactions costs as many SQL statements as one whose messages have none.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+from benchmarks.stats import percentile
+
+EMOJIS = ("+1", "tada", "heart", "eyes", "rocket", "fire", "joy", "pray")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.reactions")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--redis-url", default="memory://", help="redis://... or memory:// for the in-process stand-in")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=50, help="also the history page size")
+    parser.add_argument("--listeners", type=int, default=200)
+    parser.add_argument("--emojis", type=int, default=5)
+    parser.add_argument("--rate", type=int, default=1000, help="reaction requests per second")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--broadcast-interval-ms", type=int, default=250, help="REACTION_BROADCAST_INTERVAL_MS")
+    parser.add_argument("--persist-interval-ms", type=int, default=1000, help="REACTION_PERSIST_INTERVAL_MS")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+def persisted(message_ids: list) -> tuple:
+    """(message_id, user_id, emoji) rows and message_id -> {emoji: count} totals"""
+    from app.database import SessionLocal
+    from app.models import MessageReaction
+    from app.serializers import reaction_counts
+
+    db = SessionLocal()
+    try:
+        rows = set(db.query(MessageReaction.message_id, MessageReaction.user_id, MessageReaction.emoji).filter(
+            MessageReaction.message_id.in_(message_ids)
+        ).all())
+        return {tuple(row) for row in rows}, reaction_counts(db, message_ids)
+    finally:
+        db.close()
+
+
+def channel_messages(channel_id: int) -> list:
+    """Ids of the channel's top-level messages, newest first"""
+    from app.database import SessionLocal
+    from app.models import Message
+
+    db = SessionLocal()
+    try:
+        return [row.id for row in db.query(Message.id).filter(
+            Message.channel_id == channel_id, Message.parent_message_id.is_(None)
+        ).order_by(Message.created_at.desc(), Message.id.desc())]
+    finally:
+        db.close()
+
+
+def totals(reactors: set) -> dict:
+    """emoji -> count from a set of (user_id, emoji) pairs"""
+    counts = {}
+    for _, emoji in reactors:
+        counts[emoji] = counts.get(emoji, 0) + 1
+    return counts
+
+
+def milliseconds(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50": round(percentile(samples, 50), 2),
+        "p99": round(percentile(samples, 99), 2),
+        "max": round(samples[-1], 2),
+    }
+
+
+async def run(args, workspace) -> dict:
+    import httpx
+    import orjson
+    from app import reactions as reactions_module
+    from app.auth import create_access_token
+    from app.database import engine
+    from app.main import app
+    from app.reactions import reaction_aggregator
+    from app.redis_client import reaction_store
+    from app.websocket.connection_manager import manager
+    from benchmarks.fakes import RecordingWebSocket
+    from benchmarks.reconnect_storm import StatementCounter
+
+    rng = random.Random(args.seed)
+    channel_id = workspace.busy_channel_id
+    members = sorted(workspace.usernames)
+    message_ids = channel_messages(channel_id)
+    hot_message = message_ids[0]
+    emojis = EMOJIS[:args.emojis]
+    headers = {
+        user_id: {"Authorization": f"Bearer {create_access_token({'sub': workspace.usernames[user_id]})}"}
+        for user_id in members
+    }
+    listeners = {}
+    for user_id in rng.sample(members, min(args.listeners, len(members))):
+        listeners[user_id] = RecordingWebSocket()
+        manager.registry.add(listeners[user_id], user_id)
+        manager.registry.subscribe(user_id, channel_id)
+
+    batches = []
+    persist_reactions = reactions_module.persist_reactions
+
+    def counting_persist(batch):
+        batches.append(len(batch))
+        persist_reactions(batch)
+
+    reactions_module.persist_reactions = counting_persist
+
+    def reaction_frames(websocket) -> list:
+        frames = [orjson.loads(frame) for frame in websocket.frames]
+        return [frame["data"] for frame in frames if frame["type"] == "reactions"]
+
+    counter = StatementCounter(engine)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        page_url = f"/api/messages/channel/{channel_id}"
+        page_params = {"per_page": args.messages}
+
+        async def page_statements() -> tuple:
+            statements_before = counter.count
+            response = await client.get(page_url, params=page_params, headers=headers[members[0]])
+            response.raise_for_status()
+            return counter.count - statements_before, response
+
+        plain_statements, response = await page_statements()
+        etag_before = response.headers.get("etag")
+
+        async def react(user_id: int, message_id: int, emoji: str, add: bool) -> dict:
+            method = client.put if add else client.delete
+            response = await method(f"/api/messages/{message_id}/reactions/{emoji}", headers=headers[user_id])
+            response.raise_for_status()
+            return response.json()
+
+        # (user_id, emoji) on the hot message, as the responses said
+        reactors = set()
+        in_flight = set()
+        latencies, errors = [], 0
+        changed = 0
+
+        async def toggle(user_id: int, emoji: str):
+            nonlocal errors, changed
+            add = (user_id, emoji) not in reactors
+            started = time.perf_counter()
+            try:
+                result = await react(user_id, hot_message, emoji, add)
+                latencies.append((time.perf_counter() - started) * 1000)
+                changed += result["changed"]
+                (reactors.add if add else reactors.discard)((user_id, emoji))
+            except httpx.HTTPError:
+                errors += 1
+            finally:
+                in_flight.discard((user_id, emoji))
+
+        # Load the hot message once so the run measures the steady state
+        await react(members[0], hot_message, emojis[0], True)
+        reactors.add((members[0], emojis[0]))
+        idempotent = not (await react(members[0], hot_message, emojis[0], True))["changed"]
+
+        total = int(args.rate * args.seconds)
+        statements_before = counter.count
+        frames_before = {user_id: len(websocket.frames) for user_id, websocket in listeners.items()}
+        tasks = []
+        started = time.perf_counter()
+        for index in range(total):
+            delay = started + index / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            pair = (rng.choice(members), rng.choice(emojis))
+            while pair in in_flight:
+                # Every pair busy: let some requests finish
+                await asyncio.sleep(0)
+                pair = (rng.choice(members), rng.choice(emojis))
+            in_flight.add(pair)
+            tasks.append(asyncio.get_running_loop().create_task(toggle(*pair)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        load_statements = counter.count - statements_before
+        events = [len(websocket.frames) - frames_before[user_id] for user_id, websocket in listeners.items()]
+
+        # One reaction on every message of the page, for the N+1 check
+        for message_id in message_ids[1:args.messages]:
+            await react(rng.choice(members), message_id, rng.choice(emojis), True)
+        await reaction_aggregator.stop()
+        reacted_statements, response = await page_statements()
+        page = {message["id"]: message["reactions"] for message in response.json()}
+        etag_after = response.headers.get("etag")
+
+    expected = totals(reactors)
+    rows, counts = persisted([hot_message])
+    live = (await reaction_store.counts([hot_message]))[hot_message]
+    last_seen = {}
+    for frame in reaction_frames(listeners[min(listeners)]):
+        if frame["message_id"] == hot_message:
+            last_seen.update(frame["reactions"])
+    reactions_module.persist_reactions = persist_reactions
+    return {
+        "requests": total,
+        "achieved_rate": round(total / elapsed, 1),
+        "changed": changed,
+        "errors": errors,
+        "latency_ms": milliseconds(latencies),
+        "reactors": len(reactors),
+        "events_per_listener": {
+            "p50": percentile(sorted(events), 50),
+            "max": max(events),
+            "per_second": round(max(events) / elapsed, 2),
+        },
+        "sql_statements_per_reaction": round(load_statements / total, 3),
+        "persisted_batches": len(batches),
+        "max_ops_per_batch": max(batches) if batches else 0,
+        "history_page_sql_statements": {"without_reactions": plain_statements, "with_reactions": reacted_statements},
+        "checks": {
+            "no_errors": errors == 0,
+            "idempotent": idempotent,
+            "redis_totals": live == expected,
+            "persisted_rows": rows == {(hot_message, user_id, emoji) for user_id, emoji in reactors},
+            "persisted_totals": counts.get(hot_message, {}) == expected,
+            "last_event_totals": {emoji: count for emoji, count in last_seen.items() if count} == expected,
+            "history_page": page.get(hot_message) == expected and all(
+                page[message_id] for message_id in message_ids[:args.messages]
+            ),
+            "coalesced": max(events) <= elapsed / (args.broadcast_interval_ms / 1000) + 2 and max(events) < total,
+            "etag_changed": etag_before != etag_after,
+            "no_n_plus_one": reacted_statements == plain_statements,
+        },
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(
+        args.database_url, args.redis_url, reaction_broadcast_interval_ms=args.broadcast_interval_ms,
+        reaction_persist_interval_ms=args.persist_interval_ms
+    )
+
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(
+        env["DATABASE_URL"], SeedScale(users=args.users, teams=1, channels_per_team=1, messages=args.messages),
+        args.seed
+    )
+    results = asyncio.run(run(args, workspace))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Database load when every client reconnects at once after an outage.
+
+    python -m benchmarks.reconnect_storm --clients 500 --missed-messages 300
+
+Seeds a workspace, posts `--missed-messages` through the API while nobody is
+connected, then reconnects `--clients` users twice: once refetching the latest
+page of every channel over REST (what clients did before the event log), and
+once resuming over the WebSocket from the last event seq they had seen. Counts
+the SQL statements and wall time of each storm.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.reconnect_storm")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--teams", type=int, default=4)
+    parser.add_argument("--channels-per-team", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--missed-messages", type=int, default=300)
+    # Request handlers hold a pooled connection while blocking the loop; stay under the pool size
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+class StatementCounter:
+    """Counts SQL statements sent through an engine"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+async def storm(clients, concurrency: int, reconnect) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(user_id):
+        async with semaphore:
+            await reconnect(user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(user_id) for user_id in clients])
+    return time.perf_counter() - started
+
+
+async def run(args, workspace) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.database import engine
+    from app.main import app
+    from app.redis_client import event_log
+    from app.websocket.connection_manager import manager, get_websocket_user
+    from benchmarks.fakes import FakeWebSocket
+
+    async def skip_status_fanout(user_id, status):
+        pass
+
+    # Presence fan-out on connect is O(n^2) and not what is measured here
+    manager.broadcast_user_status = skip_status_fanout
+
+    rng = random.Random(args.seed)
+    tokens = {
+        user_id: create_access_token({"sub": username})
+        for user_id, username in workspace.usernames.items()
+    }
+    clients = rng.sample(sorted(workspace.usernames), min(args.clients, len(workspace.usernames)))
+    last_seen = {user_id: await event_log.current_seq(user_id) for user_id in clients}
+    counter = StatementCounter(engine)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # The outage: messages posted while every client is offline
+        for _ in range(args.missed_messages):
+            sender_id = rng.choice(sorted(workspace.usernames))
+            await client.post("/api/messages/channel", json={
+                "content": "posted during the outage",
+                "channel_id": rng.choice(workspace.user_channels[sender_id]),
+            }, headers={"Authorization": f"Bearer {tokens[sender_id]}"})
+
+        results = {}
+
+        async def refetch(user_id):
+            websocket = FakeWebSocket()
+            await get_websocket_user(websocket, tokens[user_id])
+            for channel_id in workspace.user_channels[user_id]:
+                await client.get(
+                    f"/api/messages/channel/{channel_id}?per_page=50",
+                    headers={"Authorization": f"Bearer {tokens[user_id]}"}
+                )
+            sockets[user_id] = websocket
+
+        async def resume(user_id):
+            websocket = FakeWebSocket()
+            user = await get_websocket_user(websocket, tokens[user_id])
+            await manager.connect(websocket, user.id)
+            await manager.handle_message(websocket, {"type": "resume", "last_seq": last_seen[user_id]})
+            sockets[user_id] = websocket
+
+        for mode, reconnect in (("rest_refetch", refetch), ("ws_resume", resume)):
+            sockets = {}
+            counter.count = 0
+            elapsed = await storm(clients, args.concurrency, reconnect)
+            results[mode] = {
+                "sql_statements": counter.count,
+                "sql_per_client": round(counter.count / len(clients), 2),
+                "elapsed_seconds": round(elapsed, 3),
+                "ws_frames": sum(websocket.frames_sent for websocket in sockets.values()),
+            }
+            for websocket in sockets.values():
+                await manager.disconnect(websocket)
+
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(args.database_url)
+
+    # Imported after the environment is set: app settings are read at import time
+    from benchmarks.seed import SeedScale, seed
+
+    scale = SeedScale(
+        users=args.users,
+        teams=args.teams,
+        channels_per_team=args.channels_per_team,
+        messages=args.messages,
+    )
+    workspace = seed(env["DATABASE_URL"], scale, args.seed)
+    results = asyncio.run(run(args, workspace))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Memory per connection and broadcast iteration cost of the connection bookkeeping.
+
+    python -m benchmarks.registry_memory --connections 100000 500000
+
+For each connection count, builds the previous dict/set layout and the
+ConnectionRegistry with the same simulated sockets and subscriptions (every
+user in one company-wide channel plus `--channels-per-user` random ones), and
+reports traced bytes per connection and the time to gather the sockets of the
+company-wide channel and of a typical small channel. Socket objects themselves
+are allocated before tracing starts, so only the bookkeeping is counted.
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.registry_memory")
+    parser.add_argument("--connections", type=int, nargs="+", default=[100000, 500000])
+    parser.add_argument("--channels", type=int, default=5000)
+    parser.add_argument("--channels-per-user", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+class SimulatedSocket:
+    __slots__ = ("number",)
+
+    def __init__(self, number: int):
+        self.number = number
+
+
+class DictSetLayout:
+    """The ConnectionManager maps this registry replaced"""
+
+    def __init__(self):
+        self.active_connections = {}
+        self.channel_subscriptions = {}
+        self.websocket_users = {}
+        self.user_channels = {}
+
+    def add(self, websocket, user_id: int, channel_ids):
+        self.active_connections.setdefault(user_id, set()).add(websocket)
+        self.websocket_users[websocket] = user_id
+        for channel_id in channel_ids:
+            self.channel_subscriptions.setdefault(channel_id, set()).add(user_id)
+        self.user_channels.setdefault(user_id, set()).update(channel_ids)
+
+    def channel_sockets(self, channel_id: int):
+        sockets = []
+        for user_id in list(self.channel_subscriptions.get(channel_id, ())):
+            sockets.extend(self.active_connections[user_id])
+        return sockets
+
+
+class RegistryLayout:
+    def __init__(self):
+        from app.websocket.registry import ConnectionRegistry
+
+        self.registry = ConnectionRegistry()
+
+    def add(self, websocket, user_id: int, channel_ids):
+        self.registry.add(websocket, user_id)
+        self.registry.subscribe_many(user_id, channel_ids)
+
+    def channel_sockets(self, channel_id: int):
+        return self.registry.channel_connections(channel_id)
+
+
+def time_gather(layout, channel_ids, repeat: int) -> float:
+    """Mean seconds to gather the sockets of one channel"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for channel_id in channel_ids:
+            layout.channel_sockets(channel_id)
+    return (time.perf_counter() - start) / (repeat * len(channel_ids))
+
+
+def measure(layout_class, sockets, subscriptions, repeat: int, small_channels) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    layout = layout_class()
+    for user_id, (websocket, channel_ids) in enumerate(zip(sockets, subscriptions), start=1):
+        layout.add(websocket, user_id, channel_ids)
+    build_seconds = time.perf_counter() - start
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "bytes_per_connection": round(traced / len(sockets), 1),
+        "total_mb": round(traced / 2 ** 20, 1),
+        "build_seconds": round(build_seconds, 3),
+        "gather_company_channel_ms": round(time_gather(layout, [0], repeat) * 1000, 3),
+        "gather_small_channel_us": round(time_gather(layout, small_channels, repeat) * 1e6, 3),
+    }
+    del layout
+    gc.collect()
+    return result
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {}
+    for connections in args.connections:
+        rng = random.Random(args.seed)
+        sockets = [SimulatedSocket(number) for number in range(connections)]
+        subscriptions = [
+            [0] + rng.sample(range(1, args.channels), args.channels_per_user)
+            for _ in range(connections)
+        ]
+        small_channels = rng.sample(range(1, args.channels), 100)
+        results[connections] = {
+            "dict_set": measure(DictSetLayout, sockets, subscriptions, args.repeat, small_channels),
+            "registry": measure(RegistryLayout, sockets, subscriptions, args.repeat, small_channels),
+        }
+        del sockets, subscriptions
+        gc.collect()
+
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
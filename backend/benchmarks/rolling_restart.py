@@ -0,0 +1,334 @@
+"""Rolling restart of several workers: hard cut versus graceful drain.
+
+    python -m benchmarks.rolling_restart --workers 3 --clients 30000 --window 10
+
+Spreads `--clients` simulated clients over `--workers` in-process
+ConnectionManagers sharing one Redis, then restarts the workers one after the
+other, twice:
+
+- hard: every socket of the worker is cut at once (what uvicorn does without
+  the drain) and clients reconnect to another worker after a random backoff of
+  up to `--client-backoff` seconds
+- drain: the worker drains over `--window` seconds and clients reconnect when
+  their `reconnect` frame tells them to
+
+Reports the peak rate of reconnect attempts (per one-second bucket), presence
+offline transitions, user_status frames that would be fanned out (counted, not
+sent) and Redis commands.
+
+Then checks the deployed path: starts the server as the Dockerfile does
+(`python -m app.main`, which installs the drain protocol), connects
+`--server-clients` real WebSocket clients and sends it SIGTERM, once with
+WS_DRAIN_WINDOW_SECONDS=0 (uvicorn's own shutdown) and once with
+`--server-window`. Reports when `reconnect` frames told clients to come back
+and when and how their sockets were closed, and checks that the drained
+server spread the closes over the window and then exited cleanly.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from benchmarks.env import configure_environment
+from benchmarks.server import running_server_process
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.rolling_restart")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=30000)
+    parser.add_argument("--window", type=float, default=10.0, help="drain window (production default is 30s)")
+    parser.add_argument("--close-grace", type=float, default=1.0)
+    parser.add_argument("--handoff", type=float, default=5.0, help="presence handoff grace")
+    parser.add_argument("--client-backoff", type=float, default=1.0, help="max reconnect delay after a hard cut")
+    parser.add_argument("--server-clients", type=int, default=300, help="WebSocket clients of the real server")
+    parser.add_argument("--server-window", type=float, default=5.0, help="drain window of the real server")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+class RedisCommandCounter:
+    """Counts commands and round trips sent through redis.asyncio clients"""
+
+    def __init__(self):
+        from redis.asyncio.client import Pipeline, Redis
+
+        self.commands = 0
+        self.round_trips = 0
+        counter = self
+        execute_command = Redis.execute_command
+        execute_pipeline = Pipeline.execute
+
+        async def counted_command(client, *args, **kwargs):
+            counter.commands += 1
+            counter.round_trips += 1
+            return await execute_command(client, *args, **kwargs)
+
+        async def counted_pipeline(pipe, *args, **kwargs):
+            counter.commands += len(pipe.command_stack)
+            counter.round_trips += 1
+            return await execute_pipeline(pipe, *args, **kwargs)
+
+        Redis.execute_command = counted_command
+        Pipeline.execute = counted_pipeline
+
+    def reset(self):
+        self.commands = 0
+        self.round_trips = 0
+
+
+class Cluster:
+    """Workers, the clients connected to them and what the restarts cost"""
+
+    def __init__(self, workers: int, rng: random.Random):
+        self.rng = rng
+        self.workers = [self.new_worker() for _ in range(workers)]
+        self.down = set()
+        self.location = {}
+        self.pending = set()
+        # When clients try to reconnect: the load the cluster would face,
+        # independent of how fast this single process can replay it
+        self.attempt_times = []
+        self.status_frames = Counter()
+        self.offline_transitions = 0
+
+    def new_worker(self):
+        from app.websocket.connection_manager import ConnectionManager
+
+        manager = ConnectionManager()
+
+        async def count_status_fanout(user_id, status):
+            # What broadcast_user_status would send, without sending it
+            self.status_frames[status] += len(manager.registry.users) - 1
+
+        async def skip_channel_lookup(user_id):
+            return []
+
+        manager.broadcast_user_status = count_status_fanout
+        # No database here and no channel traffic is measured
+        manager.get_user_channel_ids = skip_channel_lookup
+        return manager
+
+    async def connect(self, user_id: int):
+        live = [index for index, worker in enumerate(self.workers) if index not in self.down and not worker.draining]
+        index = self.rng.choice(live)
+        websocket = ClientSocket(self, user_id)
+        await self.workers[index].connect(websocket, user_id)
+        self.location[user_id] = (index, websocket)
+
+    def move_at(self, user_id: int, moment: float):
+        """Close the client's socket at `moment` (monotonic) and reconnect to another worker"""
+        self.attempt_times.append(moment)
+        task = asyncio.get_running_loop().create_task(self._move(user_id, moment - time.monotonic()))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _move(self, user_id: int, delay: float):
+        await asyncio.sleep(delay)
+        index, websocket = self.location[user_id]
+        await self.workers[index].disconnect(websocket)
+        await self.connect(user_id)
+
+    async def settle(self):
+        while self.pending:
+            await asyncio.gather(*list(self.pending))
+
+
+class ClientSocket:
+    """A client that follows `reconnect` frames"""
+
+    __slots__ = ("cluster", "user_id")
+
+    def __init__(self, cluster: Cluster, user_id: int):
+        self.cluster = cluster
+        self.user_id = user_id
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        if data.startswith('{"type": "reconnect"'):
+            self.cluster.move_at(self.user_id, time.monotonic() + json.loads(data)["data"]["after_ms"] / 1000)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+async def hard_restart(cluster: Cluster, index: int, args):
+    """Cut every socket at once; clients come back after their own backoff"""
+    worker = cluster.workers[index]
+    cluster.down.add(index)
+    cut_at = time.monotonic()
+    for connection in [connection for connection in worker.registry.connections if connection is not None]:
+        await worker.disconnect(connection.websocket)
+        cluster.move_at(connection.user_id, cut_at + cluster.rng.uniform(0, args.client_backoff))
+    await cluster.settle()
+    cluster.workers[index] = cluster.new_worker()
+    cluster.down.discard(index)
+
+
+async def drain_restart(cluster: Cluster, index: int, args):
+    worker = cluster.workers[index]
+    await worker.drain()
+    await cluster.settle()
+    cluster.workers[index] = cluster.new_worker()
+
+
+async def run_mode(args, restart, counter: RedisCommandCounter) -> dict:
+    from app.redis_client import presence_manager, redis_client
+
+    await redis_client.flushall()
+    cluster = Cluster(args.workers, random.Random(args.seed))
+    for user_id in range(1, args.clients + 1):
+        await cluster.connect(user_id)
+
+    set_user_offline = presence_manager.set_user_offline
+    finish_hand_off = presence_manager.finish_hand_off
+
+    async def counted_offline(user_id):
+        cluster.offline_transitions += 1
+        await set_user_offline(user_id)
+
+    async def counted_finish(user_ids):
+        offline = await finish_hand_off(user_ids)
+        cluster.offline_transitions += offline
+        return offline
+
+    presence_manager.set_user_offline = counted_offline
+    presence_manager.finish_hand_off = counted_finish
+    cluster.attempt_times.clear()
+    cluster.status_frames.clear()
+    counter.reset()
+    started = time.monotonic()
+    try:
+        for index in range(args.workers):
+            await restart(cluster, index, args)
+    finally:
+        presence_manager.set_user_offline = set_user_offline
+        presence_manager.finish_hand_off = finish_hand_off
+    elapsed = time.monotonic() - started
+
+    buckets = Counter(int(moment - started) for moment in cluster.attempt_times)
+    online = await redis_client.scard("online_users")
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "reconnects": len(cluster.attempt_times),
+        "peak_reconnects_per_sec": max(buckets.values(), default=0),
+        "presence_offline_transitions": cluster.offline_transitions,
+        "user_status_frames": dict(cluster.status_frames),
+        "redis_commands": counter.commands,
+        "redis_round_trips": counter.round_trips,
+        "online_at_end": online,
+    }
+
+
+async def watch_socket(websocket, signalled_at: list) -> dict:
+    """Read until the server closes the socket; when it was told to reconnect and when it was closed"""
+    import websockets
+
+    outcome = {"after_ms": None}
+    try:
+        async for frame in websocket:
+            if frame.startswith('{"type": "reconnect"'):
+                outcome["after_ms"] = json.loads(frame)["data"]["after_ms"]
+    except websockets.ConnectionClosed:
+        pass
+    outcome["closed_after"] = time.monotonic() - signalled_at[0]
+    outcome["code"] = websocket.close_code
+    return outcome
+
+
+async def run_server_mode(args, env: dict, tokens: list, window: float) -> dict:
+    """SIGTERM a real server process with `tokens` connected and see how the sockets end"""
+    import websockets
+
+    server_env = {**env, "WS_DRAIN_WINDOW_SECONDS": str(window)}
+    with running_server_process(server_env) as (base_url, process):
+        ws_url = base_url.replace("http://", "ws://")
+        sockets = []
+        for token in tokens:
+            websocket = await websockets.connect(f"{ws_url}/ws?token={token}", ping_interval=None)
+            # Registered with the manager once it answers
+            await websocket.send('{"type": "ping"}')
+            while await websocket.recv() != '{"type": "pong"}':
+                pass
+            sockets.append(websocket)
+
+        signalled_at = [time.monotonic()]
+        process.terminate()
+        outcomes = await asyncio.gather(*[watch_socket(websocket, signalled_at) for websocket in sockets])
+        exit_code = await asyncio.get_running_loop().run_in_executor(None, process.wait)
+        shutdown_seconds = time.monotonic() - signalled_at[0]
+
+    told = [outcome["after_ms"] / 1000 for outcome in outcomes if outcome["after_ms"] is not None]
+    # Reconnect attempts: when told to, else as soon as the socket was cut
+    attempts = Counter(
+        int(outcome["after_ms"] / 1000 if outcome["after_ms"] is not None else outcome["closed_after"])
+        for outcome in outcomes
+    )
+    closed = sorted(outcome["closed_after"] for outcome in outcomes)
+    return {
+        "clients": len(tokens),
+        "reconnect_frames": len(told),
+        "reconnect_after_seconds": {"min": round(min(told), 2), "max": round(max(told), 2)} if told else None,
+        "peak_reconnects_per_sec": max(attempts.values()),
+        "close_codes": {str(code): count for code, count in Counter(o["code"] for o in outcomes).items()},
+        "closed_after_seconds": {"first": round(closed[0], 2), "last": round(closed[-1], 2)},
+        "shutdown_seconds": round(shutdown_seconds, 2),
+        "exit_code": exit_code,
+    }
+
+
+async def run_server(args, env: dict, tokens: list) -> dict:
+    hard = await run_server_mode(args, env, tokens, 0)
+    drain = await run_server_mode(args, env, tokens, args.server_window)
+    spread = drain["closed_after_seconds"]["last"] - drain["closed_after_seconds"]["first"]
+    return {
+        "hard": hard,
+        "drain": drain,
+        "checks": {
+            "hard_cuts_at_once": hard["reconnect_frames"] == 0
+            and hard["closed_after_seconds"]["last"] < args.close_grace,
+            "every_client_told_to_reconnect": drain["reconnect_frames"] == len(tokens),
+            "reconnects_within_window": drain["reconnect_after_seconds"]["max"] <= args.server_window,
+            "closes_spread_over_window": spread >= args.server_window / 2,
+            "closed_with_1012": drain["close_codes"] == {"1012": len(tokens)},
+            "exited_cleanly": drain["exit_code"] == 0 and hard["exit_code"] == 0,
+        },
+    }
+
+
+async def run(args) -> dict:
+    counter = RedisCommandCounter()
+    return {
+        "hard": await run_mode(args, hard_restart, counter),
+        "drain": await run_mode(args, drain_restart, counter),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(
+        ws_drain_window_seconds=args.window,
+        ws_drain_close_grace_seconds=args.close_grace,
+        presence_handoff_seconds=args.handoff,
+    )
+    results = asyncio.run(run(args))
+
+    from app.auth import create_access_token
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(
+        env["DATABASE_URL"], SeedScale(users=args.server_clients, teams=1, channels_per_team=1, messages=0), args.seed
+    )
+    tokens = [create_access_token({"sub": username}) for username in workspace.usernames.values()]
+    results["server"] = asyncio.run(run_server(args, env, tokens))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Seed a database with users, teams, channels and messages at a configurable scale"""
+from dataclasses import dataclass, field
+from typing import Dict, List
+import random
+
+from sqlalchemy import create_engine, insert
+
+from app.models import Base, User, Team, Channel, Message, team_members, channel_members
+
+BENCH_PASSWORD = "benchpass123"
+
+WORDS = [
+    "deploy", "release", "review", "standup", "roadmap", "incident", "metrics", "design",
+    "backend", "frontend", "database", "latency", "cache", "search", "mobile", "customer",
+    "sprint", "planning", "hotfix", "rollback", "feature", "ticket", "coffee", "lunch",
+]
+
+
+@dataclass
+class SeedScale:
+    users: int = 200
+    teams: int = 4
+    channels_per_team: int = 5
+    messages: int = 20000
+    batch_size: int = 5000
+
+
+@dataclass
+class SeededWorkspace:
+    """Ids and credentials the workloads need after seeding"""
+    usernames: Dict[int, str] = field(default_factory=dict)
+    user_channels: Dict[int, List[int]] = field(default_factory=dict)
+    channel_ids: List[int] = field(default_factory=list)
+    busy_channel_id: int = 0
+    password: str = BENCH_PASSWORD
+
+
+def random_sentence(rng: random.Random, length: int = 8) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def _insert_batches(conn, table, rows: List[dict], batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        conn.execute(insert(table), rows[start:start + batch_size])
+
+
+def seed(database_url: str, scale: SeedScale, seed_value: int = 42, create_schema: bool = True) -> SeededWorkspace:
+    """Create the schema (unless already migrated) and bulk insert a synthetic workspace.
+
+    Every user belongs to team 1 (so its first channel is the "busy" company-wide
+    channel) plus one other team chosen round-robin, and joins every channel of
+    the teams they belong to.
+    """
+    from app.auth import get_password_hash
+
+    rng = random.Random(seed_value)
+    engine = create_engine(database_url)
+    if create_schema:
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+    workspace = SeededWorkspace()
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+
+    user_rows = []
+    for user_id in range(1, scale.users + 1):
+        username = f"bench_user_{user_id}"
+        workspace.usernames[user_id] = username
+        user_rows.append({
+            "id": user_id,
+            "username": username,
+            "email": f"{username}@example.com",
+            "hashed_password": hashed_password,
+            "full_name": f"Bench User {user_id}",
+            "is_active": True,
+        })
+
+    team_rows = [
+        {"id": team_id, "name": f"Bench Team {team_id}", "is_public": True, "created_by": 1}
+        for team_id in range(1, scale.teams + 1)
+    ]
+
+    team_member_rows = []
+    user_teams: Dict[int, List[int]] = {}
+    for user_id in workspace.usernames:
+        teams = {1, (user_id % scale.teams) + 1}
+        user_teams[user_id] = sorted(teams)
+        for team_id in teams:
+            team_member_rows.append({
+                "user_id": user_id,
+                "team_id": team_id,
+                "role": "admin" if user_id == 1 else "member",
+            })
+
+    channel_rows = []
+    team_channels: Dict[int, List[int]] = {}
+    channel_id = 0
+    for team_id in range(1, scale.teams + 1):
+        for index in range(scale.channels_per_team):
+            channel_id += 1
+            channel_rows.append({
+                "id": channel_id,
+                "name": f"channel-{team_id}-{index}",
+                "is_private": False,
+                "team_id": team_id,
+                "created_by": 1,
+            })
+            team_channels.setdefault(team_id, []).append(channel_id)
+    workspace.channel_ids = [row["id"] for row in channel_rows]
+    workspace.busy_channel_id = team_channels[1][0]
+
+    channel_member_rows = []
+    for user_id, teams in user_teams.items():
+        channels = [cid for team_id in teams for cid in team_channels[team_id]]
+        workspace.user_channels[user_id] = channels
+        for cid in channels:
+            channel_member_rows.append({"user_id": user_id, "channel_id": cid})
+
+    with engine.begin() as conn:
+        _insert_batches(conn, User.__table__, user_rows, scale.batch_size)
+        _insert_batches(conn, Team.__table__, team_rows, scale.batch_size)
+        _insert_batches(conn, team_members, team_member_rows, scale.batch_size)
+        _insert_batches(conn, Channel.__table__, channel_rows, scale.batch_size)
+        _insert_batches(conn, channel_members, channel_member_rows, scale.batch_size)
+
+        message_rows = []
+        for _ in range(scale.messages):
+            sender_id = rng.randint(1, scale.users)
+            message_rows.append({
+                "content": random_sentence(rng),
+                "message_type": "text",
+                "channel_id": rng.choice(workspace.user_channels[sender_id]),
+                "sender_id": sender_id,
+            })
+            if len(message_rows) >= scale.batch_size:
+                conn.execute(insert(Message.__table__), message_rows)
+                message_rows = []
+        if message_rows:
+            conn.execute(insert(Message.__table__), message_rows)
+
+    engine.dispose()
+    return workspace
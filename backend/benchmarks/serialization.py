@@ -0,0 +1,203 @@
+"""CPU per response of the list endpoints: ORM + Pydantic vs row tuples + orjson.
+
+    python -m benchmarks.serialization --iterations 200 --per-page 100
+
+Seeds a workspace, then builds the response body of each high-volume list
+endpoint `--iterations` times in two ways, on the same session:
+
+- orm: the previous path, ORM instances validated through the
+  `from_attributes` schemas (each sender lazy-loaded on first access) and
+  rendered with JSONResponse
+- rows: the current path, column tuples (senders fetched by id in a
+  second query, as messages may be on a shard) turned into dicts by
+  `app.serializers` and rendered with ORJSONResponse
+
+Both are built the same way as the routes. CPU time (time.process_time) is
+split into the query and the serialization (for the rows path the
+query includes building the message dicts with their senders), and the two bodies are checked
+to decode to the same JSON. Each route is then also called through the app
+`--iterations` times for its end-to-end CPU per response.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+def endpoints(channel_id: int, team_id: int, user_id: int, per_page: int) -> dict:
+    """name -> (orm query, orm render, rows query, rows render) for each endpoint"""
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from sqlalchemy import desc
+    from app.models import Channel, Message, User, channel_members, team_members
+    from app.schemas import Message as MessageSchema, SearchResult, User as UserSchema
+    from app.serializers import MESSAGE_COLUMNS, USER_COLUMNS, message_rows, user_rows
+
+    def channel_page_orm(db):
+        return db.query(Message).filter(
+            Message.channel_id == channel_id, Message.parent_message_id.is_(None)
+        ).order_by(desc(Message.created_at)).limit(per_page).all()
+
+    def channel_page_rows(db):
+        return message_rows(db, db.query(*MESSAGE_COLUMNS).filter(
+            Message.channel_id == channel_id, Message.parent_message_id.is_(None)
+        ).order_by(desc(Message.created_at)).limit(per_page))
+
+    def search_query(db):
+        return db.query(Message).join(Channel).join(
+            team_members, team_members.c.team_id == Channel.team_id
+        ).filter(team_members.c.user_id == user_id, Message.content.contains("deploy"))
+
+    def search_orm(db):
+        query = search_query(db)
+        return query.count(), query.order_by(desc(Message.created_at)).limit(per_page).all()
+
+    def search_rows(db):
+        query = search_query(db)
+        return query.count(), message_rows(db, query.with_entities(*MESSAGE_COLUMNS).order_by(
+            desc(Message.created_at)
+        ).limit(per_page))
+
+    def search_result_orm(result):
+        total_count, messages = result
+        return SearchResult(messages=messages, total_count=total_count, page=1, per_page=per_page)
+
+    def search_result_rows(result):
+        total_count, messages = result
+        return {"messages": messages, "total_count": total_count, "page": 1, "per_page": per_page}
+
+    def render_users(users):
+        return JSONResponse([UserSchema.model_validate(user).model_dump(mode="json") for user in users])
+
+    return {
+        "channel_messages": (
+            f"/api/messages/channel/{channel_id}?per_page={per_page}",
+            channel_page_orm,
+            lambda messages: JSONResponse(
+                [MessageSchema.model_validate(message).model_dump(mode="json") for message in messages]
+            ),
+            channel_page_rows,
+            ORJSONResponse,
+        ),
+        "search_messages": (
+            f"/api/messages/search?per_page={per_page}",
+            search_orm,
+            lambda result: JSONResponse(search_result_orm(result).model_dump(mode="json")),
+            search_rows,
+            lambda result: ORJSONResponse(search_result_rows(result)),
+        ),
+        "team_members": (
+            f"/api/teams/{team_id}/members",
+            lambda db: db.query(User).join(team_members).filter(team_members.c.team_id == team_id).all(),
+            render_users,
+            lambda db: db.query(*USER_COLUMNS).join(team_members).filter(team_members.c.team_id == team_id).all(),
+            lambda rows: ORJSONResponse(user_rows(rows)),
+        ),
+        "channel_members": (
+            f"/api/channels/{channel_id}/members",
+            lambda db: db.query(User).join(channel_members).filter(
+                channel_members.c.channel_id == channel_id
+            ).all(),
+            render_users,
+            lambda db: db.query(*USER_COLUMNS).join(channel_members).filter(
+                channel_members.c.channel_id == channel_id
+            ).all(),
+            lambda rows: ORJSONResponse(user_rows(rows)),
+        ),
+    }
+
+
+def measure(db, query, render, iterations: int) -> tuple:
+    """Mean CPU microseconds of the query and of the rendering, and the last body"""
+    query_cpu = render_cpu = 0.0
+    for _ in range(iterations):
+        # A fresh identity map each time, as each request has its own session
+        db.expunge_all()
+        started = time.process_time()
+        result = query(db)
+        queried = time.process_time()
+        body = render(result).body
+        render_cpu += time.process_time() - queried
+        query_cpu += queried - started
+    return round(query_cpu / iterations * 1e6, 1), round(render_cpu / iterations * 1e6, 1), body
+
+
+def compare_paths(args, workspace) -> dict:
+    from app.database import SessionLocal
+
+    results = {}
+    db = SessionLocal()
+    try:
+        table = endpoints(workspace.busy_channel_id, 1, 1, args.per_page)
+        for name, (_, orm_query, orm_render, rows_query, rows_render) in table.items():
+            orm_query_us, orm_render_us, orm_body = measure(db, orm_query, orm_render, args.iterations)
+            rows_query_us, rows_render_us, rows_body = measure(db, rows_query, rows_render, args.iterations)
+            orm_total = round(orm_query_us + orm_render_us, 1)
+            rows_total = round(rows_query_us + rows_render_us, 1)
+            results[name] = {
+                "orm": {"query_cpu_us": orm_query_us, "serialize_cpu_us": orm_render_us, "total_cpu_us": orm_total},
+                "rows": {"query_cpu_us": rows_query_us, "serialize_cpu_us": rows_render_us, "total_cpu_us": rows_total},
+                "speedup": round(orm_total / rows_total, 2) if rows_total else None,
+                "bytes": len(rows_body),
+                "same_body": json.loads(orm_body) == json.loads(rows_body),
+            }
+    finally:
+        db.close()
+    return results
+
+
+async def measure_routes(args, workspace) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.config import get_settings
+    from app.main import app
+
+    get_settings().history_cache_ttl_seconds = 0
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': workspace.usernames[1]})}"}
+    table = endpoints(workspace.busy_channel_id, 1, 1, args.per_page)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, (url, *_) in table.items():
+            if name == "search_messages":
+                call = lambda: client.post(url, json={"query": "deploy"}, headers=headers)
+            else:
+                call = lambda: client.get(url, headers=headers)
+            (await call()).raise_for_status()
+            started = time.process_time()
+            for _ in range(args.iterations):
+                await call()
+            results[name] = {"cpu_per_response_us": round((time.process_time() - started) / args.iterations * 1e6, 1)}
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(args.database_url)
+
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(env["DATABASE_URL"], SeedScale(users=args.users, messages=args.messages), args.seed)
+    results = {
+        "paths": compare_paths(args, workspace),
+        "routes": asyncio.run(measure_routes(args, workspace)),
+    }
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Run the FastAPI app under uvicorn in a child process for the duration of a benchmark"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_healthy(base_url: str, timeout: float = 30.0, poll_interval: float = 0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(poll_interval)
+    raise RuntimeError(f"Server at {base_url} did not become healthy within {timeout}s")
+
+
+@contextmanager
+def running_server_process(
+    env: Dict[str, str],
+    port: Optional[int] = None,
+    extra_args: Optional[List[str]] = None,
+    poll_interval: float = 0.1
+):
+    """Start the server as deployed (`python -m app.main`) and yield its base URL and process"""
+    port = port or free_port()
+    command = [
+        sys.executable, "-m", "app.main",
+        "--host", "127.0.0.1",
+        "--port", str(port),
+        "--log-level", "warning",
+        "--no-access-log",
+        "--no-reload",
+    ] + (extra_args or [])
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env={**os.environ, **env})
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_healthy(base_url, poll_interval=poll_interval)
+        yield base_url, process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+@contextmanager
+def running_server(
+    env: Dict[str, str],
+    port: Optional[int] = None,
+    extra_args: Optional[List[str]] = None,
+    poll_interval: float = 0.1
+):
+    """Start the server as deployed (`python -m app.main`) and yield its base URL"""
+    with running_server_process(env, port, extra_args, poll_interval) as (base_url, _):
+        yield base_url
@@ -0,0 +1,322 @@
+"""Message sharding over several local SQLite files: moves, reads and writes.
+
+    python -m benchmarks.sharding --shards 3 --messages 20000
+
+Seeds a workspace in the main database, with MESSAGE_SHARD_URLS naming
+`--shards` more SQLite files; every message starts on "main", as it would
+when sharding is first turned on. Then, through the app:
+
+1. reads as one user: each channel's full history, threads, a search, the
+   DM inbox and each conversation's history, and /api/bootstrap
+2. moves every channel and conversation to its hash-picked shard with
+   `app.sharding.move` and repeats the reads, which must come back the same
+3. writes on the sharded layout: a new channel (placed by hash) with
+   messages, a reply, an edit and a delete, and direct messages in a new and
+   an existing conversation; checks where the rows landed and reads them back
+4. moves the busy channel to another shard while a writer keeps posting to
+   it and retries on 503; every acknowledged message must be in the history
+   afterwards, and only on the new shard
+
+Pass `--database-url` and `--shard-url name=url` (repeatable) to run against
+MySQL instead.
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.sharding")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--shards", type=int, default=3, help="SQLite shard files, unless --shard-url is given")
+    parser.add_argument("--shard-url", action="append", default=[], help="name=url, repeatable")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--writes", type=int, default=200, help="messages posted during the online move")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--settle-seconds", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+def spread_timestamps(database_url: str, users: int, threads: int):
+    """Threads and conversations, and one second between messages so history order is total"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import bindparam, create_engine, select, update
+    from app.models import Message
+    from benchmarks.explain_queries import seed_threads_and_conversations
+
+    engine = create_engine(database_url)
+    seed_threads_and_conversations(engine, users, threads)
+    start = datetime.utcnow() - timedelta(days=30)
+    with engine.begin() as conn:
+        ids = conn.execute(select(Message.id).order_by(Message.id)).scalars().all()
+        conn.execute(
+            update(Message.__table__).where(Message.id == bindparam("row_id")).values(created_at=bindparam("at")),
+            [{"row_id": row_id, "at": start + timedelta(seconds=row_id)} for row_id in ids]
+        )
+    engine.dispose()
+
+
+async def read_everything(client, headers: dict, per_page: int) -> dict:
+    """Every read a user can make of their channels and conversations, as raw JSON"""
+    reads = {}
+    bootstrap = (await client.get("/api/bootstrap", headers=headers)).json()
+    reads["bootstrap_channels"] = bootstrap["channels"]
+    for channel in bootstrap["channels"]:
+        pages = []
+        page = 1
+        while True:
+            response = await client.get(
+                f"/api/messages/channel/{channel['id']}", params={"page": page, "per_page": per_page}, headers=headers
+            )
+            response.raise_for_status()
+            if not response.json():
+                break
+            pages.append(response.json())
+            page += 1
+        reads[f"channel:{channel['id']}"] = pages
+        # The oldest messages, where the seeded threads are
+        for thread_id in [message["id"] for message in pages[-1][-5:]] if pages else []:
+            reads[f"thread:{thread_id}"] = (await client.get(f"/api/messages/{thread_id}/thread", headers=headers)).json()
+
+    for page in (1, 2):
+        reads[f"search:{page}"] = (await client.post(
+            "/api/messages/search", params={"page": page, "per_page": per_page}, json={"query": "deploy"},
+            headers=headers
+        )).json()
+    inbox = (await client.get("/api/messages/conversations", headers=headers)).json()
+    reads["inbox"] = inbox
+    for conversation in inbox["conversations"]:
+        other_id = conversation["other_user"]["id"]
+        reads[f"direct:{other_id}"] = (await client.get(f"/api/messages/direct/{other_id}", headers=headers)).json()
+    return reads
+
+
+def move_everything(args) -> dict:
+    """Every channel and conversation to the shard the hash picks for it"""
+    from app.database import SessionLocal
+    from app.models import Channel, Conversation
+    from app.sharding import CHANNEL, CONVERSATION, move, shard_router
+
+    db = SessionLocal()
+    try:
+        keys = [(CHANNEL, row.id) for row in db.query(Channel.id)]
+        keys += [(CONVERSATION, row.id) for row in db.query(Conversation.id)]
+    finally:
+        db.close()
+
+    started = time.perf_counter()
+    moved = sum(
+        move(scope, scope_id, shard_router.pick_shard(scope, scope_id), args.batch_size, settle_seconds=0)
+        for scope, scope_id in keys
+    )
+    seconds = time.perf_counter() - started
+    return {
+        "placements": len(keys),
+        "rows_moved": moved,
+        "seconds": round(seconds, 2),
+        "rows_per_second": round(moved / seconds) if seconds else None,
+    }
+
+
+def rows_on(shard: str, table, **where) -> int:
+    from sqlalchemy import func, select
+    from app.sharding import get_shard_engine
+
+    with get_shard_engine(shard).connect() as conn:
+        return conn.execute(
+            select(func.count()).select_from(table).where(*[table.c[key] == value for key, value in where.items()])
+        ).scalar()
+
+
+async def write_phase(client, headers: dict, workspace) -> dict:
+    """Writes on the sharded layout, where they land and what reads back"""
+    from app.models import DirectMessage, Message, ShardPlacement
+    from app.database import SessionLocal
+    from app.sharding import CHANNEL, CONVERSATION
+
+    channel = (await client.post("/api/channels/", json={"name": "sharded", "team_id": 1}, headers=headers)).json()
+    sent = []
+    for index in range(20):
+        response = await client.post(
+            "/api/messages/channel", json={"channel_id": channel["id"], "content": f"message {index}"}, headers=headers
+        )
+        response.raise_for_status()
+        sent.append(response.json()["id"])
+    reply = (await client.post(
+        "/api/messages/channel", json={"channel_id": channel["id"], "content": "reply", "parent_message_id": sent[0]},
+        headers=headers
+    )).json()
+    edited = (await client.put(f"/api/messages/{sent[1]}", json={"content": "edited"}, headers=headers)).json()
+    deleted = await client.delete(f"/api/messages/{sent[2]}", headers=headers)
+    history = (await client.get(f"/api/messages/channel/{channel['id']}", headers=headers)).json()
+    thread = (await client.get(f"/api/messages/{sent[0]}/thread", headers=headers)).json()
+
+    new_partner, old_partner = len(workspace.usernames), 1
+    direct = [
+        (await client.post("/api/messages/direct", json={"receiver_id": partner, "content": "sharded hi"},
+                           headers=headers)).json()
+        for partner in (new_partner, old_partner)
+    ]
+    inbox = (await client.get("/api/messages/conversations", headers=headers)).json()
+
+    db = SessionLocal()
+    try:
+        placements = {
+            (row.scope, row.scope_id): row.shard
+            for row in db.query(ShardPlacement).filter(
+                ((ShardPlacement.scope == CHANNEL) & (ShardPlacement.scope_id == channel["id"]))
+                | ((ShardPlacement.scope == CONVERSATION)
+                   & ShardPlacement.scope_id.in_([message["conversation_id"] for message in direct]))
+            )
+        }
+    finally:
+        db.close()
+    channel_shard = placements[(CHANNEL, channel["id"])]
+    direct_shards = [placements[(CONVERSATION, message["conversation_id"])] for message in direct]
+    return {
+        "new_channel_shard": channel_shard,
+        "new_channel_rows_on_shard": rows_on(channel_shard, Message.__table__, channel_id=channel["id"]),
+        "new_channel_rows_on_main": rows_on("main", Message.__table__, channel_id=channel["id"]),
+        "history_ok": [message["id"] for message in history] == [
+            message_id for message_id in reversed(sent) if message_id != sent[2]
+        ],
+        "edit_ok": edited["content"] == "edited" and next(
+            message for message in history if message["id"] == sent[1]
+        )["is_edited"],
+        "delete_ok": deleted.status_code == 200,
+        "thread_ok": [message["id"] for message in thread["replies"]] == [reply["id"]]
+        and thread["parent"]["reply_count"] == 1,
+        "direct_shards": direct_shards,
+        "direct_rows_on_shard": [
+            rows_on(shard, DirectMessage.__table__, id=message["id"]) for shard, message in zip(direct_shards, direct)
+        ],
+        "inbox_ok": [conversation["last_message"]["id"] for conversation in inbox["conversations"][:2]] == [
+            direct[1]["id"], direct[0]["id"]
+        ],
+    }
+
+
+async def online_move(client, headers: dict, args, channel_id: int) -> dict:
+    """Move the busy channel while a writer keeps posting to it"""
+    from app.models import Message
+    from app.sharding import CHANNEL, move, shard_router
+    from benchmarks.stats import LatencyRecorder
+
+    source = shard_router.pick_shard(CHANNEL, channel_id)
+    target = next(name for name in shard_router.shard_names() if name not in (source, "main"))
+    recorder = LatencyRecorder()
+    acknowledged = []
+
+    async def writer():
+        for index in range(args.writes):
+            started = time.perf_counter()
+            while True:
+                response = await client.post(
+                    "/api/messages/channel", json={"channel_id": channel_id, "content": f"during move {index}"},
+                    headers=headers
+                )
+                if response.status_code != 503:
+                    break
+                recorder.count("refused_503")
+                await asyncio.sleep(float(response.headers.get("retry-after", 1)) / 20)
+            response.raise_for_status()
+            acknowledged.append(response.json()["id"])
+            recorder.record("send", time.perf_counter() - started)
+            await asyncio.sleep(0.005)
+
+    async def mover():
+        # Let some writes land on the old shard first
+        await asyncio.sleep(0.1)
+        started = time.perf_counter()
+        moved = await asyncio.to_thread(move, CHANNEL, channel_id, target, args.batch_size, args.settle_seconds)
+        return moved, time.perf_counter() - started
+
+    started = time.perf_counter()
+    _, (moved, move_seconds) = await asyncio.gather(writer(), mover())
+    summary = recorder.summary(time.perf_counter() - started)
+
+    history = set()
+    page = 1
+    while True:
+        messages = (await client.get(
+            f"/api/messages/channel/{channel_id}", params={"page": page, "per_page": 100}, headers=headers
+        )).json()
+        if not messages:
+            break
+        history.update(message["id"] for message in messages)
+        page += 1
+    return {
+        "from": source,
+        "to": target,
+        "rows_moved": moved,
+        "move_seconds": round(move_seconds, 3),
+        "writer": summary,
+        "writes_refused_503": recorder.counters["refused_503"],
+        "acknowledged": len(acknowledged),
+        "acknowledged_in_history": sum(message_id in history for message_id in acknowledged),
+        "rows_left_on_source": rows_on(source, Message.__table__, channel_id=channel_id),
+        "rows_on_target": rows_on(target, Message.__table__, channel_id=channel_id),
+    }
+
+
+async def run(args, workspace) -> dict:
+    import httpx
+    from app.auth import create_access_token
+    from app.main import app
+    from app.sharding import CHANNEL, move, shard_router, status
+
+    reader_id = 2
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': workspace.usernames[reader_id]})}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        before = await read_everything(client, headers, args.per_page)
+        moved = move_everything(args)
+        after = await read_everything(client, headers, args.per_page)
+        layout = status()
+        writes = await write_phase(client, headers, workspace)
+        online = await online_move(client, headers, args, workspace.busy_channel_id)
+
+    changed = sorted(key for key in before if before[key] != after.get(key))
+    return {
+        "shards": shard_router.shard_names(),
+        "move_everything": moved,
+        "layout_after_move": layout,
+        "reads_compared": len(before),
+        "reads_unchanged": not changed and before.keys() == after.keys(),
+        "reads_changed": changed[:10],
+        "writes": writes,
+        "online_move": online,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.shard_url:
+        shard_urls = dict(item.split("=", 1) for item in args.shard_url)
+    else:
+        directory = tempfile.mkdtemp(prefix="syncspace-shards-")
+        shard_urls = {f"s{index}": f"sqlite:///{directory}/s{index}.db" for index in range(1, args.shards + 1)}
+    env = configure_environment(
+        args.database_url, message_shard_urls=json.dumps(shard_urls), history_cache_ttl_seconds=0
+    )
+
+    from benchmarks.seed import SeedScale, seed
+
+    workspace = seed(env["DATABASE_URL"], SeedScale(users=args.users, messages=args.messages), args.seed)
+    spread_timestamps(env["DATABASE_URL"], args.users, args.threads)
+    results = asyncio.run(run(args, workspace))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from collections import Counter, defaultdict
+from typing import Dict, List
+import math
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sample list"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_samples)))
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+
+class LatencyRecorder:
+    """Collects per-operation latencies and errors during a benchmark run"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.counters: Counter = Counter()
+
+    def record(self, operation: str, seconds: float):
+        """Record one successful operation"""
+        self.samples[operation].append(seconds)
+
+    def error(self, operation: str):
+        """Record one failed operation"""
+        self.errors[operation] += 1
+
+    def count(self, name: str, amount: int = 1):
+        """Increment a free-form counter (frames received, bytes, ...)"""
+        self.counters[name] += amount
+
+    def summary(self, elapsed: float) -> dict:
+        """Throughput and latency percentiles (milliseconds) per operation"""
+        results = {}
+        for operation in sorted(set(self.samples) | set(self.errors)):
+            samples = sorted(self.samples.get(operation, []))
+            results[operation] = {
+                "count": len(samples),
+                "errors": self.errors.get(operation, 0),
+                "throughput_per_sec": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+                "p50_ms": round(percentile(samples, 50) * 1000, 3),
+                "p90_ms": round(percentile(samples, 90) * 1000, 3),
+                "p95_ms": round(percentile(samples, 95) * 1000, 3),
+                "p99_ms": round(percentile(samples, 99) * 1000, 3),
+                "max_ms": round(samples[-1] * 1000, 3) if samples else 0.0,
+            }
+        return results
@@ -0,0 +1,122 @@
+"""Frames/sec produced by typing indicators in a simulated busy channel.
+
+    python -m benchmarks.typing_fanout --members 2000 --typers 5 --keystroke-hz 8
+
+Runs the same keystroke stream twice against an in-process ConnectionManager:
+once rebroadcasting every event (the previous behaviour) and once through the
+coalescing TypingAggregator behind the inbound rate limits.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.typing_fanout")
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--typers", type=int, default=5)
+    parser.add_argument("--keystroke-hz", type=float, default=8.0, help="typing events per typer per second")
+    parser.add_argument("--flood-hz", type=float, default=0.0, help="extra typer sending at this rate")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+async def build_channel(members: int, channel_id: int = 1):
+    from app.websocket.connection_manager import ConnectionManager
+    from benchmarks.fakes import FakeWebSocket
+
+    manager = ConnectionManager()
+
+    async def skip_status_fanout(user_id, status):
+        pass
+
+    async def skip_channel_lookup(user_id):
+        return []
+
+    # Presence fan-out on connect is O(n^2) and not what is measured here
+    manager.broadcast_user_status = skip_status_fanout
+    # No database here: channels are subscribed explicitly below
+    manager.get_user_channel_ids = skip_channel_lookup
+    sockets = {}
+    for user_id in range(1, members + 1):
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, user_id)
+        await manager.subscribe_to_channel(user_id, channel_id)
+        sockets[user_id] = websocket
+    return manager, sockets
+
+
+async def run_mode(args, coalesced: bool, channel_id: int = 1) -> dict:
+    manager, sockets = await build_channel(args.members, channel_id)
+    typers = [(user_id, args.keystroke_hz) for user_id in range(1, args.typers + 1)]
+    if args.flood_hz:
+        typers.append((args.typers + 1, args.flood_hz))
+
+    events = {"sent": 0}
+
+    async def legacy_event(user_id):
+        await manager.broadcast_to_channel(json.dumps({
+            "type": "typing",
+            "data": {"user_id": user_id, "channel_id": channel_id, "typing": True}
+        }), channel_id)
+
+    async def typer(user_id, hz, deadline, rng):
+        from app.websocket.limits import ACCEPT
+
+        websocket = sockets[user_id]
+        frame = json.dumps({"type": "typing", "channel_id": channel_id, "typing": True})
+        while time.monotonic() < deadline:
+            await asyncio.sleep(rng.expovariate(hz))
+            events["sent"] += 1
+            if coalesced:
+                if await manager.admit(websocket, len(frame)) == ACCEPT:
+                    await manager.handle_message(websocket, json.loads(frame))
+            else:
+                await legacy_event(user_id)
+
+    started = time.monotonic()
+    deadline = started + args.duration
+    await asyncio.gather(*[
+        typer(user_id, hz, deadline, random.Random(user_id)) for user_id, hz in typers
+    ])
+    # Emit whatever the aggregator still has pending
+    if coalesced:
+        await manager.typing.flush()
+    elapsed = time.monotonic() - started
+
+    frames = sum(websocket.frames_sent for websocket in sockets.values())
+    payload_bytes = sum(websocket.bytes_sent for websocket in sockets.values())
+    return {
+        "typing_events": events["sent"],
+        "frames": frames,
+        "frames_per_sec": round(frames / elapsed, 1),
+        "bytes_per_sec": round(payload_bytes / elapsed, 1),
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+async def run(args) -> dict:
+    legacy = await run_mode(args, coalesced=False)
+    coalesced = await run_mode(args, coalesced=True)
+    return {
+        "legacy": legacy,
+        "coalesced": coalesced,
+        "frame_reduction": round(legacy["frames"] / max(coalesced["frames"], 1), 1),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment()
+    results = asyncio.run(run(args))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
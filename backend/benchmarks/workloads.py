@@ -0,0 +1,184 @@
+"""Mixed REST and WebSocket workloads driven against a running server"""
+from dataclasses import dataclass, field
+from typing import Dict, List
+import asyncio
+import json
+import random
+import time
+
+import httpx
+import websockets
+
+from benchmarks.seed import SeededWorkspace, random_sentence, WORDS
+from benchmarks.stats import LatencyRecorder
+
+
+@dataclass
+class WorkloadConfig:
+    duration: float = 20.0
+    concurrency: int = 32
+    mix: Dict[str, float] = field(default_factory=lambda: {
+        "login": 0.05,
+        "send": 0.30,
+        "history": 0.45,
+        "search": 0.20,
+    })
+    history_pages: int = 5
+    ws_clients: int = 1000
+    ws_connect_concurrency: int = 200
+    typing_interval: float = 2.0
+    ping_interval: float = 5.0
+
+
+async def _timed(recorder: LatencyRecorder, operation: str, request):
+    start = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        recorder.error(operation)
+        return None
+    if response.status_code >= 400:
+        recorder.error(operation)
+        return None
+    recorder.record(operation, time.perf_counter() - start)
+    return response
+
+
+async def rest_worker(
+    client: httpx.AsyncClient,
+    workspace: SeededWorkspace,
+    tokens: Dict[int, str],
+    config: WorkloadConfig,
+    recorder: LatencyRecorder,
+    rng: random.Random,
+    deadline: float,
+):
+    """Issue weighted random REST operations until the deadline"""
+    operations = list(config.mix)
+    weights = [config.mix[operation] for operation in operations]
+    user_ids = list(workspace.usernames)
+
+    while time.monotonic() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        user_id = rng.choice(user_ids)
+        headers = {"Authorization": f"Bearer {tokens[user_id]}"}
+        channel_id = rng.choice(workspace.user_channels[user_id])
+
+        if operation == "login":
+            request = client.post("/api/auth/login", json={
+                "username": workspace.usernames[user_id],
+                "password": workspace.password,
+            })
+        elif operation == "send":
+            request = client.post("/api/messages/channel", headers=headers, json={
+                "content": random_sentence(rng),
+                "channel_id": channel_id,
+            })
+        elif operation == "history":
+            request = client.get(f"/api/messages/channel/{channel_id}", headers=headers, params={
+                "page": rng.randint(1, config.history_pages),
+                "per_page": 50,
+            })
+        else:
+            request = client.post("/api/messages/search", headers=headers, json={
+                "query": rng.choice(WORDS),
+            })
+
+        await _timed(recorder, operation, request)
+
+
+async def run_rest_workload(
+    base_url: str,
+    workspace: SeededWorkspace,
+    tokens: Dict[int, str],
+    config: WorkloadConfig,
+    recorder: LatencyRecorder,
+    seed_value: int = 7,
+):
+    limits = httpx.Limits(max_connections=config.concurrency, max_keepalive_connections=config.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        deadline = time.monotonic() + config.duration
+        await asyncio.gather(*[
+            rest_worker(client, workspace, tokens, config, recorder, random.Random(seed_value + index), deadline)
+            for index in range(config.concurrency)
+        ])
+
+
+async def ws_client(
+    ws_url: str,
+    token: str,
+    channels: List[int],
+    config: WorkloadConfig,
+    recorder: LatencyRecorder,
+    connect_slots: asyncio.Semaphore,
+    start_event: asyncio.Event,
+    rng: random.Random,
+):
+    """One simulated browser tab: connect, join channels, type and ping"""
+    pending_pings: List[float] = []
+
+    async def receive(websocket):
+        async for raw in websocket:
+            recorder.count("ws_frames_received")
+            recorder.count("ws_bytes_received", len(raw))
+            frame_type = json.loads(raw).get("type")
+            recorder.count(f"ws_frames:{frame_type}")
+            if frame_type == "pong" and pending_pings:
+                recorder.record("ws_ping_rtt", time.perf_counter() - pending_pings.pop(0))
+
+    async with connect_slots:
+        start = time.perf_counter()
+        try:
+            websocket = await websockets.connect(f"{ws_url}?token={token}", open_timeout=60, max_queue=None)
+        except (OSError, websockets.WebSocketException, asyncio.TimeoutError):
+            recorder.error("ws_connect")
+            return
+        recorder.record("ws_connect", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for channel_id in channels:
+            await websocket.send(json.dumps({"type": "join_channel", "channel_id": channel_id}))
+        recorder.record("ws_join_channels", time.perf_counter() - start)
+
+    receiver = asyncio.create_task(receive(websocket))
+    try:
+        await start_event.wait()
+        deadline = time.monotonic() + config.duration
+        next_ping = time.monotonic() + rng.uniform(0, config.ping_interval)
+        while time.monotonic() < deadline:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * config.typing_interval)
+            channel_id = rng.choice(channels)
+            await websocket.send(json.dumps({"type": "typing", "channel_id": channel_id, "typing": True}))
+            recorder.count("ws_typing_sent")
+            if time.monotonic() >= next_ping:
+                pending_pings.append(time.perf_counter())
+                await websocket.send(json.dumps({"type": "ping"}))
+                next_ping += config.ping_interval
+    except websockets.WebSocketException:
+        recorder.error("ws_session")
+    finally:
+        receiver.cancel()
+        await websocket.close()
+
+
+async def run_ws_workload(
+    base_url: str,
+    workspace: SeededWorkspace,
+    tokens: Dict[int, str],
+    config: WorkloadConfig,
+    recorder: LatencyRecorder,
+    start_event: asyncio.Event,
+    seed_value: int = 11,
+):
+    """Ramp up `ws_clients` sockets (users are reused round-robin) and keep them busy"""
+    ws_url = base_url.replace("http://", "ws://") + "/ws"
+    connect_slots = asyncio.Semaphore(config.ws_connect_concurrency)
+    user_ids = list(workspace.usernames)
+    clients = []
+    for index in range(config.ws_clients):
+        user_id = user_ids[index % len(user_ids)]
+        clients.append(ws_client(
+            ws_url, tokens[user_id], workspace.user_channels[user_id], config,
+            recorder, connect_slots, start_event, random.Random(seed_value + index),
+        ))
+    await asyncio.gather(*clients)
@@ -0,0 +1,152 @@
+"""Impact of flooding /ws clients on well-behaved ones, with and without inbound limits.
+
+    python -m benchmarks.ws_fairness --good 200 --flooders 5 --duration 5
+
+Each simulated connection runs the same admit -> handle_message loop as
+`websocket_endpoint`, fed from an in-memory inbox. Well-behaved clients ping
+every 100 ms and record the round-trip until their pong is sent; flooders
+queue bursts of join_channel/typing/ping frames every millisecond.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.fakes import FakeWebSocket
+from benchmarks.report import run_metadata, write_report
+from benchmarks.stats import percentile
+
+FLOOD_FRAMES = [
+    json.dumps({"type": "join_channel", "channel_id": 1}),
+    json.dumps({"type": "typing", "channel_id": 1, "typing": True}),
+    json.dumps({"type": "ping"}),
+]
+
+
+class ProbeWebSocket(FakeWebSocket):
+    """Resolves pending pings when the server answers with a pong"""
+
+    def __init__(self):
+        super().__init__()
+        self.pending = []
+        self.rtts = []
+
+    async def send_text(self, data: str):
+        await super().send_text(data)
+        if self.pending and data == '{"type": "pong"}':
+            self.rtts.append(time.perf_counter() - self.pending.pop(0))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ws_fairness")
+    parser.add_argument("--good", type=int, default=200)
+    parser.add_argument("--flooders", type=int, default=5)
+    parser.add_argument("--flood-burst", type=int, default=200, help="frames a flooder queues per tick")
+    parser.add_argument("--ping-interval", type=float, default=0.1)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+async def run_scenario(args, limited: bool) -> dict:
+    from app.config import settings
+    from app.websocket.connection_manager import ConnectionManager
+    from app.websocket.limits import DROP, CLOSE
+
+    if not limited:
+        settings.ws_inbound_rate = settings.ws_user_inbound_rate = 1e9
+        settings.ws_inbound_burst = settings.ws_user_inbound_burst = 10 ** 9
+
+    manager = ConnectionManager()
+
+    async def skip_status_fanout(user_id, status):
+        pass
+
+    async def skip_channel_lookup(user_id):
+        return []
+
+    manager.broadcast_user_status = skip_status_fanout
+    # No database here: channels are subscribed explicitly below
+    manager.get_user_channel_ids = skip_channel_lookup
+    stats = {"flood_frames_sent": 0, "flood_frames_handled": 0, "flooders_closed": 0}
+    deadline = time.monotonic() + args.duration
+
+    async def serve(websocket, inbox: asyncio.Queue, flooder: bool):
+        # Mirrors the receive loop in app/websocket/endpoints.py
+        while True:
+            data = await inbox.get()
+            if data is None:
+                return
+            verdict = await manager.admit(websocket, len(data))
+            if verdict == DROP:
+                continue
+            if verdict == CLOSE:
+                stats["flooders_closed"] += flooder
+                await manager.disconnect(websocket)
+                return
+            if flooder:
+                stats["flood_frames_handled"] += 1
+            await manager.handle_message(websocket, json.loads(data))
+
+    async def good_client(websocket, inbox):
+        while time.monotonic() < deadline:
+            websocket.pending.append(time.perf_counter())
+            inbox.put_nowait(json.dumps({"type": "ping"}))
+            await asyncio.sleep(args.ping_interval)
+        inbox.put_nowait(None)
+
+    async def flooder(server_task, inbox):
+        frames = itertools.cycle(FLOOD_FRAMES)
+        while time.monotonic() < deadline and not server_task.done():
+            # A full socket buffer: the server can drain a whole burst without yielding
+            for frame in itertools.islice(frames, args.flood_burst):
+                inbox.put_nowait(frame)
+            stats["flood_frames_sent"] += args.flood_burst
+            await asyncio.sleep(0.001)
+        inbox.put_nowait(None)
+
+    tasks, good_sockets = [], []
+    for user_id in range(1, args.good + args.flooders + 1):
+        is_flooder = user_id > args.good
+        websocket = FakeWebSocket() if is_flooder else ProbeWebSocket()
+        await manager.connect(websocket, user_id)
+        await manager.subscribe_to_channel(user_id, 1)
+        inbox = asyncio.Queue()
+        server_task = asyncio.create_task(serve(websocket, inbox, is_flooder))
+        tasks.append(server_task)
+        if is_flooder:
+            tasks.append(asyncio.create_task(flooder(server_task, inbox)))
+        else:
+            good_sockets.append(websocket)
+            tasks.append(asyncio.create_task(good_client(websocket, inbox)))
+
+    await asyncio.gather(*tasks)
+    rtts = sorted(rtt for websocket in good_sockets for rtt in websocket.rtts)
+    expected_pongs = sum(len(websocket.rtts) + len(websocket.pending) for websocket in good_sockets)
+    return {
+        "good_pongs": len(rtts),
+        "good_pongs_missing": expected_pongs - len(rtts),
+        "good_rtt_p50_ms": round(percentile(rtts, 50) * 1000, 3),
+        "good_rtt_p95_ms": round(percentile(rtts, 95) * 1000, 3),
+        "good_rtt_p99_ms": round(percentile(rtts, 99) * 1000, 3),
+        **stats,
+    }
+
+
+async def run(args) -> dict:
+    limited = await run_scenario(args, limited=True)
+    unlimited = await run_scenario(args, limited=False)
+    return {"limited": limited, "unlimited": unlimited}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment()
+    results = asyncio.run(run(args))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""Bytes on the wire and CPU per event type, for each frame format and deflate setting.
+
+    python -m benchmarks.ws_payload --events 5000
+    python -m benchmarks.ws_payload --record traffic.ndjson   # save the mix
+    python -m benchmarks.ws_payload --traffic traffic.ndjson  # replay a saved mix
+
+Records the frames one client receives from an in-process ConnectionManager
+while a scripted traffic mix runs (channel messages, edits, deletes, direct
+messages, typing, presence bursts from peers reconnecting, and history bursts
+from `resume`). The recorded frames are then re-sent through each format
+(verbose JSON, compact codec) and each permessage-deflate setting using the
+same extension code as the server, and bytes and encode/compress time are
+reported per event type.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+# Event kind -> share of the scripted mix
+TRAFFIC_MIX = {
+    "new_message": 0.45,
+    "new_direct_message": 0.10,
+    "message_updated": 0.05,
+    "message_deleted": 0.03,
+    "typing": 0.20,
+    "presence_burst": 0.04,
+    "history_burst": 0.01,
+    "ping": 0.12,
+}
+
+CONTENTS = [
+    "ok",
+    "sounds good, merging now",
+    "Can someone take a look at the failing deploy? The migration step timed out again.",
+    "Here's the summary from today's sync: we agreed to move the launch by a week, "
+    "design will share the updated mocks on Thursday and QA starts Monday.",
+    "lgtm 👍",
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ws_payload")
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--peers", type=int, default=50, help="other connected users (presence and typing sources)")
+    parser.add_argument("--burst-size", type=int, default=50, help="events replayed by each history burst")
+    parser.add_argument(
+        "--deflate", nargs="+", default=["off", "6:12:5", "1:12:5", "6:15:8", "6:12:5:no-takeover"],
+        help="LEVEL:WINDOW_BITS:MEM_LEVEL[:no-takeover] or off"
+    )
+    parser.add_argument("--traffic", help="replay frames from an NDJSON file instead of recording")
+    parser.add_argument("--record", help="write the recorded frames to an NDJSON file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+def iso(rng) -> str:
+    return f"2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T1{rng.randint(0, 9)}:{rng.randint(10, 59)}:{rng.randint(10, 59)}.{rng.randint(0, 999999):06d}"
+
+
+def user_payload(rng, user_id: int) -> dict:
+    return {
+        "id": user_id,
+        "username": f"user{user_id}",
+        "email": f"user{user_id}@example.com",
+        "full_name": f"User Number {user_id}",
+        "avatar_url": None if rng.random() < 0.5 else f"https://cdn.example.com/avatars/{user_id}.png",
+        "is_active": True,
+        "is_online": rng.random() < 0.5,
+        "last_seen": iso(rng),
+        "created_at": iso(rng),
+    }
+
+
+class TrafficScript:
+    """Builds schema-valid event payloads for the scripted mix"""
+
+    def __init__(self, rng, peers: int):
+        from app.schemas import DirectMessage, Message
+
+        self.rng = rng
+        self.peers = peers
+        self.message_schema = Message
+        self.direct_message_schema = DirectMessage
+        self.next_message_id = 180000
+        self.next_direct_message_id = 52000
+        self.sent = []
+
+    def channel_message(self) -> dict:
+        rng = self.rng
+        self.next_message_id += rng.randint(1, 40)
+        sender_id = rng.randint(2, self.peers + 1)
+        parent_id = rng.choice(self.sent) if self.sent and rng.random() < 0.2 else None
+        message = {
+            "id": self.next_message_id,
+            "content": rng.choice(CONTENTS),
+            "message_type": "text",
+            "file_url": None,
+            "channel_id": 1,
+            "sender_id": sender_id,
+            "parent_message_id": parent_id,
+            "reply_count": 0,
+            "last_reply_at": None,
+            "is_edited": False,
+            "edited_at": None,
+            "created_at": iso(rng),
+            "sender": user_payload(rng, sender_id),
+        }
+        self.sent.append(message["id"])
+        return self.message_schema.model_validate(message).model_dump(mode="json")
+
+    def direct_message(self) -> dict:
+        rng = self.rng
+        self.next_direct_message_id += rng.randint(1, 40)
+        sender_id = rng.randint(2, self.peers + 1)
+        message = {
+            "id": self.next_direct_message_id,
+            "conversation_id": 900 + sender_id,
+            "content": rng.choice(CONTENTS),
+            "message_type": "text",
+            "file_url": None,
+            "sender_id": sender_id,
+            "receiver_id": 1,
+            "is_read": False,
+            "read_at": None,
+            "is_edited": False,
+            "edited_at": None,
+            "created_at": iso(rng),
+            "sender": user_payload(rng, sender_id),
+            "receiver": user_payload(rng, 1),
+        }
+        return self.direct_message_schema.model_validate(message).model_dump(mode="json")
+
+
+async def record_traffic(args) -> list:
+    """Run the scripted mix through a ConnectionManager and return the frames user 1 received"""
+    from app.websocket.connection_manager import ConnectionManager
+    from benchmarks.fakes import RecordingWebSocket, FakeWebSocket
+
+    rng = random.Random(args.seed)
+    manager = ConnectionManager()
+
+    async def skip_channel_lookup(user_id):
+        return []
+
+    # No database here: the channel is subscribed explicitly below
+    manager.get_user_channel_ids = skip_channel_lookup
+    client = RecordingWebSocket()
+    await manager.connect(client, 1)
+    await manager.subscribe_to_channel(1, 1)
+    peers = {}
+    for user_id in range(2, args.peers + 2):
+        peers[user_id] = FakeWebSocket()
+        await manager.connect(peers[user_id], user_id)
+        await manager.subscribe_to_channel(user_id, 1)
+
+    script = TrafficScript(rng, args.peers)
+    kinds, weights = zip(*TRAFFIC_MIX.items())
+    client.frames.clear()
+    while len(client.frames) < args.events:
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "new_message":
+            await manager.publish([1], {"type": "new_message", "data": script.channel_message()})
+        elif kind == "message_updated" and script.sent:
+            data = script.channel_message()
+            data.update(id=rng.choice(script.sent), is_edited=True, edited_at=iso(rng))
+            await manager.publish([1], {"type": "message_updated", "data": data})
+        elif kind == "message_deleted" and script.sent:
+            await manager.publish([1], {"type": "message_deleted", "data": {
+                "id": rng.choice(script.sent), "channel_id": 1, "parent_message_id": None
+            }})
+        elif kind == "new_direct_message":
+            await manager.publish([1], {"type": "new_direct_message", "data": script.direct_message()})
+        elif kind == "typing":
+            for user_id in rng.sample(sorted(peers), rng.randint(1, 4)):
+                manager.typing.update(1, user_id, True)
+            await manager.typing.flush()
+            manager.typing.typing.clear()
+        elif kind == "presence_burst":
+            # A handful of peers dropping and reconnecting (e.g. a flaky office network)
+            for user_id in rng.sample(sorted(peers), min(5, len(peers))):
+                await manager.disconnect(peers[user_id])
+                peers[user_id] = FakeWebSocket()
+                await manager.connect(peers[user_id], user_id)
+                await manager.subscribe_to_channel(user_id, 1)
+        elif kind == "history_burst":
+            await manager.handle_message(client, {"type": "resume", "last_seq": max(0, await current_seq(1) - args.burst_size)})
+        elif kind == "ping":
+            await manager.handle_message(client, {"type": "ping"})
+
+    if manager.typing._task:
+        manager.typing._task.cancel()
+    return client.frames[:args.events]
+
+
+async def current_seq(user_id: int) -> int:
+    from app.redis_client import event_log
+
+    return await event_log.current_seq(user_id) or 0
+
+
+def deflate_extension(spec: str):
+    from websockets.extensions.permessage_deflate import PerMessageDeflate
+
+    if spec == "off":
+        return None
+    parts = spec.split(":")
+    level, window_bits, mem_level = (int(part) for part in parts[:3])
+    no_takeover = len(parts) > 3 and parts[3] == "no-takeover"
+    return PerMessageDeflate(
+        remote_no_context_takeover=False,
+        local_no_context_takeover=no_takeover,
+        remote_max_window_bits=window_bits,
+        local_max_window_bits=window_bits,
+        compress_settings={"level": level, "memLevel": mem_level},
+    )
+
+
+def measure(frames: list, frame_format: str, spec: str) -> dict:
+    """Per event type: mean raw bytes, wire bytes and microseconds to encode and compress"""
+    from websockets.frames import Frame, Opcode
+    from app.websocket.codec import compact_codec
+
+    extension = deflate_extension(spec)
+    events = [json.loads(frame) for frame in frames]
+    totals = defaultdict(lambda: defaultdict(float))
+    for frame, event in zip(frames, events):
+        start = time.perf_counter()
+        if frame_format == "compact":
+            # What the server does: one transcode of the verbose frame
+            text = compact_codec.transcode(frame)
+        else:
+            text = json.dumps(event)
+        encoded_at = time.perf_counter()
+        data = text.encode()
+        wire = len(data)
+        if extension is not None:
+            wire = len(extension.encode(Frame(Opcode.TEXT, data)).data)
+        compressed_at = time.perf_counter()
+
+        stats = totals[event.get("type")]
+        stats["frames"] += 1
+        stats["raw_bytes"] += len(data)
+        stats["wire_bytes"] += wire
+        stats["encode_us"] += (encoded_at - start) * 1e6
+        stats["deflate_us"] += (compressed_at - encoded_at) * 1e6
+
+    per_type = {
+        event_type: {
+            "frames": int(stats["frames"]),
+            "raw_bytes_mean": round(stats["raw_bytes"] / stats["frames"], 1),
+            "wire_bytes_mean": round(stats["wire_bytes"] / stats["frames"], 1),
+            "encode_us_mean": round(stats["encode_us"] / stats["frames"], 2),
+            "deflate_us_mean": round(stats["deflate_us"] / stats["frames"], 2),
+        }
+        for event_type, stats in sorted(totals.items())
+    }
+    return {
+        "wire_bytes_total": int(sum(stats["wire_bytes"] for stats in totals.values())),
+        "cpu_us_total": round(sum(stats["encode_us"] + stats["deflate_us"] for stats in totals.values()), 1),
+        "per_type": per_type,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment()
+
+    if args.traffic:
+        with open(args.traffic) as traffic:
+            frames = [line.rstrip("\n") for line in traffic if line.strip()]
+    else:
+        frames = asyncio.run(record_traffic(args))
+    if args.record:
+        with open(args.record, "w") as record:
+            record.writelines(frame + "\n" for frame in frames)
+
+    results = {}
+    baseline = sum(len(frame.encode()) for frame in frames)
+    for frame_format in ("json", "compact"):
+        for spec in args.deflate:
+            result = measure(frames, frame_format, spec)
+            result["bytes_vs_uncompressed_json"] = round(result["wire_bytes_total"] / baseline, 3)
+            results[f"{frame_format}/deflate={spec}"] = result
+
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Time from WebSocket connect to being subscribed, for a user in many channels.
+
+    python -m benchmarks.ws_subscribe --channels 500
+
+Connects one user through an in-process ConnectionManager and compares:
+server-side auto-subscription with a cold membership cache (one query), with a
+warm cache (no query), and the old client-driven flow of one join_channel frame
+per channel, each of which is now authorized against the database.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.env import configure_environment
+from benchmarks.report import run_metadata, write_report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ws_subscribe")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+def seed_channels(database_url: str, channels: int):
+    """One user in one team, member of `channels` public channels"""
+    from sqlalchemy import create_engine, insert
+    from app.models import Base, User, Team, Channel, team_members, channel_members
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [{
+            "id": 1, "username": "bench_user_1", "email": "bench_user_1@example.com",
+            "hashed_password": "-", "is_active": True,
+        }])
+        conn.execute(insert(Team.__table__), [{"id": 1, "name": "Bench Team", "is_public": True, "created_by": 1}])
+        conn.execute(insert(team_members), [{"user_id": 1, "team_id": 1, "role": "member"}])
+        conn.execute(insert(Channel.__table__), [
+            {"id": channel_id, "name": f"channel-{channel_id}", "is_private": False, "team_id": 1, "created_by": 1}
+            for channel_id in range(1, channels + 1)
+        ])
+        conn.execute(insert(channel_members), [
+            {"user_id": 1, "channel_id": channel_id} for channel_id in range(1, channels + 1)
+        ])
+    engine.dispose()
+
+
+async def run(args) -> dict:
+    from sqlalchemy import event
+    from app.database import engine
+    from app.redis_client import cache_manager
+    from app.websocket.connection_manager import ConnectionManager
+    from benchmarks.fakes import FakeWebSocket
+    from benchmarks.stats import LatencyRecorder
+
+    statements = {"count": 0}
+
+    def count_statement(*_):
+        statements["count"] += 1
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+
+    async def skip_status_fanout(user_id, status):
+        pass
+
+    async def no_channels(user_id):
+        return []
+
+    recorder = LatencyRecorder()
+    sql = {}
+
+    async def measure(mode: str, join_frames: bool = False, cold: bool = False, auto_subscribe: bool = True):
+        manager = ConnectionManager()
+        manager.broadcast_user_status = skip_status_fanout
+        if not auto_subscribe:
+            manager.get_user_channel_ids = no_channels
+        statements["count"] = 0
+        for _ in range(args.repeat):
+            if cold:
+                await cache_manager.invalidate_user_channels(1)
+            websocket = FakeWebSocket()
+            start = time.perf_counter()
+            await manager.connect(websocket, 1)
+            if join_frames:
+                for channel_id in range(1, args.channels + 1):
+                    await manager.handle_message(websocket, {"type": "join_channel", "channel_id": channel_id})
+            recorder.record(mode, time.perf_counter() - start)
+            assert len(manager.registry.user_channel_ids(1)) == args.channels
+            await manager.disconnect(websocket)
+        sql[mode] = round(statements["count"] / args.repeat, 1)
+
+    started = time.perf_counter()
+    await measure("auto_subscribe_cold_cache", cold=True)
+    await measure("auto_subscribe_warm_cache")
+    await measure("join_channel_frames", join_frames=True, auto_subscribe=False)
+    latency = recorder.summary(time.perf_counter() - started)
+
+    return {
+        mode: {
+            "p50_ms": latency[mode]["p50_ms"],
+            "p95_ms": latency[mode]["p95_ms"],
+            "sql_statements_per_connect": sql[mode],
+        }
+        for mode in latency
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = configure_environment(args.database_url)
+    seed_channels(env["DATABASE_URL"], args.channels)
+    results = asyncio.run(run(args))
+    write_report({"meta": run_metadata(), "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
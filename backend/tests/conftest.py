@@ -0,0 +1,128 @@
+"""Shared fixtures: the app client, a fresh schema and Redis per test, and helpers to create users and channels.
+
+The app reads its settings on first use, so the environment is set here before
+any `app` module is imported. TEST_DATABASE_URL points the tests at another
+database (the schema is dropped and created per test); unset, or an in-memory
+SQLite URL that the app's threads could not share, means a SQLite file in a
+temp dir. Redis is always the memory:// stand-in.
+
+Every test shares one `TestClient`, entered once: requests, sockets and
+`client.portal.call(...)` then all run on its event loop, which the Redis
+client is bound to after first use.
+"""
+import itertools
+import os
+import tempfile
+
+database_url = os.environ.get("TEST_DATABASE_URL", "")
+if database_url in ("", "sqlite://", "sqlite:///:memory:"):
+    database_url = f"sqlite:///{tempfile.mkdtemp(prefix='syncspace-test-')}/test.db"
+os.environ["DATABASE_URL"] = os.environ["TEST_DATABASE_URL"] = database_url
+os.environ["REDIS_URL"] = "memory://"
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ["SQL_ECHO"] = "false"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+# Background tasks the tests do not exercise
+os.environ["NOTIFICATION_WORKER_ENABLED"] = "false"
+os.environ["LOOP_MONITOR_ENABLED"] = "false"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.auth import create_access_token
+from app.config import get_settings
+from app.database import Base, SessionLocal, get_engine
+from app.main import app
+from app.models import Channel, Team, User, channel_members, team_members
+from app.redis_client import redis_client
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(client):
+    """Empty tables and Redis before every test"""
+    engine = get_engine()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    client.portal.call(redis_client.flushall)
+
+
+@pytest.fixture
+def settings():
+    """The app's settings object, for tests to override with `monkeypatch.setattr`"""
+    return get_settings()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def create_user(db, is_superuser: bool = False) -> User:
+    username = f"test_user_{next(_ids)}"
+    user = User(
+        username=username,
+        email=f"{username}@example.com",
+        # Never logged in with a password; tests authenticate with tokens
+        hashed_password="!",
+        is_active=True,
+        is_superuser=is_superuser,
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def create_team(db, members=(), admins=()) -> Team:
+    creator = next(iter([*admins, *members]), None)
+    team = Team(name=f"Team {next(_ids)}", is_public=True, created_by=creator.id if creator else None)
+    db.add(team)
+    db.flush()
+    for user, role in [(user, "member") for user in members] + [(user, "admin") for user in admins]:
+        db.execute(team_members.insert().values(user_id=user.id, team_id=team.id, role=role))
+    db.commit()
+    db.refresh(team)
+    return team
+
+
+def create_channel(db, team: Team, members=(), is_private: bool = False) -> Channel:
+    """A channel of `team` joined by `members` (who should be team members too)"""
+    channel = Channel(name=f"channel-{next(_ids)}", team_id=team.id, is_private=is_private)
+    db.add(channel)
+    db.flush()
+    for user in members:
+        db.execute(channel_members.insert().values(user_id=user.id, channel_id=channel.id))
+    db.commit()
+    db.refresh(channel)
+    return channel
+
+
+def token_for(user: User) -> str:
+    return create_access_token({"sub": user.username})
+
+
+def auth_headers(user: User) -> dict:
+    return {"Authorization": f"Bearer {token_for(user)}"}
+
+
+def send_message(client, sender: User, channel: Channel, content: str, parent_message_id=None) -> dict:
+    """Post a channel message (or a reply) over the API and return it"""
+    response = client.post(
+        "/api/messages/channel",
+        json={"channel_id": channel.id, "content": content, "parent_message_id": parent_message_id},
+        headers=auth_headers(sender)
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
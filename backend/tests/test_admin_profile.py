@@ -0,0 +1,25 @@
+"""Guards of the on-demand profiler endpoint (app.api.admin)"""
+from app import loop_monitor
+from tests.conftest import auth_headers, create_user
+
+
+def test_profile_longer_than_the_cap_is_rejected_with_422(client, db, settings):
+    admin = create_user(db, is_superuser=True)
+
+    response = client.get(
+        "/api/admin/profile", params={"seconds": settings.profiler_max_seconds + 1}, headers=auth_headers(admin)
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == f"seconds must be at most {settings.profiler_max_seconds}"
+
+
+def test_second_profile_on_a_worker_is_rejected_with_409(client, db):
+    admin = create_user(db, is_superuser=True)
+
+    # Held by the profile already running
+    with loop_monitor._profile_lock:
+        response = client.get("/api/admin/profile", params={"seconds": 0.05}, headers=auth_headers(admin))
+    assert response.status_code == 409
+
+    response = client.get("/api/admin/profile", params={"seconds": 0.05}, headers=auth_headers(admin))
+    assert response.status_code == 200
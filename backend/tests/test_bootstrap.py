@@ -0,0 +1,65 @@
+"""Read markers, unread counts and the cached part of GET /api/bootstrap"""
+from tests.conftest import auth_headers, create_channel, create_team, create_user, send_message
+
+
+def bootstrap_channels(client, user) -> dict:
+    response = client.get("/api/bootstrap", headers=auth_headers(user))
+    assert response.status_code == 200
+    return {channel["id"]: channel for channel in response.json()["channels"]}
+
+
+def test_read_marker_only_moves_to_a_message_of_the_channel(client, db):
+    sender, reader = create_user(db), create_user(db)
+    team = create_team(db, members=[sender, reader])
+    channel = create_channel(db, team, members=[sender, reader])
+    other = create_channel(db, team, members=[sender])
+    send_message(client, sender, channel, "unread")
+    elsewhere = send_message(client, sender, other, "newer, in another channel")
+
+    response = client.post(
+        f"/api/channels/{channel.id}/read", params={"message_id": elsewhere["id"]}, headers=auth_headers(reader)
+    )
+    assert response.status_code == 404
+    assert bootstrap_channels(client, reader)[channel.id]["unread_count"] == 1
+
+
+def test_unread_counts_are_top_level_messages_past_the_read_marker(client, db):
+    sender, reader = create_user(db), create_user(db)
+    team = create_team(db, members=[sender, reader])
+    channel = create_channel(db, team, members=[sender, reader])
+    root = send_message(client, sender, channel, "one")
+    send_message(client, sender, channel, "two")
+    send_message(client, sender, channel, "a reply", parent_message_id=root["id"])
+    client.post("/api/messages/direct", json={"receiver_id": reader.id, "content": "dm"}, headers=auth_headers(sender))
+
+    response = client.get("/api/bootstrap", headers=auth_headers(reader))
+    assert response.json()["channels"][0]["unread_count"] == 2
+    assert response.json()["direct_unread_count"] == 1
+    # Senders have read their own messages
+    assert bootstrap_channels(client, sender)[channel.id]["unread_count"] == 0
+
+    response = client.post(f"/api/channels/{channel.id}/read", headers=auth_headers(reader))
+    assert response.status_code == 200
+    assert bootstrap_channels(client, reader)[channel.id]["unread_count"] == 0
+
+
+def test_cached_memberships_are_dropped_when_the_user_changes_them(client, db):
+    user, teammate = create_user(db), create_user(db)
+    team = create_team(db, members=[user, teammate])
+    joinable = create_channel(db, team, members=[teammate])
+    send_message(client, teammate, joinable, "before joining")
+    assert bootstrap_channels(client, user)[joinable.id]["is_member"] is False
+
+    # Someone else's change waits for the cache entry to expire
+    later = create_channel(db, team, members=[teammate])
+    assert later.id not in bootstrap_channels(client, user)
+
+    # The user's own membership change drops it
+    assert client.post(f"/api/channels/{joinable.id}/join", headers=auth_headers(user)).status_code == 200
+    channels = bootstrap_channels(client, user)
+    assert channels[joinable.id]["is_member"] is True
+    assert later.id in channels
+    # Joined with the history read; unread counts are never cached
+    assert channels[joinable.id]["unread_count"] == 0
+    send_message(client, teammate, joinable, "after joining")
+    assert bootstrap_channels(client, user)[joinable.id]["unread_count"] == 1
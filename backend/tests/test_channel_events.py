@@ -0,0 +1,94 @@
+"""Live delivery of channel message events to subscribed sockets"""
+import time
+
+from app.websocket.connection_manager import manager
+from tests.conftest import create_channel, create_team, create_user, send_message, token_for
+
+
+def settle(websocket):
+    """Wait until the server has handled every frame sent before"""
+    websocket.send_json({"type": "ping"})
+    assert websocket.receive_json() == {"type": "pong"}
+
+
+def frames_until_pong(websocket) -> list:
+    """Frames received before the answer to a ping, which also arrive in between (presence, typing)"""
+    websocket.send_json({"type": "ping"})
+    events = []
+    while (event := websocket.receive_json()) != {"type": "pong"}:
+        events.append(event)
+    return events
+
+
+def test_team_member_subscribed_with_join_channel_receives_new_message(client, db):
+    sender, watcher = create_user(db), create_user(db)
+    team = create_team(db, members=[sender, watcher])
+    channel = create_channel(db, team, members=[sender])
+
+    with client.websocket_connect(f"/ws?token={token_for(watcher)}") as websocket:
+        websocket.send_json({"type": "join_channel", "channel_id": channel.id})
+        settle(websocket)
+        message = send_message(client, sender, channel, "hello")
+        websocket.send_json({"type": "ping"})
+
+        event = websocket.receive_json()
+        assert event["type"] == "new_message"
+        assert websocket.receive_json() == {"type": "pong"}
+    assert event["data"]["id"] == message["id"]
+    # Not a member: the event is not in their log, so it carries no seq
+    assert "seq" not in event
+
+
+def test_member_who_left_over_the_socket_stops_receiving_messages(client, db):
+    sender, member = create_user(db), create_user(db)
+    team = create_team(db, members=[sender, member])
+    channel = create_channel(db, team, members=[sender, member])
+
+    with client.websocket_connect(f"/ws?token={token_for(member)}") as websocket:
+        send_message(client, sender, channel, "before")
+        event = websocket.receive_json()
+        assert event["type"] == "new_message" and event["seq"] == 1
+
+        websocket.send_json({"type": "leave_channel", "channel_id": channel.id})
+        settle(websocket)
+        send_message(client, sender, channel, "after")
+        settle(websocket)
+
+
+def test_channel_ids_that_are_not_integers_are_refused(client, db):
+    user = create_user(db)
+    # Subscribed somewhere, so the registry has channel ids to compare against
+    create_channel(db, create_team(db, members=[user]), members=[user])
+
+    with client.websocket_connect(f"/ws?token={token_for(user)}") as websocket:
+        for channel_id in ("7", [1], True):
+            websocket.send_json({"type": "join_channel", "channel_id": channel_id})
+            websocket.send_json({"type": "ping"})
+            error = websocket.receive_json()
+            assert error["type"] == "error" and error["data"]["channel_id"] == channel_id
+            assert websocket.receive_json() == {"type": "pong"}
+        websocket.send_json({"type": "leave_channel", "channel_id": "7"})
+        websocket.send_json({"type": "typing", "channel_id": [1], "typing": True})
+        settle(websocket)
+
+
+def test_leaving_a_channel_clears_the_typing_indicator(client, db, monkeypatch):
+    typist, watcher = create_user(db), create_user(db)
+    team = create_team(db, members=[typist, watcher])
+    channel = create_channel(db, team, members=[typist, watcher])
+    monkeypatch.setattr(manager.typing, "flush_interval", 0.05)
+
+    with client.websocket_connect(f"/ws?token={token_for(watcher)}") as watching:
+        with client.websocket_connect(f"/ws?token={token_for(typist)}") as typing:
+            typing.send_json({"type": "typing", "channel_id": channel.id, "typing": True})
+            event = watching.receive_json()
+            while event["type"] != "typing":
+                event = watching.receive_json()
+            assert event["data"]["user_ids"] == [typist.id]
+
+            typing.send_json({"type": "leave_channel", "channel_id": channel.id})
+            frames_until_pong(typing)
+            # Well before the typing indicator would expire on its own
+            time.sleep(0.3)
+            events = frames_until_pong(watching)
+    assert {"type": "typing", "data": {"channel_id": channel.id, "user_ids": []}} in events
@@ -0,0 +1,62 @@
+"""DM conversations: the inbox and per-participant unread counts (app.api.messages)"""
+from tests.conftest import auth_headers, create_user
+
+
+def send_direct(client, sender, receiver, content: str) -> dict:
+    response = client.post(
+        "/api/messages/direct", json={"receiver_id": receiver.id, "content": content}, headers=auth_headers(sender)
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def inbox(client, user, **params) -> dict:
+    response = client.get("/api/messages/conversations", params=params, headers=auth_headers(user))
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_unread_count_grows_for_the_receiver_and_resets_when_read(client, db):
+    alice, bob = create_user(db), create_user(db)
+    send_direct(client, alice, bob, "one")
+    last = send_direct(client, alice, bob, "two")
+
+    [received] = inbox(client, bob)["conversations"]
+    assert received["other_user"]["id"] == alice.id
+    assert received["unread_count"] == 2
+    assert received["last_message"]["id"] == last["id"]
+    # Senders have read their own messages
+    [sent] = inbox(client, alice)["conversations"]
+    assert sent["unread_count"] == 0 and sent["last_read_message_id"] == last["id"]
+
+    response = client.post(f"/api/messages/conversations/{received['id']}/read", headers=auth_headers(bob))
+    assert response.status_code == 200
+    [received] = inbox(client, bob)["conversations"]
+    assert received["unread_count"] == 0 and received["last_read_message_id"] == last["id"]
+
+    # A reply counts for the other side only
+    send_direct(client, bob, alice, "three")
+    assert inbox(client, alice)["conversations"][0]["unread_count"] == 1
+    assert inbox(client, bob)["conversations"][0]["unread_count"] == 0
+
+
+def test_inbox_lists_the_latest_conversation_first_and_pages(client, db):
+    me, old, recent = create_user(db), create_user(db), create_user(db)
+    send_direct(client, old, me, "earlier")
+    send_direct(client, recent, me, "later")
+
+    page = inbox(client, me, limit=1)
+    assert [conversation["other_user"]["id"] for conversation in page["conversations"]] == [recent.id]
+    page = inbox(client, me, limit=1, before_id=page["next_before_id"])
+    assert [conversation["other_user"]["id"] for conversation in page["conversations"]] == [old.id]
+    assert page["next_before_id"] is None
+
+
+def test_only_participants_can_mark_a_conversation_read(client, db):
+    alice, bob, eve = create_user(db), create_user(db), create_user(db)
+    send_direct(client, alice, bob, "hi")
+    conversation_id = inbox(client, bob)["conversations"][0]["id"]
+
+    response = client.post(f"/api/messages/conversations/{conversation_id}/read", headers=auth_headers(eve))
+    assert response.status_code == 404
+    assert inbox(client, bob)["conversations"][0]["unread_count"] == 1
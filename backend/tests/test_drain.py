@@ -0,0 +1,49 @@
+"""Graceful drain of a worker's WebSockets on shutdown (ConnectionManager.start_drain)"""
+from contextlib import ExitStack
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.websocket.connection_manager import manager
+from tests.conftest import create_user, token_for
+
+
+@pytest.fixture
+def draining(client, settings, monkeypatch):
+    """Start a 1 s drain on demand; the shared manager takes sockets again afterwards"""
+    monkeypatch.setattr(settings, "ws_drain_window_seconds", 1.0)
+    monkeypatch.setattr(settings, "ws_drain_close_grace_seconds", 0.2)
+    monkeypatch.setattr(settings, "presence_handoff_seconds", 0)
+    yield lambda: client.portal.call(manager.start_drain)
+    client.portal.call(manager.drain)
+    manager.draining, manager._drain_task = False, None
+
+
+def reconnect_after_ms(websocket) -> int:
+    while True:
+        event = websocket.receive_json()
+        if event["type"] == "reconnect":
+            return event["data"]["after_ms"]
+
+
+def test_reconnects_are_spread_over_the_window_and_new_sockets_are_refused(client, db, draining):
+    users = [create_user(db) for _ in range(5)]
+
+    with ExitStack() as stack:
+        sockets = [stack.enter_context(client.websocket_connect(f"/ws?token={token_for(user)}")) for user in users]
+        draining()
+        delays = sorted(reconnect_after_ms(websocket) for websocket in sockets)
+
+        with pytest.raises(WebSocketDisconnect) as refused:
+            with client.websocket_connect(f"/ws?token={token_for(users[0])}"):
+                pass
+        assert refused.value.code == 1013
+
+        # Closed by the drain once each delay and the grace have passed
+        for websocket in sockets:
+            with pytest.raises(WebSocketDisconnect) as closed:
+                reconnect_after_ms(websocket)
+            assert closed.value.code == 1012
+
+    # One client in each fifth of the 1 s window
+    assert [after_ms // 200 for after_ms in delays] == [0, 1, 2, 3, 4]
@@ -0,0 +1,63 @@
+"""NDJSON channel export: resuming with after_id and the filters (GET /api/messages/channel/{id}/export)"""
+from datetime import datetime
+
+import orjson
+
+from app.models import Message
+from tests.conftest import auth_headers, create_channel, create_team, create_user, send_message
+
+
+def export(client, user, channel, **params) -> list:
+    response = client.get(f"/api/messages/channel/{channel.id}/export", params=params, headers=auth_headers(user))
+    assert response.status_code == 200
+    # The client undoes Content-Encoding: gzip
+    assert response.headers.get("content-encoding") == ("gzip" if params.get("gzip") else None)
+    return [orjson.loads(line) for line in response.content.splitlines()]
+
+
+def ids(lines: list) -> list:
+    return [line["id"] for line in lines]
+
+
+def test_export_resumes_after_the_last_id_received(client, db, settings, monkeypatch):
+    # Several batches, to cover the keyset paging between them
+    monkeypatch.setattr(settings, "export_batch_size", 2)
+    user = create_user(db)
+    channel = create_channel(db, create_team(db, members=[user]), members=[user])
+    sent = [send_message(client, user, channel, f"message {index}")["id"] for index in range(5)]
+
+    full = export(client, user, channel)
+    assert ids(full) == sent
+    assert [line["content"] for line in full] == [f"message {index}" for index in range(5)]
+    # Stopped after the second line
+    assert ids(export(client, user, channel, after_id=full[1]["id"])) == sent[2:]
+    assert ids(export(client, user, channel, gzip=True)) == sent
+
+
+def test_export_filters(client, db):
+    user = create_user(db)
+    channel = create_channel(db, create_team(db, members=[user]), members=[user])
+    old = send_message(client, user, channel, "old")
+    root = send_message(client, user, channel, "root")
+    reply = send_message(client, user, channel, "reply", parent_message_id=root["id"])
+    other = send_message(client, user, channel, "other")
+    for message_id, day in ((old["id"], 1), (root["id"], 2), (reply["id"], 2), (other["id"], 3)):
+        db.query(Message).filter(Message.id == message_id).update({Message.created_at: datetime(2024, 1, day, 12)})
+    db.commit()
+
+    assert ids(export(client, user, channel, include_replies=False)) == [old["id"], root["id"], other["id"]]
+    assert ids(export(client, user, channel, thread_id=root["id"])) == [root["id"], reply["id"]]
+    # since is inclusive, until exclusive
+    assert ids(export(client, user, channel, since="2024-01-02T00:00:00", until="2024-01-03T12:00:00")) == [
+        root["id"], reply["id"]
+    ]
+
+
+def test_export_needs_channel_access(client, db):
+    member, outsider = create_user(db), create_user(db)
+    team = create_team(db, members=[member])
+    channel = create_channel(db, team, members=[member], is_private=True)
+    send_message(client, member, channel, "private")
+
+    response = client.get(f"/api/messages/channel/{channel.id}/export", headers=auth_headers(outsider))
+    assert response.status_code == 403
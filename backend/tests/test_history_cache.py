@@ -0,0 +1,44 @@
+"""Channel history ETags and the channel version behind them (GET /api/messages/channel/{id})"""
+from tests.conftest import auth_headers, create_channel, create_team, create_user, send_message
+
+
+def history(client, user, channel, etag=None):
+    headers = {**auth_headers(user), **({"If-None-Match": etag} if etag else {})}
+    return client.get(f"/api/messages/channel/{channel.id}", headers=headers)
+
+
+def test_unchanged_history_is_not_modified(client, db):
+    user = create_user(db)
+    channel = create_channel(db, create_team(db, members=[user]), members=[user])
+    send_message(client, user, channel, "hello")
+
+    first = history(client, user, channel)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    again = history(client, user, channel, etag)
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+    # Served from the cached page, same body
+    assert history(client, user, channel).json() == first.json()
+
+
+def test_edit_and_delete_bump_the_version(client, db):
+    user = create_user(db)
+    channel = create_channel(db, create_team(db, members=[user]), members=[user])
+    message = send_message(client, user, channel, "hello")
+    etag = history(client, user, channel).headers["ETag"]
+
+    response = client.put(f"/api/messages/{message['id']}", json={"content": "edited"}, headers=auth_headers(user))
+    assert response.status_code == 200
+    edited = history(client, user, channel, etag)
+    assert edited.status_code == 200
+    assert edited.headers["ETag"] != etag
+    assert [message["content"] for message in edited.json()] == ["edited"]
+
+    etag = edited.headers["ETag"]
+    assert client.delete(f"/api/messages/{message['id']}", headers=auth_headers(user)).status_code == 200
+    deleted = history(client, user, channel, etag)
+    assert deleted.status_code == 200
+    assert deleted.headers["ETag"] != etag
+    assert deleted.json() == []
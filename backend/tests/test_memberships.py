@@ -0,0 +1,111 @@
+"""Adding many users to a team or a channel in one request (POST /api/teams/{id}/members, /api/channels/{id}/members)"""
+import pytest
+from sqlalchemy.dialects import mysql
+
+from app.database import insert_ignore_statement
+from app.models import Channel, channel_members, team_members
+from tests.conftest import auth_headers, create_channel, create_team, create_user, send_message
+
+MISSING_USER_ID = 999999
+
+
+def add_members(client, user, path: str, user_ids: list):
+    return client.post(path, json={"user_ids": user_ids}, headers=auth_headers(user))
+
+
+def members_of(db, table, **where) -> list:
+    return sorted(user_id for user_id, in db.query(table.c.user_id).filter_by(**where))
+
+
+def test_team_members_are_split_into_added_already_members_and_rejected(client, db):
+    admin, member, newcomer, other = create_user(db), create_user(db), create_user(db), create_user(db)
+    team = create_team(db, members=[member], admins=[admin])
+
+    user_ids = [newcomer.id, member.id, MISSING_USER_ID, other.id, newcomer.id]
+    response = add_members(client, admin, f"/api/teams/{team.id}/members", user_ids)
+    assert response.status_code == 200
+    # In request order, each user once
+    assert response.json() == {
+        "added": [newcomer.id, other.id], "already_members": [member.id], "rejected": [MISSING_USER_ID],
+    }
+    assert members_of(db, team_members, team_id=team.id) == sorted([admin.id, member.id, newcomer.id, other.id])
+
+    # The same request again adds nothing
+    again = add_members(client, admin, f"/api/teams/{team.id}/members", user_ids).json()
+    assert again == {
+        "added": [], "already_members": [newcomer.id, member.id, other.id], "rejected": [MISSING_USER_ID],
+    }
+    assert len(members_of(db, team_members, team_id=team.id)) == 4
+
+
+def test_only_team_admins_add_team_members(client, db):
+    member, newcomer = create_user(db), create_user(db)
+    team = create_team(db, members=[member])
+
+    response = add_members(client, member, f"/api/teams/{team.id}/members", [newcomer.id])
+    assert response.status_code == 403
+    assert members_of(db, team_members, team_id=team.id) == [member.id]
+
+
+def test_team_member_requests_are_capped(client, db, settings, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_membership_max_users", 2)
+    admin = create_user(db)
+    team = create_team(db, admins=[admin])
+    users = [create_user(db) for _ in range(3)]
+
+    response = add_members(client, admin, f"/api/teams/{team.id}/members", [user.id for user in users])
+    assert response.status_code == 400
+    # Duplicates count once
+    ids = [users[0].id, users[1].id, users[0].id]
+    assert add_members(client, admin, f"/api/teams/{team.id}/members", ids).status_code == 200
+
+
+def test_channel_members_are_split_into_added_already_members_and_rejected(client, db):
+    admin, member, teammate, outsider = create_user(db), create_user(db), create_user(db), create_user(db)
+    team = create_team(db, members=[member, teammate], admins=[admin])
+    channel = create_channel(db, team, members=[admin, member])
+    latest = send_message(client, admin, channel, "before they joined")
+
+    user_ids = [teammate.id, member.id, outsider.id, MISSING_USER_ID]
+    response = add_members(client, admin, f"/api/channels/{channel.id}/members", user_ids)
+    assert response.status_code == 200
+    # Users outside the team, existing or not, are rejected
+    assert response.json() == {
+        "added": [teammate.id], "already_members": [member.id], "rejected": [outsider.id, MISSING_USER_ID],
+    }
+    assert members_of(db, channel_members, channel_id=channel.id) == sorted([admin.id, member.id, teammate.id])
+    # Joined with the history read
+    marker = db.query(channel_members.c.last_read_message_id).filter_by(
+        channel_id=channel.id, user_id=teammate.id
+    ).scalar()
+    assert marker == latest["id"]
+
+    again = add_members(client, admin, f"/api/channels/{channel.id}/members", user_ids).json()
+    assert again["added"] == [] and again["already_members"] == [teammate.id, member.id]
+    assert len(members_of(db, channel_members, channel_id=channel.id)) == 3
+
+
+@pytest.mark.parametrize("caller", ["creator", "team_admin", "member"])
+def test_channel_creators_and_team_admins_add_channel_members(client, db, caller):
+    creator, admin, member, newcomer = create_user(db), create_user(db), create_user(db), create_user(db)
+    team = create_team(db, members=[creator, member, newcomer], admins=[admin])
+    channel = create_channel(db, team, members=[creator, member])
+    db.query(Channel).filter(Channel.id == channel.id).update({Channel.created_by: creator.id})
+    db.commit()
+
+    user = {"creator": creator, "team_admin": admin, "member": member}[caller]
+    response = add_members(client, user, f"/api/channels/{channel.id}/members", [newcomer.id])
+    if caller == "member":
+        assert response.status_code == 403
+        assert newcomer.id not in members_of(db, channel_members, channel_id=channel.id)
+    else:
+        assert response.status_code == 200
+        assert response.json()["added"] == [newcomer.id]
+
+
+@pytest.mark.parametrize("table", [team_members, channel_members], ids=lambda table: table.name)
+def test_mysql_duplicate_membership_assigns_a_key_column(table):
+    # A concurrent request may have added the row since the check; the duplicate must leave it as it is
+    sql = str(insert_ignore_statement("mysql", table).compile(dialect=mysql.dialect()))
+
+    assert "ON DUPLICATE KEY UPDATE user_id = VALUES(user_id)" in sql
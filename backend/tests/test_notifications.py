@@ -0,0 +1,58 @@
+"""Who mention notifications reach and how they are stored (app.notifications)"""
+from sqlalchemy.dialects import mysql
+
+from app.database import insert_ignore_statement
+from app.models import Notification
+from app.notifications import NotificationWorker, mention_job, parse_mentions, store_notifications
+from tests.conftest import create_channel, create_team, create_user
+
+
+def job(message_id: int, channel, sender, content: str) -> dict:
+    message = {
+        "id": message_id, "channel_id": channel.id, "sender_id": sender.id, "parent_message_id": None,
+        "content": content,
+    }
+    return mention_job(message, parse_mentions(content))
+
+
+def test_burst_skips_users_named_in_any_held_message(client, db, monkeypatch):
+    sender, named, other = create_user(db), create_user(db), create_user(db)
+    team = create_team(db, members=[sender, named, other])
+    channel = create_channel(db, team, members=[sender, named, other])
+    worker = NotificationWorker(None)
+    notified = []
+
+    async def notify(job, kind, user_ids, inbox, count=1):
+        notified.append((kind, sorted(user_ids), count))
+
+    monkeypatch.setattr(worker, "notify", notify)
+    jobs = [
+        job(1, channel, sender, f"@channel and @{named.username}"),
+        job(2, channel, sender, "@here again"),
+    ]
+    client.portal.call(worker.deliver_broadcast, jobs)
+
+    # `named` got a mention for the first message and is left out of the broadcast
+    assert notified == [("channel", [other.id], 2)]
+
+
+def test_redelivered_mention_keeps_its_inbox_row(client, db):
+    sender, reader = create_user(db), create_user(db)
+    team = create_team(db, members=[sender, reader])
+    channel = create_channel(db, team, members=[sender, reader])
+    mention = job(7, channel, sender, f"@{reader.username} hi")
+
+    store_notifications(mention, "mention", [reader.id], batch_size=100)
+    first = db.query(Notification.id).filter_by(user_id=reader.id).all()
+    store_notifications(mention, "mention", [reader.id], batch_size=100)
+    db.expire_all()
+
+    assert db.query(Notification.id).filter_by(user_id=reader.id).all() == first
+
+
+def test_mysql_duplicate_of_a_notification_assigns_a_supplied_column():
+    # The id is autoincrement and not in the rows; assigning it would renumber the row
+    statement = insert_ignore_statement("mysql", Notification.__table__, no_op_column="user_id")
+    sql = str(statement.compile(dialect=mysql.dialect()))
+
+    assert "ON DUPLICATE KEY UPDATE user_id = VALUES(user_id)" in sql
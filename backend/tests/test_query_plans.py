@@ -0,0 +1,21 @@
+"""The history, thread and channel export queries are planned on their indexes (benchmarks.explain_queries)"""
+import pytest
+
+from app.database import get_engine
+from benchmarks.explain_queries import explain, hot_queries, uses_index
+
+QUERIES = {name: (statement, table, index) for name, statement, table, index in hot_queries()}
+
+
+@pytest.mark.parametrize("name, index", [
+    ("channel_page", "ix_messages_channel_id_parent_message_id_created_at"),
+    ("thread_page", "ix_messages_parent_message_id_id"),
+    ("channel_export_batch", "ix_messages_channel_id_id"),
+])
+def test_query_uses_its_index(name, index):
+    statement, table, expected = QUERIES[name]
+    assert expected == index
+
+    with get_engine().connect() as conn:
+        plan = explain(conn, statement)
+        assert uses_index(conn, plan, table, index), plan
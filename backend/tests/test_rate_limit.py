@@ -0,0 +1,24 @@
+"""Who anonymous requests are rate limited as (app.rate_limit)"""
+from app.rate_limit import RateLimitMiddleware
+
+
+def identity(forwarded_for=None, trusted_proxy_hops: int = 1) -> str:
+    middleware = RateLimitMiddleware(
+        None, limiter=None, rules={}, secret_key="x", algorithm="HS256", trusted_proxy_hops=trusted_proxy_hops
+    )
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for is not None else []
+    return middleware._identity({"headers": headers, "client": ("10.0.0.2", 40000)})
+
+
+def test_client_ip_is_the_entry_appended_by_the_proxy():
+    # nginx's $proxy_add_x_forwarded_for keeps what the client sent and appends the peer address
+    assert identity("203.0.113.7") == "ip:203.0.113.7"
+    assert identity("1.2.3.4, 203.0.113.7") == "ip:203.0.113.7"
+    assert identity("1.2.3.4, 203.0.113.7, 10.0.0.9", trusted_proxy_hops=2) == "ip:203.0.113.7"
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies():
+    assert identity("1.2.3.4", trusted_proxy_hops=0) == "ip:10.0.0.2"
+    assert identity() == "ip:10.0.0.2"
+    # Fewer entries than proxies: the request did not come through them
+    assert identity("1.2.3.4", trusted_proxy_hops=2) == "ip:10.0.0.2"
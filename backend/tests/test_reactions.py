@@ -0,0 +1,85 @@
+"""Reactions: counted in Redis, written in batches, then shown in history (app.reactions)"""
+import pytest
+
+from app.models import MessageReaction
+from app.reactions import reaction_aggregator
+from tests.conftest import auth_headers, create_channel, create_team, create_user, send_message, token_for
+
+
+@pytest.fixture
+def held_writes(client, monkeypatch):
+    """Keep the aggregator from writing on its own; tests persist explicitly"""
+    monkeypatch.setattr(reaction_aggregator, "persist_interval", 3600.0)
+    yield
+    # Message ids start over with the next test's schema; nothing may carry over to them
+    client.portal.call(reaction_aggregator.stop)
+    reaction_aggregator.changed.clear()
+
+
+def react(client, user, message, emoji: str, add: bool = True) -> dict:
+    method = client.put if add else client.delete
+    response = method(f"/api/messages/{message['id']}/reactions/{emoji}", headers=auth_headers(user))
+    assert response.status_code == 200
+    return response.json()
+
+
+def history_reactions(client, user, channel) -> dict:
+    return {
+        message["id"]: message["reactions"]
+        for message in client.get(f"/api/messages/channel/{channel.id}", headers=auth_headers(user)).json()
+    }
+
+
+def test_reactions_are_counted_in_redis_then_persisted_and_shown(client, db, held_writes):
+    author, fan = create_user(db), create_user(db)
+    team = create_team(db, members=[author, fan])
+    channel = create_channel(db, team, members=[author, fan])
+    message = send_message(client, author, channel, "react to me")
+    etag = client.get(f"/api/messages/channel/{channel.id}", headers=auth_headers(author)).headers["ETag"]
+
+    first = react(client, author, message, "👍")
+    assert first == {"message_id": message["id"], "emoji": "👍", "count": 1, "changed": True}
+    assert react(client, fan, message, "👍")["count"] == 2
+    # Reacting twice changes nothing
+    assert react(client, fan, message, "👍") == {**first, "count": 2, "changed": False}
+    assert react(client, fan, message, "🎉")["count"] == 1
+    assert react(client, fan, message, "🎉", add=False)["count"] == 0
+
+    # Nothing written yet: history still shows the persisted totals
+    assert db.query(MessageReaction).count() == 0
+    assert history_reactions(client, author, channel) == {message["id"]: {}}
+
+    assert client.portal.call(reaction_aggregator.persist) > 0
+    rows = db.query(MessageReaction.user_id, MessageReaction.emoji).order_by(MessageReaction.user_id).all()
+    assert rows == [(author.id, "👍"), (fan.id, "👍")]
+    # The channel version moved, so cached pages and ETags pick up the counts
+    response = client.get(
+        f"/api/messages/channel/{channel.id}", headers={**auth_headers(author), "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["reactions"] == {"👍": 2}
+
+
+def test_subscribers_get_the_current_totals(client, db, held_writes):
+    author, watcher = create_user(db), create_user(db)
+    team = create_team(db, members=[author, watcher])
+    channel = create_channel(db, team, members=[author, watcher])
+    message = send_message(client, author, channel, "react to me")
+
+    with client.websocket_connect(f"/ws?token={token_for(watcher)}") as websocket:
+        react(client, author, message, "👍")
+        react(client, watcher, message, "👍")
+        event = websocket.receive_json()
+        while event["type"] != "reactions":
+            event = websocket.receive_json()
+    assert event["data"] == {"channel_id": channel.id, "message_id": message["id"], "reactions": {"👍": 2}}
+
+
+def test_outsiders_cannot_react_to_private_channels(client, db, held_writes):
+    member, outsider = create_user(db), create_user(db)
+    team = create_team(db, members=[member, outsider])
+    channel = create_channel(db, team, members=[member], is_private=True)
+    message = send_message(client, member, channel, "members only")
+
+    response = client.put(f"/api/messages/{message['id']}/reactions/👍", headers=auth_headers(outsider))
+    assert response.status_code == 403
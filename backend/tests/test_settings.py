@@ -0,0 +1,20 @@
+"""Settings are read on first use, not when the app is imported (app.config)"""
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_app_reads_no_settings():
+    # Without the required settings, building them would fail the import
+    env = {
+        key: value for key, value in os.environ.items()
+        if key not in ("DATABASE_URL", "TEST_DATABASE_URL", "REDIS_URL", "SECRET_KEY")
+    }
+    code = "import app.main; from app.config import get_settings; print(get_settings.cache_info().currsize)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "0"
@@ -0,0 +1,82 @@
+"""Placement of channels and conversations on message shards, and routing of reads and writes (app.sharding)"""
+import pytest
+from sqlalchemy import select
+
+from app.database import get_engine
+from app.models import Channel, ShardPlacement
+from app.sharding import CHANNEL, CONVERSATION, get_shard_engine, shard_direct_messages, shard_messages, shard_router
+from tests.conftest import auth_headers, create_team, create_user, send_message
+
+
+@pytest.fixture
+def shards(settings, monkeypatch, tmp_path):
+    """Two message shards besides the main database, in SQLite files of their own"""
+    urls = {name: f"sqlite:///{tmp_path}/{name}.db" for name in ("a", "b")}
+    monkeypatch.setattr(settings, "message_shard_urls", urls)
+    get_shard_engine.cache_clear()
+    shard_router._seeded.clear()
+    yield list(urls)
+    for name in urls:
+        get_shard_engine(name).dispose()
+    get_shard_engine.cache_clear()
+    shard_router._seeded.clear()
+
+
+def rows_on(shard: str, table, **where) -> list:
+    with get_shard_engine(shard).connect() as conn:
+        return conn.execute(select(table.c.id).filter_by(**where).order_by(table.c.id)).scalars().all()
+
+
+def create_channel_over_api(client, user, team, name: str) -> Channel:
+    """A channel created through the API, which places it on a shard"""
+    response = client.post("/api/channels/", json={"name": name, "team_id": team.id}, headers=auth_headers(user))
+    assert response.status_code == 200, response.text
+    return Channel(id=response.json()["id"])
+
+
+def test_channel_messages_are_written_to_and_read_from_the_channel_shard(client, db, shards):
+    user = create_user(db)
+    team = create_team(db, members=[user])
+    channels = [create_channel_over_api(client, user, team, f"channel-{index}") for index in range(6)]
+    channel_ids = [channel.id for channel in channels]
+    placed = dict(db.query(ShardPlacement.scope_id, ShardPlacement.shard).filter(ShardPlacement.scope == CHANNEL))
+    assert placed == {channel_id: shard_router.pick_shard(CHANNEL, channel_id) for channel_id in channel_ids}
+    assert set(placed.values()) == set(shards)
+
+    sent = {}
+    for channel in channels:
+        sent[channel.id] = [send_message(client, user, channel, f"in {channel.id}")["id"] for _ in range(2)]
+
+    # Ids are allocated in the main database: unique and increasing across shards
+    all_ids = [message_id for ids in sent.values() for message_id in ids]
+    assert all_ids == sorted(set(all_ids))
+    with get_engine().connect() as conn:
+        assert conn.execute(select(shard_messages.c.id)).all() == []
+    for channel_id, ids in sent.items():
+        assert rows_on(placed[channel_id], shard_messages, channel_id=channel_id) == ids
+        history = client.get(f"/api/messages/channel/{channel_id}", headers=auth_headers(user)).json()
+        assert sorted(message["id"] for message in history) == ids
+
+    # Edits and deletes find the message's shard from its id alone
+    channel_id, (edited, deleted) = next(iter(sent.items()))
+    response = client.put(f"/api/messages/{edited}", json={"content": "edited"}, headers=auth_headers(user))
+    assert response.status_code == 200 and response.json()["content"] == "edited"
+    assert client.delete(f"/api/messages/{deleted}", headers=auth_headers(user)).status_code == 200
+    assert rows_on(placed[channel_id], shard_messages, channel_id=channel_id) == [edited]
+
+
+def test_direct_messages_are_stored_on_the_conversation_shard(client, db, shards):
+    alice, bob = create_user(db), create_user(db)
+    response = client.post(
+        "/api/messages/direct", json={"receiver_id": bob.id, "content": "hi"}, headers=auth_headers(alice)
+    )
+    assert response.status_code == 200
+    message = response.json()
+
+    shard = shard_router.pick_shard(CONVERSATION, message["conversation_id"])
+    assert rows_on(shard, shard_direct_messages, conversation_id=message["conversation_id"]) == [message["id"]]
+    history = client.get(f"/api/messages/direct/{alice.id}", headers=auth_headers(bob)).json()
+    assert [direct["id"] for direct in history] == [message["id"]]
+    # The inbox reads the last message from the shard too
+    inbox = client.get("/api/messages/conversations", headers=auth_headers(bob)).json()
+    assert inbox["conversations"][0]["last_message"]["content"] == "hi"
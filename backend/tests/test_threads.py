@@ -0,0 +1,62 @@
+"""Thread replies and the reply_count kept on their root (app.api.messages)"""
+from tests.conftest import auth_headers, create_channel, create_team, create_user, send_message
+
+
+def get_thread(client, user, message_id: int) -> dict:
+    response = client.get(f"/api/messages/{message_id}/thread", headers=auth_headers(user))
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_reply_count_follows_replies_sent_and_deleted(client, db):
+    author, replier = create_user(db), create_user(db)
+    team = create_team(db, members=[author, replier])
+    channel = create_channel(db, team, members=[author, replier])
+    root = send_message(client, author, channel, "root")
+    first = send_message(client, replier, channel, "first", parent_message_id=root["id"])
+    second = send_message(client, author, channel, "second", parent_message_id=root["id"])
+
+    thread = get_thread(client, author, root["id"])
+    assert thread["parent"]["reply_count"] == 2
+    assert [reply["id"] for reply in thread["replies"]] == [first["id"], second["id"]]
+
+    response = client.delete(f"/api/messages/{second['id']}", headers=auth_headers(author))
+    assert response.status_code == 200
+    thread = get_thread(client, author, root["id"])
+    assert thread["parent"]["reply_count"] == 1
+    assert [reply["id"] for reply in thread["replies"]] == [first["id"]]
+
+    # Channel history lists the root only, with its thread summary
+    history = client.get(f"/api/messages/channel/{channel.id}", headers=auth_headers(author)).json()
+    assert [(message["id"], message["reply_count"]) for message in history] == [(root["id"], 1)]
+
+
+def test_replies_attach_to_a_root_of_the_same_channel(client, db):
+    user = create_user(db)
+    team = create_team(db, members=[user])
+    channel, other = create_channel(db, team, members=[user]), create_channel(db, team, members=[user])
+    root = send_message(client, user, channel, "root")
+    reply = send_message(client, user, channel, "reply", parent_message_id=root["id"])
+
+    def reply_to(channel_id: int, parent_message_id: int):
+        return client.post(
+            "/api/messages/channel",
+            json={"channel_id": channel_id, "content": "x", "parent_message_id": parent_message_id},
+            headers=auth_headers(user)
+        )
+
+    assert reply_to(channel.id, reply["id"]).status_code == 400
+    assert reply_to(other.id, root["id"]).status_code == 404
+    assert get_thread(client, user, root["id"])["parent"]["reply_count"] == 1
+
+
+def test_deleting_a_root_removes_its_replies(client, db):
+    user = create_user(db)
+    channel = create_channel(db, create_team(db, members=[user]), members=[user])
+    root = send_message(client, user, channel, "root")
+    reply = send_message(client, user, channel, "reply", parent_message_id=root["id"])
+
+    assert client.delete(f"/api/messages/{root['id']}", headers=auth_headers(user)).status_code == 200
+
+    assert client.get(f"/api/messages/{root['id']}/thread", headers=auth_headers(user)).status_code == 404
+    assert client.get(f"/api/messages/{reply['id']}/thread", headers=auth_headers(user)).status_code == 404
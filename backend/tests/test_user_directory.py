@@ -0,0 +1,50 @@
+"""Team-scoped user directory search (GET /api/users/?q=)"""
+from app.redis_client import redis_client
+from tests.conftest import auth_headers, create_team, create_user
+
+
+def search(client, user, q: str) -> set:
+    response = client.get("/api/users/", params={"q": q}, headers=auth_headers(user))
+    assert response.status_code == 200
+    return {found["id"] for found in response.json()["users"]}
+
+
+def test_search_finds_every_member_after_the_index_is_lost(client, db):
+    admin, member, newcomer = create_user(db), create_user(db), create_user(db)
+    team = create_team(db, members=[member], admins=[admin])
+    assert search(client, admin, "test_user") == {admin.id, member.id}
+
+    # Redis restarted; a member joining before the next search must not leave a partial index
+    client.portal.call(redis_client.delete, f"team_directory:{team.id}")
+    response = client.post(f"/api/teams/{team.id}/members/{newcomer.id}", headers=auth_headers(admin))
+    assert response.status_code == 200
+
+    assert search(client, admin, "test_user") == {admin.id, member.id, newcomer.id}
+
+
+def named(db, username: str, full_name=None):
+    user = create_user(db)
+    user.username, user.full_name = username, full_name
+    db.commit()
+    return user
+
+
+def test_search_pages_return_every_match_once_across_teams(client, db):
+    caller = create_user(db)
+    # Seven terms starting with "al" fill the first read of team A (limit 2 reads 4 members a team)
+    many = named(db, "al_many", "Alan Alba Albert Alby Alcott")
+    in_a, in_b = named(db, "alq"), named(db, "alr")
+    create_team(db, members=[caller, many, in_a])
+    create_team(db, members=[caller, in_b])
+
+    found, cursor = [], None
+    while True:
+        params = {"q": "al", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/users/", params=params, headers=auth_headers(caller))
+        assert response.status_code == 200
+        found += [user["id"] for user in response.json()["users"]]
+        cursor = response.json()["next_cursor"]
+        if not cursor:
+            break
+
+    assert sorted(found) == sorted([many.id, in_a.id, in_b.id])
@@ -0,0 +1,54 @@
+"""Inbound size and rate limits on /ws (app.websocket.limits)"""
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.websocket.limits import WS_CLOSE_MESSAGE_TOO_BIG, WS_CLOSE_RATE_LIMITED
+from tests.conftest import create_user, token_for
+
+
+def ping(websocket):
+    websocket.send_json({"type": "ping"})
+
+
+def test_oversized_frame_closes_with_1009(client, db, settings, monkeypatch):
+    monkeypatch.setattr(settings, "ws_max_message_bytes", 64)
+    user = create_user(db)
+
+    with client.websocket_connect(f"/ws?token={token_for(user)}") as websocket:
+        ping(websocket)
+        assert websocket.receive_json() == {"type": "pong"}
+        websocket.send_text("x" * 65)
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_text()
+    assert closed.value.code == WS_CLOSE_MESSAGE_TOO_BIG
+
+
+def test_size_cap_counts_utf8_bytes(client, db, settings, monkeypatch):
+    monkeypatch.setattr(settings, "ws_max_message_bytes", 64)
+    user = create_user(db)
+
+    with client.websocket_connect(f"/ws?token={token_for(user)}") as websocket:
+        # 40 characters, 80 bytes; a frame let through would be followed by a pong
+        websocket.send_text("é" * 40)
+        ping(websocket)
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_text()
+    assert closed.value.code == WS_CLOSE_MESSAGE_TOO_BIG
+
+
+def test_frames_over_the_rate_are_dropped_then_the_socket_is_closed(client, db, settings, monkeypatch):
+    monkeypatch.setattr(settings, "ws_inbound_rate", 0.001)
+    monkeypatch.setattr(settings, "ws_inbound_burst", 2)
+    monkeypatch.setattr(settings, "ws_max_violations", 3)
+    user = create_user(db)
+
+    with client.websocket_connect(f"/ws?token={token_for(user)}") as websocket:
+        for _ in range(2):
+            ping(websocket)
+            assert websocket.receive_json() == {"type": "pong"}
+        # Three drops spend the violation budget without an answer; the fourth closes
+        for _ in range(4):
+            ping(websocket)
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_text()
+    assert closed.value.code == WS_CLOSE_RATE_LIMITED
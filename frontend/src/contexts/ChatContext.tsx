@@ -34,7 +34,7 @@ type ChatAction =
   | { type: 'SET_CURRENT_DM_USER'; payload: number | null }
   | { type: 'SET_ONLINE_USERS'; payload: number[] }
   | { type: 'UPDATE_USER_STATUS'; payload: { userId: number; status: string } }
-  | { type: 'SET_TYPING'; payload: { channelId: number; userId: number; typing: boolean } }
+  | { type: 'SET_TYPING'; payload: { channelId: number; userIds: number[] } }
   | { type: 'CLEAR_ERROR' };
 
 const initialState: ChatState = {
@@ -98,17 +98,11 @@ const chatReducer = (state: ChatState, action: ChatAction): ChatState => {
       }
       return { ...state, onlineUsers: newOnlineUsers };
     case 'SET_TYPING': {
+      // The server sends the full set of typers for a channel on every change
       const newTypingUsers = new Map(state.typingUsers);
-      const channelTyping = newTypingUsers.get(action.payload.channelId) || new Set();
       
-      if (action.payload.typing) {
-        channelTyping.add(action.payload.userId);
-      } else {
-        channelTyping.delete(action.payload.userId);
-      }
-      
-      if (channelTyping.size > 0) {
-        newTypingUsers.set(action.payload.channelId, channelTyping);
+      if (action.payload.userIds.length > 0) {
+        newTypingUsers.set(action.payload.channelId, new Set(action.payload.userIds));
       } else {
         newTypingUsers.delete(action.payload.channelId);
       }
@@ -195,16 +189,13 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
     });
 
     wsService.onTyping((data: TypingData) => {
-      if (data.channel_id) {
-        dispatch({
-          type: 'SET_TYPING',
-          payload: {
-            channelId: data.channel_id,
-            userId: data.user_id,
-            typing: data.typing,
-          },
-        });
-      }
+      dispatch({
+        type: 'SET_TYPING',
+        payload: {
+          channelId: data.channel_id,
+          userIds: data.user_ids,
+        },
+      });
     });
 
     wsService.onUserStatus((data: UserStatusData) => {
@@ -1,10 +1,13 @@
 import axios, { AxiosInstance } from 'axios';
 import {
   User,
+  UserDirectoryPage,
+  ThreadPage,
   Team,
   Channel,
   Message,
   DirectMessage,
+  ConversationPage,
   AuthResponse,
   LoginRequest,
   RegisterRequest,
@@ -74,8 +77,15 @@ class ApiService {
   }
 
   // Users
-  async getUsers(): Promise<User[]> {
-    const response = await this.api.get('/users');
+  async getUsers(params?: { q?: string; teamId?: number; limit?: number; cursor?: string }): Promise<UserDirectoryPage> {
+    const response = await this.api.get('/users', {
+      params: {
+        q: params?.q,
+        team_id: params?.teamId,
+        limit: params?.limit,
+        cursor: params?.cursor,
+      },
+    });
     return response.data;
   }
 
@@ -184,6 +194,13 @@ class ApiService {
     return response.data;
   }
 
+  async getThread(messageId: number, afterId: number = 0, limit: number = 50): Promise<ThreadPage> {
+    const response = await this.api.get(`/messages/${messageId}/thread`, {
+      params: { after_id: afterId, limit }
+    });
+    return response.data;
+  }
+
   async getDirectMessages(userId: number, page: number = 1, perPage: number = 50): Promise<DirectMessage[]> {
     const response = await this.api.get(`/messages/direct/${userId}`, {
       params: { page, per_page: perPage }
@@ -204,6 +221,17 @@ class ApiService {
     await this.api.post(`/messages/direct/${messageId}/mark-read`);
   }
 
+  async getConversations(beforeId?: number, limit: number = 50): Promise<ConversationPage> {
+    const response = await this.api.get('/messages/conversations', {
+      params: { before_id: beforeId, limit }
+    });
+    return response.data;
+  }
+
+  async markConversationRead(conversationId: number): Promise<void> {
+    await this.api.post(`/messages/conversations/${conversationId}/read`);
+  }
+
   async searchMessages(searchData: SearchRequest, page: number = 1, perPage: number = 20): Promise<SearchResult> {
     const response = await this.api.post('/messages/search', searchData, {
       params: { page, per_page: perPage }
@@ -10,6 +10,11 @@ export interface User {
   created_at: string;
 }
 
+export interface UserDirectoryPage {
+  users: User[];
+  next_cursor?: string | null;
+}
+
 export interface Team {
   id: number;
   name: string;
@@ -40,17 +45,26 @@ export interface Message {
   channel_id?: number;
   sender_id: number;
   parent_message_id?: number;
+  reply_count: number;
+  last_reply_at?: string;
   is_edited: boolean;
   edited_at?: string;
   created_at: string;
   sender: User;
 }
 
+export interface ThreadPage {
+  parent: Message;
+  replies: Message[];
+  next_after_id?: number;
+}
+
 export interface DirectMessage {
   id: number;
   content: string;
   message_type: string;
   file_url?: string;
+  conversation_id?: number;
   sender_id: number;
   receiver_id: number;
   is_read: boolean;
@@ -62,6 +76,19 @@ export interface DirectMessage {
   receiver: User;
 }
 
+export interface ConversationSummary {
+  id: number;
+  other_user: User;
+  last_message?: DirectMessage;
+  last_read_message_id?: number;
+  unread_count: number;
+}
+
+export interface ConversationPage {
+  conversations: ConversationSummary[];
+  next_before_id?: number;
+}
+
 export interface UserPresence {
   user_id: number;
   status: 'online' | 'offline' | 'away' | 'busy';
@@ -145,9 +172,8 @@ export interface ChatMessageData {
 }
 
 export interface TypingData {
-  user_id: number;
-  channel_id?: number;
-  typing: boolean;
+  channel_id: number;
+  user_ids: number[];
 }
 
 export interface UserStatusData {